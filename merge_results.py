@@ -1,56 +1,491 @@
 #!/usr/bin/env python3
-import glob
+"""
+合并并分析梯度压测结果
+
+1. 与原来一样, 把每个 results_<并发>_stats.csv 的汇总行合并到 merged_benchmark_results.csv
+   (流式/开环/前缀缓存/输入网格模式下 Aggregated 行混入了 STREAM/OPENLOOP/PREFIX/GRID 派生指标, 此时改用主请求行);
+2. 读取每个并发的 results_<并发>_stats_history.csv, 去掉爬坡/预热/收尾后计算稳态吞吐和 p50/p90/p99/p99.9;
+   有 results_<并发>_hdr.jsonl (HDR直方图, 见 src/latency_histogram.py) 时, 合并稳态区间内各worker的
+   区间直方图得到精确分位数, 代替历史行分位数的中位数;
+3. 拟合 延迟-吞吐 曲线 (L = L0 / (1 - X/Xmax)), 用 Kneedle 找吞吐拐点,
+   并给出在延迟SLO下可持续的最大并发;
+4. 结果写入 benchmark_analysis.csv 和静态HTML报告 benchmark_report.html。
+
+用法:
+    python merge_results.py --slo-ms 30000 --slo-percentile 99
+"""
+import argparse
 import csv
+import glob
+import html
+import os
 import re
+import sys
 
-def merge_results():
-    # 找到所有 results_*_stats.csv 文件
-    files = glob.glob("results_*_stats.csv")
-    
-    if not files:
-        print("未找到 results_*_stats.csv 文件")
-        return
-    
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from latency_histogram import load_histogram_file  # noqa: E402
+
+DERIVED_TYPES = ("STREAM", "OPENLOOP", "PREFIX", "GRID")
+PERCENTILES = ("50%", "90%", "99%", "99.9%")
+ANALYSIS_FIELDS = [
+    "Concurrency", "Source", "Steady Seconds", "Requests", "Requests/s", "Error Rate",
+    "p50 (ms)", "p90 (ms)", "p99 (ms)", "p99.9 (ms)", "TTFT p99 (ms)", "Little's Law Concurrency",
+    "Input Tokens/s", "Output Tokens/s", "Meets SLO",
+]
+
+
+def find_runs(pattern):
+    """[(并发数, stats.csv, stats_history.csv, tokens.csv, HDR直方图文件)], 缺失的文件为 None, 按并发数排序"""
+    runs = []
+    for file in glob.glob(pattern):
+        match = re.search(r'results_(\d+)_stats\.csv$', file)
+        if not match:
+            continue
+        prefix = file[:-len("_stats.csv")]
+        history = prefix + "_stats_history.csv"
+        tokens = prefix + "_tokens.csv"
+        hdr = next((p for p in (prefix + "_hdr.jsonl", prefix + "_hdr.json") if os.path.exists(p)), None)
+        runs.append((int(match.group(1)), file,
+                     history if os.path.exists(history) else None,
+                     tokens if os.path.exists(tokens) else None,
+                     hdr))
+    runs.sort(key=lambda x: x[0])
+    return runs
+
+
+def read_rows(path):
+    with open(path, 'r', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def main_request_row(rows):
+    """汇总行; 含派生指标时 Aggregated 被污染, 改用请求数最多的主请求行"""
+    if not any(row.get('Type') in DERIVED_TYPES for row in rows):
+        for row in rows:
+            if row['Name'] == 'Aggregated':
+                return row, False
+    candidates = [row for row in rows
+                  if row['Name'] != 'Aggregated' and row.get('Type') not in DERIVED_TYPES]
+    if not candidates:
+        return None, True
+    return max(candidates, key=lambda row: int(row['Request Count'] or 0)), True
+
+
+def merge_results(runs, output_file="merged_benchmark_results.csv"):
     merged_data = []
     headers = None
-    
-    # 先过滤有效文件
-    valid_files = []
-    for file in files:
-        match = re.search(r'results_(\d+)_stats\.csv', file)
-        if match:
-            valid_files.append((file, int(match.group(1))))
-    
-    # 按并发数排序
-    valid_files.sort(key=lambda x: x[1])
-    
-    for file, concurrency in valid_files:
-        
-        # 读取CSV文件
-        with open(file, 'r') as f:
-            reader = csv.DictReader(f)
-            
-            for row in reader:
-                if row['Name'] == 'Aggregated':
-                    row['Concurrency'] = concurrency
-                    if headers is None:
-                        headers = ['Concurrency'] + [k for k in row.keys() if k != 'Concurrency']
-                    merged_data.append(row)
-                    print(f"处理文件: {file}, 并发数: {concurrency}")
-                    break
-    
+
+    for file, concurrency in [(run[1], run[0]) for run in runs]:
+        row, derived = main_request_row(read_rows(file))
+        if row is None:
+            continue
+        row = dict(row)
+        row['Concurrency'] = concurrency
+        if headers is None:
+            headers = ['Concurrency'] + [k for k in row.keys() if k != 'Concurrency']
+        merged_data.append(row)
+        note = f" (含派生指标, 使用 {row['Type']} {row['Name']} 行)" if derived else ""
+        print(f"处理文件: {file}, 并发数: {concurrency}{note}")
+
     if merged_data:
         # 保存到文件
-        output_file = "merged_benchmark_results.csv"
         with open(output_file, 'w', newline='') as f:
             writer = csv.DictWriter(f, fieldnames=headers)
             writer.writeheader()
             writer.writerows(merged_data)
-        
+
         print(f"合并结果已保存到: {output_file}")
         print(f"共处理 {len(merged_data)} 个文件")
     else:
         print("未找到有效的数据")
 
+
+def _to_float(values):
+    out = np.empty(len(values))
+    for i, v in enumerate(values):
+        try:
+            out[i] = float(v)
+        except (TypeError, ValueError):
+            out[i] = np.nan
+    return out
+
+
+def load_history(path, polluted):
+    """主请求序列的历史: 有 --csv-full-history 的逐名称行时用主请求行, 否则用 Aggregated 行"""
+    rows = read_rows(path)
+    main = [r for r in rows if r['Name'] != 'Aggregated' and r.get('Type') not in DERIVED_TYPES]
+    if main:
+        names = {}
+        for r in main:
+            names.setdefault(r['Name'], []).append(r)
+        rows = max(names.values(), key=lambda rs: _to_float([rs[-1]['Total Request Count']])[0])
+    elif polluted:
+        return None  # Aggregated 混入了派生指标, 历史不可用
+    else:
+        rows = [r for r in rows if r['Name'] == 'Aggregated']
+    if not rows:
+        return None
+    hist = {
+        "t": _to_float([r['Timestamp'] for r in rows]),
+        "users": _to_float([r['User Count'] for r in rows]),
+        "total": _to_float([r['Total Request Count'] for r in rows]),
+        "failures": _to_float([r['Total Failure Count'] for r in rows]),
+    }
+    for p in PERCENTILES:
+        hist[p] = _to_float([r.get(p) for r in rows])
+    order = np.argsort(hist["t"], kind="stable")
+    return {k: v[order] for k, v in hist.items()}
+
+
+def steady_state(hist, warmup=0.1, cooldown=0.05):
+    """满并发且已有完成请求的区间, 去掉开头warmup和结尾cooldown比例后的稳态指标"""
+    active = (hist["users"] >= np.nanmax(hist["users"])) & (hist["total"] > 0)
+    if active.sum() < 3:
+        return None
+    t = hist["t"][active]
+    t0, t1 = t[0], t[-1]
+    span = t1 - t0
+    window = active & (hist["t"] >= t0 + span * warmup) & (hist["t"] <= t1 - span * cooldown)
+    if window.sum() < 2:
+        return None
+    idx = np.flatnonzero(window)
+    first, last = idx[0], idx[-1]
+    seconds = hist["t"][last] - hist["t"][first]
+    requests = hist["total"][last] - hist["total"][first]
+    failures = hist["failures"][last] - hist["failures"][first]
+    if seconds <= 0 or requests <= 0:
+        return None
+    result = {
+        "seconds": float(seconds),
+        "requests": int(requests),
+        "rps": float(requests / seconds),
+        "error_rate": float(failures / requests),
+        "t_start": float(hist["t"][first]),
+        "t_end": float(hist["t"][last]),
+    }
+    # 每行是最近约10秒的窗口分位数, 取稳态区间内的中位数
+    for p in PERCENTILES:
+        values = hist[p][window]
+        result[p] = float(np.nanmedian(values)) if np.isfinite(values).any() else float("nan")
+    return result
+
+
+def stats_fallback(row):
+    """没有可用历史时退回整个运行的累计统计"""
+    result = {
+        "seconds": float("nan"),
+        "requests": int(float(row['Request Count'] or 0)),
+        "rps": float(row['Requests/s'] or 0),
+        "error_rate": (float(row['Failure Count'] or 0) / float(row['Request Count']))
+        if float(row['Request Count'] or 0) else 0.0,
+    }
+    for p in PERCENTILES:
+        result[p] = _to_float([row.get(p)])[0]
+    return result
+
+
+def apply_hdr(result, path):
+    """用HDR直方图替换分位数: 有稳态区间且为区间日志时只合并区间内的直方图; 返回是否替换"""
+    if path.endswith(".jsonl") and "t_start" in result:
+        histograms = load_histogram_file(path, result["t_start"], result["t_end"])
+    else:
+        histograms = load_histogram_file(path)
+    e2e = histograms.get("e2e")
+    if e2e is None or not e2e.count:
+        return False
+    for p in PERCENTILES:
+        result[p] = e2e.percentile_ms(float(p[:-1]))
+    ttft = histograms.get("ttft")
+    if ttft is not None and ttft.count:
+        result["ttft_99%"] = ttft.percentile_ms(99)
+    return True
+
+
+def read_token_rates(path):
+    rates = {}
+    if path:
+        for row in read_rows(path):
+            rates[row['Metric']] = _to_float([row.get('Tokens/s')])[0]
+    return rates.get('prompt_tokens', float("nan")), rates.get('completion_tokens', float("nan"))
+
+
+def fit_latency_curve(throughput, latency):
+    """拟合 L = L0 / (1 - X/Xmax): 1/L 对 X 线性回归; 返回 (L0, Xmax) 或 None"""
+    mask = np.isfinite(throughput) & np.isfinite(latency) & (latency > 0)
+    if mask.sum() < 2:
+        return None
+    slope, intercept = np.polyfit(throughput[mask], 1.0 / latency[mask], 1)
+    if intercept <= 0 or slope >= 0:
+        return None
+    return 1.0 / intercept, -intercept / slope
+
+
+def find_knee(concurrency, throughput):
+    """Kneedle: 归一化(并发取log2)后吞吐曲线与对角线差值最大的点"""
+    mask = np.isfinite(throughput)
+    if mask.sum() < 3:
+        return None
+    x = np.log2(concurrency[mask].astype(float))
+    y = throughput[mask]
+    if np.ptp(x) == 0 or np.ptp(y) == 0:
+        return None
+    xn = (x - x.min()) / np.ptp(x)
+    yn = (y - y.min()) / np.ptp(y)
+    diff = yn - xn
+    i = int(np.argmax(diff))
+    if diff[i] <= 0:
+        return None
+    return int(concurrency[mask][i])
+
+
+def max_sustainable(concurrency, latency, error_rate, slo_ms, max_error_rate):
+    """满足延迟SLO和错误率的最大并发, 及按对数插值估计的SLO越界并发"""
+    ok = np.isfinite(latency) & (latency <= slo_ms) & (error_rate <= max_error_rate)
+    if not ok.any():
+        return None, None
+    best = int(concurrency[ok].max())
+    above = np.flatnonzero((concurrency > best) & np.isfinite(latency) & (latency > slo_ms))
+    estimate = None
+    if above.size:
+        i = int(np.flatnonzero(concurrency == best)[0])
+        j = int(above[0])
+        l0, l1 = np.log(latency[i]), np.log(latency[j])
+        if l1 > l0:
+            frac = (np.log(slo_ms) - l0) / (l1 - l0)
+            estimate = float(np.exp(np.log(concurrency[i]) + frac * (np.log(concurrency[j]) - np.log(concurrency[i]))))
+    return best, estimate
+
+
+def analyze(runs, args):
+    records = []
+    for concurrency, stats_file, history_file, tokens_file, hdr_file in runs:
+        row, polluted = main_request_row(read_rows(stats_file))
+        if row is None:
+            continue
+        result, source = None, "history"
+        if history_file:
+            hist = load_history(history_file, polluted)
+            if hist is not None:
+                result = steady_state(hist, args.warmup, args.cooldown)
+        if result is None:
+            result, source = stats_fallback(row), "stats"
+            print(f"[WARNING] 并发 {concurrency}: 无可用的稳态历史, 使用整体统计")
+        if hdr_file and apply_hdr(result, hdr_file):
+            source += "+hdr"
+        result["concurrency"] = concurrency
+        result["source"] = source
+        result["input_tps"], result["output_tps"] = read_token_rates(tokens_file)
+        records.append(result)
+
+    if not records:
+        return None
+    concurrency = np.array([r["concurrency"] for r in records])
+    rps = np.array([r["rps"] for r in records])
+    error_rate = np.array([r["error_rate"] for r in records])
+    lat = {p: np.array([r[p] for r in records]) for p in PERCENTILES}
+    slo_key = f"{args.slo_percentile:g}%"
+    slo_latency = lat.get(slo_key, lat["99%"])
+
+    # Little's law: 闭环下 N ≈ X * R, 偏离说明客户端或排队有额外开销
+    littles = rps * lat["50%"] / 1000.0
+    fit = fit_latency_curve(rps, lat["50%"])
+    knee = find_knee(concurrency, rps)
+    sustainable = estimate = None
+    if args.slo_ms:
+        sustainable, estimate = max_sustainable(concurrency, slo_latency, error_rate, args.slo_ms, args.max_error_rate)
+
+    for r, n_little in zip(records, littles):
+        r["littles"] = n_little
+        r["meets_slo"] = (not args.slo_ms or (np.isfinite(r.get(slo_key, np.nan)) and r.get(slo_key) <= args.slo_ms)) \
+            and r["error_rate"] <= args.max_error_rate
+
+    return {
+        "records": records,
+        "concurrency": concurrency,
+        "rps": rps,
+        "latency": lat,
+        "fit": fit,
+        "knee": knee,
+        "sustainable": sustainable,
+        "sustainable_estimate": estimate,
+        "peak_rps": float(np.nanmax(rps)),
+        "peak_concurrency": int(concurrency[int(np.nanargmax(rps))]),
+    }
+
+
+def _fmt(v, digits=1):
+    if v is None or (isinstance(v, float) and not np.isfinite(v)):
+        return ""
+    return f"{v:.{digits}f}" if isinstance(v, float) else str(v)
+
+
+def write_analysis(analysis, output_file):
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=ANALYSIS_FIELDS)
+        writer.writeheader()
+        for r in analysis["records"]:
+            writer.writerow({
+                "Concurrency": r["concurrency"],
+                "Source": r["source"],
+                "Steady Seconds": _fmt(r["seconds"]),
+                "Requests": r["requests"],
+                "Requests/s": _fmt(r["rps"], 3),
+                "Error Rate": _fmt(r["error_rate"], 4),
+                "p50 (ms)": _fmt(r["50%"], 0),
+                "p90 (ms)": _fmt(r["90%"], 0),
+                "p99 (ms)": _fmt(r["99%"], 0),
+                "p99.9 (ms)": _fmt(r["99.9%"], 0),
+                "TTFT p99 (ms)": _fmt(r.get("ttft_99%"), 0),
+                "Little's Law Concurrency": _fmt(r["littles"], 1),
+                "Input Tokens/s": _fmt(r["input_tps"]),
+                "Output Tokens/s": _fmt(r["output_tps"]),
+                "Meets SLO": "yes" if r["meets_slo"] else "no",
+            })
+    print(f"分析结果已保存到: {output_file}")
+
+
+def svg_chart(series, x_label, y_label, log_x=False, width=640, height=360):
+    """极简SVG折线图; series: [(名称, xs, ys, 颜色, 虚线)]"""
+    pad_l, pad_r, pad_t, pad_b = 70, 20, 20, 50
+    xs_all = np.concatenate([np.asarray(s[1], float) for s in series])
+    ys_all = np.concatenate([np.asarray(s[2], float) for s in series])
+    finite = np.isfinite(xs_all) & np.isfinite(ys_all)
+    if not finite.any():
+        return "<p>无数据</p>"
+    tx = np.log2 if log_x else (lambda v: np.asarray(v, float))
+    x_min, x_max = tx(xs_all[finite]).min(), tx(xs_all[finite]).max()
+    y_min, y_max = 0.0, ys_all[finite].max() * 1.1 or 1.0
+    if x_max == x_min:
+        x_min, x_max = x_min - 1, x_max + 1
+
+    def px(x):
+        return pad_l + (tx(x) - x_min) / (x_max - x_min) * (width - pad_l - pad_r)
+
+    def py(y):
+        return height - pad_b - (y - y_min) / (y_max - y_min) * (height - pad_t - pad_b)
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'font-family="sans-serif" font-size="11">',
+             f'<rect x="{pad_l}" y="{pad_t}" width="{width - pad_l - pad_r}" '
+             f'height="{height - pad_t - pad_b}" fill="none" stroke="#999"/>']
+    for k in range(6):
+        y = y_min + (y_max - y_min) * k / 5
+        parts.append(f'<line x1="{pad_l}" x2="{width - pad_r}" y1="{py(y):.1f}" y2="{py(y):.1f}" stroke="#eee"/>'
+                     f'<text x="{pad_l - 6}" y="{py(y) + 4:.1f}" text-anchor="end">{y:.4g}</text>')
+    for x in sorted(set(xs_all[finite].tolist()))[:20] if log_x else np.linspace(xs_all[finite].min(), xs_all[finite].max(), 6):
+        parts.append(f'<text x="{px(x):.1f}" y="{height - pad_b + 16}" text-anchor="middle">{x:.4g}</text>')
+    parts.append(f'<text x="{(width + pad_l) / 2:.0f}" y="{height - 10}" text-anchor="middle">{html.escape(x_label)}</text>')
+    parts.append(f'<text transform="translate(14,{(height - pad_b) / 2:.0f}) rotate(-90)" '
+                 f'text-anchor="middle">{html.escape(y_label)}</text>')
+    for i, (name, xs, ys, color, dashed) in enumerate(series):
+        xs, ys = np.asarray(xs, float), np.asarray(ys, float)
+        ok = np.isfinite(xs) & np.isfinite(ys)
+        points = " ".join(f"{px(x):.1f},{py(y):.1f}" for x, y in zip(xs[ok], ys[ok]))
+        dash = ' stroke-dasharray="5,4"' if dashed else ""
+        parts.append(f'<polyline points="{points}" fill="none" stroke="{color}" stroke-width="2"{dash}/>')
+        if not dashed:
+            parts.extend(f'<circle cx="{px(x):.1f}" cy="{py(y):.1f}" r="3" fill="{color}"/>'
+                         for x, y in zip(xs[ok], ys[ok]))
+        parts.append(f'<rect x="{pad_l + 10}" y="{pad_t + 8 + i * 16}" width="12" height="3" fill="{color}"/>'
+                     f'<text x="{pad_l + 28}" y="{pad_t + 13 + i * 16}">{html.escape(name)}</text>')
+    parts.append('</svg>')
+    return "".join(parts)
+
+
+def write_html(analysis, args, output_file):
+    c, rps, lat = analysis["concurrency"], analysis["rps"], analysis["latency"]
+    charts = [
+        ("吞吐 vs 并发", svg_chart([("Requests/s", c, rps, "#1f77b4", False)], "并发数", "Requests/s", log_x=True)),
+        ("延迟 vs 并发", svg_chart([("p50", c, lat["50%"], "#2ca02c", False),
+                                   ("p90", c, lat["90%"], "#ff7f0e", False),
+                                   ("p99", c, lat["99%"], "#d62728", False)], "并发数", "延迟 (ms)", log_x=True)),
+    ]
+    curve = [("p50 实测", rps, lat["50%"], "#2ca02c", False)]
+    fit = analysis["fit"]
+    if fit is not None:
+        l0, xmax = fit
+        xs = np.linspace(0, min(np.nanmax(rps), xmax * 0.98), 50)
+        curve.append((f"拟合 L0={l0:.0f}ms, Xmax={xmax:.2f}/s", xs, l0 / (1 - xs / xmax), "#7f7f7f", True))
+    charts.append(("延迟 vs 吞吐", svg_chart(curve, "Requests/s", "p50 延迟 (ms)")))
+
+    summary = [
+        ("峰值吞吐", f"{analysis['peak_rps']:.3f} req/s (并发 {analysis['peak_concurrency']})"),
+        ("吞吐拐点 (Kneedle)", f"并发 {analysis['knee']}" if analysis["knee"] else "数据点不足或无明显拐点"),
+        ("拟合饱和吞吐 Xmax", f"{fit[1]:.3f} req/s, 空载延迟 L0 {fit[0]:.0f} ms" if fit else "无法拟合"),
+    ]
+    if args.slo_ms:
+        text = f"并发 {analysis['sustainable']}" if analysis["sustainable"] else "所有并发均违反SLO"
+        if analysis["sustainable_estimate"]:
+            text += f" (插值估计SLO越界点 ≈ {analysis['sustainable_estimate']:.0f})"
+        summary.append((f"p{args.slo_percentile:g} ≤ {args.slo_ms:g} ms 下最大并发", text))
+
+    head = "".join(f"<th>{html.escape(h)}</th>" for h in ANALYSIS_FIELDS)
+    body_rows = []
+    for r in analysis["records"]:
+        cells = [r["concurrency"], r["source"], _fmt(r["seconds"]), r["requests"], _fmt(r["rps"], 3),
+                 f"{r['error_rate'] * 100:.2f}%", _fmt(r["50%"], 0), _fmt(r["90%"], 0), _fmt(r["99%"], 0),
+                 _fmt(r["99.9%"], 0), _fmt(r.get("ttft_99%"), 0),
+                 _fmt(r["littles"]), _fmt(r["input_tps"]), _fmt(r["output_tps"]), "✔" if r["meets_slo"] else "✘"]
+        highlight = ' class="knee"' if r["concurrency"] == analysis["knee"] else ""
+        body_rows.append(f"<tr{highlight}>" + "".join(f"<td>{html.escape(str(v))}</td>" for v in cells) + "</tr>")
+
+    doc = f"""<!DOCTYPE html>
+<html lang="zh"><head><meta charset="utf-8"><title>VLM 压测分析报告</title>
+<style>
+body {{ font-family: sans-serif; margin: 24px; color: #222; }}
+table {{ border-collapse: collapse; margin: 12px 0; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: right; }}
+th {{ background: #f3f3f3; }}
+tr.knee td {{ background: #fff4d6; }}
+.charts {{ display: flex; flex-wrap: wrap; gap: 16px; }}
+</style></head><body>
+<h1>VLM 压测分析报告</h1>
+<table>{''.join(f'<tr><th>{html.escape(k)}</th><td>{html.escape(v)}</td></tr>' for k, v in summary)}</table>
+<h2>各并发稳态指标</h2>
+<p>稳态区间: 满并发后去掉前 {args.warmup * 100:.0f}% 与后 {args.cooldown * 100:.0f}%; 分位数为区间内各行窗口分位数的中位数, 来源含 hdr 时为稳态区间内HDR直方图合并后的精确分位数。</p>
+<table><tr>{head}</tr>{''.join(body_rows)}</table>
+<h2>曲线</h2>
+<div class="charts">{''.join(f'<div><h3>{html.escape(t)}</h3>{svg}</div>' for t, svg in charts)}</div>
+</body></html>
+"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        f.write(doc)
+    print(f"HTML报告已保存到: {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合并并分析 results_*_stats*.csv")
+    parser.add_argument("--pattern", default="results_*_stats.csv", help="stats.csv 文件匹配模式")
+    parser.add_argument("--warmup", type=float, default=0.1, help="满并发后丢弃的前段比例")
+    parser.add_argument("--cooldown", type=float, default=0.05, help="丢弃的收尾比例")
+    parser.add_argument("--slo-ms", type=float, default=0, help="延迟SLO(毫秒), 0表示不评估")
+    parser.add_argument("--slo-percentile", type=float, default=99, choices=(50, 90, 99, 99.9), help="SLO使用的分位数")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="可接受的错误率")
+    parser.add_argument("--output", default="merged_benchmark_results.csv", help="合并结果CSV")
+    parser.add_argument("--analysis", default="benchmark_analysis.csv", help="稳态分析CSV")
+    parser.add_argument("--html", default="benchmark_report.html", help="HTML报告")
+    args = parser.parse_args()
+
+    # 找到所有 results_*_stats.csv 文件
+    runs = find_runs(args.pattern)
+    if not runs:
+        print("未找到 results_*_stats.csv 文件")
+        return
+
+    merge_results(runs, args.output)
+    analysis = analyze(runs, args)
+    if analysis is None:
+        print("未找到可分析的数据")
+        return
+    write_analysis(analysis, args.analysis)
+    write_html(analysis, args, args.html)
+    print(f"峰值吞吐: {analysis['peak_rps']:.3f} req/s (并发 {analysis['peak_concurrency']}), "
+          f"拐点并发: {analysis['knee'] or 'N/A'}")
+    if args.slo_ms:
+        print(f"p{args.slo_percentile:g} ≤ {args.slo_ms:g} ms 下最大并发: {analysis['sustainable'] or 'N/A'}")
+
+
 if __name__ == "__main__":
-    merge_results()
\ No newline at end of file
+    main()
@@ -1,51 +1,53 @@
 #!/usr/bin/env python3
+"""
+统计 processed_videos 下每个视频(类别/视频名/)的帧数和帧尺寸分布
+
+用法:
+    python scripts/analyze_video_frames.py --data_dir processed_videos --workers 16
+"""
 import os
-import glob
+import json
+import time
+import argparse
 import statistics
+from collections import Counter
+
+import numpy as np
+
+from dataset_scan import list_video_dirs, print_histogram, scan_frames, scanned_from_manifest, scanned_from_shards
+
 
-def analyze_video_frames():
-    base_path = "./processed_videos"
-    
+def analyze_video_frames(base_path="./processed_videos", workers=0, read_sizes=True, bins=10, output=None,
+                         use_manifest=True):
     if not os.path.exists(base_path):
         print(f"目录不存在: {base_path}")
         return
-    
-    frame_counts = []
-    video_count = 0
-    
-    # 遍历所有视频目录 (category/video_name/)
-    for category in os.listdir(base_path):
-        category_path = os.path.join(base_path, category)
-        if not os.path.isdir(category_path):
-            continue
-            
-        for video_name in os.listdir(category_path):
-            video_path = os.path.join(category_path, video_name)
-            if not os.path.isdir(video_path):
-                continue
-                
-            # 统计该视频的帧数
-            frame_files = glob.glob(os.path.join(video_path, "*.jpg"))
-            frame_count = len(frame_files)
-            
-            if frame_count > 0:
-                frame_counts.append(frame_count)
-                video_count += 1
-                
-                if video_count % 100 == 0:
-                    print(f"已处理 {video_count} 个视频...")
-    
+
+    started = time.time()
+    scanned = scanned_from_manifest(base_path) if use_manifest else None
+    shards = None if scanned is not None else scanned_from_shards(base_path, workers, sizes=read_sizes)
+    if scanned is not None:
+        print(f"使用清单: {len(scanned)} 个视频目录, 耗时 {time.time() - started:.1f}s")
+    elif shards is not None:
+        scanned = shards
+        print(f"读取分片: {len(scanned)} 个视频, 耗时 {time.time() - started:.1f}s")
+    else:
+        video_dirs = list_video_dirs(base_path)
+        scanned = scan_frames(video_dirs, workers, sizes=read_sizes)
+        print(f"扫描 {len(video_dirs)} 个视频目录, 耗时 {time.time() - started:.1f}s")
+
+    frame_counts = [n for _, n, _ in scanned]
     if not frame_counts:
         print("未找到任何视频帧")
         return
-    
+
     # 计算统计信息
     total_frames = sum(frame_counts)
     avg_frames = total_frames / len(frame_counts)
     min_frames = min(frame_counts)
     max_frames = max(frame_counts)
     median_frames = statistics.median(frame_counts)
-    
+
     print(f"\n视频帧数统计:")
     print(f"总视频数: {len(frame_counts)}")
     print(f"总帧数: {total_frames}")
@@ -53,7 +55,7 @@ def analyze_video_frames():
     print(f"最小帧数: {min_frames}")
     print(f"最大帧数: {max_frames}")
     print(f"中位数帧数: {median_frames}")
-    
+
     # 帧数分布
     ranges = [(1, 10), (11, 20), (21, 50), (51, 100), (101, float('inf'))]
     print(f"\n帧数分布:")
@@ -64,6 +66,44 @@ def analyze_video_frames():
         else:
             count = sum(1 for x in frame_counts if min_r <= x <= max_r)
             print(f"{min_r}-{max_r} 帧: {count} 个视频")
+    result = {
+        "total_videos": len(frame_counts),
+        "total_frames": total_frames,
+        "avg_frames": avg_frames,
+        "min_frames": min_frames,
+        "max_frames": max_frames,
+        "median_frames": median_frames,
+        "frames_histogram": print_histogram(np.array(frame_counts), "帧数直方图", bins=bins),
+    }
+
+    sizes = Counter(size for _, _, group in scanned for size in group)
+    if sizes:
+        pixels = np.array([w * h for _, _, group in scanned for w, h in group])
+        print(f"\n帧尺寸 (宽x高), 共 {len(sizes)} 种:")
+        for (w, h), n in sizes.most_common(10):
+            print(f"  {w}x{h}: {n} 帧")
+        result["frame_sizes"] = {f"{w}x{h}": n for (w, h), n in sizes.most_common()}
+        result["pixels_histogram"] = print_histogram(pixels, "每帧像素数直方图", bins=bins)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n统计结果已保存到: {output}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计视频帧目录的帧数和帧尺寸分布")
+    parser.add_argument("--data_dir", default="./processed_videos", help="帧目录 (默认: ./processed_videos)")
+    parser.add_argument("--workers", type=int, default=0, help="扫描进程数 (默认: 0, 即CPU核数; 1表示不用进程池)")
+    parser.add_argument("--no_sizes", action="store_true", help="只统计帧数, 不读取帧文件头")
+    parser.add_argument("--no_manifest", action="store_true", help="忽略 manifest.json, 重新扫描目录")
+    parser.add_argument("--bins", type=int, default=10, help="直方图区间数 (默认: 10)")
+    parser.add_argument("--output", default=None, help="统计结果 JSON 输出文件")
+    args = parser.parse_args()
+    analyze_video_frames(args.data_dir, args.workers, not args.no_sizes, args.bins, args.output,
+                         not args.no_manifest)
+
 
 if __name__ == "__main__":
-    analyze_video_frames()
\ No newline at end of file
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+对比两种视频抽帧方式的耗时、内存和输出一致性
+
+- full:   按 qwen_vl_utils 全量解码并抽帧, 再截取前 max_frames 帧 (原有方式)
+- sparse: 先算出要保留的帧序号, 只 seek/解码这些帧 (src/frame_sampler.py)
+
+每种方式在单独的进程中依次处理所有视频, 统计总耗时、每个视频的耗时和进程峰值内存;
+两种方式每个视频输出的帧数组(resize后、uint8)按 SHA-1 比较, 应完全一致。
+
+sparse 方式依赖容器元数据中的帧数, 元数据有误但未被检测到时两者会不一致; 在新数据集上启用
+VLM_SPARSE_DECODE (默认) 之前必须先运行本脚本, 有不一致的视频时以退出码 1 结束。
+--limit 0 检查全部视频。
+
+用法:
+    python scripts/benchmark_frame_sampling.py --video_dir videos_directory --limit 20 --fps 1.0 --max_frames 16
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+import argparse
+import resource
+import statistics
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+VIDEO_EXTENSIONS = ("*.mp4", "*.avi", "*.mov", "*.mkv")
+
+
+def run_method(args):
+    """子进程: 用一种方式处理所有视频, 返回 (每个视频 [路径, 耗时, 帧数, sha1 或错误], 峰值内存MB)"""
+    method, videos, video_part, max_frames = args
+    import numpy as np
+    from video_preload import decode_video
+
+    results = []
+    for path in videos:
+        part = dict(video_part, video=path)
+        started = time.perf_counter()
+        try:
+            video = decode_video(part, max_frames, sparse=(method == "sparse"))
+            frames = np.ascontiguousarray(video.permute(0, 2, 3, 1).numpy().astype(np.uint8))
+            results.append([path, time.perf_counter() - started, len(frames),
+                            hashlib.sha1(frames.tobytes()).hexdigest() + f":{frames.shape}"])
+        except Exception as e:
+            results.append([path, time.perf_counter() - started, 0, f"error: {e}"])
+    return results, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比全量解码与稀疏 seek 抽帧的耗时、内存和输出一致性")
+    parser.add_argument("--video_dir", default="videos_directory", help="视频目录 (递归查找)")
+    parser.add_argument("--limit", type=int, default=20, help="最多测试的视频数 (默认: 20, 0 为全部)")
+    parser.add_argument("--fps", type=float, default=1.0, help="抽帧帧率 (默认: 1.0, 与 video 压测一致)")
+    parser.add_argument("--max_frames", type=int, default=16, help="保留的帧数 (默认: 16)")
+    parser.add_argument("--min_pixels", type=int, default=28 * 28, help="每帧最小像素数")
+    parser.add_argument("--max_pixels", type=int, default=512 * 512, help="每帧最大像素数")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出文件")
+    args = parser.parse_args()
+
+    videos = []
+    for ext in VIDEO_EXTENSIONS:
+        videos.extend(glob.glob(os.path.join(args.video_dir, "**", ext), recursive=True))
+    videos = sorted(videos)[:args.limit or None]
+    if not videos:
+        print(f"错误: {args.video_dir} 下没有找到视频文件")
+        sys.exit(1)
+    print(f"测试 {len(videos)} 个视频, fps={args.fps}, max_frames={args.max_frames}")
+
+    video_part = {"type": "video", "min_pixels": args.min_pixels, "max_pixels": args.max_pixels, "fps": args.fps}
+    ctx = mp.get_context("spawn")
+    summary = {}
+    outputs = {}
+    for method in ("full", "sparse"):
+        # 每种方式单独一个进程, 峰值内存互不影响
+        with ctx.Pool(1) as pool:
+            started = time.time()
+            results, peak_mb = pool.apply(run_method, ((method, videos, video_part, args.max_frames),))
+            elapsed = time.time() - started
+        outputs[method] = {path: digest for path, _, _, digest in results}
+        per_video = [seconds for _, seconds, n, _ in results if n]
+        summary[method] = {
+            "total_seconds": elapsed,
+            "mean_seconds": statistics.mean(per_video) if per_video else None,
+            "max_seconds": max(per_video) if per_video else None,
+            "frames": sum(n for _, _, n, _ in results),
+            "errors": sum(1 for _, _, n, _ in results if not n),
+            "peak_rss_mb": peak_mb,
+        }
+        s = summary[method]
+        print(f"\n{method}:")
+        print(f"  总耗时: {elapsed:.2f}s, 平均每视频 {s['mean_seconds'] or 0:.3f}s, 最长 {s['max_seconds'] or 0:.3f}s")
+        print(f"  输出帧数: {s['frames']}, 失败: {s['errors']}, 进程峰值内存: {peak_mb:.0f}MB")
+
+    mismatched = [p for p in videos if outputs["full"].get(p) != outputs["sparse"].get(p)]
+    full, sparse = summary["full"], summary["sparse"]
+    print(f"\n输出一致: {len(videos) - len(mismatched)}/{len(videos)} 个视频")
+    for path in mismatched[:10]:
+        print(f"  不一致: {path} (full {outputs['full'].get(path)}, sparse {outputs['sparse'].get(path)})")
+    if full["mean_seconds"] and sparse["mean_seconds"]:
+        print(f"加速比: {full['mean_seconds'] / sparse['mean_seconds']:.2f}x, "
+              f"峰值内存 {full['peak_rss_mb']:.0f}MB -> {sparse['peak_rss_mb']:.0f}MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"videos": len(videos), "summary": summary, "mismatched": mismatched},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
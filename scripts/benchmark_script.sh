@@ -1,27 +1,13 @@
 #!/bin/bash
 
 # 梯度压测脚本 - 找到性能上限
-echo "开始梯度压测，寻找性能上限..."
-
-# 测试不同并发数
-concurrency_levels=(10 16 32 64 128 256)
-
-for concurrency in "${concurrency_levels[@]}"; do
-    echo "========================================="
-    echo "测试并发数: $concurrency"
-    echo "========================================="
-    
-    # 运行压测
-    python -m locust -f src/concurrent_test_frames.py \
-        -u $concurrency \
-        -r 10 \
-        -t 20m \
-        --host http://localhost:8080 \
-        --headless \
-        --csv=results_${concurrency}
-    
-    echo "并发数 $concurrency 测试完成"
-    sleep 10  # 让系统恢复
-done
-
-echo "所有测试完成，请查看 results_*.csv 文件分析结果"
\ No newline at end of file
+# 由 scripts/sweep.py 驱动: 每个并发级别进入稳态后即结束, 吞吐平台或违反SLO时提前停止,
+# 并在拐点附近二分; 结果汇总在 sweep_results.csv / sweep_summary.json。
+# 额外参数原样传给 sweep.py (及locust), 例如: ./scripts/benchmark_script.sh --slo-p95-ms 30000
+
+python scripts/sweep.py \
+    -f src/concurrent_test_frames.py \
+    --levels 10,16,32,64,128,256 \
+    --host http://localhost:8080 \
+    --max-level-time 1200 \
+    "$@"
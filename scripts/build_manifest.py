@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+生成/校验数据集清单 manifest.json
+
+压测脚本(payload_sets 的数据发现)、fragment_store 以及 calculate_tokens.py / analyze_video_frames.py
+在数据目录下存在 manifest.json 时直接读取清单, 不再遍历文件系统: 启动只需读一个JSON文件,
+每次运行、每个worker的payload顺序也完全一致。
+
+清单中每个条目对应一个请求的数据 (frames: 类别/视频名/ 帧目录; images: 单张图片), 记录:
+- files: 相对数据根目录的文件路径(按名称排序)
+- bytes / sizes: 每个文件的字节数和 [宽, 高]
+- image_tokens: 按 Qwen2.5-VL smart_resize 估算的视觉token数(每张图含 vision_start/end)
+- sha1: 所有文件内容按顺序计算的 SHA-1
+- shard: 打包数据集 (preprocess_videos_simple.py --pack) 中该视频所在的分片文件; 此时 files 为分片内的帧名
+
+preprocess_videos_simple.py 处理完成后会自动重建输出目录的清单。数据有变动时重新运行本脚本,
+或用 --verify 检查清单与磁盘是否一致。
+
+用法:
+    python scripts/build_manifest.py --data_dir processed_videos_512_512
+    python scripts/build_manifest.py --data_dir cc_ocr_data --mode images
+    python scripts/build_manifest.py --data_dir processed_videos_512_512 --verify
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+import numpy as np
+
+from calculate_tokens import IMAGE_MAX_PIXELS, IMAGE_MIN_PIXELS, VISION_SPECIAL_TOKENS, image_tokens
+from dataset_scan import (FRAME_EXTENSIONS, image_size_from_bytes, pool_map, list_files, list_images,
+                          list_video_dirs, read_image_size)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from dataset_manifest import MANIFEST_NAME, MANIFEST_VERSION, DatasetManifest  # noqa: E402
+from frame_shards import ShardReader, shard_paths  # noqa: E402
+
+
+def describe_files(args):
+    """(key, 相对路径, 字节数, 尺寸, sha1); 读取失败的文件跳过"""
+    root, key, paths = args
+    digest = hashlib.sha1()
+    files, sizes, byte_counts = [], [], []
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"警告: 无法读取 {path}: {e}")
+            continue
+        size = read_image_size(path)
+        if size is None:
+            print(f"警告: 无法识别图片尺寸 {path}")
+            continue
+        digest.update(data)
+        files.append(os.path.relpath(path, root))
+        byte_counts.append(len(data))
+        sizes.append(list(size))
+    return key, files, byte_counts, sizes, digest.hexdigest(), None
+
+
+def describe_shard(args):
+    """分片中每个视频的 (key, 帧名, 字节数, 尺寸, sha1, 分片相对路径); 无法识别尺寸的帧跳过"""
+    root, path = args
+    reader = ShardReader(path)
+    shard = os.path.relpath(path, root)
+    described = []
+    for key in reader.keys:
+        digest = hashlib.sha1()
+        files, sizes, byte_counts = [], [], []
+        for name, data in zip(reader.names(key), reader.frames(key)):
+            size = image_size_from_bytes(data)
+            if size is None:
+                print(f"警告: 无法识别图片尺寸 {shard}:{key}/{name}")
+                continue
+            digest.update(data)
+            files.append(os.path.join(key, name))
+            byte_counts.append(len(data))
+            sizes.append(list(size))
+        described.append((key, files, byte_counts, sizes, digest.hexdigest(), shard))
+    return described
+
+
+def describe_shards(root, workers=0):
+    """所有分片的 describe_shard 结果; 同一视频出现在多个分片时以后写入的为准"""
+    latest = {}
+    for shard in pool_map(describe_shard, [(root, p) for p in shard_paths(root)], workers):
+        for described in shard:
+            latest[described[0]] = described
+    return list(latest.values())
+
+
+def build_manifest(data_dir, mode="frames", workers=0, min_pixels=IMAGE_MIN_PIXELS, max_pixels=IMAGE_MAX_PIXELS):
+    """扫描数据目录, 返回清单字典"""
+    root = os.path.abspath(data_dir)
+    if mode == "frames" and shard_paths(root):
+        # 打包数据集只读分片, 与 payload_sets 的数据发现一致
+        described = [d for d in describe_shards(root, workers) if d[1]]
+    else:
+        if mode == "frames":
+            tasks = [(root, os.path.relpath(d, root), list_files(d, FRAME_EXTENSIONS))
+                     for d in list_video_dirs(root)]
+        else:
+            tasks = [(root, os.path.relpath(p, root), [p]) for p in list_images(root)]
+        described = [d for d in pool_map(describe_files, tasks, workers) if d[1]]
+
+    counts = [len(d[3]) for d in described]
+    if described:
+        sizes = np.array([s for d in described for s in d[3]], dtype=np.int64)
+        owner = np.repeat(np.arange(len(described)), counts)
+        per_image = image_tokens(sizes[:, 1], sizes[:, 0], min_pixels, max_pixels) + VISION_SPECIAL_TOKENS
+        tokens = np.bincount(owner, weights=per_image, minlength=len(described)).astype(np.int64)
+    else:
+        tokens = []
+
+    entries = []
+    for (key, files, byte_counts, sizes, sha1, shard), n in zip(described, tokens):
+        entry = {
+            "key": key,
+            "files": files,
+            "bytes": byte_counts,
+            "sizes": sizes,
+            "image_tokens": int(n),
+            "sha1": sha1,
+        }
+        if shard is not None:
+            entry["shard"] = shard
+        entries.append(entry)
+    return {
+        "version": MANIFEST_VERSION,
+        "kind": mode,
+        "created": time.time(),
+        "min_pixels": min_pixels,
+        "max_pixels": max_pixels,
+        "entries": entries,
+    }
+
+
+def write_manifest(manifest, path):
+    """紧凑JSON, 先写临时文件再替换, 读取方不会读到半个文件"""
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _verify_shards(manifest, workers, checksum):
+    """打包数据集: 比较清单与当前分片中的帧名、字节数和 sha1; 返回 (问题数, 分片中的视频)"""
+    current = {}
+    for path in shard_paths(manifest.root):
+        reader = ShardReader(path)
+        for key in reader.keys:
+            current[key] = ([os.path.join(key, n) for n in reader.names(key)],
+                            [length for _, length in reader.spans(key)])
+    problems = 0
+    for entry in manifest.entries:
+        key = entry["key"]
+        if key not in current:
+            print(f"缺失: {key} (分片 {entry.get('shard')})")
+            problems += 1
+            continue
+        files, byte_counts = current[key]
+        if files != entry["files"] or byte_counts != entry["bytes"]:
+            print(f"帧列表不一致: {key} (清单 {len(entry['files'])} 帧 {sum(entry['bytes'])} 字节, "
+                  f"分片 {len(files)} 帧 {sum(byte_counts)} 字节)")
+            problems += 1
+    if checksum:
+        described = {d[0]: d for d in describe_shards(manifest.root, workers)}
+        for entry in manifest.entries:
+            if entry["key"] in described and described[entry["key"]][4] != entry["sha1"]:
+                print(f"内容不一致: {entry['key']}")
+                problems += 1
+    return problems, {key for key, (files, _) in current.items() if files}
+
+
+def verify_manifest(path, data_dir, workers=0, checksum=True):
+    """比较清单与磁盘: 文件缺失、大小或 sha1 不一致, 帧目录的文件列表变化, 以及清单外的新条目; 返回问题数"""
+    manifest = DatasetManifest.load(path, root=os.path.abspath(data_dir))
+    if manifest.kind == "frames" and shard_paths(manifest.root):
+        problems, current = _verify_shards(manifest, workers, checksum)
+        return problems + _report_new(current, manifest)
+    problems = 0
+    for entry in manifest.entries:
+        for rel, size in zip(entry["files"], entry["bytes"]):
+            full = os.path.join(manifest.root, rel)
+            try:
+                actual = os.path.getsize(full)
+            except OSError:
+                print(f"缺失: {rel}")
+                problems += 1
+                continue
+            if actual != size:
+                print(f"大小不一致: {rel} (清单 {size}, 实际 {actual})")
+                problems += 1
+    if checksum:
+        tasks = [(manifest.root, e["key"], manifest.files(e["key"])) for e in manifest.entries]
+        for entry, (key, _, _, _, sha1, _) in zip(manifest.entries, pool_map(describe_files, tasks, workers)):
+            if sha1 != entry["sha1"]:
+                print(f"内容不一致: {key}")
+                problems += 1
+    if manifest.kind == "frames":
+        current = set()
+        for d in list_video_dirs(manifest.root):
+            files = [os.path.relpath(f, manifest.root) for f in list_files(d, FRAME_EXTENSIONS)]
+            key = os.path.relpath(d, manifest.root)
+            entry = manifest.entry(key)
+            if files:
+                current.add(key)
+            if entry is not None and files != entry["files"]:
+                print(f"帧文件列表不一致: {key} (清单 {len(entry['files'])} 帧, 实际 {len(files)} 帧)")
+                problems += 1
+    else:
+        current = {os.path.relpath(p, manifest.root) for p in list_images(manifest.root)}
+    return problems + _report_new(current, manifest)
+
+
+def _report_new(current, manifest):
+    """打印磁盘上有而清单中没有的条目, 返回其数量"""
+    new = sorted(current - set(manifest.keys))
+    for key in new[:20]:
+        print(f"不在清单中: {key}")
+    if len(new) > 20:
+        print(f"... 另有 {len(new) - 20} 个条目不在清单中")
+    return len(new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成或校验数据集清单 manifest.json")
+    parser.add_argument("--data_dir", default="processed_videos_512_512", help="数据根目录")
+    parser.add_argument("--mode", choices=("frames", "images"), default="frames",
+                        help="frames: 类别/视频名/*.jpg 帧目录; images: 递归查找图片")
+    parser.add_argument("--output", default=None, help=f"清单文件 (默认: <data_dir>/{MANIFEST_NAME})")
+    parser.add_argument("--workers", type=int, default=0, help="进程数 (默认: 0, 即CPU核数)")
+    parser.add_argument("--min_pixels", type=int, default=IMAGE_MIN_PIXELS, help="估算token用的 min_pixels")
+    parser.add_argument("--max_pixels", type=int, default=IMAGE_MAX_PIXELS, help="估算token用的 max_pixels")
+    parser.add_argument("--verify", action="store_true", help="校验已有清单而不是重新生成")
+    parser.add_argument("--no_checksum", action="store_true", help="校验时只比较文件大小, 不重新计算 sha1")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误: 目录 {args.data_dir} 不存在")
+        sys.exit(1)
+    output = args.output or os.path.join(args.data_dir, MANIFEST_NAME)
+
+    started = time.time()
+    if args.verify:
+        problems = verify_manifest(output, args.data_dir, args.workers, not args.no_checksum)
+        print(f"校验完成, 耗时 {time.time() - started:.1f}s: "
+              + ("清单与磁盘一致" if not problems else f"{problems} 处不一致, 请重新生成清单"))
+        sys.exit(1 if problems else 0)
+
+    manifest = build_manifest(args.data_dir, args.mode, args.workers, args.min_pixels, args.max_pixels)
+    write_manifest(manifest, output)
+    entries = manifest["entries"]
+    files = sum(len(e["files"]) for e in entries)
+    total_bytes = sum(sum(e["bytes"]) for e in entries)
+    print(f"清单已保存到: {output}")
+    print(f"  {len(entries)} 个条目, {files} 个文件, {total_bytes / (1024 * 1024):.1f}MB, "
+          f"耗时 {time.time() - started:.1f}s")
+    if entries:
+        tokens = [e["image_tokens"] for e in entries]
+        print(f"  每条目视觉tokens: 平均 {sum(tokens) / len(tokens):.0f}, 最大 {max(tokens)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+生成"线上即用"的预编码数据: 每一帧/每张图片直接存为请求体中的 image_url JSON 片段 (含 base64 数据)
+
+frames / image 压测启动时要逐个读取 JPEG 并 base64 编码 (image 还要解码、LANCZOS resize、重新编码),
+每次运行、每个 worker 都重复同样的工作。本脚本只做一次, 结果按分片格式 (src/frame_shards.py)
+写到 <data_dir>/wire/<类型>-<参数哈希>/shards/ 下; 压测 worker 启动时只需 mmap 这些文件,
+请求体由 prompt 前缀 + 映射中的片段 + 后缀直接拼成, 与原方式生成的请求体逐字节一致。
+
+目录名包含构建参数 (image 的 --image_size、frames 的 --max_pixels 等) 的哈希, 参数与压测设置不一致时
+不会被使用; 数据集变动后需重新生成。设置 VLM_WIRE_PAYLOADS=0 可让压测脚本忽略这些文件。
+
+frames 模式的 --max_pixels 为输入尺寸网格 (VLM_GRID=1) 的每个像素预算各生成一份缩小后的片段,
+网格压测启动时直接映射, 不再逐帧 resize。
+
+用法:
+    python scripts/build_wire_payloads.py --data_dir processed_videos_512_512
+    python scripts/build_wire_payloads.py --data_dir processed_videos_512_512 --max_pixels 0,401408,200704
+    python scripts/build_wire_payloads.py --data_dir cc_ocr_data --mode images --image_size 1024x1024
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from fragment_store import frame_fragment  # noqa: E402
+from frame_shards import ShardWriter  # noqa: E402
+from payload_sets import (discover_frame_dirs, discover_image_files, encode_image_file,  # noqa: E402
+                          iter_frame_bytes, resize_jpeg)
+from wire_payloads import wire_dir, wire_params  # noqa: E402
+
+
+def encode_frames_entry(args):
+    """帧目录 -> (key, 帧名, image_url 片段); max_pixels 非0时与网格压测相同地缩小每帧"""
+    data_dir, key, max_pixels = args
+    names, fragments = [], []
+    for name, image_bytes in iter_frame_bytes(data_dir, key):
+        if max_pixels:
+            try:
+                image_bytes = resize_jpeg(image_bytes, max_pixels)
+            except Exception as e:
+                print(f"警告: 无法缩小帧 {name}: {e}")
+                continue
+        names.append(os.path.basename(name))
+        fragments.append(frame_fragment(image_bytes))
+    return key, names, fragments
+
+
+def encode_image_entry(args):
+    """图片 -> (key, [文件名], [image_url 片段]); 与 concurrent_test_image.py 相同的 resize 和编码"""
+    data_dir, key, image_size = args
+    try:
+        image_bytes = encode_image_file(os.path.join(data_dir, key), image_size)
+    except Exception as e:
+        print(f"警告: 无法处理图片 {key}: {e}")
+        return key, [], []
+    return key, [os.path.basename(key)], [frame_fragment(image_bytes)]
+
+
+def build_wire(data_dir, mode, image_size, per_shard, workers, max_pixels=0):
+    """生成到临时目录再替换旧目录, 返回 (输出目录, 条目数, 片段数, 字节数)"""
+    params = wire_params(mode, image_size, max_pixels=max_pixels)
+    output = wire_dir(data_dir, mode, params)
+    if mode == "frames":
+        tasks = [(data_dir, key, max_pixels) for key in discover_frame_dirs(data_dir)]
+        func = encode_frames_entry
+    else:
+        keys = [os.path.relpath(p, data_dir) for p in discover_image_files(data_dir)]
+        tasks = [(data_dir, key, image_size) for key in keys]
+        func = encode_image_entry
+
+    tmp = f"{output}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    writer = ShardWriter(tmp, per_shard)
+    entries = fragments = 0
+    # 按分片大小分批提交, 主进程按输入顺序写分片, 内存中最多保留约两个分片的数据
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        for start in range(0, len(tasks), per_shard):
+            batch = tasks[start:start + per_shard]
+            chunksize = max(1, len(batch) // ((workers or os.cpu_count() or 1) * 4))
+            for key, names, encoded in pool.map(func, batch, chunksize=chunksize):
+                if not encoded:
+                    continue
+                writer.add(key, names, encoded)
+                entries += 1
+                fragments += len(encoded)
+            print(f"已处理 {min(start + per_shard, len(tasks))}/{len(tasks)} 个条目")
+    writer.flush()
+
+    old = f"{output}.old{os.getpid()}"
+    if os.path.exists(output):
+        os.rename(output, old)
+    os.rename(tmp, output)
+    shutil.rmtree(old, ignore_errors=True)
+    return output, entries, fragments, writer.bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成压测用的预编码 (base64 image_url 片段) 数据")
+    parser.add_argument("--data_dir", default="processed_videos_512_512", help="数据根目录")
+    parser.add_argument("--mode", choices=("frames", "images"), default="frames",
+                        help="frames: 帧数据集 (类别/视频名/ 或分片); images: 递归查找图片")
+    parser.add_argument("--image_size", default="1024x1024",
+                        help="images 模式的 resize 尺寸, 需与压测的 VLM_IMAGE_SIZE 一致 (默认: 1024x1024)")
+    parser.add_argument("--max_pixels", default="0",
+                        help="frames 模式的每帧像素上限, 逗号分隔时每个值各生成一份, 需与 VLM_GRID_PIXELS 一致 "
+                             "(默认: 0, 即原图)")
+    parser.add_argument("--per_shard", type=int, default=256, help="每个分片文件的条目数 (默认: 256)")
+    parser.add_argument("--workers", type=int, default=0, help="进程数 (默认: 0, 即CPU核数)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"错误: 目录 {args.data_dir} 不存在")
+        sys.exit(1)
+    image_size = tuple(int(v) for v in args.image_size.lower().split("x"))
+
+    budgets = [int(v) for v in args.max_pixels.split(",") if v.strip()] or [0]
+    if args.mode != "frames":
+        budgets = [0]
+
+    for max_pixels in budgets:
+        started = time.time()
+        output, entries, fragments, total_bytes = build_wire(args.data_dir, args.mode, image_size,
+                                                             args.per_shard, args.workers, max_pixels)
+        print(f"预编码数据已保存到: {output}" + (f" (每帧像素上限 {max_pixels})" if max_pixels else ""))
+        print(f"  {entries} 个条目, {fragments} 个片段, {total_bytes / (1024 * 1024):.1f}MB, "
+              f"耗时 {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
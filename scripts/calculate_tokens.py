@@ -1,151 +1,300 @@
 #!/usr/bin/env python3
 """
-计算 processed_videos 中每个视频的平均输入token数量
+计算数据集中每个请求的输入token数量 (按 Qwen2.5-VL 处理器的规则精确计算)
+
+- 图像: 按 Qwen2.5-VL 的 smart_resize 把宽高取整到28像素(14像素patch经2x2合并)的倍数,
+  并限制在 [min_pixels, max_pixels] 内; 每张图 token 数 = (高/28) × (宽/28),
+  另加 <|vision_start|> / <|vision_end|> 两个token;
+- 视频(--as_video): 整个帧目录作为一个 --frames_fps 帧率的视频输入, 与 qwen_vl_utils 的 fetch_video
+  相同: 先按 smart_nframes 以 --sample_fps 抽取偶数帧, 再以 max(min(VIDEO_MAX_PIXELS, total_pixels/帧数×2),
+  int(min_pixels×1.05)) (不超过 --video_max_pixels) 作为每帧像素上限; 相邻两帧合并为一个时间patch,
+  token 数 = 帧数/2 × (高/28) × (宽/28) + 2;
+- 文本: 按 Qwen2.5 的对话模板(含默认system prompt)渲染后计数; 指定 --tokenizer
+  (本地 tokenizer.json 或其所在目录, 需安装 tokenizers) 时为精确值, 否则按 4字符≈1token 估算。
+
+默认分析整个数据集: 由 dataset_scan.py 并行读取所有帧的文件头获取尺寸, 再用 numpy 一次性向量化计算。
+
+用法:
+    python scripts/calculate_tokens.py --video_dir processed_videos \\
+        --tokenizer /models/Qwen2.5-VL-7B-Instruct
+    python scripts/calculate_tokens.py --mode images --data_dir cc_ocr_data --resize 1024x1024
 """
 
 import os
-import glob
 import json
-import base64
+import math
+import random
 import argparse
-from pathlib import Path
-from PIL import Image
-import requests
 import statistics
+import time
 
-def count_text_tokens(text, model_name="Qwen2.5-VL"):
-    """估算文本token数量（简单估算：1个token约4个字符）"""
-    return len(text) // 4 + 1
-
-def get_image_info(image_path):
-    """获取图像信息"""
-    try:
-        with Image.open(image_path) as img:
-            return {
-                "width": img.width,
-                "height": img.height,
-                "size": os.path.getsize(image_path)
-            }
-    except Exception as e:
-        return None
+import numpy as np
 
-def estimate_image_tokens(width, height):
-    """估算图像token数量（基于Qwen2.5-VL的压缩机制）"""
-    # Qwen2.5-VL使用Vision Transformer，通常将图像分成patches
-    # 估算公式：(width/patch_size) * (height/patch_size) * compression_ratio
-    patch_size = 14  # 常见的patch大小
-    compression_ratio = 0.3  # 经验压缩比
-    
-    patches_w = width // patch_size
-    patches_h = height // patch_size
-    base_tokens = patches_w * patches_h * compression_ratio
-    
-    # 添加特殊token（CLS, SEP等）
-    return int(base_tokens + 10)
-
-def calculate_video_tokens(video_dir, prompt_text):
-    """计算单个视频的token数量"""
-    frame_files = sorted(glob.glob(os.path.join(video_dir, "*.jpg")))
-    
-    if not frame_files:
-        return None
-    
-    # 文本token
-    text_tokens = count_text_tokens(prompt_text)
-    
-    # 图像token
-    image_tokens = 0
-    valid_frames = 0
-    
-    for frame_file in frame_files:
-        img_info = get_image_info(frame_file)
-        if img_info:
-            tokens = estimate_image_tokens(img_info["width"], img_info["height"])
-            image_tokens += tokens
-            valid_frames += 1
-    
-    if valid_frames == 0:
+from dataset_scan import (list_images, list_video_dirs, print_histogram, scan_frames, scan_image_files,
+                          scanned_from_manifest, scanned_from_shards)
+
+PATCH_SIZE = 14
+MERGE_SIZE = 2
+TEMPORAL_PATCH_SIZE = 2
+FACTOR = PATCH_SIZE * MERGE_SIZE
+# Qwen2.5-VL preprocessor_config.json
+IMAGE_MIN_PIXELS = 56 * 56
+IMAGE_MAX_PIXELS = 28 * 28 * 16384
+# qwen_vl_utils 的视频默认值
+VIDEO_MIN_PIXELS = 128 * 28 * 28
+VIDEO_MAX_PIXELS = 768 * 28 * 28
+VIDEO_TOTAL_PIXELS = 24576 * 28 * 28
+FPS = 2.0
+FPS_MIN_FRAMES = 4
+FPS_MAX_FRAMES = 768
+VISION_SPECIAL_TOKENS = 2
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+IMAGE_PLACEHOLDER = "<|vision_start|><|image_pad|><|vision_end|>"
+VIDEO_PLACEHOLDER = "<|vision_start|><|video_pad|><|vision_end|>"
+# 无tokenizer时模板部分的token数: <|im_start|>system\n You are a helpful assistant.<|im_end|>\n
+# <|im_start|>user\n ... <|im_end|>\n<|im_start|>assistant\n
+TEMPLATE_TOKENS = 19
+
+
+def smart_resize(height, width, factor=FACTOR, min_pixels=IMAGE_MIN_PIXELS, max_pixels=IMAGE_MAX_PIXELS):
+    """Qwen2.5-VL smart_resize 的向量化版本; 输入/输出为数组 (高, 宽)"""
+    h = np.asarray(height, dtype=np.float64)
+    w = np.asarray(width, dtype=np.float64)
+    min_pixels = np.asarray(min_pixels, dtype=np.float64)
+    max_pixels = np.asarray(max_pixels, dtype=np.float64)
+    h_bar = np.maximum(factor, np.round(h / factor) * factor)
+    w_bar = np.maximum(factor, np.round(w / factor) * factor)
+
+    too_big = h_bar * w_bar > max_pixels
+    beta = np.sqrt(h * w / max_pixels)
+    h_big = np.maximum(factor, np.floor(h / beta / factor) * factor)
+    w_big = np.maximum(factor, np.floor(w / beta / factor) * factor)
+
+    too_small = h_bar * w_bar < min_pixels
+    beta = np.sqrt(min_pixels / (h * w))
+    h_small = np.ceil(h * beta / factor) * factor
+    w_small = np.ceil(w * beta / factor) * factor
+
+    h_bar = np.where(too_big, h_big, np.where(too_small, h_small, h_bar))
+    w_bar = np.where(too_big, w_big, np.where(too_small, w_small, w_bar))
+    return h_bar.astype(np.int64), w_bar.astype(np.int64)
+
+
+def image_tokens(height, width, min_pixels=IMAGE_MIN_PIXELS, max_pixels=IMAGE_MAX_PIXELS):
+    """每张图像的视觉token数(不含 vision_start/end)"""
+    h_bar, w_bar = smart_resize(height, width, min_pixels=min_pixels, max_pixels=max_pixels)
+    return (h_bar // FACTOR) * (w_bar // FACTOR)
+
+
+def smart_nframes(total_frames, video_fps=FPS, fps=FPS, min_frames=FPS_MIN_FRAMES, max_frames=FPS_MAX_FRAMES):
+    """qwen_vl_utils smart_nframes 的向量化版本: 以 fps 从 total_frames 帧 (帧率 video_fps) 中抽取的偶数帧数"""
+    total = np.asarray(total_frames, dtype=np.float64)
+    min_frames = math.ceil(min_frames / TEMPORAL_PATCH_SIZE) * TEMPORAL_PATCH_SIZE
+    max_frames = np.floor(np.minimum(max_frames, total) / TEMPORAL_PATCH_SIZE) * TEMPORAL_PATCH_SIZE
+    nframes = np.minimum(np.minimum(np.maximum(total / video_fps * fps, min_frames), max_frames), total)
+    # 少于2帧时 qwen_vl_utils 会报错, 这里按2帧计算
+    nframes = np.floor(nframes / TEMPORAL_PATCH_SIZE) * TEMPORAL_PATCH_SIZE
+    return np.maximum(TEMPORAL_PATCH_SIZE, nframes).astype(np.int64)
+
+
+def video_tokens(height, width, nframes, min_pixels=VIDEO_MIN_PIXELS, max_pixels=VIDEO_MAX_PIXELS,
+                 total_pixels=VIDEO_TOTAL_PIXELS):
+    """每个视频的视觉token数(不含 vision_start/end); nframes 为 smart_nframes 抽取后的帧数。
+
+    每帧像素上限与 qwen_vl_utils fetch_video 相同, 随帧数收缩, 且不超过请求的 max_pixels。
+    """
+    nframes = np.asarray(nframes, dtype=np.int64)
+    frame_max = np.maximum(np.minimum(VIDEO_MAX_PIXELS, total_pixels / nframes * TEMPORAL_PATCH_SIZE),
+                           int(min_pixels * 1.05))
+    frame_max = np.minimum(max_pixels, frame_max)
+    h_bar, w_bar = smart_resize(height, width, min_pixels=min_pixels, max_pixels=frame_max)
+    return (nframes // TEMPORAL_PATCH_SIZE) * (h_bar // FACTOR) * (w_bar // FACTOR)
+
+
+class TextCounter:
+    """渲染对话模板后计数文本token; 有本地tokenizer时精确, 否则估算"""
+
+    def __init__(self, tokenizer_path=None, system_prompt=DEFAULT_SYSTEM_PROMPT):
+        self.system_prompt = system_prompt
+        self.tokenizer = None
+        if tokenizer_path:
+            if os.path.isdir(tokenizer_path):
+                tokenizer_path = os.path.join(tokenizer_path, "tokenizer.json")
+            try:
+                from tokenizers import Tokenizer
+                self.tokenizer = Tokenizer.from_file(tokenizer_path)
+            except ImportError:
+                print("警告: 未安装 tokenizers (pip install tokenizers), 文本token改为估算")
+            except Exception as e:
+                print(f"警告: 无法加载 tokenizer {tokenizer_path}: {e}, 文本token改为估算")
+        self.exact = self.tokenizer is not None
+        self._cache = {}
+
+    def count(self, prompt_text, n_images, as_video=False):
+        """对话模板+文本+每个视觉输入的 vision_start/end 的token数(视觉pad token另算)"""
+        key = (prompt_text, n_images, as_video)
+        if key not in self._cache:
+            if self.exact:
+                vision = VIDEO_PLACEHOLDER if as_video else IMAGE_PLACEHOLDER * n_images
+                rendered = (f"<|im_start|>system\n{self.system_prompt}<|im_end|>\n"
+                            f"<|im_start|>user\n{prompt_text}{vision}<|im_end|>\n<|im_start|>assistant\n")
+                # 占位符中的 <|image_pad|>/<|video_pad|> 由视觉token数替换, 这里先减掉
+                pads = 1 if as_video else n_images
+                self._cache[key] = len(self.tokenizer.encode(rendered, add_special_tokens=False).ids) - pads
+            else:
+                items = 1 if as_video else n_images
+                self._cache[key] = (TEMPLATE_TOKENS + len(prompt_text) // 4 + 1
+                                    + items * VISION_SPECIAL_TOKENS)
+        return self._cache[key]
+
+
+def analyze(scanned, args, text_counter):
+    """对扫描结果 [(路径, 帧数, [(宽, 高)])] 向量化计算每个请求的token数"""
+    counts = [len(sizes) for _, _, sizes in scanned]
+    if not sum(counts):
+        return []
+    sizes = np.asarray([s for _, _, group in scanned for s in group], dtype=np.int64)
+    owner = np.repeat(np.arange(len(scanned)), counts)
+    width, height = sizes[:, 0], sizes[:, 1]
+    if args.resize:
+        width = np.full_like(width, args.resize[0])
+        height = np.full_like(height, args.resize[1])
+
+    frame_counts = np.array([n for _, n, _ in scanned], dtype=np.int64)
+    if args.as_video:
+        sampled = smart_nframes(frame_counts, args.frames_fps, args.sample_fps)
+        per_item = video_tokens(height, width, sampled[owner],
+                                args.video_min_pixels, args.video_max_pixels, args.video_total_pixels)
+        valid = np.where(np.bincount(owner, minlength=len(scanned)) > 0, sampled, 0)
+    else:
+        per_item = image_tokens(height, width, args.min_pixels, args.max_pixels)
+        valid = np.bincount(owner, minlength=len(scanned))
+    vision = np.bincount(owner, weights=per_item, minlength=len(scanned)).astype(np.int64)
+
+    results = []
+    for g, (path, _, _) in enumerate(scanned):
+        if not valid[g]:
+            continue
+        n = int(valid[g])
+        text = text_counter.count(args.prompt, n, args.as_video)
+        results.append({
+            "video_dir": path,
+            "num_frames": n,
+            "text_tokens": text,
+            "image_tokens": int(vision[g]),
+            "total_tokens": text + int(vision[g]),
+            "avg_tokens_per_frame": int(vision[g]) / n,
+        })
+    return results
+
+
+def parse_size(text):
+    if not text:
         return None
-    
-    return {
-        "video_dir": video_dir,
-        "num_frames": valid_frames,
-        "text_tokens": text_tokens,
-        "image_tokens": image_tokens,
-        "total_tokens": text_tokens + image_tokens,
-        "avg_tokens_per_frame": image_tokens / valid_frames if valid_frames > 0 else 0
-    }
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
 
 def main():
-    parser = argparse.ArgumentParser(description="计算processed_videos中每个视频的token数量")
-    parser.add_argument("--video_dir", type=str, default="processed_videos",
-                       help="预处理视频目录 (默认: processed_videos)")
-    parser.add_argument("--prompt", type=str, 
-                       default="Please describe the content of the video.",
-                       help="输入提示文本")
-    parser.add_argument("--sample_size", type=int, default=50,
-                       help="采样视频数量 (默认: 50, 0表示全部)")
+    parser = argparse.ArgumentParser(description="按Qwen2.5-VL规则计算数据集每个请求的输入token数量")
+    parser.add_argument("--video_dir", "--data_dir", dest="data_dir", type=str, default="processed_videos",
+                        help="数据目录: frames模式为 类别/视频名/*.jpg, images模式为图片目录 (默认: processed_videos)")
+    parser.add_argument("--mode", choices=("frames", "images"), default="frames",
+                        help="frames: 每个帧目录一个请求(每帧一张图); images: 每张图片一个请求")
+    parser.add_argument("--as_video", action="store_true",
+                        help="frames模式下把帧目录作为一个视频输入计算(时间patch)")
+    parser.add_argument("--prompt", type=str,
+                        default="Please describe the content of the video.",
+                        help="输入提示文本")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="本地 tokenizer.json 或模型目录, 用于精确计算文本token")
+    parser.add_argument("--resize", type=parse_size, default=None,
+                        help="客户端发送前的缩放尺寸 宽x高 (如 image 压测的 1024x1024)")
+    parser.add_argument("--min_pixels", type=int, default=IMAGE_MIN_PIXELS, help="服务端图像 min_pixels")
+    parser.add_argument("--max_pixels", type=int, default=IMAGE_MAX_PIXELS, help="服务端图像 max_pixels")
+    parser.add_argument("--video_min_pixels", type=int, default=VIDEO_MIN_PIXELS, help="视频每帧 min_pixels")
+    parser.add_argument("--video_max_pixels", type=int, default=VIDEO_MAX_PIXELS, help="视频每帧 max_pixels")
+    parser.add_argument("--video_total_pixels", type=int, default=VIDEO_TOTAL_PIXELS, help="视频所有帧的总像素上限")
+    parser.add_argument("--frames_fps", type=float, default=FPS,
+                        help="帧目录的抽帧帧率, 与 preprocess_videos_simple.py 的 --video_fps 一致 (默认: 2.0)")
+    parser.add_argument("--sample_fps", type=float, default=FPS,
+                        help="--as_video 时 qwen_vl_utils 按此 fps 抽帧 (请求中视频的 fps, 默认: 2.0)")
+    parser.add_argument("--max_tokens", type=int, default=200,
+                        help="请求的输出 max_tokens, 用于推荐 --max-model-len (默认: 200)")
+    parser.add_argument("--sample_size", type=int, default=0,
+                        help="随机采样请求数量 (默认: 0, 分析全部)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="扫描进程数 (默认: 0, 即CPU核数; 1表示不用进程池)")
+    parser.add_argument("--no_manifest", action="store_true",
+                        help="忽略数据目录下的 manifest.json, 重新扫描文件头")
+    parser.add_argument("--bins", type=int, default=10, help="直方图区间数 (默认: 10)")
     parser.add_argument("--output", type=str, default="token_analysis.json",
-                       help="输出文件名 (默认: token_analysis.json)")
-    
+                        help="输出文件名 (默认: token_analysis.json)")
+
     args = parser.parse_args()
-    
-    if not os.path.exists(args.video_dir):
-        print(f"错误: 目录 {args.video_dir} 不存在")
-        return
-    
-    # 收集所有视频目录
-    video_dirs = []
-    for category in os.listdir(args.video_dir):
-        category_path = os.path.join(args.video_dir, category)
-        if os.path.isdir(category_path):
-            for video_name in os.listdir(category_path):
-                video_path = os.path.join(category_path, video_name)
-                if os.path.isdir(video_path):
-                    video_dirs.append(video_path)
-    
-    print(f"找到 {len(video_dirs)} 个视频目录")
-    
-    if not video_dirs:
-        print("没有找到视频目录")
+
+    if not os.path.exists(args.data_dir):
+        print(f"错误: 目录 {args.data_dir} 不存在")
         return
-    
-    # 采样
-    if args.sample_size > 0 and len(video_dirs) > args.sample_size:
-        import random
-        video_dirs = random.sample(video_dirs, args.sample_size)
-        print(f"随机采样 {len(video_dirs)} 个视频进行分析")
-    
-    # 分析每个视频
-    results = []
-    total_tokens = []
-    frame_counts = []
-    
+
+    text_counter = TextCounter(args.tokenizer)
+    started = time.time()
+    scanned = None if args.no_manifest else scanned_from_manifest(args.data_dir, args.mode, args.as_video)
+    if scanned is not None:
+        print(f"使用清单: {len(scanned)} 个{'视频目录' if args.mode == 'frames' else '图片'}")
+    elif args.mode == "frames":
+        scanned = scanned_from_shards(args.data_dir, args.workers, first_only=args.as_video)
+        if scanned is not None:
+            print(f"读取分片: {len(scanned)} 个视频")
+    if scanned is not None:
+        if args.sample_size > 0 and len(scanned) > args.sample_size:
+            scanned = random.sample(scanned, args.sample_size)
+            print(f"随机采样 {len(scanned)} 个请求进行分析")
+    else:
+        paths = list_video_dirs(args.data_dir) if args.mode == "frames" else list_images(args.data_dir)
+        print(f"找到 {len(paths)} 个{'视频目录' if args.mode == 'frames' else '图片'}")
+        if not paths:
+            print("没有找到可分析的数据")
+            return
+
+        # 采样
+        if args.sample_size > 0 and len(paths) > args.sample_size:
+            paths = random.sample(paths, args.sample_size)
+            print(f"随机采样 {len(paths)} 个请求进行分析")
+
+        print("开始扫描...")
+        if args.mode == "frames":
+            scanned = scan_frames(paths, args.workers, first_only=args.as_video)
+        else:
+            scanned = scan_image_files(paths, args.workers)
+    print(f"扫描完成: {len(scanned)} 个请求, {sum(len(s) for _, _, s in scanned)} 个文件头, "
+          f"耗时 {time.time() - started:.1f}s")
     print("开始分析...")
-    for i, video_dir in enumerate(video_dirs):
-        result = calculate_video_tokens(video_dir, args.prompt)
-        if result:
-            results.append(result)
-            total_tokens.append(result["total_tokens"])
-            frame_counts.append(result["num_frames"])
-            
-            if (i + 1) % 10 == 0:
-                print(f"已处理 {i+1}/{len(video_dirs)} 个视频")
-    
+    results = analyze(scanned, args, text_counter)
     if not results:
         print("没有成功分析的视频")
         return
-    
-    # 统计分析
+
+    total_tokens = [r["total_tokens"] for r in results]
+    frame_counts = [r["num_frames"] for r in results]
+    per_frame = [r["avg_tokens_per_frame"] for r in results]
     stats = {
         "total_videos": len(results),
+        "mode": "video" if args.as_video else args.mode,
         "prompt_text": args.prompt,
         "text_tokens": results[0]["text_tokens"],
+        "text_tokens_exact": text_counter.exact,
+        "pixel_limits": {
+            "min_pixels": args.video_min_pixels if args.as_video else args.min_pixels,
+            "max_pixels": args.video_max_pixels if args.as_video else args.max_pixels,
+            "resize": list(args.resize) if args.resize else None,
+        },
         "token_statistics": {
             "min_tokens": min(total_tokens),
             "max_tokens": max(total_tokens),
             "avg_tokens": statistics.mean(total_tokens),
             "median_tokens": statistics.median(total_tokens),
+            "p99_tokens": float(np.percentile(total_tokens, 99)),
             "std_tokens": statistics.stdev(total_tokens) if len(total_tokens) > 1 else 0
         },
         "frame_statistics": {
@@ -154,39 +303,58 @@ def main():
             "avg_frames": statistics.mean(frame_counts),
             "median_frames": statistics.median(frame_counts)
         },
+        "tokens_per_frame": {
+            "min": min(per_frame),
+            "max": max(per_frame),
+            "avg": statistics.mean(per_frame),
+        },
         "detailed_results": results[:10]  # 只保存前10个详细结果
     }
-    
+
     # 输出结果
     print("\n" + "="*60)
     print("TOKEN 分析结果")
     print("="*60)
     print(f"分析视频数量: {stats['total_videos']}")
     print(f"提示文本: '{stats['prompt_text']}'")
-    print(f"文本tokens: {stats['text_tokens']}")
+    print(f"文本tokens(含对话模板): {stats['text_tokens']}"
+          + ("" if text_counter.exact else " (估算, 指定 --tokenizer 可精确计算)"))
     print("\nToken统计:")
     print(f"  最小tokens: {stats['token_statistics']['min_tokens']}")
     print(f"  最大tokens: {stats['token_statistics']['max_tokens']}")
     print(f"  平均tokens: {stats['token_statistics']['avg_tokens']:.1f}")
     print(f"  中位数tokens: {stats['token_statistics']['median_tokens']:.1f}")
+    print(f"  p99 tokens: {stats['token_statistics']['p99_tokens']:.1f}")
     print(f"  标准差: {stats['token_statistics']['std_tokens']:.1f}")
+    print(f"  每帧视觉tokens: 平均 {stats['tokens_per_frame']['avg']:.1f}, "
+          f"范围 {stats['tokens_per_frame']['min']:.0f}-{stats['tokens_per_frame']['max']:.0f}")
     print("\n帧数统计:")
     print(f"  最小帧数: {stats['frame_statistics']['min_frames']}")
     print(f"  最大帧数: {stats['frame_statistics']['max_frames']}")
     print(f"  平均帧数: {stats['frame_statistics']['avg_frames']:.1f}")
     print(f"  中位数帧数: {stats['frame_statistics']['median_frames']:.1f}")
-    
-    # 推荐配置
-    recommended_max_len = int(stats['token_statistics']['avg_tokens'] * 1.5)
+
+    stats["histograms"] = {
+        "total_tokens": print_histogram(np.array(total_tokens), "每请求输入tokens分布", bins=args.bins),
+        "frames": print_histogram(np.array(frame_counts), "每请求帧数分布", bins=args.bins),
+    }
+
+    # 推荐配置: 最长请求 + 输出token, 向上取整到1024
+    needed = stats['token_statistics']['max_tokens'] + args.max_tokens
+    recommended_max_len = int(math.ceil(needed / 1024) * 1024)
+    stats["recommended"] = {"max_model_len": recommended_max_len}
     print(f"\n推荐配置:")
-    print(f"  --max-model-len {recommended_max_len}")
+    print(f"  --max-model-len {recommended_max_len}  (最长输入 {stats['token_statistics']['max_tokens']} + 输出 {args.max_tokens})")
+    if not args.as_video:
+        stats["recommended"]["limit_mm_per_prompt_image"] = stats['frame_statistics']['max_frames']
+        print(f"  --limit-mm-per-prompt.image {stats['frame_statistics']['max_frames']}")
     print("="*60)
-    
+
     # 保存详细结果
     with open(args.output, 'w', encoding='utf-8') as f:
         json.dump(stats, f, ensure_ascii=False, indent=2)
-    
+
     print(f"\n详细结果已保存到: {args.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
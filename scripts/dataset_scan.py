@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+数据集快速扫描: os.scandir 遍历目录 + 只解析 JPEG/PNG 文件头读取宽高 + 进程池并行
+
+逐帧用 PIL 打开、逐目录 glob 在十万帧级别的数据集上要几分钟; 这里每个文件只读几百字节的文件头,
+视频目录(或图片批次)分发到进程池, 整个数据集几秒内扫完。
+calculate_tokens.py、analyze_video_frames.py 和 build_manifest.py 共用本模块;
+数据目录下有 manifest.json (见 build_manifest.py) 时分析脚本直接读取清单, 不再扫描;
+打包成分片的帧数据集 (preprocess_videos_simple.py --pack) 按分片 mmap 读取帧数据头。
+"""
+
+import io
+import os
+import sys
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+FRAME_EXTENSIONS = (".jpg",)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# SOF0-SOF15, 不含 DHT(C4) / JPG(C8) / DAC(CC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_IMAGES_PER_TASK = 2048
+
+
+def _jpeg_size(f):
+    """沿 JPEG 段标记跳到 SOF 段读取 (宽, 高)"""
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue
+        if marker in (0xD9, 0xDA):
+            return None
+        header = f.read(2)
+        if len(header) < 2:
+            return None
+        length = struct.unpack(">H", header)[0]
+        if marker in _SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">xHH", data)
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _header_size(f):
+    """从 JPEG/PNG 文件头读取 (宽, 高), 无法识别时返回 None"""
+    head = f.read(24)
+    if head[:2] == b"\xff\xd8":
+        f.seek(2)
+        return _jpeg_size(f)
+    if head[:8] == _PNG_SIGNATURE and head[12:16] == b"IHDR":
+        return struct.unpack(">II", head[16:24])
+    return None
+
+
+def read_image_size(path):
+    """只读文件头获取 (宽, 高); 非 JPEG/PNG 时退回 PIL, 失败返回 None"""
+    try:
+        with open(path, "rb") as f:
+            size = _header_size(f)
+            if size is not None:
+                return size
+    except OSError:
+        return None
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def image_size_from_bytes(data):
+    """内存中(如分片 mmap 切片)图片数据的 (宽, 高), 与 read_image_size 相同的解析方式"""
+    size = _header_size(io.BytesIO(data))
+    if size is not None:
+        return size
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def list_files(path, extensions):
+    """目录下(不递归)指定扩展名的文件, 按名称排序"""
+    try:
+        with os.scandir(path) as it:
+            names = [e.name for e in it if e.is_file() and e.name.lower().endswith(extensions)]
+    except OSError:
+        return []
+    return [os.path.join(path, n) for n in sorted(names)]
+
+
+def _artifact_dir_check():
+    """判断数据根目录下的分片/预编码数据目录 (shards/、wire/、隐藏目录) 的函数, 这些不是类别目录"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    from frame_shards import is_artifact_dir
+    return is_artifact_dir
+
+
+def list_video_dirs(data_dir):
+    """data_dir 下所有 类别/视频名/ 目录, 按名称排序 (跳过 shards/、wire/ 等数据产物目录)"""
+    is_artifact_dir = _artifact_dir_check()
+    video_dirs = []
+    with os.scandir(data_dir) as categories:
+        categories = [e for e in categories if e.is_dir() and not is_artifact_dir(e.name)]
+        for category in sorted(categories, key=lambda e: e.name):
+            with os.scandir(category.path) as videos:
+                video_dirs.extend(sorted(e.path for e in videos if e.is_dir()))
+    return video_dirs
+
+
+def list_images(data_dir):
+    """data_dir 下(递归)所有图片文件, 按路径排序 (跳过根目录下的数据产物目录)"""
+    is_artifact_dir = _artifact_dir_check()
+    files = []
+    stack = [data_dir]
+    while stack:
+        path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    if e.is_dir():
+                        if path != data_dir or not is_artifact_dir(e.name):
+                            stack.append(e.path)
+                    elif e.name.lower().endswith(IMAGE_EXTENSIONS):
+                        files.append(e.path)
+        except OSError:
+            continue
+    return sorted(files)
+
+
+def scan_video_dir(args):
+    """(目录, 帧数, [(宽, 高)]); sizes=False 或 first_only=True 时只读0或1帧的文件头"""
+    video_dir, sizes, first_only = args
+    frames = list_files(video_dir, FRAME_EXTENSIONS)
+    if not sizes:
+        return video_dir, len(frames), []
+    read = frames[:1] if first_only else frames
+    return video_dir, len(frames), [s for s in map(read_image_size, read) if s is not None]
+
+
+def scan_images(paths):
+    return [(p, 1, [s]) for p, s in zip(paths, map(read_image_size, paths)) if s is not None]
+
+
+def pool_map(func, tasks, workers):
+    if workers == 1 or len(tasks) <= 1:
+        return [func(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 8))
+        return list(pool.map(func, tasks, chunksize=chunksize))
+
+
+def scan_frames(video_dirs, workers=0, sizes=True, first_only=False):
+    """并行扫描帧目录, 返回 [(目录, 帧数, [(宽, 高)])], 保持输入顺序, 跳过空目录; workers=0 表示CPU核数"""
+    results = pool_map(scan_video_dir, [(d, sizes, first_only) for d in video_dirs], workers)
+    return [r for r in results if r[1]]
+
+
+def scan_image_files(paths, workers=0):
+    """并行读取图片文件头, 返回 [(路径, 1, [(宽, 高)])], 跳过无法识别的文件"""
+    batches = [paths[i:i + _IMAGES_PER_TASK] for i in range(0, len(paths), _IMAGES_PER_TASK)]
+    return [r for batch in pool_map(scan_images, batches, workers) for r in batch]
+
+
+def scanned_from_manifest(data_dir, mode="frames", first_only=False):
+    """从 data_dir 的清单得到与 scan_frames/scan_image_files 相同格式的结果; 没有可用清单时返回 None"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    from dataset_manifest import load_manifest
+
+    manifest = load_manifest(data_dir, mode)
+    if manifest is None:
+        return None
+    scanned = []
+    for entry in manifest.entries:
+        sizes = [tuple(s) for s in entry["sizes"]]
+        scanned.append((os.path.join(data_dir, entry["key"]), len(sizes), sizes[:1] if first_only else sizes))
+    return scanned
+
+
+def scan_shard(args):
+    """一个分片文件中每个视频的 (目录, 帧数, [(宽, 高)]), 直接解析 mmap 中的帧数据头"""
+    data_dir, path, sizes, first_only = args
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    from frame_shards import ShardReader
+
+    reader = ShardReader(path)
+    scanned = []
+    for key in reader.keys:
+        frames = reader.frames(key)
+        read = (frames[:1] if first_only else frames) if sizes else []
+        scanned.append((os.path.join(data_dir, key), len(frames),
+                        [s for s in map(image_size_from_bytes, read) if s is not None]))
+    return scanned
+
+
+def scanned_from_shards(data_dir, workers=0, sizes=True, first_only=False):
+    """打包数据集(preprocess_videos_simple.py --pack)的扫描结果, 格式同 scan_frames; 没有分片时返回 None"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+    from frame_shards import shard_paths
+
+    paths = shard_paths(data_dir)
+    if not paths:
+        return None
+    # 同一视频出现在多个分片时以后写入的为准, 顺序按首次出现, 与 frame_shards.ShardSet 一致
+    latest = {}
+    for shard in pool_map(scan_shard, [(data_dir, p, sizes, first_only) for p in paths], workers):
+        for result in shard:
+            latest[result[0]] = result
+    return [r for r in latest.values() if r[1]]
+
+
+def print_histogram(values, title, bins=10, width=40):
+    """按等宽区间打印文本直方图, 返回 [(下界, 上界, 数量)]"""
+    import numpy as np
+
+    values = np.asarray(values)
+    if not len(values):
+        return []
+    lo, hi = values.min(), values.max()
+    integer = np.issubdtype(values.dtype, np.integer)
+    if integer:
+        bins = min(bins, int(hi - lo) + 1)
+    counts, edges = np.histogram(values, bins=bins, range=(lo, hi + 1) if integer else None)
+    rows = []
+    peak = counts.max() or 1
+    print(f"\n{title}:")
+    for i, n in enumerate(counts):
+        low, high = edges[i], edges[i + 1]
+        if integer:
+            low, high = int(np.ceil(low)), int(np.ceil(high)) - 1
+            if high < low:
+                continue
+            label = f"{low}" if low == high else f"{low}-{high}"
+        else:
+            label = f"{low:.0f}-{high:.0f}"
+        print(f"  {label:>15} | {'#' * int(round(n / peak * width)):<{width}} {n}")
+        rows.append((float(low), float(high), int(n)))
+    return rows
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+输入尺寸网格压测结果分析: 帧数 × 像素预算 × prompt长度 的延迟/吞吐曲面
+
+配合 VLM_GRID=1 的 concurrent_test_frames.py 使用: 每个请求按所属网格单元额外记录为
+GRID 类型的 `<name>:f<帧数>_p<像素>_w<词数>` 行。本脚本读取各并发的 results_<并发>_stats.csv
+中的这些行, 以及(如有) results_<并发>_trace*.jsonl 中每个单元的实际 prompt token 数,
+输出 grid_surface.csv, 并按并发打印 帧数×像素 的延迟与输入token吞吐表:
+- 单元的最大 prompt token 数是 --max-num-batched-tokens 至少要容纳的单请求长度;
+- 对比不同像素预算下的延迟和输入token吞吐, 决定客户端是否需要预先缩小图片。
+
+用法:
+    VLM_GRID=1 VLM_GRID_FRAMES=4,8,16 VLM_GRID_PIXELS=0,401408,200704 \\
+        python -m locust -f src/concurrent_test_frames.py -u 32 -r 32 -t 10m --headless --csv results_32 ...
+    python scripts/grid_surface.py --slo-ms 30000
+"""
+
+import os
+import re
+import sys
+import csv
+import glob
+import json
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from input_grid import GRID_REQUEST_TYPE, parse_cell_label  # noqa: E402
+
+SURFACE_FIELDS = [
+    "Concurrency", "Cell", "Frames", "Max Pixels", "Prompt Words", "Requests", "Failures", "Requests/s",
+    "Average (ms)", "p50 (ms)", "p90 (ms)", "p99 (ms)",
+    "Avg Prompt Tokens", "Max Prompt Tokens", "Input Tokens/s", "Meets SLO",
+]
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_cell_tokens(prefix):
+    """从追踪日志统计每个单元成功请求的 prompt token 数: {单元: (平均, 最大)}"""
+    tokens = defaultdict(list)
+    for path in glob.glob(prefix + "_trace*.jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("cell") and record.get("ok") and record.get("prompt_tokens"):
+                    tokens[record["cell"]].append(record["prompt_tokens"])
+    return {cell: (sum(v) / len(v), max(v)) for cell, v in tokens.items()}
+
+
+def load_surface(pattern, slo_ms):
+    rows = []
+    for file in glob.glob(pattern):
+        match = re.search(r'results_(\d+)_stats\.csv$', file)
+        if not match:
+            continue
+        concurrency = int(match.group(1))
+        cell_tokens = read_cell_tokens(file[:-len("_stats.csv")])
+        with open(file, newline="") as f:
+            for row in csv.DictReader(f):
+                if row.get("Type") != GRID_REQUEST_TYPE:
+                    continue
+                label = row["Name"].rsplit(":", 1)[-1]
+                cell = parse_cell_label(label)
+                if cell is None:
+                    continue
+                frames, pixels, words = cell
+                rps = _float(row.get("Requests/s")) or 0.0
+                avg_tokens, max_tokens = cell_tokens.get(label, (None, None))
+                p99 = _float(row.get("99%"))
+                rows.append({
+                    "Concurrency": concurrency,
+                    "Cell": label,
+                    "Frames": frames if frames is not None else "all",
+                    "Max Pixels": pixels or "original",
+                    "Prompt Words": words,
+                    "Requests": int(_float(row.get("Request Count")) or 0),
+                    "Failures": int(_float(row.get("Failure Count")) or 0),
+                    "Requests/s": rps,
+                    "Average (ms)": _float(row.get("Average Response Time")),
+                    "p50 (ms)": _float(row.get("50%")),
+                    "p90 (ms)": _float(row.get("90%")),
+                    "p99 (ms)": p99,
+                    "Avg Prompt Tokens": avg_tokens,
+                    "Max Prompt Tokens": max_tokens,
+                    "Input Tokens/s": rps * avg_tokens if avg_tokens is not None else None,
+                    "Meets SLO": "" if not slo_ms else ("yes" if p99 is not None and p99 <= slo_ms else "no"),
+                })
+    rows.sort(key=lambda r: (r["Concurrency"], r["Prompt Words"], str(r["Frames"]).zfill(6),
+                             str(r["Max Pixels"]).zfill(12)))
+    return rows
+
+
+def _fmt(value, digits=1):
+    if value is None:
+        return ""
+    return f"{value:.{digits}f}" if isinstance(value, float) else str(value)
+
+
+def write_surface(rows, output_file):
+    with open(output_file, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SURFACE_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: _fmt(v, 3 if k == "Requests/s" else 1) for k, v in row.items()})
+    print(f"曲面数据已保存到: {output_file}")
+
+
+def print_tables(rows):
+    """每个并发、每个prompt长度一张表: 行为帧数, 列为像素预算, 单元格为 p50秒 / 输入tok/s"""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row["Concurrency"], row["Prompt Words"])].append(row)
+    for (concurrency, words), group in sorted(groups.items()):
+        frames_values = sorted({r["Frames"] for r in group}, key=lambda v: str(v).zfill(6))
+        pixel_values = sorted({r["Max Pixels"] for r in group}, key=lambda v: str(v).zfill(12))
+        cells = {(r["Frames"], r["Max Pixels"]): r for r in group}
+        print(f"\n并发 {concurrency}, prompt {words or '默认'} 词: p50延迟(s) / 输入token吞吐(tok/s)")
+        print("帧数\\像素".ljust(10) + "".join(str(p).rjust(20) for p in pixel_values))
+        for frames in frames_values:
+            line = str(frames).ljust(10)
+            for pixels in pixel_values:
+                r = cells.get((frames, pixels))
+                if r is None or r["p50 (ms)"] is None:
+                    line += "-".rjust(20)
+                    continue
+                tps = f"{r['Input Tokens/s']:.0f}" if r["Input Tokens/s"] is not None else "-"
+                line += f"{r['p50 (ms)'] / 1000:.2f} / {tps}".rjust(20)
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分析 VLM_GRID 输入尺寸网格压测结果")
+    parser.add_argument("--pattern", default="results_*_stats.csv", help="stats.csv 文件匹配模式")
+    parser.add_argument("--slo-ms", type=float, default=0, help="p99延迟SLO(毫秒), 0表示不评估")
+    parser.add_argument("--output", default="grid_surface.csv", help="输出CSV")
+    args = parser.parse_args()
+
+    rows = load_surface(args.pattern, args.slo_ms)
+    if not rows:
+        print("未找到 GRID 类型的统计行, 请确认压测时设置了 VLM_GRID=1")
+        return
+    write_surface(rows, args.output)
+    print_tables(rows)
+
+    max_tokens = [r["Max Prompt Tokens"] for r in rows if r["Max Prompt Tokens"] is not None]
+    if max_tokens:
+        largest = max(rows, key=lambda r: r["Max Prompt Tokens"] or 0)
+        print(f"\n单请求最大 prompt token 数: {max(max_tokens)} (单元 {largest['Cell']}), "
+              f"--max-num-batched-tokens 至少应不小于该值")
+    else:
+        print("\n未找到追踪日志中的token数(需 --csv 并保留 results_<并发>_trace*.jsonl), 仅输出延迟与吞吐")
+    if args.slo_ms:
+        for concurrency in sorted({r["Concurrency"] for r in rows}):
+            ok = [r["Cell"] for r in rows if r["Concurrency"] == concurrency and r["Meets SLO"] == "yes"]
+            print(f"并发 {concurrency}: 满足 p99 ≤ {args.slo_ms:g} ms 的单元 {len(ok)} 个"
+                  + (f": {', '.join(ok)}" if ok else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,44 @@
 """
 简化的视频预处理脚本
 将 videos_directory 下的视频抽帧、resize、编码等预处理
+
+多进程流水线, 阶段之间用有界队列连接:
+- 解码进程: 按 qwen_vl_utils 的规则抽帧(只解码保留的帧)、resize, 转为 uint8 帧数组;
+- 编码进程: 帧数组 JPEG 编码并写盘。
+解码和编码各自占用独立进程, 不再争抢 GIL; 帧队列有上限, 解码快于编码时解码进程阻塞等待,
+同时在内存中的帧数组不超过 (解码进程数 + 队列深度 + 编码进程数) 个视频。
+结束时按阶段输出吞吐、利用率、峰值内存和内存上限估算。
+
+--pack N 时不再每帧写一个 frame_XXXX.jpg: 编码进程把 JPEG 数据交回主进程, 每 N 个视频写成
+<output_dir>/shards/ 下的一个分片文件(带偏移索引, 见 src/frame_shards.py), 压测脚本和分析脚本
+通过 mmap 读取, 省去海量小文件的 glob/open。已有的帧目录会直接打包进分片, 不再重新解码。
 """
 
+import io
 import os
-import math
+import time
+import queue
 import argparse
 import glob
-import gc
+import resource
+import multiprocessing as mp
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import numpy as np
 
 # 导入必要的库
-from qwen_vl_utils import process_vision_info
 from PIL import Image
-from PIL.Image import Image as ImageObject
+
+from build_manifest import build_manifest, write_manifest
+from dataset_manifest import MANIFEST_NAME
+from frame_shards import ShardReader, ShardWriter, shard_paths
+from video_preload import decode_video
 
 
 class VideoPreprocessor:
     """视频预处理器，复制LLaMA-Factory中的视频处理逻辑"""
-    
-    def __init__(self, 
+
+    def __init__(self,
                  video_max_pixels: int = 602112,  # 对应推理脚本中的video_max_pixels
                  video_min_pixels: int = 784,     # 16*16，最小像素数
                  video_fps: float = 2.0,          # 抽帧帧率
@@ -32,88 +48,287 @@ class VideoPreprocessor:
         self.video_min_pixels = video_min_pixels
         self.video_fps = video_fps
         self.video_maxlen = video_maxlen
-    
+
     # 使用qwen_vl_utils处理，不需要手动实现预处理逻辑
-    
+
+    def decode(self, video_path: str) -> np.ndarray:
+        """解码视频、抽帧并resize, 返回 (帧数, 高, 宽, 3) 的 uint8 数组
+
+        只解码保留的前 video_maxlen 帧 (见 src/frame_sampler.py); 容器元数据中的帧数缺失或
+        与实际不符时改为全量解码。元数据有误但未被发现时帧的选取可能与 process_vision_info 不同,
+        新数据集请先用 scripts/benchmark_frame_sampling.py 检查 (或设置 VLM_SPARSE_DECODE=0)
+        """
+        video_part = {
+            "type": "video",
+            "video": video_path,
+            "min_pixels": self.video_min_pixels,
+            "max_pixels": self.video_max_pixels,
+            "fps": self.video_fps,
+        }
+        video = decode_video(video_part, self.video_maxlen)
+        return np.ascontiguousarray(video.permute(0, 2, 3, 1).numpy().astype(np.uint8))
+
+    @staticmethod
+    def save_frames(frames: np.ndarray, video_output_dir: str) -> list:
+        """把帧数组保存为 frame_0000.jpg ..., 返回帧文件路径"""
+        os.makedirs(video_output_dir, exist_ok=True)
+        frame_paths = []
+        for i, frame in enumerate(frames):
+            frame_path = os.path.join(video_output_dir, f"frame_{i:04d}.jpg")
+            Image.fromarray(frame).save(frame_path, "JPEG", quality=95)
+            frame_paths.append(frame_path)
+        return frame_paths
+
+    @staticmethod
+    def encode_frames(frames: np.ndarray) -> list:
+        """帧数组编码为 JPEG 数据 (与 save_frames 写出的文件内容相同), 用于打包成分片"""
+        encoded = []
+        for frame in frames:
+            buffer = io.BytesIO()
+            Image.fromarray(frame).save(buffer, "JPEG", quality=95)
+            encoded.append(buffer.getvalue())
+        return encoded
+
     def process_video(self, video_path: str, output_dir: str, video_base_dir: str) -> dict:
         """
-        使用LLaMA-Factory Qwen-VL处理逻辑处理单个视频文件
-        
+        使用LLaMA-Factory Qwen-VL处理逻辑处理单个视频文件 (单进程, 不经过流水线)
+
         Args:
             video_path: 视频文件路径
             output_dir: 输出目录
             video_base_dir: 视频基础目录
-            
+
         Returns:
             包含处理结果的字典
         """
         try:
-            # 创建输出目录，保持原始目录结构
-            video_path_obj = Path(video_path)
-            video_name = video_path_obj.stem
-            
-            # 保持相对于 video_base_dir 的目录结构
-            rel_path = video_path_obj.relative_to(Path(video_base_dir))
-            video_output_dir = Path(output_dir) / rel_path.parent / video_name
-            
-            video_output_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 使用qwen_vl_utils处理视频
-            video_message = [{
-                'content': [{
-                    "type": "video",
-                    "video": video_path,
-                    "min_pixels": self.video_min_pixels,
-                    "max_pixels": self.video_max_pixels,
-                    "fps": self.video_fps,
-                    "video_maxlen": self.video_maxlen
-                }]
-            }]
-            
-            # 使用process_vision_info处理视频
-            image_inputs, video_inputs, video_kwargs = process_vision_info(video_message, return_video_kwargs=True)
-            
-            if video_inputs is None:
-                raise ValueError("Failed to process video with qwen_vl_utils")
-            
-            # 获取处理后的视频帧
-            video_input = (video_inputs.pop()).permute(0, 2, 3, 1).numpy().astype(np.uint8)
-            selected_frames = video_input[:self.video_maxlen] if len(video_input) > self.video_maxlen else video_input
-            
-            # 保存处理后的帧
-            frame_paths = []
-            for i, frame in enumerate(selected_frames):
-                img = Image.fromarray(frame)
-                frame_filename = f"frame_{i:04d}.jpg"
-                frame_path = video_output_dir / frame_filename
-                img.save(frame_path, "JPEG", quality=95)
-                frame_paths.append(str(frame_path))
-                del img  # 立即释放内存
-            
-            # 清理大对象
-            del video_input, selected_frames, video_inputs
-            gc.collect()  # 强制垃圾回收
-            
-            return {
-                "video_path": video_path,
-                "video_name": video_name,
-                "frame_paths": frame_paths,
-                "num_frames": len(frame_paths),
-                "fps_per_video": self.video_fps,
-                "success": True,
-                "error": None
-            }
-            
+            frames = self.decode(video_path)
+            frame_paths = self.save_frames(frames, video_output_dir(video_path, output_dir, video_base_dir))
+            return video_result(video_path, frame_paths, self.video_fps)
         except Exception as e:
-            return {
-                "video_path": video_path,
-                "video_name": Path(video_path).stem,
-                "frame_paths": [],
-                "num_frames": 0,
-                "fps_per_video": 0.0,
-                "success": False,
-                "error": str(e)
-            }
+            return video_result(video_path, error=str(e))
+
+
+def video_output_dir(video_path, output_dir, video_base_dir):
+    """输出目录, 保持相对于 video_base_dir 的目录结构: <output_dir>/<相对目录>/<视频名>/"""
+    video_path_obj = Path(video_path)
+    rel_path = video_path_obj.relative_to(Path(video_base_dir))
+    return str(Path(output_dir) / rel_path.parent / video_path_obj.stem)
+
+
+def video_result(video_path, frame_paths=(), fps=0.0, error=None):
+    return {
+        "video_path": video_path,
+        "video_name": Path(video_path).stem,
+        "frame_paths": list(frame_paths),
+        "num_frames": len(frame_paths),
+        "fps_per_video": fps if error is None else 0.0,
+        "success": error is None,
+        "error": error
+    }
+
+
+def _peak_rss_mb():
+    # Linux 上 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def decode_worker(preprocessor, tasks, frames_queue, results):
+    """解码阶段: 从 tasks 取视频, 帧数组放入有界的 frames_queue; 失败直接报告结果"""
+    try:
+        import torch
+        torch.set_num_threads(1)  # 每个进程单线程, 并行度由进程数决定
+    except ImportError:
+        pass
+    busy = 0.0
+    count = 0
+    frames_total = 0
+    while True:
+        item = tasks.get()
+        if item is None:
+            break
+        video_path, out_dir = item
+        started = time.perf_counter()
+        try:
+            frames = preprocessor.decode(video_path)
+        except Exception as e:
+            busy += time.perf_counter() - started
+            results.put(("video", "decode", video_result(video_path, error=str(e)), 0))
+            continue
+        busy += time.perf_counter() - started
+        count += 1
+        frames_total += len(frames)
+        frames_queue.put((video_path, out_dir, frames))
+    results.put(("stage", "decode", {"busy": busy, "videos": count, "frames": frames_total,
+                                     "peak_rss_mb": _peak_rss_mb()}, 0))
+
+
+def frame_names(count):
+    return [f"frame_{i:04d}.jpg" for i in range(count)]
+
+
+def encode_worker(fps, frames_queue, results, pack=False):
+    """编码阶段: 帧数组 JPEG 编码并写盘; pack 时 JPEG 数据随结果交给主进程写入分片"""
+    busy = 0.0
+    count = 0
+    frames_total = 0
+    bytes_written = 0
+    while True:
+        item = frames_queue.get()
+        if item is None:
+            break
+        video_path, out_dir, frames = item
+        started = time.perf_counter()
+        try:
+            if pack:
+                encoded = VideoPreprocessor.encode_frames(frames)
+                bytes_written += sum(len(f) for f in encoded)
+                result = video_result(video_path, frame_names(len(encoded)), fps)
+                result["frame_bytes"] = encoded
+                result["shard_key"] = out_dir
+            else:
+                frame_paths = VideoPreprocessor.save_frames(frames, out_dir)
+                bytes_written += sum(os.path.getsize(p) for p in frame_paths)
+                result = video_result(video_path, frame_paths, fps)
+        except Exception as e:
+            result = video_result(video_path, error=str(e))
+        busy += time.perf_counter() - started
+        count += 1
+        frames_total += len(frames)
+        results.put(("video", "encode", result, frames.nbytes))
+        del frames
+    results.put(("stage", "encode", {"busy": busy, "videos": count, "frames": frames_total,
+                                     "bytes": bytes_written, "peak_rss_mb": _peak_rss_mb()}, 0))
+
+
+def split_workers(num_workers, encode_workers):
+    """(解码进程数, 编码进程数); 默认按CPU核数, 解码较重, 编码占约1/4"""
+    total = num_workers or os.cpu_count() or 1
+    encode = encode_workers or max(1, total // 4)
+    decode = max(1, total - encode)
+    return decode, encode
+
+
+def run_pipeline(preprocessor, videos, output_dir, video_base_dir, decode_workers, encode_workers, queue_depth,
+                 shard_writer=None):
+    """多进程流水线处理 videos, 返回 (每个视频的结果, 阶段统计); 给出 shard_writer 时结果写入分片"""
+    ctx = mp.get_context("spawn")  # torch 在 fork 出的子进程中不安全
+    tasks = ctx.Queue()
+    frames_queue = ctx.Queue(maxsize=queue_depth)
+    results = ctx.Queue()
+    for video_path in videos:
+        tasks.put((video_path, video_output_dir(video_path, output_dir, video_base_dir)))
+    for _ in range(decode_workers):
+        tasks.put(None)
+
+    decoders = [ctx.Process(target=decode_worker, args=(preprocessor, tasks, frames_queue, results), daemon=True)
+                for _ in range(decode_workers)]
+    encoders = [ctx.Process(target=encode_worker,
+                            args=(preprocessor.video_fps, frames_queue, results, shard_writer is not None),
+                            daemon=True)
+                for _ in range(encode_workers)]
+    for p in decoders + encoders:
+        p.start()
+
+    started = time.time()
+    video_results = []
+    stages = {"decode": [], "encode": []}
+    largest = 0
+    successful_count = failed_count = 0
+    decoders_done = False
+    with tqdm(total=len(videos), desc="处理视频") as pbar:
+        while len(video_results) < len(videos) or len(stages["encode"]) < encode_workers:
+            if not decoders_done and len(stages["decode"]) == decode_workers:
+                # 解码全部结束, 之后通知编码进程退出
+                for _ in range(encode_workers):
+                    frames_queue.put(None)
+                decoders_done = True
+            try:
+                kind, stage, payload, nbytes = results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [p for p in decoders + encoders if p.exitcode not in (None, 0)]
+                if dead:
+                    print(f"\n错误: {len(dead)} 个处理进程异常退出 (exitcode {dead[0].exitcode}), 停止处理")
+                    break
+                continue
+            if kind == "stage":
+                stages[stage].append(payload)
+                continue
+            if "frame_bytes" in payload:
+                key = os.path.relpath(payload.pop("shard_key"), output_dir)
+                shard_writer.add(key, payload["frame_paths"], payload.pop("frame_bytes"))
+            video_results.append(payload)
+            largest = max(largest, nbytes)
+            if payload["success"]:
+                successful_count += 1
+            else:
+                failed_count += 1
+                print(f"\n处理失败: {payload['video_path']} - {payload['error']}")
+            pbar.set_postfix({"成功": successful_count, "失败": failed_count,
+                              "当前": Path(payload["video_path"]).name})
+            pbar.update(1)
+
+    for p in decoders + encoders:
+        p.join(timeout=5)
+        if p.is_alive():
+            p.terminate()
+    if shard_writer is not None:
+        shard_writer.flush()
+    elapsed = time.time() - started
+    stats = {"elapsed": elapsed, "stages": stages, "largest_video_bytes": largest,
+             "packed": shard_writer is not None, "decode_workers": decode_workers, "encode_workers": encode_workers, "queue_depth": queue_depth}
+    return video_results, stats
+
+
+def print_pipeline_stats(stats):
+    elapsed = stats["elapsed"] or 1e-9
+    workers = {"decode": stats["decode_workers"], "encode": stats["encode_workers"]}
+    names = {"decode": "解码+resize", "encode": "编码" if stats["packed"] else "编码+写盘"}
+    print(f"\n流水线统计 (总耗时 {stats['elapsed']:.1f}s, 解码进程 {workers['decode']}, "
+          f"编码进程 {workers['encode']}, 帧队列深度 {stats['queue_depth']}):")
+    for stage in ("decode", "encode"):
+        reports = stats["stages"][stage]
+        if not reports:
+            continue
+        busy = sum(r["busy"] for r in reports)
+        videos = sum(r["videos"] for r in reports)
+        frames = sum(r["frames"] for r in reports)
+        line = (f"  {names[stage]}: {videos / elapsed:.2f} 视频/s, {frames / elapsed:.1f} 帧/s, "
+                f"进程利用率 {busy / (elapsed * workers[stage]) * 100:.0f}%, "
+                f"单进程峰值内存 {max(r['peak_rss_mb'] for r in reports):.0f}MB")
+        if stage == "encode":
+            line += f", 写入 {sum(r['bytes'] for r in reports) / (1024 * 1024):.1f}MB"
+        print(line)
+    in_flight = workers["decode"] + stats["queue_depth"] + workers["encode"]
+    print(f"  帧数组内存上限: {in_flight} 个视频 × 最大 {stats['largest_video_bytes'] / (1024 * 1024):.1f}MB"
+          f" = {in_flight * stats['largest_video_bytes'] / (1024 * 1024):.0f}MB")
+
+
+def packed_videos(output_dir):
+    """已写入分片的视频 (类别/视频名)"""
+    keys = set()
+    for path in shard_paths(output_dir):
+        try:
+            keys.update(ShardReader(path).keys)
+        except (OSError, ValueError) as e:
+            print(f"警告: 跳过无法读取的分片 {path}: {e}")
+    return keys
+
+
+def pack_frame_dir(shard_writer, out_dir, output_dir):
+    """把已有帧目录中的 frame_*.jpg 直接写入分片 (不重新解码), 返回帧数"""
+    frame_files = sorted(Path(out_dir).glob("frame_*.jpg"))
+    frames = [f.read_bytes() for f in frame_files]
+    shard_writer.add(os.path.relpath(out_dir, output_dir), [f.name for f in frame_files], frames)
+    return len(frames)
+
+
+def update_manifest(output_dir):
+    """重建输出目录的 manifest.json, 压测脚本和分析脚本直接读取, 不再遍历目录"""
+    manifest = build_manifest(output_dir, "frames")
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    write_manifest(manifest, path)
+    print(f"清单已更新: {path} ({len(manifest['entries'])} 个视频)")
 
 
 def main():
@@ -130,66 +345,82 @@ def main():
                        help="视频抽帧帧率 (默认: 2.0)")
     parser.add_argument("--video_maxlen", type=int, default=16,
                        help="视频最大帧数 (默认: 16)")
-    parser.add_argument("--num_workers", type=int, default=2,
-                       help="并行处理的线程数 (默认: 2)")
-    
+    parser.add_argument("--num_workers", type=int, default=0,
+                       help="流水线总进程数 (默认: 0, 即CPU核数)")
+    parser.add_argument("--encode_workers", type=int, default=0,
+                       help="其中编码+写盘的进程数 (默认: 0, 即总进程数的1/4, 至少1个)")
+    parser.add_argument("--queue_depth", type=int, default=0,
+                       help="解码与编码之间帧队列可容纳的视频数 (默认: 0, 即编码进程数的2倍)")
+    parser.add_argument("--no_manifest", action="store_true",
+                       help="处理完成后不生成 manifest.json")
+    parser.add_argument("--pack", type=int, default=0,
+                       help="每 N 个视频打包成一个分片文件 (<output_dir>/shards/), 不再逐帧写 JPEG 文件 (默认: 0, 不打包)")
+
     args = parser.parse_args()
-    
+
     # 检查视频目录是否存在
     if not os.path.exists(args.video_dir):
         print(f"错误: 视频目录 {args.video_dir} 不存在")
         return
-    
+
     # 创建输出目录
     os.makedirs(args.output_dir, exist_ok=True)
-    
+
     # 查找所有视频文件（兼容两种目录结构）
     video_extensions = ['*.mp4', '*.avi', '*.mov', '*.mkv', '*.flv', '*.wmv']
     video_files = []
-    
+
     # 递归查找所有视频文件
     for ext in video_extensions:
         pattern = os.path.join(args.video_dir, '**', ext)
         found_files = glob.glob(pattern, recursive=True)
         video_files.extend(found_files)
-    
+
     # 检查直接在根目录下的视频文件
     for ext in video_extensions:
         pattern = os.path.join(args.video_dir, ext)
         found_files = glob.glob(pattern)
         video_files.extend(found_files)
-    
+
     # 去重
-    video_files = list(set(video_files))
-    
+    video_files = sorted(set(video_files))
+
     print(f"在 {args.video_dir} 中找到 {len(video_files)} 个视频文件")
-    
+
     if not video_files:
         print("没有找到视频文件")
         return
-    
-    # 检查哪些视频已经处理过
+
+    # 检查哪些视频已经处理过; 打包模式下以分片为准, 已有帧目录直接打包
     unprocessed_videos = []
     processed_count = 0
-    
+    shard_writer = ShardWriter(args.output_dir, args.pack) if args.pack > 0 else None
+    packed = packed_videos(args.output_dir) if shard_writer is not None else set()
+    repacked = 0
+
     for video_path in video_files:
-        video_path_obj = Path(video_path)
-        video_name = video_path_obj.stem
-        rel_path = video_path_obj.relative_to(Path(args.video_dir))
-        video_output_dir = Path(args.output_dir) / rel_path.parent / video_name
-        
-        if video_output_dir.exists() and any(video_output_dir.glob("frame_*.jpg")):
+        out_dir = Path(video_output_dir(video_path, args.output_dir, args.video_dir))
+        if shard_writer is not None and os.path.relpath(out_dir, args.output_dir) in packed:
+            processed_count += 1
+        elif out_dir.exists() and any(out_dir.glob("frame_*.jpg")):
+            if shard_writer is not None:
+                pack_frame_dir(shard_writer, str(out_dir), args.output_dir)
+                repacked += 1
             processed_count += 1
         else:
             unprocessed_videos.append(video_path)
-    
-    print(f"已处理: {processed_count} 个视频")
+
+    print(f"已处理: {processed_count} 个视频" + (f" (其中 {repacked} 个由帧目录打包进分片)" if repacked else ""))
     print(f"未处理: {len(unprocessed_videos)} 个视频")
-    
+
     if not unprocessed_videos:
         print("所有视频都已处理完成")
+        if shard_writer is not None:
+            shard_writer.flush()
+        if not args.no_manifest and (repacked or not os.path.exists(os.path.join(args.output_dir, MANIFEST_NAME))):
+            update_manifest(args.output_dir)
         return
-    
+
     # 创建预处理器
     preprocessor = VideoPreprocessor(
         video_max_pixels=args.video_max_pixels,
@@ -197,71 +428,38 @@ def main():
         video_fps=args.video_fps,
         video_maxlen=args.video_maxlen
     )
-    
-    # 并行处理未处理的视频
-    results = []
-    successful_count = 0
-    failed_count = 0
-    
-    with ThreadPoolExecutor(max_workers=args.num_workers) as executor:
-        # 只提交未处理的视频任务
-        future_to_video = {
-            executor.submit(preprocessor.process_video, video_path, args.output_dir, args.video_dir): video_path
-            for video_path in unprocessed_videos
-        }
-        
-        # 处理结果
-        with tqdm(total=len(unprocessed_videos), desc="处理视频") as pbar:
-            for future in as_completed(future_to_video):
-                video_path = future_to_video[future]
-                try:
-                    result = future.result()
-                    results.append(result)
-                    
-                    if result["success"]:
-                        successful_count += 1
-                        pbar.set_postfix({
-                            "成功": successful_count,
-                            "失败": failed_count,
-                            "当前": Path(video_path).name
-                        })
-                    else:
-                        failed_count += 1
-                        print(f"\n处理失败: {video_path} - {result['error']}")
-                    
-                    # 每处理完10个视频就清理一次内存
-                    if (successful_count + failed_count) % 10 == 0:
-                        gc.collect()
-                        
-                except Exception as e:
-                    failed_count += 1
-                    print(f"\n处理异常: {video_path} - {str(e)}")
-                    results.append({
-                        "video_path": video_path,
-                        "success": False,
-                        "error": str(e)
-                    })
-                    gc.collect()  # 异常时也清理内存
-                
-                pbar.update(1)
-    
+
+    decode_workers, encode_workers = split_workers(args.num_workers, args.encode_workers)
+    queue_depth = args.queue_depth or 2 * encode_workers
+    results, stats = run_pipeline(preprocessor, unprocessed_videos, args.output_dir, args.video_dir,
+                                  decode_workers, encode_workers, queue_depth, shard_writer)
+    successful_count = sum(1 for r in results if r["success"])
+    failed_count = len(results) - successful_count
+
     # 输出统计信息
     print(f"\n处理完成:")
     print(f"  - 新处理: {successful_count} 个视频")
     print(f"  - 处理失败: {failed_count} 个视频")
+    if len(results) < len(unprocessed_videos):
+        print(f"  - 未完成: {len(unprocessed_videos) - len(results)} 个视频")
     print(f"  - 之前已处理: {processed_count} 个视频")
     print(f"  - 总计: {processed_count + successful_count} 个视频")
     print(f"  - 输出目录: {args.output_dir}")
-    
+    if shard_writer is not None:
+        print(f"  - 新写入分片: {len(shard_writer.paths)} 个, {shard_writer.videos} 个视频, "
+              f"{shard_writer.bytes / (1024 * 1024):.1f}MB")
+    print_pipeline_stats(stats)
+
     # 输出失败的视频列表
     if failed_count > 0:
         print(f"\n失败的视频:")
         for result in results:
             if not result["success"]:
                 print(f"  - {result['video_path']}: {result['error']}")
-    
 
+    if not args.no_manifest:
+        update_manifest(args.output_dir)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
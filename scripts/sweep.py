@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+自适应梯度压测: 替代 benchmark_script.sh 的固定并发列表
+
+每个并发级别启动一次 locust (headless, --csv), 实时读取 stats_history.csv:
+- 预热结束后, 当最近一个窗口内的吞吐稳定(三段吞吐的相对偏差 < --tolerance)即认为进入稳态,
+  用该窗口的数据作为本级别结果并立即结束本级别, 不再固定跑满20分钟;
+- 吞吐相比此前最好结果提升不足 --plateau 或违反SLO(p95延迟/错误率)时停止加压;
+- 然后在最后两个级别之间二分, 定位吞吐拐点(达到峰值吞吐 (1-plateau) 的最小并发)
+  或满足SLO的最大并发;
+- 所有级别的结果汇总到 <output-dir>/sweep_results.csv 和 sweep_summary.json,
+  每个级别的locust原始CSV仍为 results_<并发>_*.csv, 可继续用 merge_results.py 合并。
+
+未识别的参数原样传给locust, 例如:
+    python scripts/sweep.py -f src/concurrent_test_frames.py --host http://localhost:8080 --slo-p95-ms 30000
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import signal
+import argparse
+import statistics
+import subprocess
+
+RESULT_FIELDS = [
+    "users", "phase", "status", "measured_s", "requests", "rps", "failures_per_s", "error_rate",
+    "p50_ms", "p95_ms", "p99_ms", "input_tokens_per_s", "output_tokens_per_s", "slo_ok",
+]
+
+
+def parse_levels(text):
+    return sorted({int(x) for x in text.split(",") if x.strip()})
+
+
+def doubling_levels(start, maximum, growth):
+    levels = []
+    users = start
+    while users <= maximum:
+        levels.append(users)
+        users = max(users + 1, int(round(users * growth)))
+    return levels
+
+
+def read_history(path, request_type):
+    """stats_history.csv 中主请求(按Type过滤, 排除STREAM/OPENLOOP/PREFIX/GRID等派生指标)的各行"""
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("Type") != request_type:
+                continue
+            try:
+                rows.append({
+                    "t": float(row["Timestamp"]),
+                    "users": int(row["User Count"]),
+                    "total": int(row["Total Request Count"]),
+                    "failures": int(row["Total Failure Count"]),
+                    "p50": row.get("50%"),
+                    "p95": row.get("95%"),
+                    "p99": row.get("99%"),
+                })
+            except (KeyError, ValueError):
+                continue
+    return rows
+
+
+def _median_ms(values):
+    numbers = []
+    for v in values:
+        try:
+            numbers.append(float(v))
+        except (TypeError, ValueError):
+            continue
+    return statistics.median(numbers) if numbers else None
+
+
+def measure_window(rows):
+    """窗口内吞吐(由累计请求数差值计算)与延迟分位数(各行当前分位数的中位数)"""
+    first, last = rows[0], rows[-1]
+    span = last["t"] - first["t"]
+    requests = last["total"] - first["total"]
+    failures = last["failures"] - first["failures"]
+    return {
+        "measured_s": span,
+        "requests": requests,
+        "rps": requests / span if span > 0 else 0.0,
+        "failures_per_s": failures / span if span > 0 else 0.0,
+        "error_rate": failures / requests if requests else 0.0,
+        "p50_ms": _median_ms(r["p50"] for r in rows),
+        "p95_ms": _median_ms(r["p95"] for r in rows),
+        "p99_ms": _median_ms(r["p99"] for r in rows),
+    }
+
+
+def is_steady(rows, tolerance):
+    """把窗口三等分, 各段吞吐相对均值的最大偏差小于tolerance即为稳态"""
+    t0, t1 = rows[0]["t"], rows[-1]["t"]
+    if t1 <= t0:
+        return False
+    edges = [t0 + (t1 - t0) * k / 3 for k in range(4)]
+    rates = []
+    for a, b in zip(edges, edges[1:]):
+        seg = [r for r in rows if a <= r["t"] <= b]
+        if len(seg) < 2 or seg[-1]["t"] <= seg[0]["t"]:
+            return False
+        rates.append((seg[-1]["total"] - seg[0]["total"]) / (seg[-1]["t"] - seg[0]["t"]))
+    mean = sum(rates) / 3
+    if mean <= 0:
+        return False
+    return max(abs(r - mean) for r in rates) / mean < tolerance
+
+
+def read_token_rates(path):
+    """locustfile在test_stop时写出的 <prefix>_tokens.csv"""
+    rates = {}
+    if os.path.exists(path):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    rates[row["Metric"]] = float(row["Tokens/s"])
+                except (KeyError, ValueError):
+                    continue
+    return rates.get("prompt_tokens"), rates.get("completion_tokens")
+
+
+def stop_locust(proc, timeout=60):
+    if proc.poll() is not None:
+        return
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_level(args, users, phase, locust_args):
+    """跑一个并发级别, 稳态后提前结束; 返回该级别的结果"""
+    prefix = os.path.join(args.output_dir, f"{args.prefix}_{users}")
+    history_path = f"{prefix}_stats_history.csv"
+    for suffix in ("_stats.csv", "_stats_history.csv", "_failures.csv", "_exceptions.csv", "_tokens.csv",
+                   "_hdr.json", "_hdr.jsonl"):
+        if os.path.exists(prefix + suffix):
+            os.remove(prefix + suffix)
+    # 追踪日志按worker分文件 (results_<并发>_trace_<主机>_<pid>.jsonl), 旧文件会被 grid_surface.py 一并读取
+    for path in glob.glob(prefix + "_trace*.jsonl") + glob.glob(prefix + "_trace*.parquet"):
+        os.remove(path)
+
+    cmd = [
+        sys.executable, "-m", "locust", "-f", args.locustfile,
+        "-u", str(users), "-r", str(args.spawn_rate or users),
+        "--host", args.host, "--headless", "--csv", prefix, "--csv-full-history",
+    ] + locust_args
+    env = dict(os.environ, VLM_MAX_REQUESTS="0")
+
+    print("=========================================")
+    print(f"测试并发数: {users} ({phase})")
+    print("=========================================")
+    start = time.time()
+    with open(f"{prefix}.log", "w") as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        status = "timeout"
+        window_rows = []
+        measure_start = None
+        try:
+            while True:
+                time.sleep(args.poll_interval)
+                if proc.poll() is not None:
+                    status = "exited"
+                    break
+                rows = [r for r in read_history(history_path, args.request_type)
+                        if r["users"] >= users and r["total"] > 0]
+                if measure_start is None:
+                    if rows:
+                        measure_start = rows[0]["t"] + args.warmup
+                        print(f"[INFO] 首个请求完成 (启动+预加载 {time.time() - start:.0f}s), 预热 {args.warmup:.0f}s")
+                    elif time.time() - start > args.preload_timeout:
+                        status = "no-traffic"
+                        break
+                    continue
+                eligible = [r for r in rows if r["t"] >= measure_start]
+                if eligible and eligible[-1]["t"] - eligible[0]["t"] >= args.window:
+                    window_rows = [r for r in eligible if r["t"] >= eligible[-1]["t"] - args.window]
+                    if is_steady(window_rows, args.tolerance):
+                        status = "steady"
+                        break
+                if eligible and eligible[-1]["t"] - measure_start >= args.max_level_time:
+                    break
+        finally:
+            stop_locust(proc)
+
+    if not window_rows:
+        rows = [r for r in read_history(history_path, args.request_type) if r["users"] >= users]
+        window_rows = [r for r in rows if measure_start is None or r["t"] >= measure_start] or rows
+    result = {"users": users, "phase": phase, "status": status}
+    if len(window_rows) >= 2:
+        result.update(measure_window(window_rows))
+    else:
+        result.update({"measured_s": 0, "requests": 0, "rps": 0.0, "failures_per_s": 0.0,
+                       "error_rate": 1.0 if status != "steady" else 0.0,
+                       "p50_ms": None, "p95_ms": None, "p99_ms": None})
+    result["input_tokens_per_s"], result["output_tokens_per_s"] = read_token_rates(f"{prefix}_tokens.csv")
+    result["slo_ok"] = meets_slo(result, args)
+
+    print(f"[INFO] 并发 {users}: {result['rps']:.2f} req/s, p95 {result['p95_ms']} ms, "
+          f"错误率 {result['error_rate'] * 100:.2f}%, {status}, SLO {'满足' if result['slo_ok'] else '违反'}, "
+          f"耗时 {time.time() - start:.0f}s")
+    if args.cooldown:
+        time.sleep(args.cooldown)  # 让系统恢复
+    return result
+
+
+def meets_slo(result, args):
+    if result["requests"] == 0:
+        return False
+    if result["error_rate"] > args.slo_error_rate:
+        return False
+    if args.slo_p95_ms and (result["p95_ms"] is None or result["p95_ms"] > args.slo_p95_ms):
+        return False
+    return True
+
+
+def sweep(args, locust_args):
+    levels = parse_levels(args.levels) if args.levels else doubling_levels(args.start_users, args.max_users, args.growth)
+    results = {}
+    stop_reason = "max-users"
+
+    # 1. 逐级加压, 直到吞吐平台或违反SLO
+    for users in levels:
+        result = run_level(args, users, "sweep", locust_args)
+        results[users] = result
+        passing = [r for u, r in results.items() if r["slo_ok"] and u != users]
+        if not result["slo_ok"]:
+            stop_reason = "slo"
+            break
+        best_before = max((r["rps"] for r in passing), default=0.0)
+        if passing and result["rps"] < best_before * (1 + args.plateau):
+            stop_reason = "plateau"
+            break
+
+    # 2. 在最后两个级别之间二分
+    def passing_levels():
+        return sorted(u for u, r in results.items() if r["slo_ok"])
+
+    knee = None
+    if stop_reason == "slo":
+        ok = passing_levels()
+        breached = min(u for u, r in results.items() if not r["slo_ok"] and (not ok or u > ok[-1]))
+        lo, hi = (ok[-1] if ok else 0), breached
+        for _ in range(args.bisect_steps):
+            if hi - lo <= max(1, int(lo * args.resolution)):
+                break
+            mid = (lo + hi) // 2
+            results[mid] = run_level(args, mid, "bisect", locust_args)
+            if results[mid]["slo_ok"]:
+                lo = mid
+            else:
+                hi = mid
+        knee = lo or None
+    elif passing_levels():
+        peak = max(results[u]["rps"] for u in passing_levels())
+        target = peak * (1 - args.plateau)
+        reaching = [u for u in passing_levels() if results[u]["rps"] >= target]
+        hi = reaching[0]
+        lo = max((u for u in results if u < hi), default=0)
+        if stop_reason == "plateau" and lo > 0:
+            for _ in range(args.bisect_steps):
+                if hi - lo <= max(1, int(lo * args.resolution)):
+                    break
+                mid = (lo + hi) // 2
+                results[mid] = run_level(args, mid, "bisect", locust_args)
+                if results[mid]["slo_ok"] and results[mid]["rps"] >= target:
+                    hi = mid
+                else:
+                    lo = mid
+        knee = hi
+    return results, stop_reason, knee
+
+
+def write_results(args, results, stop_reason, knee, elapsed):
+    rows = [results[u] for u in sorted(results)]
+    csv_path = os.path.join(args.output_dir, "sweep_results.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    summary = {
+        "locustfile": args.locustfile,
+        "host": args.host,
+        "stop_reason": stop_reason,
+        "knee_users": knee,
+        "knee": results.get(knee),
+        "peak_rps": max((r["rps"] for r in rows if r["slo_ok"]), default=None),
+        "slo": {"p95_ms": args.slo_p95_ms or None, "error_rate": args.slo_error_rate},
+        "levels": rows,
+        "elapsed_s": elapsed,
+    }
+    json_path = os.path.join(args.output_dir, "sweep_summary.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print("\n" + "=" * 72)
+    print(f"{'并发':>6} {'阶段':>6} {'状态':>10} {'req/s':>8} {'p95(ms)':>9} {'错误率':>7} {'输出tok/s':>10}  SLO")
+    for r in rows:
+        p95 = f"{r['p95_ms']:.0f}" if r["p95_ms"] is not None else "N/A"
+        out_tps = f"{r['output_tokens_per_s']:.1f}" if r["output_tokens_per_s"] is not None else "N/A"
+        print(f"{r['users']:>6} {r['phase']:>6} {r['status']:>10} {r['rps']:>8.2f} {p95:>9} "
+              f"{r['error_rate'] * 100:>6.2f}% {out_tps:>10}  {'OK' if r['slo_ok'] else 'X'}")
+    print("=" * 72)
+    reason = {"plateau": "吞吐已平台", "slo": "违反SLO", "max-users": "达到最大并发仍未饱和"}[stop_reason]
+    print(f"停止原因: {reason}; 拐点并发: {knee if knee is not None else 'N/A'}; 总耗时 {elapsed / 60:.1f} 分钟")
+    print(f"结果已保存到: {csv_path}, {json_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="自适应梯度压测, 自动寻找吞吐拐点")
+    parser.add_argument("-f", "--locustfile", default="src/concurrent_test_frames.py", help="locustfile路径")
+    parser.add_argument("--host", default="http://localhost:8080", help="服务地址")
+    parser.add_argument("--levels", default="", help="显式指定并发列表, 如 10,16,32,64; 默认按倍数递增")
+    parser.add_argument("--start-users", type=int, default=8, help="起始并发数")
+    parser.add_argument("--max-users", type=int, default=512, help="最大并发数")
+    parser.add_argument("--growth", type=float, default=2.0, help="并发递增倍数")
+    parser.add_argument("--spawn-rate", type=float, default=0, help="用户启动速率, 0表示与并发数相同")
+    parser.add_argument("--warmup", type=float, default=30, help="首个请求完成后的预热时间(秒)")
+    parser.add_argument("--window", type=float, default=120, help="稳态判定与测量窗口(秒)")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="稳态判定: 窗口三段吞吐的最大相对偏差")
+    parser.add_argument("--max-level-time", type=float, default=1200, help="每个级别预热后的最长测量时间(秒)")
+    parser.add_argument("--preload-timeout", type=float, default=1800, help="等待首个请求完成的最长时间(秒)")
+    parser.add_argument("--plateau", type=float, default=0.05, help="吞吐提升低于该比例视为平台")
+    parser.add_argument("--slo-p95-ms", type=float, default=0, help="p95延迟SLO(毫秒), 0表示不限制")
+    parser.add_argument("--slo-error-rate", type=float, default=0.01, help="错误率SLO")
+    parser.add_argument("--bisect-steps", type=int, default=3, help="二分定位拐点的最多步数")
+    parser.add_argument("--resolution", type=float, default=0.1, help="二分区间小于下界的该比例时停止")
+    parser.add_argument("--request-type", default="POST", help="主请求的Type列, 用于排除STREAM/OPENLOOP/PREFIX/GRID派生指标")
+    parser.add_argument("--cooldown", type=float, default=10, help="级别之间的等待时间(秒)")
+    parser.add_argument("--poll-interval", type=float, default=2, help="读取stats_history的间隔(秒)")
+    parser.add_argument("--output-dir", default=".", help="结果输出目录")
+    parser.add_argument("--prefix", default="results", help="每个级别的CSV前缀, 生成 <prefix>_<并发>_stats.csv")
+    args, locust_args = parser.parse_known_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    print("开始自适应梯度压测，寻找性能上限...")
+    start = time.time()
+    results, stop_reason, knee = sweep(args, locust_args)
+    write_results(args, results, stop_reason, knee, time.time() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Open-loop arrival schedule for the locustfiles.
+
+In the default closed-loop mode each user sends its next request as soon as
+the previous one completes, so a slow server automatically receives less load
+and latency looks better than it is (coordinated omission). In open-loop mode
+requests are assigned intended send times from a fixed-rate schedule (constant
+spacing or Poisson arrivals) that does not depend on completions. A user claims
+the next slot, sleeps until its intended time and sends; latency is measured
+from the intended time, so time spent waiting for a free user counts against
+the server. Slots that are already due but not yet claimed are the client-side
+backlog, reported when the server (or the user pool) cannot keep up.
+
+VLM_ARRIVAL_RATE is the aggregate rate of the whole run. Under
+``--master``/``--worker`` every worker runs its own schedule, so at test start
+the master tells the workers how many of them there are and each one runs at
+rate / workers; the superposition of those Poisson streams is again a Poisson
+stream at the configured rate. Workers that join after the test started keep
+the share they were last given.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+try:
+    from locust.runners import MasterRunner, WorkerRunner
+except ImportError:  # outside locust a schedule is always standalone
+    MasterRunner = WorkerRunner = None
+
+OPEN_LOOP_REQUEST_TYPE = "OPENLOOP"
+ARRIVAL_SHARE_MESSAGE = "vlm_arrival_share"
+
+
+class ArrivalSchedule:
+    """Shared schedule of intended send times at ``rate`` requests per second.
+
+    ``rate`` is the aggregate target; set_workers(n) makes this process send
+    its 1/n share of it.
+    """
+
+    def __init__(self, rate, distribution="poisson", seed=None):
+        if rate <= 0:
+            raise ValueError("arrival rate must be positive")
+        if distribution not in ("poisson", "constant"):
+            raise ValueError(f"unknown arrival distribution: {distribution}")
+        self.target_rate = rate
+        self.rate = rate
+        self.workers = 1
+        self.distribution = distribution
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._pending = deque()     # generated, unclaimed intended times (ascending)
+        self._last_time = None      # latest generated intended time
+
+        self.claimed = 0
+        self.max_backlog = 0
+        self.backlog_samples = 0
+        self.backlog_total = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self._last_warning = 0.0
+        self._master = False
+
+    def set_workers(self, workers):
+        """Run this process's share of the aggregate rate when ``workers`` processes send"""
+        with self._lock:
+            self.workers = max(1, int(workers))
+            self.rate = self.target_rate / self.workers
+
+    def attach(self, environment):
+        """Split the aggregate rate across locust workers (call from events.init)"""
+        runner = environment.runner
+        if MasterRunner is not None and isinstance(runner, MasterRunner):
+            self._master = True
+
+            @environment.events.test_start.add_listener
+            def _share(**kwargs):
+                # Sent on the same sockets before the spawn messages, so workers have it first
+                workers = max(1, runner.worker_count)
+                runner.send_message(ARRIVAL_SHARE_MESSAGE, {"workers": workers})
+                print(f"[INFO] Open-loop rate {self.target_rate:.2f} req/s split across {workers} worker(s): "
+                      f"{self.target_rate / workers:.2f} req/s each")
+        elif WorkerRunner is not None and isinstance(runner, WorkerRunner):
+            runner.register_message(
+                ARRIVAL_SHARE_MESSAGE, lambda environment, msg, **kwargs: self.set_workers(msg.data["workers"]))
+
+    def _gap(self):
+        if self.distribution == "constant":
+            return 1.0 / self.rate
+        return self._random.expovariate(self.rate)
+
+    def _generate_until(self, now):
+        """Generate intended times up to now, plus at least one in the future.
+
+        Users that claim faster than slots come due take successive future slots.
+        """
+        if self._last_time is None:
+            self._last_time = now
+            self._pending.append(now)
+        while self._last_time <= now or not self._pending:
+            self._last_time += self._gap()
+            self._pending.append(self._last_time)
+
+    def _due(self, now):
+        """Pending slots due by now: _generate_until leaves only the newest few in the future"""
+        future = 0
+        for t in reversed(self._pending):
+            if t <= now:
+                break
+            future += 1
+        return len(self._pending) - future
+
+    def backlog(self, now=None):
+        """Number of arrivals already due but not yet claimed by any user"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._generate_until(now)
+            return self._due(now)
+
+    def claim(self):
+        """Claim the next slot and return (slot number, intended wall-clock send time)"""
+        now = time.time()
+        with self._lock:
+            self._generate_until(now)
+            intended = self._pending.popleft()
+            slot = self.claimed
+            self.claimed += 1
+            backlog = self._due(now)
+            self.backlog_samples += 1
+            self.backlog_total += backlog
+            if backlog > self.max_backlog:
+                self.max_backlog = backlog
+        if backlog and now - self._last_warning > 10.0:
+            self._last_warning = now
+            print(f"[WARNING] Open-loop backlog: {backlog} arrivals due but not sent "
+                  f"(add users or the server cannot sustain {self.rate:.2f} req/s)")
+        return slot, intended
+
+    def wait_for_slot(self):
+        """Claim a slot and sleep until its intended send time; returns the intended time"""
+        _, intended = self.claim()
+        delay = intended - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        lag = max(0.0, time.time() - intended)
+        with self._lock:
+            self.lag_total += lag
+            if lag > self.lag_max:
+                self.lag_max = lag
+        return intended
+
+    def report(self):
+        if self._master:
+            print(f"[INFO] Open-loop {self.distribution} arrivals at {self.target_rate:.2f} req/s aggregate "
+                  f"(per-worker dispatch reported by each worker)")
+            return
+        with self._lock:
+            claimed = self.claimed
+            avg_backlog = self.backlog_total / self.backlog_samples if self.backlog_samples else 0.0
+            avg_lag = self.lag_total / claimed if claimed else 0.0
+            max_lag, max_backlog = self.lag_max, self.max_backlog
+        share = f" ({self.workers} workers, {self.target_rate:.2f} req/s aggregate)" if self.workers > 1 else ""
+        print(f"[INFO] Open-loop {self.distribution} arrivals at {self.rate:.2f} req/s{share}: {claimed} dispatched, "
+              f"send lag avg {avg_lag * 1000:.1f}ms / max {max_lag * 1000:.1f}ms, "
+              f"backlog avg {avg_backlog:.1f} / max {max_backlog}")
+
+
+def fire_intended_latency(events, name, intended, end, exception=None):
+    """Report latency measured from the intended send time as ``<name>:intended``"""
+    events.request.fire(
+        request_type=OPEN_LOOP_REQUEST_TYPE,
+        name=f"{name}:intended",
+        response_time=(end - intended) * 1000,
+        response_length=0,
+        exception=exception,
+        context={},
+    )
+
+
+def schedule_from_env(environ):
+    """Build an ArrivalSchedule from VLM_ARRIVAL_RATE / VLM_ARRIVAL_DIST, or None for closed loop"""
+    rate = float(environ.get("VLM_ARRIVAL_RATE", "0") or 0)
+    if rate <= 0:
+        return None
+    return ArrivalSchedule(rate, environ.get("VLM_ARRIVAL_DIST", "poisson"))
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+asyncio load engine for thousands of concurrent multimodal requests.
+
+Locust runs one greenlet per user on top of the requests library, which falls
+over once bodies are several MB and concurrency reaches a few hundred. This
+engine runs one asyncio event loop per process (one process per core by
+default) with pooled keep-alive aiohttp connections. It sends the same payload
+sets as the three locustfiles (built through payload_sets.py) and writes
+locust-format CSVs, so merge_results.py and the rest of the tooling work
+unchanged.
+
+Usage:
+    python src/async_engine.py --payload-set frames -u 2000 --host http://localhost:8080 \\
+        --max-requests 20000 --csv results_2000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import time
+
+import aiohttp
+
+from arrival import ArrivalSchedule, OPEN_LOOP_REQUEST_TYPE
+from image_preload import image_cache_params, preload_image_payloads
+from latency_histogram import HdrRecorder
+from payload_cache import FrameCache
+from payload_sets import (
+    build_frame_body, build_video_body, build_video_messages,
+    discover_frame_dirs, discover_image_files, discover_video_files,
+)
+from stats_csv import RequestRecorder, write_locust_csvs
+from stream_metrics import SSEParser, STREAM_REQUEST_TYPE
+from token_stats import TokenStats
+from wire_payloads import load_wire, wire_bodies, wire_params
+
+# Defaults mirror the constants at the top of each locustfile
+PAYLOAD_SETS = {
+    "image": {
+        "data_path": "./cc_ocr_data",
+        "prompt": "what is the text in the image?",
+        "max_tokens": 64,
+        "max_requests": 500,
+        "limit": 500,
+        "name": "vllm_single_image_completion",
+    },
+    "frames": {
+        "data_path": "./processed_videos_512_512",
+        "prompt": "Please describe the content of the video.",
+        "max_tokens": 200,
+        "max_requests": 512,
+        "limit": None,
+        "name": "vllm_video_completion",
+    },
+    "video": {
+        "data_path": "videos_directory",
+        "prompt": "Please describe the content of the video.",
+        "max_tokens": 200,
+        "max_requests": 584,
+        "limit": None,
+        "name": "vllm_video_completion",
+    },
+}
+VIDEO_SETTINGS = {"min_pixels": 28 * 28, "max_pixels": 512 * 512, "fps": 1.0, "max_frames": 16}
+HEADERS = {"Content-Type": "application/json"}
+
+
+def parse_timespan(value):
+    """Locust-style timespan: '90', '90s', '20m', '1h30m'"""
+    if value is None:
+        return None
+    if re.fullmatch(r"\d+(\.\d+)?", value):
+        return float(value)
+    parts = re.findall(r"(\d+)\s*([hms])", value)
+    if not parts or "".join(n + u for n, u in parts) != value.replace(" ", ""):
+        raise argparse.ArgumentTypeError(f"invalid timespan: {value}")
+    return float(sum(int(n) * {"h": 3600, "m": 60, "s": 1}[u] for n, u in parts))
+
+
+def load_payload_set(args):
+    """Build the encoded request bodies for the chosen payload set"""
+    start = time.time()
+    bodies = []
+    wire = None
+    if args.payload_set in ("image", "frames"):
+        kind = "images" if args.payload_set == "image" else "frames"
+        wire = load_wire(args.data_path, kind, wire_params(kind, (1024, 1024)))
+    if wire is not None:
+        # Prebuilt fragments (scripts/build_wire_payloads.py); aiohttp wants contiguous bytes
+        if args.payload_set == "image":
+            keys = [os.path.relpath(f, args.data_path) for f in discover_image_files(args.data_path, args.limit)]
+        else:
+            keys = discover_frame_dirs(args.data_path)[:args.limit]
+        bodies = [b.tobytes() for b in wire_bodies(wire, [k for k in keys if k in wire], args.prompt,
+                                                   args.max_tokens, args.stream)]
+    elif args.payload_set == "image":
+        image_files = discover_image_files(args.data_path, args.limit)
+        frame_cache = None
+        if args.payload_cache_dir:
+            frame_cache = FrameCache(args.payload_cache_dir, image_cache_params((1024, 1024)))
+        bodies, _ = preload_image_payloads(image_files, (1024, 1024), args.prompt, args.max_tokens, args.stream,
+                                           frame_cache, max(1, args.processes))
+    elif args.payload_set == "frames":
+        for video_dir in discover_frame_dirs(args.data_path)[:args.limit]:
+            try:
+                body, _, _ = build_frame_body(args.data_path, video_dir, args.prompt,
+                                              args.max_tokens, args.stream)
+                if body is not None:
+                    bodies.append(body)
+            except Exception as e:
+                print(f"[ERROR] Failed to preload video {video_dir}: {e}")
+    else:
+        # Imported here so the image/frames sets do not need torch/qwen_vl_utils
+        from video_preload import frame_cache_params, iter_video_frames
+        frame_cache = None
+        if args.payload_cache_dir:
+            frame_cache = FrameCache(args.payload_cache_dir, frame_cache_params(**VIDEO_SETTINGS))
+        tasks, task_messages = [], {}
+        for video_file in discover_video_files(args.data_path)[:args.limit]:
+            messages = build_video_messages(video_file, args.prompt, **VIDEO_SETTINGS)
+            cache_path = frame_cache.entry_path(video_file) if frame_cache is not None else None
+            tasks.append((video_file, messages[-1]["content"][-1], VIDEO_SETTINGS["max_frames"], cache_path))
+            task_messages[video_file] = messages
+        if frame_cache is not None:
+            frame_cache.save()
+        for video_file, frames_b64, _, _, error in iter_video_frames(tasks, max(1, args.processes)):
+            if error or not frames_b64:
+                print(f"[ERROR] Failed to preload video {video_file}: {error or 'no frames decoded'}")
+                continue
+            bodies.append(build_video_body(task_messages.pop(video_file), frames_b64,
+                                           args.max_tokens, args.stream))
+
+    total = sum(len(b) for b in bodies)
+    print(f"[INFO] Preloaded {len(bodies)} {args.payload_set} payloads "
+          f"({total / (1024 * 1024):.1f}MB) in {time.time() - start:.2f}s")
+    return bodies
+
+
+class _Shared:
+    """Cross-process request budget and round-robin payload index"""
+
+    def __init__(self, ctx):
+        self.request_count = ctx.Value("q", 0)
+        self.payload_index = ctx.Value("q", 0)
+
+    def claim(self, max_requests, payload_count):
+        """Return the payload index for the next request, or None once the budget is spent"""
+        with self.request_count.get_lock():
+            if max_requests and self.request_count.value >= max_requests:
+                return None
+            self.request_count.value += 1
+            index = self.payload_index.value % payload_count
+            self.payload_index.value += 1
+            return index
+
+
+async def _send(session, url, body, args, recorder, token_stats, schedule_intended):
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    length = 0
+    usage = None
+    stream_result = None
+    try:
+        async with session.post(url, data=body, headers=HEADERS) as response:
+            if args.stream and response.status == 200:
+                parser = SSEParser(start)
+                async for line in response.content:
+                    if not parser.feed(line.rstrip(b"\r\n")):
+                        break
+                stream_result = parser.finish()
+                length = stream_result.bytes
+                usage = stream_result.usage
+            else:
+                data = await response.read()
+                length = len(data)
+                if response.status == 200:
+                    usage = json.loads(data).get("usage")
+            if response.status != 200:
+                error = f"HTTP {response.status}"
+    except Exception as e:
+        error = repr(e)
+    end = time.perf_counter()
+
+    recorder.record("POST", args.name, (end - start) * 1000, length, error)
+    if error is None:
+        token_stats.record(usage, start_wall, time.time())
+    if stream_result is not None:
+        # :ttft and :tpot STREAM rows, as in the locustfiles; ITLs only go to the HDR histograms
+        if stream_result.ttft is not None:
+            recorder.record(STREAM_REQUEST_TYPE, f"{args.name}:ttft", stream_result.ttft * 1000, 0)
+            for itl in stream_result.itls:
+                recorder.record_metric("itl", itl * 1000)
+            if stream_result.tpot is not None:
+                recorder.record(STREAM_REQUEST_TYPE, f"{args.name}:tpot", stream_result.tpot * 1000, 0)
+    if schedule_intended is not None:
+        recorder.record(OPEN_LOOP_REQUEST_TYPE, f"{args.name}:intended",
+                        (time.time() - schedule_intended) * 1000, 0, error)
+
+
+async def _user(session, url, bodies, args, shared, deadline, schedule, recorder, token_stats):
+    while deadline is None or time.time() < deadline:
+        index = shared.claim(args.max_requests, len(bodies))
+        if index is None:
+            return
+        intended = None
+        if schedule is not None:
+            _, intended = schedule.claim()
+            delay = intended - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await _send(session, url, bodies[index], args, recorder, token_stats, intended)
+
+
+async def _run_worker(users, bodies, args, shared, deadline, recorder, token_stats):
+    schedule = None
+    if args.arrival_rate > 0:
+        schedule = ArrivalSchedule(args.arrival_rate / args.processes, args.arrival_dist)
+    connector = aiohttp.TCPConnector(limit=users, keepalive_timeout=75)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(base_url=args.host, connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(
+            _user(session, "/v1/chat/completions", bodies, args, shared, deadline, schedule, recorder, token_stats)
+            for _ in range(users)
+        ))
+    if schedule is not None:
+        schedule.report()
+
+
+def _worker_main(users, bodies, args, shared, deadline, result_queue):
+    recorder = RequestRecorder()
+    token_stats = TokenStats()
+    try:
+        asyncio.run(_run_worker(users, bodies, args, shared, deadline, recorder, token_stats))
+    finally:
+        result_queue.put((recorder.export(), token_stats.export()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio load engine for the VLM payload sets")
+    parser.add_argument("--payload-set", choices=sorted(PAYLOAD_SETS), default="frames")
+    parser.add_argument("--host", default="http://localhost:8080")
+    parser.add_argument("-u", "--users", type=int, default=256, help="concurrent in-flight requests")
+    parser.add_argument("-t", "--run-time", type=parse_timespan, default=None, help="e.g. 20m; default: until budget")
+    parser.add_argument("--max-requests", type=int, default=None,
+                        help="total request budget across all processes (0 = unlimited; default: locustfile value)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="event loops, one per process")
+    parser.add_argument("--stream", action="store_true", help="stream responses and record TTFT/ITL/TPOT")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="open-loop QPS (0 = closed loop)")
+    parser.add_argument("--arrival-dist", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--csv", dest="csv_prefix", default=None, help="write <prefix>_stats.csv etc.")
+    parser.add_argument("--data-path", default=None)
+    parser.add_argument("--prompt", default=None)
+    parser.add_argument("--max-tokens", type=int, default=None)
+    parser.add_argument("--payload-cache-dir", default=os.environ.get("VLM_PAYLOAD_CACHE_DIR", ".payload_cache"))
+    args = parser.parse_args()
+
+    defaults = PAYLOAD_SETS[args.payload_set]
+    for key in ("data_path", "prompt", "max_tokens", "max_requests"):
+        if getattr(args, key) is None:
+            setattr(args, key, defaults[key])
+    args.limit = defaults["limit"]
+    args.name = defaults["name"]
+    if args.max_requests == 0 and args.run_time is None:
+        parser.error("--max-requests 0 needs --run-time")
+
+    bodies = load_payload_set(args)
+    if not bodies:
+        print("[ERROR] No payloads to send")
+        return
+
+    # Children are forked after preload so they share the bodies copy-on-write
+    ctx = multiprocessing.get_context("fork")
+    processes = max(1, min(args.processes, args.users))
+    args.processes = processes
+    shared = _Shared(ctx)
+    result_queue = ctx.Queue()
+    start_time = time.time()
+    deadline = start_time + args.run_time if args.run_time else None
+    print(f"[INFO] Starting {args.users} users on {processes} event loop(s) against {args.host}")
+
+    workers = []
+    for i in range(processes):
+        users = args.users // processes + (1 if i < args.users % processes else 0)
+        worker = ctx.Process(target=_worker_main, args=(users, bodies, args, shared, deadline, result_queue))
+        worker.start()
+        workers.append(worker)
+
+    recorder = RequestRecorder()
+    token_stats = TokenStats()
+    for _ in workers:
+        exported_requests, exported_tokens = result_queue.get()
+        recorder.merge(exported_requests)
+        token_stats.merge(exported_tokens)
+    for worker in workers:
+        worker.join()
+    end_time = time.time()
+
+    requests, failures = recorder.count("POST", args.name)
+    duration = end_time - start_time
+    print(f"[INFO] {requests} requests ({failures} failed) in {duration:.2f}s: "
+          f"{requests / duration if duration > 0 else 0:.2f} req/s")
+    token_stats.report()
+    if args.csv_prefix:
+        write_locust_csvs(args.csv_prefix, recorder, start_time, end_time, args.users)
+        token_stats.write_csv(f"{args.csv_prefix}_tokens.csv")
+        HdrRecorder().replay(recorder.interval_snapshots(), recorder.hdr_failures, args.csv_prefix)
+        print(f"[INFO] Stats written to {args.csv_prefix}_stats.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,54 @@
-from locust import HttpUser, task, between
+from locust import HttpUser, task, between, events
 from locust.exception import StopUser
-import base64
-import json
 import os
-import glob
 import random
 import time
 import threading
 import argparse
 import sys
 from threading import Timer
+from payload_utils import ClientOverheadTracker
+from payload_sets import discover_frame_dirs, build_frame_body, frame_count
+from payload_source import InMemoryPayloadSource, StreamingPayloadSource, first_available
+from fragment_store import FrameFragmentStore, FragmentPayloadSource, load_prompts
+from stream_metrics import post_streaming_completion
+from token_stats import TokenStats, extract_usage, write_token_stats
+from arrival import schedule_from_env, fire_intended_latency
+from shared_payloads import load_shared_payloads, payload_set_key
+from request_budget import RequestBudget
+from latency_histogram import HdrRecorder
+from trace_log import TraceLog
+from prefix_workload import workload_from_env
+from input_grid import GridPayloadSource, fire_grid_cell, parse_int_list
+from wire_payloads import load_wire, wire_bodies, wire_params
 
 
 # Default values
 VIDEO_BASE_PATH = "./processed_videos_512_512"
-_max_requests = 512
+# Total request budget; VLM_MAX_REQUESTS=0 removes it (run until -t expires)
+_max_requests = int(os.environ.get("VLM_MAX_REQUESTS", "512"))
 prompt_text = "Please describe the content of the video."
 max_tokens = 200
+# Stream bodies from disk through a bounded LRU instead of preloading everything
+stream_payloads = os.environ.get("VLM_STREAM_PAYLOADS", "0") == "1"
+payload_cache_mb = int(os.environ.get("VLM_PAYLOAD_CACHE_MB", "1024"))
+prefetch_depth = int(os.environ.get("VLM_PREFETCH_DEPTH", "32"))
+# Request SSE responses and record TTFT / inter-token latency / TPOT
+stream_response = os.environ.get("VLM_STREAM_RESPONSE", "0") == "1"
+# Build the bodies once per host in shared memory; other local workers attach to them
+shared_payloads = os.environ.get("VLM_SHARED_PAYLOADS", "0") == "1"
+# Compose bodies per request from frames stored once, varying prompt and frame count
+fragment_payloads = os.environ.get("VLM_FRAGMENT_PAYLOADS", "0") == "1"
+frame_counts = [int(c) for c in os.environ.get("VLM_FRAME_COUNTS", "").split(",") if c.strip()]
+frame_sampling = os.environ.get("VLM_FRAME_SAMPLING", "uniform")
+prompts_file = os.environ.get("VLM_PROMPTS_FILE", "")
+# Input-size grid: every request cycles through frames x pixel budget x prompt length cells
+grid_payloads = os.environ.get("VLM_GRID", "0") == "1"
+grid_frames = parse_int_list(os.environ.get("VLM_GRID_FRAMES"), (4, 8, 16), minimum=1)
+grid_pixels = parse_int_list(os.environ.get("VLM_GRID_PIXELS"), (0, 401408, 200704))
+grid_prompt_words = parse_int_list(os.environ.get("VLM_GRID_PROMPT_WORDS"), (0,))
+# Processes resizing grid frames at preload when no wire artifact covers a pixel budget
+preload_workers = int(os.environ.get("VLM_PRELOAD_WORKERS", os.cpu_count() or 1))
 
 def status_monitor():
     """Monitor and report status every 30 seconds"""
@@ -33,6 +65,68 @@ def status_monitor():
     if active_users > 0 or not stop_sending:
         Timer(30.0, status_monitor).start()
 
+
+_client_overhead = ClientOverheadTracker()
+_token_stats = TokenStats()
+# Open-loop arrival schedule (None = closed loop, the default)
+_arrival = schedule_from_env(os.environ)
+# Request budget; coordinated by the master under --master/--worker
+_budget = RequestBudget(_max_requests, int(os.environ.get("VLM_BUDGET_BLOCK", "8")))
+
+
+@events.init.add_listener
+def _attach_budget(environment, **kwargs):
+    _budget.attach(environment)
+
+
+@events.init.add_listener
+def _attach_arrival(environment, **kwargs):
+    if _arrival is not None:
+        _arrival.attach(environment)
+
+
+# Mergeable HDR latency histograms (e2e and derived stream metrics), see latency_histogram.py
+_hdr = HdrRecorder(float(os.environ.get("VLM_HDR_INTERVAL", "10")))
+
+
+@events.init.add_listener
+def _attach_hdr(environment, **kwargs):
+    _hdr.attach(environment)
+
+
+@events.init.add_listener
+def _attach_token_stats(environment, **kwargs):
+    _token_stats.attach(environment)
+
+
+# Prefix-cache workload: repeated videos, varied prompts (None = one pass over distinct videos)
+_prefix = workload_from_env(os.environ, prompt_text)
+if _prefix is not None and (fragment_payloads or grid_payloads):
+    # Those modes pick the prompt and frames per request, so the prefix plan would not hold
+    raise ValueError("VLM_PREFIX_WORKLOAD cannot be combined with VLM_FRAGMENT_PAYLOADS or VLM_GRID")
+
+
+# Per-request trace (JSONL/Parquet) written by a background thread; replaces per-request prints
+_trace = TraceLog(summary_interval=float(os.environ.get("VLM_TRACE_SUMMARY", "30")))
+
+
+@events.init.add_listener
+def _attach_trace(environment, **kwargs):
+    _trace.attach(environment, os.environ.get("VLM_TRACE_FILE", ""))
+
+
+@events.test_stop.add_listener
+def _report_client_overhead(environment, **kwargs):
+    _client_overhead.report()
+    write_token_stats(environment, _token_stats)
+    if _arrival is not None:
+        _arrival.report()
+    if _prefix is not None:
+        _prefix.report()
+    if VLLMUser._payload_source is not None:
+        VLLMUser._payload_source.report()
+
+
 class VLLMUser(HttpUser):
     wait_time = between(0, 0)
     
@@ -42,14 +136,14 @@ class VLLMUser(HttpUser):
     _max_requests = _max_requests
     _stop_sending = False
     
-    # Shared preloaded data across all users
+    # Shared preloaded data across all users (pre-encoded JSON request bodies)
     _preloaded_payloads = []
     _preload_lock = threading.Lock()
     _preload_done = False
-    
-    # Global video index to ensure each request uses a different video
-    _global_video_index = 0
-    _video_index_lock = threading.Lock()
+    _payload_source = None
+    # Per payload index: video directory and frame count, for the trace log
+    _payload_keys = None
+    _payload_frames = None
     
     # Active users tracking
     _active_users = set()
@@ -64,19 +158,9 @@ class VLLMUser(HttpUser):
             
             print("[INFO] Starting video preloading (shared across all users)...")
             start_time = time.time()
-            total_files = 0
-            total_bytes = 0
             
             # Load video directories (nested structure: category/video_name/)
-            video_dirs = []
-            if os.path.exists(VIDEO_BASE_PATH):
-                for category in os.listdir(VIDEO_BASE_PATH):
-                    category_path = os.path.join(VIDEO_BASE_PATH, category)
-                    if os.path.isdir(category_path):
-                        for video_name in os.listdir(category_path):
-                            video_path = os.path.join(category_path, video_name)
-                            if os.path.isdir(video_path):
-                                video_dirs.append(os.path.join(category, video_name))
+            video_dirs = discover_frame_dirs(VIDEO_BASE_PATH)
             
             print(f"[DEBUG] Found {len(video_dirs)} video directories")
             
@@ -88,68 +172,137 @@ class VLLMUser(HttpUser):
             # Preload and encode all video frames
             max_preload = len(video_dirs)  # Load all available videos
             # max_preload=10
-            for i, video_dir in enumerate(video_dirs[:max_preload]):
-                try:
-                    content, file_count, byte_count = cls._load_and_encode_video_frames_static(video_dir)
-                    total_files += file_count
-                    total_bytes += byte_count
-                    
-                    if len(content) > 1:  # Has images
-                        payload = {
-                            "model": "Qwen2.5-VL",
-                            "messages": [{"role": "user", "content": content}],
-                            "max_tokens": max_tokens,
-                            "temperature": 0.2
-                        }
-                        cls._preloaded_payloads.append(payload)
-                        
+
+            if grid_payloads:
+                def progress(budget, done, total):
+                    if done % 100 == 0:
+                        print(f"[INFO] Grid pixels {budget or 'original'}: processed {done}/{total} videos "
+                              f"in {time.time() - start_time:.2f}s")
+                wires = {budget: load_wire(VIDEO_BASE_PATH, "frames", wire_params("frames", max_pixels=budget))
+                         for budget in grid_pixels}
+                source = GridPayloadSource(
+                    VIDEO_BASE_PATH, video_dirs[:max_preload], prompt_text, max_tokens, stream_response,
+                    grid_frames, grid_pixels, grid_prompt_words, progress,
+                    {budget: wire for budget, wire in wires.items() if wire is not None}, preload_workers)
+                cls._payload_source = source
+                cls._payload_keys = [source.key(i) for i in range(len(source))]
+                print(f"[INFO] Built input grid of {len(source.cells)} cells over {len(source.keys)} videos "
+                      f"in {time.time() - start_time:.2f}s")
+                cls._preload_done = True
+                return
+
+            # Fragments prebuilt by scripts/build_wire_payloads.py: preload is mapping files
+            wire = load_wire(VIDEO_BASE_PATH, "frames", wire_params("frames"))
+            if wire is not None:
+                missing = [d for d in video_dirs[:max_preload] if d not in wire]
+                if missing:
+                    print(f"[WARNING] {len(missing)} video directories are not in the wire payloads "
+                          f"(e.g. {missing[0]}); rebuild them with scripts/build_wire_payloads.py")
+                wire_keys = [d for d in video_dirs[:max_preload] if d in wire]
+
+            if fragment_payloads:
+                store = FrameFragmentStore()
+                for i, video_dir in enumerate(video_dirs[:max_preload]):
+                    if wire is not None:
+                        if video_dir in wire:
+                            store.add_fragments(video_dir, wire.frames(video_dir))
+                        continue
+                    store.add_video(VIDEO_BASE_PATH, video_dir)
                     # Progress indicator every 100 videos
                     if (i + 1) % 100 == 0:
                         elapsed = time.time() - start_time
                         print(f"[INFO] Processed {i+1}/{max_preload} videos in {elapsed:.2f}s")
-                        
-                except Exception as e:
-                    print(f"[ERROR] Failed to preload video {video_dir}: {e}")
-                    continue
-            
-            load_time = time.time() - start_time
-            avg_speed = total_bytes / load_time / (1024 * 1024)  # MB/s
-            print(f"[INFO] Preloaded {len(cls._preloaded_payloads)} video payloads in {load_time:.2f}s")
-            print(f"[INFO] Processed {total_files} files, {total_bytes/(1024*1024):.1f}MB at {avg_speed:.1f}MB/s")
+                prompts = load_prompts(prompts_file) if prompts_file else [prompt_text]
+                cls._payload_source = FragmentPayloadSource(
+                    store, prompts, max_tokens, stream_response, frame_counts, frame_sampling)
+                cls._payload_keys = store.keys
+                print(f"[INFO] Stored {len(store)} videos as frame fragments "
+                      f"({store.nbytes / (1024 * 1024):.1f}MB) in {time.time() - start_time:.2f}s")
+                cls._preload_done = True
+                return
+
+            if wire is not None:
+                # Mapped pages are shared by every local worker and loaded on demand, so the
+                # shared-memory and streaming modes have nothing left to save
+                bodies = wire_bodies(wire, wire_keys, prompt_text, max_tokens, stream_response)
+                cls._payload_keys = wire_keys
+                cls._payload_frames = [wire.frame_count(d) for d in wire_keys]
+                cls._preloaded_payloads = bodies
+                cls._payload_source = InMemoryPayloadSource(bodies)
+                print(f"[INFO] Mapped {len(bodies)} wire-ready video payloads "
+                      f"({wire.nbytes / (1024 * 1024):.1f}MB) in {time.time() - start_time:.2f}s")
+                cls._preload_done = True
+                return
+
+            # Only directories with frames become payloads, in order
+            frame_dirs = [(d, frame_count(VIDEO_BASE_PATH, d))
+                          for d in video_dirs[:max_preload]]
+            frame_dirs = [(d, n) for d, n in frame_dirs if n]
+            cls._payload_keys = [d for d, _ in frame_dirs]
+            cls._payload_frames = [n for _, n in frame_dirs]
+
+            if stream_payloads:
+                # Bodies are built on demand
+                stream_dirs = cls._payload_keys
+                cls._payload_source = StreamingPayloadSource(
+                    stream_dirs, lambda d: cls._build_payload_static(d)[0],
+                    payload_cache_mb * 1024 * 1024, prefetch_depth)
+                print(f"[INFO] Streaming {len(stream_dirs)} video payloads from disk "
+                      f"({payload_cache_mb}MB cache, prefetch depth {prefetch_depth}) "
+                      f"after {time.time() - start_time:.2f}s")
+                cls._preload_done = True
+                return
+
+            if shared_payloads:
+                shared_key = payload_set_key(
+                    "frames", {"prompt": prompt_text, "max_tokens": max_tokens, "stream": stream_response},
+                    [os.path.join(VIDEO_BASE_PATH, d) for d in video_dirs[:max_preload]])
+                cls._preloaded_payloads = load_shared_payloads(
+                    shared_key, lambda: cls._build_payloads(video_dirs[:max_preload], start_time))
+            else:
+                cls._preloaded_payloads = cls._build_payloads(video_dirs[:max_preload], start_time)
+            # A body that failed to build or came out empty shifts every later index
+            if len(cls._preloaded_payloads) != len(cls._payload_keys):
+                print(f"[WARNING] Built {len(cls._preloaded_payloads)} payloads for {len(cls._payload_keys)} "
+                      f"video directories; trace records will not name their video")
+                cls._payload_keys = cls._payload_frames = None
+            cls._payload_source = InMemoryPayloadSource(cls._preloaded_payloads)
             cls._preload_done = True
 
-    @staticmethod
-    def _load_and_encode_video_frames_static(video_dir):
-        """Static method to load and encode up to 8 frames from a video directory"""
-        video_path = os.path.join(VIDEO_BASE_PATH, video_dir)
-        frame_files = sorted(glob.glob(os.path.join(video_path, "*.jpg")))
-        
-        file_count = 0
+    @classmethod
+    def _build_payloads(cls, video_dirs, start_time):
+        """Build the request body for every video directory that has frames"""
+        payloads = []
+        total_files = 0
         total_bytes = 0
-        
-        if not frame_files:
-            return [{"type": "text", "text": prompt_text}], 0, 0
-        
-        # Load all available frames (no limit)
-        content = [{"type": "text", "text": prompt_text}]
-        
-        for frame_file in frame_files:
+        for i, video_dir in enumerate(video_dirs):
             try:
-                with open(frame_file, "rb") as f:
-                    image_bytes = f.read()
-                    file_count += 1
-                    total_bytes += len(image_bytes)
-                    image_base64 = base64.b64encode(image_bytes).decode()
-
-                content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                })
+                body, file_count, byte_count = cls._build_payload_static(video_dir)
+                total_files += file_count
+                total_bytes += byte_count
+                
+                if body is not None:  # Has images
+                    payloads.append(body)
+                    
+                # Progress indicator every 100 videos
+                if (i + 1) % 100 == 0:
+                    elapsed = time.time() - start_time
+                    print(f"[INFO] Processed {i+1}/{len(video_dirs)} videos in {elapsed:.2f}s")
+                    
             except Exception as e:
-                print(f"[ERROR] Failed to load frame {frame_file}: {e}")
+                print(f"[ERROR] Failed to preload video {video_dir}: {e}")
                 continue
         
-        return content, file_count, total_bytes
+        load_time = time.time() - start_time
+        avg_speed = total_bytes / load_time / (1024 * 1024)  # MB/s
+        print(f"[INFO] Preloaded {len(payloads)} video payloads in {load_time:.2f}s")
+        print(f"[INFO] Processed {total_files} files, {total_bytes/(1024*1024):.1f}MB at {avg_speed:.1f}MB/s")
+        return payloads
+
+    @staticmethod
+    def _build_payload_static(video_dir):
+        """Build the encoded request body for one video directory (None if it has no frames)"""
+        return build_frame_body(VIDEO_BASE_PATH, video_dir, prompt_text, max_tokens, stream_response)
 
     def on_start(self):
         user_id = id(self)
@@ -165,7 +318,7 @@ class VLLMUser(HttpUser):
         # Initialize per-user index for sequential selection
         self.current_index = 0
         
-        print(f"[INFO] User {user_id} ready with {len(self._preloaded_payloads)} preloaded payloads")
+        print(f"[INFO] User {user_id} ready with {len(self._payload_source or [])} preloaded payloads")
         
         # Start status monitoring (only once)
         if len(VLLMUser._active_users) == 1:
@@ -186,6 +339,8 @@ class VLLMUser(HttpUser):
 
     @task
     def send_chat_completion(self):
+        task_start = time.perf_counter()
+
         # Check if we should stop sending requests and increment counter atomically
         should_send = False
         current_count = 0
@@ -195,77 +350,119 @@ class VLLMUser(HttpUser):
             if VLLMUser._stop_sending:
                 print(f"[INFO] User stopping - already reached {VLLMUser._request_count} requests")
                 raise StopUser()
-                
-            if VLLMUser._request_count < VLLMUser._max_requests:
-                # Increment request count and allow this request
+
+        # Global sequence number; the master hands these out in distributed runs.
+        # Claimed outside _request_lock so a worker waiting on the master does not block its other users
+        claim = _budget.claim()
+
+        with VLLMUser._request_lock:
+            if claim is not None:
+                sequence, is_final_request = claim
                 VLLMUser._request_count += 1
-                current_count = VLLMUser._request_count
+                current_count = sequence + 1
                 should_send = True
                 
                 # Check if this is the last request
-                if current_count >= VLLMUser._max_requests:
+                if is_final_request:
                     VLLMUser._stop_sending = True
-                    is_final_request = True
                     print(f"[INFO] Request #{current_count}: This is the final request")
             else:
+                VLLMUser._stop_sending = True
                 print(f"[INFO] Already reached maximum requests ({VLLMUser._max_requests}), stopping user")
                 raise StopUser()
         
         # Only send request if we got permission
         if not should_send:
             raise StopUser()
+
+        # Open-loop mode: wait for this request's intended send time
+        intended_time = None
+        if _arrival is not None:
+            intended_time = _arrival.wait_for_slot()
+            task_start = time.perf_counter()  # overhead excludes the pacing sleep
             
-        if not self._preloaded_payloads:
+        payload_source = VLLMUser._payload_source
+        if not payload_source:
             print(f"[WARNING] No preloaded payloads available for request #{current_count}")
             raise StopUser()
         
-        # Get unique video index for this request
-        video_index = 0
-        with VLLMUser._video_index_lock:
-            video_index = VLLMUser._global_video_index % len(self._preloaded_payloads)
-            VLLMUser._global_video_index += 1
+        # Distinct sequence numbers map to distinct videos until the set wraps,
+        # unless the prefix workload plans repeats
+        expected_cache = None
+        if _prefix is not None:
+            video_index, expected_cache = _prefix.plan(sequence, len(payload_source))
+        else:
+            video_index = sequence % len(payload_source)
         
-        # Use the unique video index to select payload
-        payload = self._preloaded_payloads[video_index]
-        print(f"[INFO] Request #{current_count} using video index {video_index}")
+        # Use the video index to select the pre-encoded body; the sequence is
+        # already claimed, so an unloadable body falls through to the next one
+        planned_index = video_index
+        video_index, body = first_available(payload_source, video_index)
+        if body is None:
+            VLLMUser._stop_sending = True
+            print(f"[ERROR] No payload could be loaded for request #{current_count}, stopping")
+            raise StopUser()
+        if video_index != planned_index:
+            print(f"[WARNING] Payload {planned_index} unavailable, request #{current_count} sends {video_index}")
+            expected_cache = None  # the prefix plan no longer describes this request
+        if _prefix is not None:
+            body = _prefix.compose(body, sequence)
         
         headers = {"Content-Type": "application/json"}
 
         # Send the request
+        _client_overhead.record(time.perf_counter() - task_start)
         request_start_time = time.time()
+        status, usage, ttft, error = 0, None, None, None
         try:
-            response = self.client.post(
-                "/v1/chat/completions",
-                data=json.dumps(payload),
-                headers=headers,
-                name="vllm_video_completion",
-                timeout=300  # 5 minutes timeout
-            )
+            if stream_response:
+                response, stream_result = post_streaming_completion(
+                    self.client, self.environment.events, body, headers,
+                    name="vllm_video_completion", timeout=300)
+                usage = stream_result.usage if stream_result else None
+                ttft = stream_result.ttft if stream_result else None
+            else:
+                response = self.client.post(
+                    "/v1/chat/completions",
+                    data=body,
+                    headers=headers,
+                    name="vllm_video_completion",
+                    timeout=300  # 5 minutes timeout
+                )
+                usage = extract_usage(response)
             request_duration = time.time() - request_start_time
-            print(f"[INFO] Request #{current_count} completed in {request_duration:.2f}s with status: {response.status_code}")
-            
-            # # Debug: Print model inference results
-            # if response.status_code == 200:
-            #     try:
-            #         response_data = response.json()
-            #         print(f"[DEBUG] Request #{current_count} - Full Response: {json.dumps(response_data, indent=2, ensure_ascii=False)}")
-                    
-            #         # Extract and print the model's response content
-            #         if 'choices' in response_data and len(response_data['choices']) > 0:
-            #             model_response = response_data['choices'][0].get('message', {}).get('content', '')
-            #             print(f"[DEBUG] Request #{current_count} - Model Response: {model_response}")
-            #         else:
-            #             print(f"[DEBUG] Request #{current_count} - No choices found in response")
-                        
-            #     except json.JSONDecodeError as json_err:
-            #         print(f"[ERROR] Request #{current_count} - Failed to parse JSON response: {json_err}")
-            #         print(f"[DEBUG] Request #{current_count} - Raw response text: {response.text}")
-            # else:
-            #     print(f"[ERROR] Request #{current_count} - HTTP Error {response.status_code}: {response.text}")
-                
+            status = response.status_code
+            if response.status_code == 200:
+                _token_stats.record(usage, request_start_time, request_start_time + request_duration)
+            else:
+                error = response.text[:500]
         except Exception as e:
-            print(f"[ERROR] Request #{current_count} failed: {e}")
+            error = str(e)
+        request_end_time = time.time()
         
+        frames = getattr(body, "frames", None)
+        if frames is None and VLLMUser._payload_frames:
+            frames = VLLMUser._payload_frames[video_index]
+        _trace.record(
+            request_id=current_count, user=getattr(self, 'user_id', None), payload=video_index,
+            payload_key=VLLMUser._payload_keys[video_index] if VLLMUser._payload_keys else None,
+            frames=frames, bytes_sent=len(body), intended=intended_time, start=request_start_time, end=request_end_time,
+            latency_ms=(request_end_time - request_start_time) * 1000,
+            ttft_ms=ttft * 1000 if ttft is not None else None, status=status, ok=status == 200, error=error,
+            prompt_tokens=usage.get("prompt_tokens") if usage else None,
+            completion_tokens=usage.get("completion_tokens") if usage else None, cache=expected_cache,
+            cell=payload_source.cell_label(video_index) if grid_payloads else None)
+        if grid_payloads:
+            fire_grid_cell(self.environment.events, "vllm_video_completion", payload_source.cell_label(video_index),
+                           request_start_time, request_end_time, None if status == 200 else Exception(error))
+        if expected_cache is not None:
+            _prefix.record(self.environment.events, "vllm_video_completion", expected_cache,
+                           request_start_time, request_end_time, None if status == 200 else Exception(error))
+        
+        if intended_time is not None:
+            fire_intended_latency(self.environment.events, "vllm_video_completion", intended_time, time.time(),
+                                  None if status == 200 else Exception(error))
+
         # Stop this user after completing the request
         if is_final_request:
             print(f"[INFO] Final request completed. Total requests sent: {current_count}")
@@ -1,89 +1,136 @@
-from locust import HttpUser, task, between
+from locust import HttpUser, task, between, events
 from locust.exception import StopUser
-import base64
-import json
 import os
-import glob
 import time
 import threading
-from PIL import Image
-import io
+from payload_utils import ClientOverheadTracker
+from payload_sets import discover_image_files
+from payload_cache import FrameCache
+from image_preload import image_cache_params, preload_image_payloads
+from stream_metrics import post_streaming_completion
+from token_stats import TokenStats, extract_usage, write_token_stats
+from arrival import schedule_from_env, fire_intended_latency
+from shared_payloads import load_shared_payloads, payload_set_key
+from request_budget import RequestBudget
+from latency_histogram import HdrRecorder
+from trace_log import TraceLog
+from prefix_workload import workload_from_env
+from wire_payloads import load_wire, wire_bodies, wire_params
 
 IMAGE_BASE_PATH = "./cc_ocr_data"
 prompt_text = "what is the text in the image?"
 max_tokens = 64
-_max_requests = 500
+# Total request budget; VLM_MAX_REQUESTS=0 removes it (run until -t expires)
+_max_requests = int(os.environ.get("VLM_MAX_REQUESTS", "500"))
+# Request SSE responses and record TTFT / inter-token latency / TPOT
+stream_response = os.environ.get("VLM_STREAM_RESPONSE", "0") == "1"
+# Build the bodies once per host in shared memory; other local workers attach to them
+shared_payloads = os.environ.get("VLM_SHARED_PAYLOADS", "0") == "1"
+# Client-side resize before encoding (WIDTHxHEIGHT); vary it to measure input-size effects
+image_size = tuple(int(v) for v in os.environ.get("VLM_IMAGE_SIZE", "1024x1024").lower().split("x"))
+# Number of images to preload; 0 uses the whole dataset
+image_limit = int(os.environ.get("VLM_IMAGE_LIMIT", "500"))
+# Resized JPEGs are cached here across runs; set VLM_PAYLOAD_CACHE_DIR="" to disable
+payload_cache_dir = os.environ.get("VLM_PAYLOAD_CACHE_DIR", ".payload_cache")
+# Processes used to resize and encode images at preload; 1 encodes serially in-process
+preload_workers = int(os.environ.get("VLM_PRELOAD_WORKERS", os.cpu_count() or 1))
 
 # Preload images at module level (before any test starts)
 print("[INFO] Starting image preloading at module initialization...")
 preload_start_time = time.time()
 
-# Load all image files recursively
-image_files = glob.glob(os.path.join(IMAGE_BASE_PATH, "**", "*.jpg"), recursive=True) + \
-             glob.glob(os.path.join(IMAGE_BASE_PATH, "**", "*.png"), recursive=True) + \
-             glob.glob(os.path.join(IMAGE_BASE_PATH, "**", "*.jpeg"), recursive=True)
-
-# Limit to maximum 500 images
-if len(image_files) > 500:
-    image_files = image_files[:500]
-    print(f"[DEBUG] Limited to 500 images out of total available")
+# Load all image files recursively, up to VLM_IMAGE_LIMIT
+image_files = discover_image_files(IMAGE_BASE_PATH, image_limit or None)
 
 print(f"[DEBUG] Will process {len(image_files)} image files")
 
+def _build_image_payloads():
+    """Resize and encode every image into a ready-to-send request body, in a process pool"""
+    global image_files
+    frame_cache = FrameCache(payload_cache_dir, image_cache_params(image_size)) if payload_cache_dir else None
+    payloads, image_files = preload_image_payloads(
+        image_files, image_size, prompt_text, max_tokens, stream_response, frame_cache, preload_workers)
+    return payloads
+
 _preloaded_payloads = []
-if image_files:
-    total_files = 0
-    total_bytes = 0
-    
-    for i, image_file in enumerate(image_files):
-        try:
-            # Load and resize image to 1024x1024
-            with Image.open(image_file) as img:
-                img = img.convert('RGB')
-                img = img.resize((1024, 1024), Image.Resampling.LANCZOS)
-                
-                # Convert to bytes
-                img_buffer = io.BytesIO()
-                img.save(img_buffer, format='JPEG', quality=95)
-                image_bytes = img_buffer.getvalue()
-                
-                total_files += 1
-                total_bytes += len(image_bytes)
-                image_base64 = base64.b64encode(image_bytes).decode()
-            
-            content = [
-                {"type": "text", "text": prompt_text},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                }
-            ]
-            
-            payload = {
-                "model": "Qwen2.5-VL",
-                "messages": [{"role": "user", "content": content}],
-                "max_tokens": max_tokens,
-                "temperature": 0.2
-            }
-            _preloaded_payloads.append(payload)
-            
-            # Progress indicator every 100 images
-            if (i + 1) % 100 == 0:
-                elapsed = time.time() - preload_start_time
-                print(f"[INFO] Processed {i+1}/{len(image_files)} images in {elapsed:.2f}s")
-                
-        except Exception as e:
-            print(f"[ERROR] Failed to preload image {image_file}: {e}")
-            continue
-    
-    load_time = time.time() - preload_start_time
-    avg_speed = total_bytes / load_time / (1024 * 1024)  # MB/s
-    print(f"[INFO] Preloaded {len(_preloaded_payloads)} image payloads in {load_time:.2f}s")
-    print(f"[INFO] Processed {total_files} files, {total_bytes/(1024*1024):.1f}MB at {avg_speed:.1f}MB/s")
+# Fragments prebuilt by scripts/build_wire_payloads.py for this image size: preload is mapping files
+_wire = load_wire(IMAGE_BASE_PATH, "images", wire_params("images", image_size)) if image_files else None
+if _wire is not None:
+    image_files = [f for f in image_files if os.path.relpath(f, IMAGE_BASE_PATH) in _wire]
+    _preloaded_payloads = wire_bodies(_wire, [os.path.relpath(f, IMAGE_BASE_PATH) for f in image_files],
+                                      prompt_text, max_tokens, stream_response)
+    print(f"[INFO] Mapped {len(_preloaded_payloads)} wire-ready image payloads "
+          f"in {time.time() - preload_start_time:.2f}s")
+elif image_files:
+    if shared_payloads:
+        _shared_key = payload_set_key(
+            "image", {"prompt": prompt_text, "max_tokens": max_tokens, "stream": stream_response,
+                      "size": list(image_size)}, image_files)
+        _preloaded_payloads = load_shared_payloads(_shared_key, _build_image_payloads)
+    else:
+        _preloaded_payloads = _build_image_payloads()
 else:
     print(f"[ERROR] No image files found in {IMAGE_BASE_PATH}")
 
 print("[INFO] Image preloading completed. Test can start without including loading time.")
+# Source file per payload index for the trace log (unknown if some images failed to load)
+_payload_keys = image_files if len(image_files) == len(_preloaded_payloads) else None
+
+_client_overhead = ClientOverheadTracker()
+_token_stats = TokenStats()
+# Open-loop arrival schedule (None = closed loop, the default)
+_arrival = schedule_from_env(os.environ)
+# Request budget; coordinated by the master under --master/--worker
+_budget = RequestBudget(_max_requests, int(os.environ.get("VLM_BUDGET_BLOCK", "8")))
+
+
+@events.init.add_listener
+def _attach_budget(environment, **kwargs):
+    _budget.attach(environment)
+
+
+@events.init.add_listener
+def _attach_arrival(environment, **kwargs):
+    if _arrival is not None:
+        _arrival.attach(environment)
+
+
+# Mergeable HDR latency histograms (e2e and derived stream metrics), see latency_histogram.py
+_hdr = HdrRecorder(float(os.environ.get("VLM_HDR_INTERVAL", "10")))
+
+
+@events.init.add_listener
+def _attach_hdr(environment, **kwargs):
+    _hdr.attach(environment)
+
+
+@events.init.add_listener
+def _attach_token_stats(environment, **kwargs):
+    _token_stats.attach(environment)
+
+
+# Per-request trace (JSONL/Parquet) written by a background thread; replaces per-request prints
+_trace = TraceLog(summary_interval=float(os.environ.get("VLM_TRACE_SUMMARY", "30")))
+
+
+@events.init.add_listener
+def _attach_trace(environment, **kwargs):
+    _trace.attach(environment, os.environ.get("VLM_TRACE_FILE", ""))
+
+
+# Prefix-cache workload (VLM_PREFIX_WORKLOAD=1): repeats images, image before prompt, shared system prompt
+_prefix = workload_from_env(os.environ, prompt_text)
+
+
+@events.test_stop.add_listener
+def _report_client_overhead(environment, **kwargs):
+    _client_overhead.report()
+    write_token_stats(environment, _token_stats)
+    if _arrival is not None:
+        _arrival.report()
+    if _prefix is not None:
+        _prefix.report()
+
 
 class VLLMUser(HttpUser):
     wait_time = between(0, 0)
@@ -94,10 +141,6 @@ class VLLMUser(HttpUser):
     _max_requests = _max_requests
     _stop_sending = False
     
-    # Global image index to ensure each request uses a different image
-    _global_image_index = 0
-    _image_index_lock = threading.Lock()
-    
     # Active users tracking
     _active_users = set()
     _users_lock = threading.Lock()
@@ -125,6 +168,8 @@ class VLLMUser(HttpUser):
 
     @task
     def send_chat_completion(self):
+        task_start = time.perf_counter()
+
         # Check if we should stop sending requests and increment counter atomically
         should_send = False
         current_count = 0
@@ -134,63 +179,103 @@ class VLLMUser(HttpUser):
             if VLLMUser._stop_sending:
                 print(f"[INFO] User stopping - already reached {VLLMUser._request_count} requests")
                 raise StopUser()
-                
-            if VLLMUser._request_count < VLLMUser._max_requests:
-                # Increment request count and allow this request
+
+        # Global sequence number; the master hands these out in distributed runs.
+        # Claimed outside _request_lock so a worker waiting on the master does not block its other users
+        claim = _budget.claim()
+
+        with VLLMUser._request_lock:
+            if claim is not None:
+                sequence, is_final_request = claim
                 VLLMUser._request_count += 1
-                current_count = VLLMUser._request_count
+                current_count = sequence + 1
                 should_send = True
                 
                 # Check if this is the last request
-                if current_count >= VLLMUser._max_requests:
+                if is_final_request:
                     VLLMUser._stop_sending = True
-                    is_final_request = True
                     print(f"[INFO] Request #{current_count}: This is the final request")
             else:
+                VLLMUser._stop_sending = True
                 print(f"[INFO] Already reached maximum requests ({VLLMUser._max_requests}), stopping user")
                 raise StopUser()
         
         # Only send request if we got permission
         if not should_send:
             raise StopUser()
+
+        # Open-loop mode: wait for this request's intended send time
+        intended_time = None
+        if _arrival is not None:
+            intended_time = _arrival.wait_for_slot()
+            task_start = time.perf_counter()  # overhead excludes the pacing sleep
             
         if not _preloaded_payloads:
             print(f"[WARNING] No preloaded payloads available for request #{current_count}")
             raise StopUser()
         
-        # Get unique image index for this request
-        image_index = 0
-        with VLLMUser._image_index_lock:
-            image_index = VLLMUser._global_image_index % len(_preloaded_payloads)
-            VLLMUser._global_image_index += 1
+        # Distinct sequence numbers map to distinct images until the set wraps,
+        # unless the prefix workload plans repeats
+        expected_cache = None
+        if _prefix is not None:
+            image_index, expected_cache = _prefix.plan(sequence, len(_preloaded_payloads))
+        else:
+            image_index = sequence % len(_preloaded_payloads)
         
-        # Use the unique image index to select payload
-        payload = _preloaded_payloads[image_index]
-        print(f"[INFO] Request #{current_count} using image index {image_index}")
+        # Use the unique image index to select the pre-encoded body
+        body = _preloaded_payloads[image_index]
+        if _prefix is not None:
+            body = _prefix.compose(body, sequence)
         
         headers = {"Content-Type": "application/json"}
 
         # Send the request
+        _client_overhead.record(time.perf_counter() - task_start)
         request_start_time = time.time()
+        status, usage, ttft, error = 0, None, None, None
         try:
-            response = self.client.post(
-                "/v1/chat/completions",
-                data=json.dumps(payload),
-                headers=headers,
-                name="vllm_single_image_completion",
-                timeout=300  # 5 minutes timeout
-            )
+            if stream_response:
+                response, stream_result = post_streaming_completion(
+                    self.client, self.environment.events, body, headers,
+                    name="vllm_single_image_completion", timeout=300)
+                usage = stream_result.usage if stream_result else None
+                ttft = stream_result.ttft if stream_result else None
+            else:
+                response = self.client.post(
+                    "/v1/chat/completions",
+                    data=body,
+                    headers=headers,
+                    name="vllm_single_image_completion",
+                    timeout=300  # 5 minutes timeout
+                )
+                usage = extract_usage(response)
             request_duration = time.time() - request_start_time
-            
-            if response.status_code == 400:
-                print(f"[ERROR] Request #{current_count} failed with 400. Response: {response.text}")
+            status = response.status_code
+            if response.status_code == 200:
+                _token_stats.record(usage, request_start_time, request_start_time + request_duration)
             else:
-                print(f"[INFO] Request #{current_count} completed in {request_duration:.2f}s with status: {response.status_code}")
+                error = response.text[:500]
                 
         except Exception as e:
-            request_duration = time.time() - request_start_time
-            print(f"[ERROR] Request #{current_count} failed after {request_duration:.2f}s: {e}")
+            error = str(e)
+        request_end_time = time.time()
         
+        _trace.record(
+            request_id=current_count, user=getattr(self, 'user_id', None), payload=image_index,
+            payload_key=_payload_keys[image_index] if _payload_keys else None,
+            frames=1, bytes_sent=len(body), intended=intended_time, start=request_start_time, end=request_end_time,
+            latency_ms=(request_end_time - request_start_time) * 1000,
+            ttft_ms=ttft * 1000 if ttft is not None else None, status=status, ok=status == 200, error=error,
+            prompt_tokens=usage.get("prompt_tokens") if usage else None,
+            completion_tokens=usage.get("completion_tokens") if usage else None, cache=expected_cache)
+        if expected_cache is not None:
+            _prefix.record(self.environment.events, "vllm_single_image_completion", expected_cache,
+                           request_start_time, request_end_time, None if status == 200 else Exception(error))
+        
+        if intended_time is not None:
+            fire_intended_latency(self.environment.events, "vllm_single_image_completion", intended_time, time.time(),
+                                  None if status == 200 else Exception(error))
+
         # Stop this user after completing the request
         if is_final_request:
             print(f"[INFO] Final request completed. Total requests sent: {current_count}")
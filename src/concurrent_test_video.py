@@ -1,80 +1,113 @@
 #!/usr/bin/env python3
 """
-Debug version of locustfile_video_net.py to identify why requests are 0
+Locust load test sending raw videos to a vLLM chat completions endpoint.
+
+Each video under VIDEO_BASE_PATH is decoded once at preload (in a process
+pool, with decoded frames cached on disk in VLM_PAYLOAD_CACHE_DIR), sampled
+to at most ``max_frames`` frames and sent as one image_url part per frame.
+Users then walk the payloads round-robin until the request budget is spent.
 """
-from locust import HttpUser, task, between
+from locust import HttpUser, task, between, events
 from locust.exception import StopUser
 import base64
-import json
 import os
-import glob
 import time
 import threading
-import numpy as np
-from PIL import Image
-from io import BytesIO
-from qwen_vl_utils import process_vision_info
-import argparse
-import sys
+from payload_utils import ClientOverheadTracker
+from payload_sets import discover_video_files, build_video_messages, build_video_body
+from payload_cache import FrameCache, read_frames
+from payload_source import InMemoryPayloadSource, StreamingPayloadSource, first_available
+from stream_metrics import post_streaming_completion
+from token_stats import TokenStats, extract_usage, write_token_stats
+from arrival import schedule_from_env, fire_intended_latency
+from shared_payloads import load_shared_payloads, payload_set_key
+from request_budget import RequestBudget
+from latency_histogram import HdrRecorder
+from trace_log import TraceLog
+from prefix_workload import workload_from_env
+from video_preload import iter_video_frames, frame_cache_params, StageStats
 
 # Default values
 VIDEO_BASE_PATH = "videos_directory"
-_max_requests = 584
+# Total request budget; VLM_MAX_REQUESTS=0 removes it (run until -t expires)
+_max_requests = int(os.environ.get("VLM_MAX_REQUESTS", "584"))
 prompt_text = "Please describe the content of the video."
 max_tokens = 200
 max_frames = 16
 min_pixels = 28 * 28
 max_pixels = 512 * 512
 fps = 1.0
+# Decoded frames are cached here across runs; set VLM_PAYLOAD_CACHE_DIR="" to disable
+payload_cache_dir = os.environ.get("VLM_PAYLOAD_CACHE_DIR", ".payload_cache")
+# Number of processes decoding videos in parallel during preload (1 = serial)
+preload_workers = int(os.environ.get("VLM_PRELOAD_WORKERS", os.cpu_count() or 1))
+# Stream bodies from the frame cache through a bounded LRU instead of preloading everything
+stream_payloads = os.environ.get("VLM_STREAM_PAYLOADS", "0") == "1"
+payload_cache_mb = int(os.environ.get("VLM_PAYLOAD_CACHE_MB", "1024"))
+prefetch_depth = int(os.environ.get("VLM_PREFETCH_DEPTH", "32"))
+# Request SSE responses and record TTFT / inter-token latency / TPOT
+stream_response = os.environ.get("VLM_STREAM_RESPONSE", "0") == "1"
+# Build the bodies once per host in shared memory; other local workers attach to them
+shared_payloads = os.environ.get("VLM_SHARED_PAYLOADS", "0") == "1"
+
+
+_client_overhead = ClientOverheadTracker()
+_token_stats = TokenStats()
+# Open-loop arrival schedule (None = closed loop, the default)
+_arrival = schedule_from_env(os.environ)
+# Request budget; coordinated by the master under --master/--worker
+_budget = RequestBudget(_max_requests, int(os.environ.get("VLM_BUDGET_BLOCK", "8")))
+
+
+@events.init.add_listener
+def _attach_budget(environment, **kwargs):
+    _budget.attach(environment)
+
+
+@events.init.add_listener
+def _attach_arrival(environment, **kwargs):
+    if _arrival is not None:
+        _arrival.attach(environment)
+
+
+# Mergeable HDR latency histograms (e2e and derived stream metrics), see latency_histogram.py
+_hdr = HdrRecorder(float(os.environ.get("VLM_HDR_INTERVAL", "10")))
+
+
+@events.init.add_listener
+def _attach_hdr(environment, **kwargs):
+    _hdr.attach(environment)
+
+
+@events.init.add_listener
+def _attach_token_stats(environment, **kwargs):
+    _token_stats.attach(environment)
+
+
+# Prefix-cache workload: repeated videos, varied prompts (None = one pass over distinct videos)
+_prefix = workload_from_env(os.environ, prompt_text)
+
+
+# Per-request trace (JSONL/Parquet) written by a background thread; replaces per-request prints
+_trace = TraceLog(summary_interval=float(os.environ.get("VLM_TRACE_SUMMARY", "30")))
+
+
+@events.init.add_listener
+def _attach_trace(environment, **kwargs):
+    _trace.attach(environment, os.environ.get("VLM_TRACE_FILE", ""))
+
+
+@events.test_stop.add_listener
+def _report_client_overhead(environment, **kwargs):
+    _client_overhead.report()
+    write_token_stats(environment, _token_stats)
+    if _arrival is not None:
+        _arrival.report()
+    if _prefix is not None:
+        _prefix.report()
+    if VLLMUser._payload_source is not None:
+        VLLMUser._payload_source.report()
 
-def prepare_message_for_vllm(content_messages):
-    """Convert video frames to individual image_url messages for vLLM compatibility"""
-    # print("[DEBUG] prepare_message_for_vllm called")
-    vllm_messages = []
-    for message in content_messages:
-        message_content_list = message["content"]
-        if not isinstance(message_content_list, list):
-            vllm_messages.append(message)
-            continue
-
-        new_content_list = []
-        for part_message in message_content_list:
-            if 'video' in part_message:
-                # print(f"[DEBUG] Processing video: {part_message.get('video', 'unknown')}")
-                video_message = [{'content': [part_message]}]
-                try:
-                    image_inputs, video_inputs, video_kwargs = process_vision_info(video_message, return_video_kwargs=True)
-                    assert video_inputs is not None, "video_inputs should not be None"
-                    video_input = (video_inputs.pop()).permute(0, 2, 3, 1).numpy().astype(np.uint8)
-                    # Limit frames to match server configuration (image=8)
-                    selected_frames = video_input[:max_frames] if len(video_input) > max_frames else video_input
-                    print(f"[DEBUG] Limited to {len(selected_frames)} frames (from {len(video_input)} total frames)")
-                    
-                    # Convert each frame to individual image_url messages
-                    for i, frame in enumerate(selected_frames):
-                        img = Image.fromarray(frame)
-                        output_buffer = BytesIO()
-                        img.save(output_buffer, format="jpeg")
-                        byte_data = output_buffer.getvalue()
-                        base64_str = base64.b64encode(byte_data).decode("utf-8")
-                        
-                        # Add each frame as a separate image_url
-                        new_content_list.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:image/jpeg;base64,{base64_str}"}
-                        })
-                        # print(f"[DEBUG] Added frame {i+1} as image_url")
-                except Exception as e:
-                    print(f"[ERROR] Failed to process video: {e}")
-                    return [], {}
-            else:
-                new_content_list.append(part_message)
-                
-        message["content"] = new_content_list
-        vllm_messages.append(message)
-    
-    # print(f"[DEBUG] Returning {len(vllm_messages)} messages")
-    return vllm_messages, {}
 
 class VLLMUser(HttpUser):
     wait_time = between(0, 0)
@@ -85,14 +118,14 @@ class VLLMUser(HttpUser):
     _max_requests = _max_requests
     _stop_sending = False
     
-    # Shared preloaded data across all users
+    # Shared preloaded data across all users (pre-encoded JSON request bodies)
     _preloaded_payloads = []
     _preload_lock = threading.Lock()
     _preload_done = False
-    
-    # Global video index to ensure each request uses a different video
-    _global_video_index = 0
-    _video_index_lock = threading.Lock()
+    _payload_source = None
+    # Per payload index: video file and frame count, for the trace log (None = unknown)
+    _payload_keys = None
+    _payload_frames = None
     
     # Real request timing (excluding preload time)
     _first_request_time = None
@@ -111,15 +144,8 @@ class VLLMUser(HttpUser):
             start_time = time.time()
             
             # Load video files recursively from subdirectories
-            if os.path.exists(VIDEO_BASE_PATH):
-                video_files = []
-                for ext in ['*.mp4', '*.avi', '*.mov', '*.mkv']:
-                    # Search recursively in subdirectories
-                    found_files = glob.glob(os.path.join(VIDEO_BASE_PATH, '**', ext), recursive=True)
-                    video_files.extend(found_files)
-                    print(f"[DEBUG] Found {len(found_files)} {ext} files")
-            else:
-                video_files = []
+            video_files = discover_video_files(VIDEO_BASE_PATH)
+            if not os.path.exists(VIDEO_BASE_PATH):
                 print(f"[ERROR] Video directory does not exist: {VIDEO_BASE_PATH}")
             
             print(f"[DEBUG] Total video files found: {len(video_files)}")
@@ -134,63 +160,114 @@ class VLLMUser(HttpUser):
             # max_preload=10 
             print(f"[DEBUG] Will preload {max_preload} videos out of {len(video_files)} total")
             
-            successful_loads = 0
-            for i, video_file in enumerate(video_files[:max_preload]):
-                print(f"[DEBUG] Processing video {i+1}/{max_preload}: {video_file}")
-                try:
-                    messages = cls._prepare_video_message_static(video_file)
-                    if messages:
-                        # print(f"[DEBUG] Prepared messages for {video_file}")
-                        processed_messages, video_kwargs = prepare_message_for_vllm(messages)
-                        if processed_messages:
-                            payload = {
-                                "model": "Qwen2.5-VL",
-                                "messages": processed_messages,
-                                "max_tokens": max_tokens,
-                                "temperature": 0.2
-                            }
-                            cls._preloaded_payloads.append(payload)
-                            successful_loads += 1
-                            # print(f"[DEBUG] Successfully preloaded {video_file}")
-                        else:
-                            print(f"[ERROR] No processed messages for {video_file}")
-                    else:
-                        print(f"[ERROR] No messages prepared for {video_file}")
-                except Exception as e:
-                    print(f"[ERROR] Failed to preload video {video_file}: {e}")
-                    import traceback
-                    traceback.print_exc()
+            frame_cache = None
+            if payload_cache_dir:
+                frame_cache = FrameCache(payload_cache_dir,
+                                         frame_cache_params(min_pixels, max_pixels, fps, max_frames))
+
+            # Build one decode task per video; cache lookups happen inside the workers
+            tasks = []
+            task_messages = {}
+            for video_file in video_files[:max_preload]:
+                messages = cls._prepare_video_message_static(video_file)
+                if not messages:
+                    print(f"[ERROR] No messages prepared for {video_file}")
                     continue
-            
-            load_time = time.time() - start_time
-            print(f"[INFO] Preloaded {len(cls._preloaded_payloads)} video payloads in {load_time:.2f}s")
-            print(f"[DEBUG] Success rate: {successful_loads}/{max_preload}")
+                video_part = messages[-1]["content"][-1]
+                cache_path = frame_cache.entry_path(video_file) if frame_cache is not None else None
+                tasks.append((video_file, video_part, max_frames, cache_path))
+                task_messages[video_file] = messages
+            if frame_cache is not None:
+                frame_cache.save()
+
+            streaming = stream_payloads and frame_cache is not None
+            if stream_payloads and frame_cache is None:
+                print("[WARNING] VLM_STREAM_PAYLOADS needs the frame cache; falling back to full preload")
+            if streaming:
+                # Only decode what the cache lacks; bodies are built from the cache on demand
+                cache_paths = {task[0]: task[3] for task in tasks}
+                tasks = [task for task in tasks if not os.path.exists(task[3])]
+                cls._decode_payloads(tasks, task_messages, frame_cache, start_time, keep_bodies=False)
+                load_time = time.time() - start_time
+                stream_files = [f for f, path in cache_paths.items() if os.path.exists(path)]
+                cls._payload_keys, cls._payload_frames = stream_files, None
+                cls._payload_source = StreamingPayloadSource(
+                    stream_files, lambda f: cls._load_cached_body_static(f, cache_paths[f]),
+                    payload_cache_mb * 1024 * 1024, prefetch_depth)
+                print(f"[INFO] Streaming {len(stream_files)} video payloads from {payload_cache_dir} "
+                      f"({payload_cache_mb}MB cache, prefetch depth {prefetch_depth}) after {load_time:.2f}s")
+            else:
+                if shared_payloads:
+                    shared_key = payload_set_key(
+                        "video", dict(frame_cache_params(min_pixels, max_pixels, fps, max_frames),
+                                      prompt=prompt_text, max_tokens=max_tokens, stream=stream_response),
+                        [task[0] for task in tasks])
+                    cls._preloaded_payloads = load_shared_payloads(
+                        shared_key, lambda: cls._decode_payloads(tasks, task_messages, frame_cache, start_time))
+                else:
+                    cls._preloaded_payloads = cls._decode_payloads(tasks, task_messages, frame_cache, start_time)
+                load_time = time.time() - start_time
+                cls._payload_source = InMemoryPayloadSource(cls._preloaded_payloads)
+                print(f"[INFO] Preloaded {len(cls._preloaded_payloads)} video payloads in {load_time:.2f}s")
+            if frame_cache is not None:
+                frame_cache.report()
             cls._preload_done = True
 
+    @classmethod
+    def _decode_payloads(cls, tasks, task_messages, frame_cache, start_time, keep_bodies=True):
+        """Decode (or read from the frame cache) every task's frames; return the request bodies"""
+        workers = max(1, min(preload_workers, len(tasks)))
+        print(f"[INFO] Decoding {len(tasks)} videos with {workers} preload worker(s)")
+        stage_stats = StageStats()
+        successful_loads = 0
+        payloads = []
+        keys, frame_counts = [], []
+        for i, (video_file, frames_b64, cached, timings, error) in enumerate(iter_video_frames(tasks, workers)):
+            stage_stats.add(timings)
+            if frame_cache is not None:
+                if cached:
+                    frame_cache.hits += 1
+                else:
+                    frame_cache.misses += 1
+            if error or not frames_b64:
+                print(f"[ERROR] Failed to preload video {video_file}: {error or 'no frames decoded'}")
+                continue
+
+            messages = task_messages.pop(video_file)
+            if keep_bodies:
+                payloads.append(cls._build_video_body_static(messages, frames_b64))
+                keys.append(video_file)
+                frame_counts.append(len(frames_b64))
+            successful_loads += 1
+
+            # Progress indicator every 100 videos
+            if (i + 1) % 100 == 0:
+                elapsed = time.time() - start_time
+                print(f"[INFO] Processed {i+1}/{len(tasks)} videos in {elapsed:.2f}s")
+
+        print(f"[DEBUG] Success rate: {successful_loads}/{len(tasks)}")
+        stage_stats.report(time.time() - start_time, workers)
+        if keep_bodies:
+            cls._payload_keys, cls._payload_frames = keys, frame_counts
+        return payloads
+
+    @staticmethod
+    def _build_video_body_static(messages, frames_b64):
+        """Replace the video part of prepared messages with image_url frames and encode the body"""
+        return build_video_body(messages, frames_b64, max_tokens, stream_response)
+
+    @staticmethod
+    def _load_cached_body_static(video_file, cache_path):
+        """Build the request body for one video from its frame cache entry"""
+        frames_b64 = [base64.b64encode(f).decode("utf-8") for f in read_frames(cache_path)]
+        messages = VLLMUser._prepare_video_message_static(video_file)
+        return VLLMUser._build_video_body_static(messages, frames_b64)
+
     @staticmethod
     def _prepare_video_message_static(video_file):
         """Static method to prepare video message for processing"""
         try:
-            # print(f"[DEBUG] Preparing message for {video_file}")
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant."},
-                {
-                    "role": "user", 
-                    "content": [
-                        {"type": "text", "text": prompt_text},
-                        {
-                            "type": "video",
-                            "video": video_file,
-                            "min_pixels": min_pixels,
-                            "max_pixels": max_pixels,
-                            "fps": fps,
-                            "video_maxlen": max_frames
-                        }
-                    ]
-                }
-            ]
-            # print(f"[DEBUG] Messages prepared for {video_file}") 
-            return messages
+            return build_video_messages(video_file, prompt_text, min_pixels, max_pixels, fps, max_frames)
         except Exception as e:
             print(f"[ERROR] Failed to prepare video message for {video_file}: {e}")
             return None
@@ -203,18 +280,18 @@ class VLLMUser(HttpUser):
         self._preload_videos()
         
         # Check if we have any preloaded payloads
-        if not self._preloaded_payloads:
+        if not self._payload_source:
             print(f"[ERROR] User {user_id} has no preloaded payloads - stopping")
             raise StopUser()
         
         # Initialize per-user index for sequential selection
         self.current_index = 0
         
-        print(f"[INFO] User {user_id} ready with {len(self._preloaded_payloads)} preloaded payloads")
+        print(f"[INFO] User {user_id} ready with {len(self._payload_source)} preloaded payloads")
 
     @task
     def send_chat_completion(self):
-        print(f"[DEBUG] send_chat_completion called")
+        task_start = time.perf_counter()
         
         # Check if we should stop sending requests and increment counter atomically
         should_send = False
@@ -225,58 +302,94 @@ class VLLMUser(HttpUser):
             if VLLMUser._stop_sending:
                 print(f"[INFO] User stopping - already reached {VLLMUser._request_count} requests")
                 raise StopUser()
-                
-            if VLLMUser._request_count < VLLMUser._max_requests:
-                # Increment request count and allow this request
+
+        # Global sequence number; the master hands these out in distributed runs.
+        # Claimed outside _request_lock so a worker waiting on the master does not block its other users
+        claim = _budget.claim()
+
+        with VLLMUser._request_lock:
+            if claim is not None:
+                sequence, is_final_request = claim
                 VLLMUser._request_count += 1
-                current_count = VLLMUser._request_count
+                current_count = sequence + 1
                 should_send = True
                 
                 # Check if this is the last request
-                if current_count >= VLLMUser._max_requests:
+                if is_final_request:
                     VLLMUser._stop_sending = True
-                    is_final_request = True
                     print(f"[INFO] Request #{current_count}: This is the final request")
             else:
+                VLLMUser._stop_sending = True
                 print(f"[INFO] Already reached maximum requests ({VLLMUser._max_requests}), stopping user")
                 raise StopUser()
         
         # Only send request if we got permission
         if not should_send:
-            print(f"[DEBUG] Request not allowed, stopping user")
             raise StopUser()
+
+        # Open-loop mode: wait for this request's intended send time
+        intended_time = None
+        if _arrival is not None:
+            intended_time = _arrival.wait_for_slot()
+            task_start = time.perf_counter()  # overhead excludes the pacing sleep
             
-        if not self._preloaded_payloads:
+        payload_source = VLLMUser._payload_source
+        if not payload_source:
             print(f"[WARNING] No preloaded payloads available for request #{current_count}")
             raise StopUser()
         
-        # Get unique video index for this request
-        video_index = 0
-        with VLLMUser._video_index_lock:
-            video_index = VLLMUser._global_video_index % len(self._preloaded_payloads)
-            VLLMUser._global_video_index += 1
+        # Distinct sequence numbers map to distinct videos until the set wraps,
+        # unless the prefix workload plans repeats
+        expected_cache = None
+        if _prefix is not None:
+            video_index, expected_cache = _prefix.plan(sequence, len(payload_source))
+        else:
+            video_index = sequence % len(payload_source)
         
-        # Use the unique video index to select payload
-        payload = self._preloaded_payloads[video_index]
-        # print(f"[INFO] Request #{current_count} using video index {video_index}")
+        # Use the video index to select the pre-encoded body; the sequence is
+        # already claimed, so an unloadable body falls through to the next one
+        planned_index = video_index
+        video_index, body = first_available(payload_source, video_index)
+        if body is None:
+            VLLMUser._stop_sending = True
+            print(f"[ERROR] No payload could be loaded for request #{current_count}, stopping")
+            raise StopUser()
+        if video_index != planned_index:
+            print(f"[WARNING] Payload {planned_index} unavailable, request #{current_count} sends {video_index}")
+            expected_cache = None  # the prefix plan no longer describes this request
+        if _prefix is not None:
+            body = _prefix.compose(body, sequence)
         
         headers = {"Content-Type": "application/json"}
 
         # Record timing for real req/s calculation
+        _client_overhead.record(time.perf_counter() - task_start)
         request_start_time = time.time()
+        request_end_time = None
+        status, usage, ttft, error = 0, None, None, None
         
         # Send the request
         try:
-            print(f"[DEBUG] Sending request #{current_count}")
-            response = self.client.post(
-                "/v1/chat/completions",
-                data=json.dumps(payload),
-                headers=headers,
-                name="vllm_video_completion"
-            )
+            if stream_response:
+                response, stream_result = post_streaming_completion(
+                    self.client, self.environment.events, body, headers,
+                    name="vllm_video_completion", timeout=None)
+                usage = stream_result.usage if stream_result else None
+                ttft = stream_result.ttft if stream_result else None
+            else:
+                response = self.client.post(
+                    "/v1/chat/completions",
+                    data=body,
+                    headers=headers,
+                    name="vllm_video_completion"
+                )
+                usage = extract_usage(response)
             
             # Record request completion time
             request_end_time = time.time()
+            status = response.status_code
+            if response.status_code == 200:
+                _token_stats.record(usage, request_start_time, request_end_time)
             
             # Update timing statistics
             with VLLMUser._timing_lock:
@@ -285,18 +398,33 @@ class VLLMUser(HttpUser):
                     print(f"[INFO] First request started at {request_start_time}")
                 VLLMUser._last_request_time = request_end_time
             
-            # Print error details for debugging
+            # Keep error details in the trace
             if response.status_code != 200:
-                print(f"[ERROR] Request #{current_count} failed with status {response.status_code}")
-                print(f"[ERROR] Response: {response.text}")
-            else:
-                print(f"[SUCCESS] Request #{current_count} completed in {request_end_time - request_start_time:.2f}s")
+                error = response.text[:500]
                     
         except Exception as e:
-            print(f"[ERROR] Request #{current_count} failed: {e}")
-            import traceback
-            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        if request_end_time is None:
+            request_end_time = time.time()
+        
+        keys, frame_counts = VLLMUser._payload_keys, VLLMUser._payload_frames
+        _trace.record(
+            request_id=current_count, user=getattr(self, 'user_id', None), payload=video_index,
+            payload_key=keys[video_index] if keys and len(keys) == len(payload_source) else None,
+            frames=frame_counts[video_index] if frame_counts and len(frame_counts) == len(payload_source) else None,
+            bytes_sent=len(body), intended=intended_time, start=request_start_time, end=request_end_time,
+            latency_ms=(request_end_time - request_start_time) * 1000,
+            ttft_ms=ttft * 1000 if ttft is not None else None, status=status, ok=status == 200, error=error,
+            prompt_tokens=usage.get("prompt_tokens") if usage else None,
+            completion_tokens=usage.get("completion_tokens") if usage else None, cache=expected_cache)
+        if expected_cache is not None:
+            _prefix.record(self.environment.events, "vllm_video_completion", expected_cache,
+                           request_start_time, request_end_time, None if status == 200 else Exception(error))
         
+        if intended_time is not None:
+            fire_intended_latency(self.environment.events, "vllm_video_completion", intended_time, time.time(),
+                                  None if status == 200 else Exception(error))
+
         # Stop this user after completing the request
         if is_final_request:
             print(f"[INFO] Final request completed. Total requests sent: {current_count}")
@@ -326,6 +454,10 @@ class VLLMUser(HttpUser):
                 if real_test_duration > 0:
                     real_req_per_sec = total_requests / real_test_duration
                     print(f"🎯 REAL REQ/S (excluding preload): {real_req_per_sec:.2f}")
+                    token_rows = {row["Metric"]: row for row in _token_stats.summary()[0]}
+                    if token_rows["prompt_tokens"]["Requests"]:
+                        print(f"🔤 Input tokens/s: {token_rows['prompt_tokens']['Total'] / real_test_duration:.1f}")
+                        print(f"🔤 Output tokens/s: {token_rows['completion_tokens']['Total'] / real_test_duration:.1f}")
                 else:
                     print(f"🎯 REAL REQ/S: Unable to calculate (duration too short)")
                 
@@ -0,0 +1,93 @@
+"""
+Prebuilt dataset manifest.
+
+scripts/build_manifest.py (also run at the end of
+scripts/preprocess_videos_simple.py) writes ``manifest.json`` at the root of
+a frames or image dataset. Each entry is one request's worth of data: a
+frame directory (``category/video_name``) or one image. An entry lists the
+files relative to the root, their byte sizes and dimensions, the estimated
+vision tokens and a SHA-1 over the file contents. Entries of a packed
+dataset (frame_shards) also name their ``shard``; their files are the frame
+names inside it and are read through frame_shards rather than opened.
+
+payload_sets discovery and fragment_store load the manifest instead of
+walking the filesystem. Startup then costs one JSON read, and the payload
+order is the manifest order on every run and every worker. VLM_MANIFEST
+selects the file:
+- empty: ``<base_path>/manifest.json`` when it exists;
+- a path: that file;
+- ``0``: never use a manifest.
+"""
+import json
+import os
+import threading
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class DatasetManifest:
+    """Entries of a manifest.json, in manifest order"""
+
+    def __init__(self, root, data):
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"unsupported manifest version: {data.get('version')}")
+        self.root = root
+        self.kind = data["kind"]
+        self.created = data.get("created")
+        self.entries = data["entries"]
+        self.keys = [e["key"] for e in self.entries]
+        self._by_key = {e["key"]: e for e in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry(self, key):
+        return self._by_key.get(key)
+
+    def files(self, key):
+        """Absolute paths of an entry's files, or None for an unknown or packed key"""
+        entry = self._by_key.get(key)
+        if entry is None or "shard" in entry:
+            return None
+        return [os.path.join(self.root, f) for f in entry["files"]]
+
+    @classmethod
+    def load(cls, path, root=None):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(root or os.path.dirname(os.path.abspath(path)), data)
+
+
+def manifest_path(base_path, environ=None):
+    """The manifest file to use for base_path, or None"""
+    setting = (environ if environ is not None else os.environ).get("VLM_MANIFEST", "")
+    if setting == "0":
+        return None
+    path = setting or os.path.join(base_path, MANIFEST_NAME)
+    return path if os.path.isfile(path) else None
+
+
+def load_manifest(base_path, kind=None, environ=None):
+    """Cached DatasetManifest for base_path (of the given kind), or None when there is none"""
+    path = manifest_path(base_path, environ)
+    if path is None:
+        return None
+    key = (os.path.abspath(path), os.path.abspath(base_path))
+    with _lock:
+        manifest = _cache.get(key)
+        if manifest is None:
+            try:
+                manifest = DatasetManifest.load(path, root=os.path.abspath(base_path))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[WARNING] Ignoring manifest {path}: {e}")
+                manifest = False
+            else:
+                print(f"[INFO] Using dataset manifest {path}: {len(manifest)} {manifest.kind} entries")
+            _cache[key] = manifest
+    if not manifest or (kind is not None and manifest.kind != kind):
+        return None
+    return manifest
@@ -0,0 +1,193 @@
+"""
+Frame-level fragment store for the frames payload set.
+
+Instead of baking each video into one fixed request body, every frame is
+base64-encoded once and kept as its ready-to-send JSON fragment
+(``{"type":"image_url",...}``). A request body is then assembled per request
+from pre-encoded pieces: a prompt prefix (cached per prompt), the selected
+frame fragments and a suffix carrying max_tokens and the stream options. No
+JSON serialization happens on the hot path, and the body is handed to the
+HTTP client as a list of fragments with a known length, so the frame bytes
+are never copied.
+
+With every frame selected and the same prompt, the assembled bytes equal what
+payload_sets.build_frame_body() produces.
+"""
+import base64
+import json
+import random
+import threading
+from collections import Counter
+
+from payload_sets import MODEL_NAME, image_url_part, iter_frame_bytes
+
+FRAME_SAMPLINGS = ("uniform", "random", "head")
+
+
+class FragmentBody:
+    """Request body made of byte fragments; requests sends it with Content-Length, chunk by chunk"""
+
+    __slots__ = ("fragments", "_length", "frames")
+
+    def __init__(self, fragments, frames=None):
+        self.fragments = fragments
+        self._length = sum(len(f) for f in fragments)
+        self.frames = frames
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.fragments)
+
+    def tobytes(self):
+        return b"".join(self.fragments)
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def frame_fragment(image_bytes):
+    """JSON bytes of one image_url content part"""
+    return _encode(image_url_part(base64.b64encode(image_bytes).decode()))
+
+
+def prompt_prefix(prompt_text):
+    """Body bytes up to and including the text part of the user message"""
+    return (b'{"model":' + _encode(MODEL_NAME) + b',"messages":[{"role":"user","content":['
+            + _encode({"type": "text", "text": prompt_text}))
+
+
+def body_suffix(max_tokens, stream=False):
+    """Body bytes closing the content list and carrying the sampling options"""
+    options = {"max_tokens": max_tokens, "temperature": 0.2}
+    if stream:
+        options.update(stream=True, stream_options={"include_usage": True})
+    return b"]}]," + _encode(options)[1:]
+
+
+def select_frames(total, count, sampling="uniform", rng=None):
+    """Indices of ``count`` frames out of ``total``, in temporal order"""
+    if count is None or count >= total:
+        return list(range(total))
+    if count <= 0:
+        return []
+    if sampling == "head":
+        return list(range(count))
+    if sampling == "random":
+        return sorted((rng or random).sample(range(total), count))
+    # uniform: evenly spaced across the clip, like fps-based sampling
+    return [int(i * total / count) for i in range(count)]
+
+
+def load_prompts(path):
+    """One prompt per non-empty line"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class FrameFragmentStore:
+    """Each frame's image_url fragment, stored once per video directory"""
+
+    def __init__(self):
+        self.keys = []
+        self.frames = []     # per video: list of fragment bytes
+        self.nbytes = 0
+        self.jpeg_bytes = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add_video(self, base_path, video_dir, transform=None):
+        """Load one frame directory; returns the number of frames stored (0 = skipped).
+
+        ``transform`` (JPEG bytes -> JPEG bytes) is applied to each frame before encoding.
+        """
+        fragments = []
+        for frame_file, image_bytes in iter_frame_bytes(base_path, video_dir):
+            if transform is not None:
+                try:
+                    image_bytes = transform(image_bytes)
+                except Exception as e:
+                    print(f"[ERROR] Failed to transform frame {frame_file}: {e}")
+                    continue
+            self.jpeg_bytes += len(image_bytes)
+            fragments.append(frame_fragment(image_bytes))
+        return self.add_fragments(video_dir, fragments)
+
+    def add_fragments(self, video_dir, fragments):
+        """Store already-encoded fragments (e.g. mapped from a wire_payloads artifact)"""
+        if not fragments:
+            return 0
+        self.keys.append(video_dir)
+        self.frames.append(fragments)
+        self.nbytes += sum(len(f) for f in fragments)
+        return len(fragments)
+
+    def compose(self, index, prefix, suffix, frame_indices=None):
+        """Assemble a body from a cached prefix, the chosen frames and a cached suffix"""
+        frames = self.frames[index]
+        if frame_indices is None:
+            frame_indices = range(len(frames))
+        fragments = [prefix]
+        for i in frame_indices:
+            fragments.append(b",")
+            fragments.append(frames[i])
+        fragments.append(suffix)
+        return FragmentBody(fragments, len(frame_indices))
+
+
+class FragmentPayloadSource:
+    """Payload source (see payload_source.py) composing bodies from a FrameFragmentStore.
+
+    Each get() picks a prompt from ``prompts`` and a frame count from
+    ``frame_counts`` (None = all frames) at random, then selects that many
+    frames with ``sampling``. Prefixes and the suffix are encoded once.
+    """
+
+    def __init__(self, store, prompts, max_tokens, stream=False, frame_counts=None,
+                 sampling="uniform", seed=None):
+        if sampling not in FRAME_SAMPLINGS:
+            raise ValueError(f"unknown frame sampling: {sampling}")
+        self.store = store
+        self.prompts = list(prompts)
+        self.frame_counts = list(frame_counts) if frame_counts else [None]
+        self.sampling = sampling
+        self._prefixes = [prompt_prefix(p) for p in self.prompts]
+        self._suffix = body_suffix(max_tokens, stream)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.composed = 0
+        self.composed_bytes = 0
+        self.frames_sent = Counter()
+
+    def __len__(self):
+        return len(self.store)
+
+    def get(self, index):
+        with self._lock:
+            prefix = self._random.choice(self._prefixes)
+            count = self._random.choice(self.frame_counts)
+            frame_indices = select_frames(len(self.store.frames[index]), count, self.sampling, self._random)
+        body = self.store.compose(index, prefix, self._suffix, frame_indices)
+        with self._lock:
+            self.composed += 1
+            self.composed_bytes += len(body)
+            self.frames_sent[len(frame_indices)] += 1
+        return body
+
+    def report(self):
+        with self._lock:
+            composed, composed_bytes = self.composed, self.composed_bytes
+            frames_sent = sorted(self.frames_sent.items())
+        print(f"[INFO] Payload source: {len(self.store)} videos as frame fragments, "
+              f"{self.store.nbytes / (1024 * 1024):.1f}MB stored once, "
+              f"{len(self.prompts)} prompt(s), frame counts "
+              f"{', '.join(str(c) if c else 'all' for c in self.frame_counts)}, {self.sampling} sampling")
+        if composed:
+            print(f"[INFO]   Composed {composed} bodies, avg {composed_bytes / composed / 1024:.1f}KB; "
+                  f"frames per request: " + ", ".join(f"{n} frames: {c}" for n, c in frames_sent))
+
+    def close(self):
+        pass
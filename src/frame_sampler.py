@@ -0,0 +1,190 @@
+"""
+Seek-based sparse frame extraction.
+
+qwen_vl_utils.process_vision_info samples ``nframes`` frames (from ``fps``
+and the clip length) evenly over the whole video, with the torchvision
+backend decoding every frame first. We then keep only the first
+``max_frames`` of them, so on long clips most of the decode work and memory
+is thrown away.
+
+SparseFrameReader computes the same sample indices up front (qwen_vl_utils'
+smart_nframes plus ``torch.linspace(0, total - 1, nframes).round()``) and
+keeps the first ``max_frames``. It decodes only those frames:
+- decord: ``VideoReader.get_batch`` (the same reader and frame count
+  qwen_vl_utils' decord backend uses);
+- PyAV: decodes forward while the next target is within one keyframe
+  interval (learned while decoding), and otherwise seeks to the keyframe
+  before the target and decodes from there.
+
+The PyAV path has to take the frame count from the container metadata,
+while qwen_vl_utils' torchvision backend counts the frames it decoded.
+When the metadata has no frame count, disagrees with the stream duration,
+or decoding shows it was wrong (the stream ends early, or timestamps are not
+one frame apart), the reader raises SparseDecodeUnsupported and the caller
+decodes the whole clip instead. A count that is off without any of those
+signs is not detected, so the frames are only known to match the full-decode
+path for the videos scripts/benchmark_frame_sampling.py was run on. Resizing
+is left to the caller (video_preload applies the same smart-resize).
+"""
+import math
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+try:
+    from qwen_vl_utils.vision_process import get_video_reader_backend, smart_nframes
+except ImportError:
+    get_video_reader_backend = None
+    smart_nframes = None
+
+FRAME_FACTOR = 2
+FPS = 2.0
+FPS_MIN_FRAMES = 4
+FPS_MAX_FRAMES = 768
+
+
+class SparseDecodeUnsupported(ValueError):
+    """The sample indices cannot be trusted for this video; decode the whole clip instead"""
+
+
+def _smart_nframes(video_part, total_frames, video_fps):
+    """qwen_vl_utils.vision_process.smart_nframes, for when it cannot be imported"""
+    if "nframes" in video_part:
+        nframes = round(video_part["nframes"] / FRAME_FACTOR) * FRAME_FACTOR
+    else:
+        fps = video_part.get("fps", FPS)
+        min_frames = math.ceil(video_part.get("min_frames", FPS_MIN_FRAMES) / FRAME_FACTOR) * FRAME_FACTOR
+        max_frames = math.floor(video_part.get("max_frames", min(FPS_MAX_FRAMES, total_frames))
+                                / FRAME_FACTOR) * FRAME_FACTOR
+        nframes = total_frames / video_fps * fps
+        nframes = min(min(max(nframes, min_frames), max_frames), total_frames)
+        nframes = math.floor(nframes / FRAME_FACTOR) * FRAME_FACTOR
+    if not (FRAME_FACTOR <= nframes <= total_frames):
+        raise ValueError(f"nframes should in interval [{FRAME_FACTOR}, {total_frames}], but got {nframes}.")
+    return int(nframes)
+
+
+def sample_indices(video_part, total_frames, video_fps, max_frames=None):
+    """Frame indices process_vision_info samples, truncated to the first max_frames"""
+    nframes = (smart_nframes or _smart_nframes)(video_part, total_frames=total_frames, video_fps=video_fps)
+    if torch is not None:
+        # float32 torch.linspace, as qwen_vl_utils computes it; float64 can round a .5 index differently
+        indices = torch.linspace(0, total_frames - 1, int(nframes)).round().long().tolist()
+    else:
+        indices = np.round(np.linspace(0, total_frames - 1, int(nframes))).astype(np.int64).tolist()
+    return indices[:max_frames] if max_frames else indices, int(nframes)
+
+
+def video_path(video_part):
+    path = video_part["video"]
+    return path[len("file://"):] if path.startswith("file://") else path
+
+
+def default_backend():
+    """decord when qwen_vl_utils would use it (or is absent but decord is installed), else pyav"""
+    if get_video_reader_backend is not None:
+        try:
+            return "decord" if get_video_reader_backend() == "decord" else "pyav"
+        except Exception:
+            return "pyav"
+    try:
+        import decord  # noqa: F401
+        return "decord"
+    except ImportError:
+        return "pyav"
+
+
+class SparseFrameReader:
+    """Decode only the requested frames of a video file as (T, H, W, 3) uint8 RGB"""
+
+    def __init__(self, backend=None, seek_seconds=2.0):
+        self.backend = backend or default_backend()
+        if self.backend not in ("decord", "pyav"):
+            raise ValueError(f"unknown sparse decode backend: {self.backend}")
+        # Targets further apart than this are reached by seeking instead of decoding through
+        self.seek_seconds = seek_seconds
+        self.decoded = 0
+        self.seeks = 0
+
+    def read(self, video_part, max_frames=None):
+        """(frames, sample indices, nframes before truncation) for one qwen_vl_utils video part"""
+        path = video_path(video_part)
+        if self.backend == "decord":
+            import decord
+
+            reader = decord.VideoReader(path, num_threads=1)
+            indices, nframes = sample_indices(video_part, len(reader), reader.get_avg_fps(), max_frames)
+            frames = reader.get_batch(indices).asnumpy()
+            self.decoded += len(indices)
+            return frames, indices, nframes
+        return self._read_pyav(path, video_part, max_frames)
+
+    def _read_pyav(self, path, video_part, max_frames):
+        import av
+
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            fps = float(stream.average_rate or stream.guessed_rate)
+            time_base = float(stream.time_base)
+            start = stream.start_time or 0
+            total = stream.frames
+            duration = (stream.duration * time_base if stream.duration
+                        else (container.duration or 0) / av.time_base)
+            if not total:
+                raise SparseDecodeUnsupported(f"no frame count in the metadata of {path}")
+            if duration and abs(total - duration * fps) > 1:
+                raise SparseDecodeUnsupported(
+                    f"frame count {total} disagrees with {duration:.2f}s at {fps:.2f}fps in {path}")
+            indices, nframes = sample_indices(video_part, total, fps, max_frames)
+
+            targets = sorted(set(indices))
+            # Until two keyframes have been seen, seek only across gaps longer than seek_seconds
+            seek_frames = max(1, int(self.seek_seconds * fps))
+            last_key = None
+            found = {}
+            position = -1     # index of the last decoded frame
+            t = 0
+            while t < len(targets):
+                if targets[t] - position > seek_frames:
+                    # backward=True lands on the keyframe at or before the target
+                    container.seek(start + int(targets[t] / fps / time_base), stream=stream, backward=True)
+                    self.seeks += 1
+                    last_key = None
+                    position = None
+                exhausted = True
+                for frame in container.decode(stream):
+                    if frame.pts is None:
+                        continue
+                    self.decoded += 1
+                    previous = position
+                    position = int(round((frame.pts - start) * time_base * fps))
+                    if previous is not None and position != previous + 1:
+                        # Variable frame rate: timestamps no longer give the decoded frame's ordinal
+                        raise SparseDecodeUnsupported(f"frame timestamps of {path} are not constant-rate")
+                    if frame.key_frame:
+                        # A target more than one keyframe interval ahead is cheaper to seek to
+                        if last_key is not None and position > last_key:
+                            seek_frames = position - last_key
+                        last_key = position
+                    if position < targets[t]:
+                        continue
+                    image = frame.to_ndarray(format="rgb24")
+                    while t < len(targets) and targets[t] <= position:
+                        found[targets[t]] = image
+                        t += 1
+                    # Decide how to reach the next target only once this one is reached
+                    if t == len(targets) or targets[t] - position > seek_frames:
+                        exhausted = False
+                        break
+                if exhausted:
+                    break
+            if len(found) < len(targets):
+                raise SparseDecodeUnsupported(
+                    f"{path} ended before frame {targets[len(found)]} of the {total} in its metadata")
+            frames = np.stack([found[i] for i in indices])
+        return frames, indices, nframes
@@ -0,0 +1,202 @@
+"""
+Packed frame shards: many videos' JPEG frames in one memory-mappable file.
+
+A frames dataset normally holds one ``frame_XXXX.jpg`` per frame under
+``category/video_name/``. Preloading it costs a directory listing and an
+open() per frame, and on network or overlay filesystems that small-file I/O
+dominates. ``scripts/preprocess_videos_simple.py --pack N`` writes
+``<dataset>/shards/shard_XXXXX.vlmshard`` files instead, each holding up to N
+videos:
+
+    header   magic, video count, index length        (struct "<8sIQ")
+    index    JSON: [{"key": "category/video_name", "names": [...],
+                     "frames": [[offset, length], ...]}, ...]
+    data     the JPEG bytes, offsets relative to the start of the file
+
+Readers map each shard once and hand out zero-copy slices of the map. The
+dataset walkers skip ``shards/``, ``wire/`` and hidden directories (see
+is_artifact_dir), so packed artifacts are never taken for categories.
+Whenever a dataset has shards, payload_sets.discover_frame_dirs(),
+frame_count() and iter_frame_bytes() read them through load_shards().
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+
+SHARD_DIR = "shards"
+WIRE_DIR = "wire"        # wire_payloads artifacts, themselves shard sets
+SHARD_SUFFIX = ".vlmshard"
+_MAGIC = b"VLMSH1\0\0"
+_HEADER = struct.Struct("<8sIQ")   # magic, video count, index length
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def is_artifact_dir(name):
+    """True for a directory in a dataset root that holds packed artifacts instead of media"""
+    return name in (SHARD_DIR, WIRE_DIR) or name.startswith(".")
+
+
+def shard_name(index):
+    return f"shard_{index:05d}{SHARD_SUFFIX}"
+
+
+def write_shard(path, videos):
+    """Atomically write [(key, [frame names], [JPEG bytes])] into one shard file"""
+    # Offsets depend on the index length, which depends on the offsets' digits:
+    # lay the data out after a provisional index and grow until it fits
+    data_start = _HEADER.size
+    while True:
+        offset = data_start
+        index = []
+        for key, names, frames in videos:
+            spans = []
+            for frame in frames:
+                spans.append([offset, len(frame)])
+                offset += len(frame)
+            index.append({"key": key, "names": list(names), "frames": spans})
+        encoded = json.dumps(index, separators=(",", ":")).encode("utf-8")
+        if _HEADER.size + len(encoded) <= data_start:
+            break
+        data_start = _HEADER.size + len(encoded) + 64
+
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(videos), len(encoded)))
+        f.write(encoded)
+        f.write(b" " * (data_start - _HEADER.size - len(encoded)))
+        for _, _, frames in videos:
+            for frame in frames:
+                f.write(frame)
+    os.replace(tmp_path, path)
+
+
+class ShardWriter:
+    """Buffer videos and write a new shard every ``videos_per_shard`` of them.
+
+    Numbering continues after the shards already in base_path, so a resumed
+    run only adds files. At most one shard's worth of JPEG bytes is held.
+    """
+
+    def __init__(self, base_path, videos_per_shard):
+        self.directory = os.path.join(base_path, SHARD_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self.videos_per_shard = max(1, videos_per_shard)
+        self.index = len(shard_paths(base_path))
+        self.paths = []
+        self.videos = 0
+        self.bytes = 0
+        self._pending = []
+
+    def add(self, key, names, frames):
+        self._pending.append((key, names, frames))
+        if len(self._pending) >= self.videos_per_shard:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        while os.path.exists(os.path.join(self.directory, shard_name(self.index))):
+            self.index += 1
+        path = os.path.join(self.directory, shard_name(self.index))
+        write_shard(path, self._pending)
+        self.paths.append(path)
+        self.videos += len(self._pending)
+        self.bytes += os.path.getsize(path)
+        self.index += 1
+        self._pending = []
+
+
+class ShardReader:
+    """One mapped shard file; frames() returns memoryview slices of the map"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError(f"truncated shard {path}")
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, index_length = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self._mm.close()
+            raise ValueError(f"bad shard magic in {path}")
+        index = json.loads(bytes(self._mm[_HEADER.size:_HEADER.size + index_length]))
+        if len(index) != count:
+            self._mm.close()
+            raise ValueError(f"shard index of {path} lists {len(index)} videos, header says {count}")
+        self.keys = [v["key"] for v in index]
+        self._videos = {v["key"]: v for v in index}
+        self._view = memoryview(self._mm)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def names(self, key):
+        return self._videos[key]["names"]
+
+    def spans(self, key):
+        return self._videos[key]["frames"]
+
+    def frames(self, key):
+        return [self._view[offset:offset + length] for offset, length in self._videos[key]["frames"]]
+
+
+class ShardSet:
+    """All shards of a dataset, keyed by video directory, in shard order"""
+
+    def __init__(self, paths):
+        self.readers = [ShardReader(p) for p in paths]
+        self.keys = []
+        self._owner = {}
+        for reader in self.readers:
+            for key in reader.keys:
+                if key not in self._owner:
+                    self.keys.append(key)
+                self._owner[key] = reader
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._owner
+
+    def reader(self, key):
+        return self._owner[key]
+
+    def frames(self, key):
+        """The key's frames as zero-copy views, or None when no shard holds it"""
+        reader = self._owner.get(key)
+        return reader.frames(key) if reader is not None else None
+
+    def frame_count(self, key):
+        reader = self._owner.get(key)
+        return len(reader.spans(key)) if reader is not None else 0
+
+    @property
+    def nbytes(self):
+        return sum(len(r._mm) for r in self.readers)
+
+
+def shard_paths(base_path):
+    return sorted(glob.glob(os.path.join(base_path, SHARD_DIR, "*" + SHARD_SUFFIX)))
+
+
+def load_shards(base_path):
+    """Cached ShardSet for a dataset, or None when it has no shards"""
+    key = os.path.abspath(base_path)
+    with _lock:
+        if key not in _cache:
+            paths = shard_paths(base_path)
+            shards = None
+            if paths:
+                try:
+                    shards = ShardSet(paths)
+                    print(f"[INFO] Using {len(paths)} shard file(s) in {base_path}: {len(shards)} entries")
+                except (OSError, ValueError) as e:
+                    print(f"[WARNING] Ignoring frame shards in {base_path}: {e}")
+            _cache[key] = shards
+        return _cache[key]
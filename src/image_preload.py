@@ -0,0 +1,130 @@
+"""
+Image decode / resize / encode pipeline used by the image locustfile's preload.
+
+Like video_preload, the per-image work (decode, RGB, LANCZOS resize, JPEG,
+base64 and body serialization) is a top-level function so it can run in a
+process pool, and this module does not import locust. Resized JPEGs are kept
+in the payload_cache FrameCache as one-frame entries keyed by the sampled
+source digest (see payload_cache.file_digest) and the resize parameters; a
+warm start only reads them and builds the bodies. Source digests are
+computed in the workers too, so a cold start over a large dataset does not
+hash every image in the locust process.
+"""
+import multiprocessing
+import os
+import time
+
+from payload_cache import cache_entry_path, file_digest, read_frames, write_frames
+from payload_sets import build_image_body, encode_image_file
+
+
+def image_cache_params(size, quality=95):
+    """FrameCache key parameters for images produced by encode_image_file"""
+    return {"kind": "image", "size": list(size), "quality": quality, "format": "jpeg"}
+
+
+def load_image_task(task):
+    """Pool worker: return (image_file, body, jpeg bytes, cached, digest, stat, error) for one image.
+
+    ``task`` is (image_file, size, quality, cache, digest, body_args). ``cache`` is
+    (cache_dir, params_key) or None; ``digest`` is the source digest when the
+    caller already knows it; ``body_args`` is (prompt, max_tokens, stream).
+    """
+    image_file, size, quality, cache, digest, body_args = task
+    cached = False
+    stat = None
+    try:
+        image_bytes = None
+        cache_path = None
+        if cache is not None:
+            st = os.stat(image_file)
+            stat = (st.st_size, st.st_mtime_ns)
+            if digest is None:
+                digest = file_digest(image_file, st.st_size)
+            cache_path = cache_entry_path(cache[0], cache[1], digest)
+            if os.path.exists(cache_path):
+                try:
+                    image_bytes = read_frames(cache_path)[0]
+                    cached = True
+                except (OSError, ValueError, IndexError):
+                    image_bytes = None
+
+        if image_bytes is None:
+            image_bytes = encode_image_file(image_file, size, quality)
+            if cache_path is not None:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                write_frames(cache_path, [image_bytes])
+
+        body = build_image_body(image_bytes, *body_args)
+        return image_file, body, len(image_bytes), cached, digest, stat, None
+    except Exception as e:
+        return image_file, None, 0, cached, digest, stat, str(e)
+
+
+def iter_image_payloads(tasks, workers):
+    """Yield load_image_task results in input order, using a process pool when workers > 1"""
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield load_image_task(task)
+        return
+
+    # spawn keeps children from inheriting the locust process's gevent state
+    ctx = multiprocessing.get_context("spawn")
+    chunksize = max(1, min(64, len(tasks) // (workers * 8)))
+    with ctx.Pool(processes=workers) as pool:
+        for result in pool.imap(load_image_task, tasks, chunksize=chunksize):
+            yield result
+
+
+def _known_digest(frame_cache, image_file):
+    if frame_cache is None:
+        return None
+    try:
+        return frame_cache.known_digest(image_file)
+    except OSError:
+        return None   # the worker reports the missing file
+
+
+def preload_image_payloads(image_files, size, prompt_text, max_tokens, stream=False, frame_cache=None,
+                           workers=1, quality=95):
+    """Build the request body of every image; returns (bodies, source files of the bodies).
+
+    ``frame_cache`` is a FrameCache created with image_cache_params(size, quality).
+    """
+    start_time = time.time()
+    cache = (frame_cache.cache_dir, frame_cache.params_key) if frame_cache is not None else None
+    body_args = (prompt_text, max_tokens, stream)
+    tasks = [(image_file, size, quality, cache, _known_digest(frame_cache, image_file), body_args)
+             for image_file in image_files]
+    workers = max(1, min(workers, len(tasks)))
+    print(f"[INFO] Preprocessing {len(tasks)} images with {workers} preload worker(s)")
+
+    bodies, keys = [], []
+    total_bytes = 0
+    for i, (image_file, body, nbytes, cached, digest, stat, error) in enumerate(iter_image_payloads(tasks, workers)):
+        if frame_cache is not None:
+            if cached:
+                frame_cache.hits += 1
+            else:
+                frame_cache.misses += 1
+            if digest is not None and stat is not None and tasks[i][4] is None:
+                frame_cache.remember(image_file, stat[0], stat[1], digest)
+        if error:
+            print(f"[ERROR] Failed to preload image {image_file}: {error}")
+            continue
+        bodies.append(body)
+        keys.append(image_file)
+        total_bytes += nbytes
+
+        # Progress indicator every 1000 images
+        if (i + 1) % 1000 == 0:
+            print(f"[INFO] Processed {i + 1}/{len(tasks)} images in {time.time() - start_time:.2f}s")
+
+    if frame_cache is not None:
+        frame_cache.save()
+        frame_cache.report()
+    load_time = time.time() - start_time
+    print(f"[INFO] Preloaded {len(bodies)} image payloads in {load_time:.2f}s "
+          f"({len(bodies) / load_time if load_time > 0 else 0:.0f} images/s, "
+          f"{total_bytes / (1024 * 1024):.1f}MB of JPEG)")
+    return bodies, keys
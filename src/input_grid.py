@@ -0,0 +1,211 @@
+"""
+Input-size grid for the frames payload set.
+
+A normal run sends one input size: every frame at its stored resolution,
+all frames, one prompt. GridPayloadSource instead builds variants of the
+same videos across a grid of
+- frame counts (uniformly sampled, see fragment_store.select_frames),
+- per-frame pixel budgets (frames downscaled Qwen-style to multiples of 28;
+  0 keeps the stored resolution),
+- prompt lengths in words (the base prompt padded with filler words).
+
+The grid only exists in the frames locustfile. Downscaled frames come from
+the wire artifact built for that budget when there is one
+(``scripts/build_wire_payloads.py --max_pixels``, mapped like the normal
+frames artifact); otherwise they are resized and encoded at preload in a
+process pool, since every budget re-encodes every frame of the dataset.
+
+Payload index ``i`` maps to grid cell ``i % cells`` and video ``i // cells``.
+Consecutive request sequences therefore walk through every cell in turn, and
+each cell gets an equal share of the load. Requests are tagged with their
+cell label (``f8_p401408_w500``) as a ``GRID`` request next to the main
+request, and scripts/grid_surface.py turns those rows into a
+latency/throughput surface.
+"""
+import itertools
+import multiprocessing
+import re
+import threading
+from collections import Counter
+
+from fragment_store import FrameFragmentStore, body_suffix, frame_fragment, prompt_prefix, select_frames
+from payload_sets import frame_count, iter_frame_bytes, resize_jpeg
+
+GRID_REQUEST_TYPE = "GRID"
+CELL_PATTERN = re.compile(r"^f(\d+|all)_p(\d+)_w(\d+)$")
+_FILLER = ("Consider every detail of the scene, including the people, objects, text, colors, "
+           "motion and background, and how they change over time.").split()
+
+
+def parse_int_list(text, default, minimum=0):
+    values = [int(v) for v in (text or "").split(",") if v.strip()]
+    too_small = [v for v in values if v < minimum]
+    if too_small:
+        raise ValueError(f"{too_small[0]} in {text!r} is below the minimum of {minimum}")
+    return values or list(default)
+
+
+def prompt_of_length(base_prompt, words):
+    """base_prompt preceded by filler so the prompt has about ``words`` words (0 = unchanged)"""
+    missing = words - len(base_prompt.split())
+    if missing <= 0:
+        return base_prompt
+    filler = list(itertools.islice(itertools.cycle(_FILLER), missing))
+    return " ".join(filler) + " " + base_prompt
+
+
+def cell_label(frames, max_pixels, words):
+    return f"f{'all' if frames is None else frames}_p{max_pixels}_w{words}"
+
+
+def parse_cell_label(label):
+    """(frames or None, max pixels, prompt words) from a cell label, or None"""
+    match = CELL_PATTERN.match(label)
+    if not match:
+        return None
+    frames = None if match.group(1) == "all" else int(match.group(1))
+    return frames, int(match.group(2)), int(match.group(3))
+
+
+def resize_video_task(task):
+    """Pool worker: (video_dir, image_url fragments, errors) for one frame directory at max_pixels"""
+    base_path, video_dir, max_pixels = task
+    fragments, errors = [], []
+    for frame_file, image_bytes in iter_frame_bytes(base_path, video_dir):
+        try:
+            fragments.append(frame_fragment(resize_jpeg(image_bytes, max_pixels)))
+        except Exception as e:
+            errors.append(f"{frame_file}: {e}")
+    return video_dir, fragments, errors
+
+
+def iter_resized_videos(tasks, workers):
+    """Yield resize_video_task results in input order, using a process pool when workers > 1"""
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield resize_video_task(task)
+        return
+
+    # spawn keeps children from inheriting the locust process's gevent state
+    ctx = multiprocessing.get_context("spawn")
+    chunksize = max(1, min(16, len(tasks) // (workers * 8)))
+    with ctx.Pool(processes=min(workers, len(tasks))) as pool:
+        for result in pool.imap(resize_video_task, tasks, chunksize=chunksize):
+            yield result
+
+
+class GridPayloadSource:
+    """Payload source (see payload_source.py) over videos x (frames, pixels, prompt words) cells
+
+    ``wires`` maps a pixel budget to the wire ShardSet built for it; budgets
+    without one are resized with ``workers`` processes.
+    """
+
+    def __init__(self, base_path, video_dirs, base_prompt, max_tokens, stream=False,
+                 frame_counts=(4, 8, 16), pixel_budgets=(0,), prompt_words=(0,), progress=None,
+                 wires=None, workers=1):
+        if any(count is not None and count <= 0 for count in frame_counts):
+            raise ValueError(f"grid frame counts must be positive: {list(frame_counts)}")
+        self.frame_counts = list(frame_counts)
+        self.pixel_budgets = list(pixel_budgets)
+        self.prompt_words = list(prompt_words)
+        self.cells = list(itertools.product(self.frame_counts, self.pixel_budgets, self.prompt_words))
+        self.labels = [cell_label(*cell) for cell in self.cells]
+        self.wires = {budget: wire for budget, wire in (wires or {}).items() if budget in self.pixel_budgets}
+
+        # Every budget must cover the same videos, so the mapped artifacts limit the set
+        missing = [d for d in video_dirs if any(d not in wire for wire in self.wires.values())]
+        if missing:
+            print(f"[WARNING] {len(missing)} video directories are not in every grid wire artifact "
+                  f"(e.g. {missing[0]}) and are left out; rebuild them with scripts/build_wire_payloads.py")
+            video_dirs = [d for d in video_dirs if d not in set(missing)]
+
+        # A video shorter than the largest cell would send fewer frames than its label says
+        largest = max((count for count in self.frame_counts if count is not None), default=0)
+        short = [d for d in video_dirs if frame_count(base_path, d) < largest]
+        if short:
+            print(f"[WARNING] {len(short)} video directories have fewer than {largest} frames "
+                  f"(e.g. {short[0]}) and are left out of the grid")
+            video_dirs = [d for d in video_dirs if d not in set(short)]
+
+        # One fragment store per pixel budget, all over the same videos
+        self.stores = {}
+        keys = None
+        for budget in self.pixel_budgets:
+            store = FrameFragmentStore()
+            if budget in self.wires:
+                for video_dir in video_dirs:
+                    store.add_fragments(video_dir, self.wires[budget].frames(video_dir))
+                if progress is not None:
+                    progress(budget, len(video_dirs), len(video_dirs))
+            elif budget:
+                tasks = [(base_path, video_dir, budget) for video_dir in video_dirs]
+                for i, (video_dir, fragments, errors) in enumerate(iter_resized_videos(tasks, workers)):
+                    for error in errors:
+                        print(f"[ERROR] Failed to transform frame {error}")
+                    store.add_fragments(video_dir, fragments)
+                    if progress is not None:
+                        progress(budget, i + 1, len(video_dirs))
+            else:
+                for i, video_dir in enumerate(video_dirs):
+                    store.add_video(base_path, video_dir)
+                    if progress is not None:
+                        progress(budget, i + 1, len(video_dirs))
+            if keys is None:
+                keys = store.keys
+            elif store.keys != keys:
+                raise ValueError("videos differ between pixel budgets")
+            self.stores[budget] = store
+        self.keys = keys or []
+
+        self._prefixes = {w: prompt_prefix(prompt_of_length(base_prompt, w)) for w in self.prompt_words}
+        self._suffix = body_suffix(max_tokens, stream)
+        self._lock = threading.Lock()
+        self.composed = Counter()
+
+    def __len__(self):
+        return len(self.keys) * len(self.cells)
+
+    def cell_label(self, index):
+        return self.labels[index % len(self.cells)]
+
+    def key(self, index):
+        return self.keys[index // len(self.cells)]
+
+    def get(self, index):
+        frames, budget, words = self.cells[index % len(self.cells)]
+        video = index // len(self.cells)
+        store = self.stores[budget]
+        frame_indices = select_frames(len(store.frames[video]), frames, "uniform")
+        body = store.compose(video, self._prefixes[words], self._suffix, frame_indices)
+        with self._lock:
+            self.composed[self.labels[index % len(self.cells)]] += 1
+        return body
+
+    def report(self):
+        print(f"[INFO] Payload source: input grid over {len(self.keys)} videos, "
+              f"{len(self.cells)} cells (frames {self.frame_counts} x pixels {self.pixel_budgets} "
+              f"x prompt words {self.prompt_words})")
+        for budget, store in self.stores.items():
+            origin = "mapped" if budget in self.wires else "in memory"
+            print(f"[INFO]   pixels {budget or 'original'}: {store.nbytes / (1024 * 1024):.1f}MB "
+                  f"of frame fragments ({origin})")
+        with self._lock:
+            composed = sorted(self.composed.items())
+        if composed:
+            print("[INFO]   requests per cell: " + ", ".join(f"{label}: {n}" for label, n in composed))
+
+    def close(self):
+        pass
+
+
+def fire_grid_cell(events, name, label, start, end, exception=None):
+    """Report this request's latency as ``<name>:<cell label>``"""
+    events.request.fire(
+        request_type=GRID_REQUEST_TYPE,
+        name=f"{name}:{label}",
+        response_time=(end - start) * 1000,
+        response_length=0,
+        exception=exception,
+        context={},
+    )
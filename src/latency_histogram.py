@@ -0,0 +1,356 @@
+"""
+Mergeable high-dynamic-range latency histograms.
+
+Locust keeps response times in coarse rounded buckets and only writes
+percentiles, so multi-second VLM latencies lose tail resolution and separate
+runs cannot be re-aggregated. LatencyHistogram is a log-linear (HDR-style)
+histogram over integer microseconds with 2048 sub-buckets per power of two:
+every value is kept within 0.1% across 1us..hours, and two histograms merge
+losslessly by adding counts.
+
+HdrRecorder hooks locust's request event, so the locustfiles' hot paths are
+unchanged. It records end-to-end latency of the real requests plus the
+derived ttft/tpot/intended, prefix hit/partial/miss and grid cell metrics;
+the itl histogram comes from the context of each request's ``:ttft`` event.
+Every interval the new samples are cut into an interval histogram:
+- workers send theirs to the master with their regular stats report, and
+  the remainder as a message when they stop;
+- the master (or a standalone run) merges them into run totals.
+A headless master fires test_stop before its workers stop, so their last
+intervals arrive after the totals were written; the master rewrites them.
+With --csv, every interval goes to ``<prefix>_hdr.jsonl`` and the totals to
+``<prefix>_hdr.json``. Those files merge offline across workers and runs:
+
+    python src/latency_histogram.py results_64_hdr.json results_128_hdr.json
+"""
+import argparse
+import json
+import threading
+import time
+
+SUB_BUCKET_BITS = 11
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+REPORT_PERCENTILES = (50, 90, 99, 99.9, 99.99)
+HDR_REPORT_KEY = "vlm_hdr"
+
+
+def _index(value):
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value >> shift) - SUB_BUCKET_HALF)
+
+
+def _highest_equivalent(index):
+    """Largest value that lands in bucket index"""
+    if index < SUB_BUCKET_COUNT:
+        return index
+    shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    mantissa = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Sparse log-linear histogram of latencies in integer microseconds"""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = None
+
+    def record_ms(self, ms):
+        us = max(0, int(round(ms * 1000)))
+        i = _index(us)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.total_us += us
+        if self.min_us is None or us < self.min_us:
+            self.min_us = us
+        if self.max_us is None or us > self.max_us:
+            self.max_us = us
+
+    def merge(self, other):
+        for i, n in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + n
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        if other.max_us is not None and (self.max_us is None or other.max_us > self.max_us):
+            self.max_us = other.max_us
+        return self
+
+    def percentile_ms(self, q):
+        """Value at percentile q (0-100), within 0.1%; None when empty"""
+        if not self.count:
+            return None
+        target = max(1, -(-self.count * q // 100))
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= target:
+                return min(_highest_equivalent(i), self.max_us) / 1000.0
+        return self.max_us / 1000.0
+
+    def mean_ms(self):
+        return self.total_us / self.count / 1000.0 if self.count else None
+
+    def to_dict(self):
+        return {
+            "unit": "us",
+            "sub_bucket_bits": SUB_BUCKET_BITS,
+            "count": self.count,
+            "sum": self.total_us,
+            "min": self.min_us,
+            "max": self.max_us,
+            "counts": sorted([i, n] for i, n in self.counts.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("sub_bucket_bits", SUB_BUCKET_BITS) != SUB_BUCKET_BITS:
+            raise ValueError("histogram was recorded with a different precision")
+        h = cls()
+        h.counts = {int(i): int(n) for i, n in data["counts"]}
+        h.count = data["count"]
+        h.total_us = data["sum"]
+        h.min_us = data["min"]
+        h.max_us = data["max"]
+        return h
+
+
+def metric_for(request_type, name):
+    """Histogram name for a locust request event: e2e, or the derived metric suffix"""
+    if ":" in name and request_type in ("STREAM", "OPENLOOP", "PREFIX", "GRID"):
+        return name.rsplit(":", 1)[1]
+    return "e2e"
+
+
+def merge_snapshots(snapshots):
+    """Merge {metric: histogram dict} snapshots into {metric: LatencyHistogram}"""
+    merged = {}
+    for snapshot in snapshots:
+        for metric, data in snapshot.items():
+            merged.setdefault(metric, LatencyHistogram()).merge(LatencyHistogram.from_dict(data))
+    return merged
+
+
+def summary_rows(histograms):
+    rows = []
+    for metric in sorted(histograms):
+        h = histograms[metric]
+        row = {"Metric": metric, "Count": h.count, "Mean (ms)": h.mean_ms(),
+               "Min (ms)": h.min_us / 1000.0 if h.min_us is not None else None}
+        for q in REPORT_PERCENTILES:
+            row[f"p{q:g} (ms)"] = h.percentile_ms(q)
+        row["Max (ms)"] = h.max_us / 1000.0 if h.max_us is not None else None
+        rows.append(row)
+    return rows
+
+
+def print_summary(histograms, title="HDR latency"):
+    for row in summary_rows(histograms):
+        if not row["Count"]:
+            continue
+        tail = ", ".join(f"p{q:g} {row[f'p{q:g} (ms)']:.1f}" for q in REPORT_PERCENTILES)
+        print(f"[INFO] {title} {row['Metric']:<8} n={row['Count']}, mean {row['Mean (ms)']:.1f}ms, "
+              f"{tail}, max {row['Max (ms)']:.1f}ms")
+
+
+class HdrRecorder:
+    """Per-process interval histograms, merged into run totals on the master or standalone runner"""
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._current = {}
+        self.totals = {}
+        self.failures = 0
+        self._log = None
+        self._csv_prefix = None
+        self._written = False    # master: totals written at test_stop, rewritten for late worker intervals
+
+    def record(self, metric, ms):
+        with self._lock:
+            h = self._current.get(metric)
+            if h is None:
+                h = self._current[metric] = LatencyHistogram()
+            h.record_ms(ms)
+
+    def take_interval(self):
+        """Serialized histograms recorded since the last call, then reset"""
+        with self._lock:
+            current, self._current = self._current, {}
+        return {metric: h.to_dict() for metric, h in current.items() if h.count}
+
+    def merge_interval(self, snapshot, source, timestamp=None):
+        if not snapshot:
+            return
+        with self._lock:
+            for metric, h in merge_snapshots([snapshot]).items():
+                self.totals.setdefault(metric, LatencyHistogram()).merge(h)
+            if self._csv_prefix:
+                if self._log is None:
+                    self._open_log()
+                self._log.write(json.dumps({"t": timestamp or time.time(), "source": source,
+                                            "histograms": snapshot}) + "\n")
+                self._log.flush()
+
+    def _open_log(self):
+        """Start a fresh interval log: a rerun with the same --csv prefix must not merge old intervals"""
+        if self._log is not None:
+            self._log.close()
+        self._log = open(f"{self._csv_prefix}_hdr.jsonl", "w")
+
+    def start_run(self):
+        """Reset the run totals and truncate the interval log (called on test_start)"""
+        with self._lock:
+            self.totals = {}
+            self.failures = 0
+            self._written = False
+            if self._csv_prefix:
+                self._open_log()
+
+    def record_stream(self, context):
+        """Per-token gaps carried in a ``:ttft`` STREAM event's context (see stream_metrics)"""
+        itls = context.get("itl_ms")
+        if itls:
+            with self._lock:
+                h = self._current.setdefault("itl", LatencyHistogram())
+                for ms in itls:
+                    h.record_ms(ms)
+
+    def _on_request(self, request_type, name, response_time, exception=None, context=None, **kwargs):
+        if exception is not None:
+            with self._lock:
+                self.failures += 1
+            return
+        self.record(metric_for(request_type, name), response_time)
+        if request_type == "STREAM" and context:
+            self.record_stream(context)
+
+    def attach(self, environment):
+        """Record every locust request event and wire up interval shipping (call from events.init)"""
+        from locust.runners import MasterRunner, WorkerRunner
+
+        events = environment.events
+        options = getattr(environment, "parsed_options", None)
+        self._csv_prefix = getattr(options, "csv_prefix", None)
+        runner = environment.runner
+
+        if isinstance(runner, WorkerRunner):
+            events.request.add_listener(self._on_request)
+
+            @events.report_to_master.add_listener
+            def _ship(client_id, data, **kwargs):
+                data[HDR_REPORT_KEY] = self.take_interval()
+
+            # A stopping worker sends no final stats report after its test_stop
+            @events.test_stop.add_listener
+            def _ship_rest(**kwargs):
+                runner.send_message(HDR_REPORT_KEY, self.take_interval())
+            return
+
+        @events.test_start.add_listener
+        def _reset(**kwargs):
+            self.start_run()
+
+        if isinstance(runner, MasterRunner):
+            @events.worker_report.add_listener
+            def _collect(client_id, data, **kwargs):
+                self._merge_late(data.get(HDR_REPORT_KEY), client_id)
+
+            runner.register_message(HDR_REPORT_KEY, lambda environment, msg, **kw:
+                                    self._merge_late(msg.data, msg.node_id))
+        else:
+            import gevent
+            events.request.add_listener(self._on_request)
+
+            def _flush_loop():
+                while True:
+                    gevent.sleep(self.interval)
+                    self.merge_interval(self.take_interval(), "local")
+
+            flusher = []
+
+            @events.test_start.add_listener
+            def _start(**kwargs):
+                flusher.append(gevent.spawn(_flush_loop))
+
+            @events.test_stop.add_listener
+            def _stop(**kwargs):
+                while flusher:
+                    flusher.pop().kill()
+                self.merge_interval(self.take_interval(), "local")
+
+        @events.test_stop.add_listener
+        def _write(**kwargs):
+            self.write_totals()
+
+    def _merge_late(self, snapshot, source):
+        """Merge a worker interval; after test_stop the totals file is rewritten to include it"""
+        if not snapshot:
+            return
+        self.merge_interval(snapshot, source)
+        if self._written:
+            print(f"[INFO] HDR: merged the final interval from {source} after the run stopped")
+            self.write_totals(quiet=True)
+
+    def replay(self, snapshots, failures=0, csv_prefix=None):
+        """Merge stats_csv.RequestRecorder interval snapshots into run totals (asyncio engine)"""
+        self._csv_prefix = csv_prefix
+        self.start_run()
+        self.failures = failures
+        for timestamp, snapshot in snapshots:
+            self.merge_interval(snapshot, "async", timestamp)
+        self.write_totals()
+
+    def write_totals(self, quiet=False):
+        with self._lock:
+            totals = dict(self.totals)
+            self._written = True
+        if not quiet:
+            print_summary(totals)
+        if self._csv_prefix and totals:
+            path = f"{self._csv_prefix}_hdr.json"
+            with open(path, "w") as f:
+                json.dump({metric: h.to_dict() for metric, h in totals.items()}, f)
+            if not quiet:
+                print(f"[INFO] HDR histograms written to {path}")
+
+
+def load_histogram_file(path, start=None, end=None):
+    """Load a _hdr.json (totals) or _hdr.jsonl (intervals, optionally limited to start < t <= end)"""
+    if path.endswith(".jsonl"):
+        snapshots = []
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                if (start is None or entry["t"] > start) and (end is None or entry["t"] <= end):
+                    snapshots.append(entry["histograms"])
+        return merge_snapshots(snapshots)
+    with open(path) as f:
+        return merge_snapshots([json.load(f)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge HDR latency histograms across workers and runs")
+    parser.add_argument("files", nargs="+", help="<prefix>_hdr.json or <prefix>_hdr.jsonl files")
+    parser.add_argument("-o", "--output", help="write the merged histograms to this .json file")
+    args = parser.parse_args()
+
+    merged = {}
+    for path in args.files:
+        for metric, h in load_histogram_file(path).items():
+            merged.setdefault(metric, LatencyHistogram()).merge(h)
+    print_summary(merged, title=f"Merged {len(args.files)} file(s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({metric: h.to_dict() for metric, h in merged.items()}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Persistent on-disk cache for encoded video frames.
+
+Each cache entry is a single file holding the JPEG bytes of every sampled
+frame plus an offset table, keyed by a digest of the source file and the
+sampling parameters (min_pixels/max_pixels/fps/max_frames). The digest is
+sampled rather than taken over the whole file: it covers the file size and
+its first and last MiB, so multi-GB videos are not read just to look them up.
+An index of path, size and mtime to digest lets warm starts skip even that.
+A warm start only reads the entry files (one read each). Videos whose size
+or sampled bytes changed are decoded again; an edit that keeps the size and
+touches only the middle of the file is not detected.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+
+_MAGIC = b"VLMFC1\0\0"
+_HEADER = struct.Struct("<8sII")   # magic, frame count, reserved
+_ENTRY = struct.Struct("<QQ")      # offset, length
+_SAMPLE_BYTES = 1 << 20            # bytes hashed from each end of the source file
+_INDEX_NAME = "index.json"
+
+
+def file_digest(path, size=None):
+    """Sampled digest of a source file: its size plus the first and last MiB (not the whole content)"""
+    if size is None:
+        size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(_SAMPLE_BYTES))
+        if size > 2 * _SAMPLE_BYTES:
+            f.seek(-_SAMPLE_BYTES, os.SEEK_END)
+            h.update(f.read(_SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def write_frames(path, frames):
+    """Atomically write a list of encoded frames into one cache entry file"""
+    header_size = _HEADER.size + _ENTRY.size * len(frames)
+    table = []
+    offset = header_size
+    for frame in frames:
+        table.append(_ENTRY.pack(offset, len(frame)))
+        offset += len(frame)
+
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(frames), 0))
+        f.write(b"".join(table))
+        for frame in frames:
+            f.write(frame)
+    os.replace(tmp_path, path)
+
+
+def read_frames(path):
+    """Read a frame file written by write_frames in one call.
+
+    The frames are returned as memoryview slices of that single buffer, so no
+    frame is copied again; every caller only base64-encodes them.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError(f"truncated cache entry {path}")
+    magic, count, _ = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        raise ValueError(f"bad cache entry magic in {path}")
+    view = memoryview(data)
+    frames = []
+    for i in range(count):
+        offset, length = _ENTRY.unpack_from(data, _HEADER.size + i * _ENTRY.size)
+        if offset + length > len(data):
+            raise ValueError(f"truncated cache entry {path}")
+        frames.append(view[offset:offset + length])
+    return frames
+
+
+def cache_entry_path(cache_dir, params_key, digest):
+    """Entry file for a source digest under the given parameters"""
+    key = hashlib.sha1(f"{digest}|{params_key}".encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2], f"{key}.frames")
+
+
+class FrameCache:
+    """Cache of encoded frames keyed by sampled source digest and sampling parameters"""
+
+    def __init__(self, cache_dir, params):
+        self.cache_dir = cache_dir
+        self.params_key = json.dumps(params, sort_keys=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # path -> {"size", "mtime_ns", "digest"}; lets warm starts skip hashing
+        self._index_path = os.path.join(cache_dir, _INDEX_NAME)
+        self._index = {}
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, "r") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Ignoring unreadable cache index {self._index_path}: {e}")
+
+    def known_digest(self, source_path, st=None):
+        """Indexed digest of source_path if its size and mtime are unchanged, else None"""
+        if st is None:
+            st = os.stat(source_path)
+        with self._lock:
+            known = self._index.get(os.path.abspath(source_path))
+        if known and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns:
+            return known["digest"]
+        return None
+
+    def remember(self, source_path, size, mtime_ns, digest):
+        """Record a digest computed elsewhere (e.g. in a pool worker) for the next start"""
+        with self._lock:
+            self._index[os.path.abspath(source_path)] = {"size": size, "mtime_ns": mtime_ns, "digest": digest}
+            self._dirty = True
+
+    def _source_digest(self, source_path):
+        st = os.stat(source_path)
+        digest = self.known_digest(source_path, st)
+        if digest is None:
+            digest = file_digest(source_path, st.st_size)
+            self.remember(source_path, st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def entry_path(self, source_path):
+        return cache_entry_path(self.cache_dir, self.params_key, self._source_digest(source_path))
+
+    def get(self, source_path):
+        """Return the cached frames for source_path, or None on a miss"""
+        path = self.entry_path(source_path)
+        frames = None
+        if os.path.exists(path):
+            try:
+                frames = read_frames(path)
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Discarding corrupt cache entry {path}: {e}")
+        with self._lock:
+            if frames is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return frames
+
+    def put(self, source_path, frames):
+        path = self.entry_path(source_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_frames(path, frames)
+
+    def get_or_build(self, source_path, build):
+        """Return cached frames, calling build(source_path) and storing the result on a miss"""
+        frames = self.get(source_path)
+        if frames is None:
+            frames = build(source_path)
+            if frames:
+                self.put(source_path, frames)
+        return frames
+
+    def save(self):
+        """Persist the path -> digest index so the next start can skip hashing"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = json.dumps(self._index)
+            self._dirty = False
+        tmp_path = f"{self._index_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self._index_path)
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total * 100 if total else 0.0
+        print(f"[INFO] Frame cache {self.cache_dir}: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)")
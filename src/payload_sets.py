@@ -0,0 +1,220 @@
+"""
+Locust-free builders for the three payload sets (image, frames, video).
+
+The locustfiles and the asyncio engine (async_engine.py) both build their
+request bodies through these functions, so every engine sends byte-identical
+payloads. Nothing here imports locust, which keeps the module usable from
+plain asyncio code and from process-pool workers.
+"""
+import base64
+import glob
+import io
+import os
+
+from PIL import Image
+
+from dataset_manifest import load_manifest
+from frame_shards import is_artifact_dir, load_shards
+from payload_utils import encode_payload
+
+MODEL_NAME = "Qwen2.5-VL"
+IMAGE_EXTENSIONS = ("*.jpg", "*.png", "*.jpeg")
+VIDEO_EXTENSIONS = ("*.mp4", "*.avi", "*.mov", "*.mkv")
+
+
+def build_body(messages, max_tokens, stream=False):
+    """Encode a chat completion request body for the served model"""
+    payload = {
+        "model": MODEL_NAME,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": 0.2
+    }
+    return encode_payload(payload, stream=stream)
+
+
+def image_url_part(image_base64):
+    return {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}}
+
+
+# ---------------------------------------------------------------- image set
+
+def discover_image_files(base_path, limit=None):
+    """All images under base_path (recursive, or from its manifest), optionally capped at limit"""
+    manifest = load_manifest(base_path, "images")
+    if manifest is not None:
+        image_files = [path for key in manifest.keys for path in manifest.files(key)]
+    else:
+        image_files = []
+        for ext in IMAGE_EXTENSIONS:
+            image_files += glob.glob(os.path.join(base_path, "**", ext), recursive=True)
+        image_files = [f for f in image_files
+                       if not is_artifact_dir(os.path.relpath(f, base_path).split(os.sep, 1)[0])]
+    if limit is not None and len(image_files) > limit:
+        image_files = image_files[:limit]
+    return image_files
+
+
+def encode_image_file(image_file, size=(1024, 1024), quality=95):
+    """Load an image, resize it to size and return JPEG bytes"""
+    with Image.open(image_file) as img:
+        img = img.convert('RGB')
+        img = img.resize(size, Image.Resampling.LANCZOS)
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format='JPEG', quality=quality)
+        return img_buffer.getvalue()
+
+
+def resize_jpeg(image_bytes, max_pixels, quality=95, factor=28):
+    """Downscale JPEG bytes to at most max_pixels, both sides multiples of factor (no upscaling)"""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        width, height = img.size
+        if width * height <= max_pixels:
+            return image_bytes
+        scale = (max_pixels / (width * height)) ** 0.5
+        size = (max(factor, int(width * scale) // factor * factor),
+                max(factor, int(height * scale) // factor * factor))
+        img = img.convert('RGB').resize(size, Image.Resampling.LANCZOS)
+        img_buffer = io.BytesIO()
+        img.save(img_buffer, format='JPEG', quality=quality)
+        return img_buffer.getvalue()
+
+
+def build_image_body(image_bytes, prompt_text, max_tokens, stream=False):
+    content = [
+        {"type": "text", "text": prompt_text},
+        image_url_part(base64.b64encode(image_bytes).decode()),
+    ]
+    return build_body([{"role": "user", "content": content}], max_tokens, stream)
+
+
+# --------------------------------------------------------------- frames set
+
+def discover_frame_dirs(base_path):
+    """Video frame directories (category/video_name/) relative to base_path, in manifest or shard order if any.
+
+    Artifact directories in the dataset root (shards/, wire/, hidden ones) are not categories.
+    """
+    manifest = load_manifest(base_path, "frames")
+    if manifest is not None:
+        return list(manifest.keys)
+    shards = load_shards(base_path)
+    if shards is not None:
+        return list(shards.keys)
+    video_dirs = []
+    if os.path.exists(base_path):
+        for category in os.listdir(base_path):
+            category_path = os.path.join(base_path, category)
+            if os.path.isdir(category_path) and not is_artifact_dir(category):
+                for video_name in os.listdir(category_path):
+                    video_path = os.path.join(category_path, video_name)
+                    if os.path.isdir(video_path):
+                        video_dirs.append(os.path.join(category, video_name))
+    return video_dirs
+
+
+def list_frame_files(base_path, video_dir):
+    """Sorted frame files of a video directory, from the manifest when there is one"""
+    manifest = load_manifest(base_path, "frames")
+    if manifest is not None:
+        files = manifest.files(video_dir)
+        if files is not None:
+            return files
+    return sorted(glob.glob(os.path.join(base_path, video_dir, "*.jpg")))
+
+
+def frame_count(base_path, video_dir):
+    """Number of frames of a video directory, from its shard when the dataset is packed"""
+    shards = load_shards(base_path)
+    if shards is not None and video_dir in shards:
+        return shards.frame_count(video_dir)
+    return len(list_frame_files(base_path, video_dir))
+
+
+def iter_frame_bytes(base_path, video_dir):
+    """Yield (name, JPEG bytes) for each frame of a video directory, in order.
+
+    Packed datasets (frame_shards) yield zero-copy memoryviews of the mapped
+    shard; otherwise each frame file is read, and unreadable ones are skipped.
+    """
+    shards = load_shards(base_path)
+    if shards is not None and video_dir in shards:
+        reader = shards.reader(video_dir)
+        for name, data in zip(reader.names(video_dir), reader.frames(video_dir)):
+            yield os.path.join(video_dir, name), data
+        return
+    for frame_file in list_frame_files(base_path, video_dir):
+        try:
+            with open(frame_file, "rb") as f:
+                image_bytes = f.read()
+        except Exception as e:
+            print(f"[ERROR] Failed to load frame {frame_file}: {e}")
+            continue
+        yield frame_file, image_bytes
+
+
+def load_frame_content(base_path, video_dir, prompt_text):
+    """Load and base64-encode every frame of a video directory.
+
+    Returns (content parts, file count, total JPEG bytes).
+    """
+    file_count = 0
+    total_bytes = 0
+    content = [{"type": "text", "text": prompt_text}]
+
+    for _, image_bytes in iter_frame_bytes(base_path, video_dir):
+        file_count += 1
+        total_bytes += len(image_bytes)
+        content.append(image_url_part(base64.b64encode(image_bytes).decode()))
+
+    return content, file_count, total_bytes
+
+
+def build_frame_body(base_path, video_dir, prompt_text, max_tokens, stream=False):
+    """Encoded request body for one frame directory, or None if it has no frames.
+
+    Returns (body, file count, total JPEG bytes).
+    """
+    content, file_count, byte_count = load_frame_content(base_path, video_dir, prompt_text)
+    if len(content) <= 1:
+        return None, file_count, byte_count
+    return build_body([{"role": "user", "content": content}], max_tokens, stream), file_count, byte_count
+
+
+# ---------------------------------------------------------------- video set
+
+def discover_video_files(base_path):
+    """All video files under base_path (recursive)"""
+    video_files = []
+    if os.path.exists(base_path):
+        for ext in VIDEO_EXTENSIONS:
+            video_files.extend(glob.glob(os.path.join(base_path, '**', ext), recursive=True))
+    return video_files
+
+
+def build_video_messages(video_file, prompt_text, min_pixels, max_pixels, fps, max_frames):
+    """Chat messages with a qwen_vl_utils video part; the last part is the video"""
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt_text},
+                {
+                    "type": "video",
+                    "video": video_file,
+                    "min_pixels": min_pixels,
+                    "max_pixels": max_pixels,
+                    "fps": fps,
+                    "video_maxlen": max_frames
+                }
+            ]
+        }
+    ]
+
+
+def build_video_body(messages, frames_b64, max_tokens, stream=False):
+    """Replace the video part of build_video_messages() output with image_url frames and encode"""
+    user_content = messages[-1]["content"]
+    user_content[-1:] = [image_url_part(b64) for b64 in frames_b64]
+    return build_body(messages, max_tokens, stream)
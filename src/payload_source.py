@@ -0,0 +1,235 @@
+"""
+Payload sources: where the locustfiles get request bodies from on the hot path.
+
+InMemoryPayloadSource wraps the classic fully-preloaded list. StreamingPayloadSource
+keeps only a byte-bounded LRU of bodies in memory and loads the rest from disk,
+with a background prefetcher that stays ahead of the round-robin request index.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    # Under locust, threading is gevent-patched; the prefetcher needs a real OS
+    # thread so its disk reads overlap with request handling.
+    import gevent as _gevent
+    from gevent import monkey as _gevent_monkey
+    _Thread = _gevent_monkey.get_original("threading", "Thread")
+    _Lock = _gevent_monkey.get_original("threading", "Lock")
+    _Event = _gevent_monkey.get_original("threading", "Event")
+except ImportError:
+    _gevent = None
+    _Thread, _Lock, _Event = threading.Thread, threading.Lock, threading.Event
+
+
+def _off_hub(func, *args):
+    """Run a blocking call on gevent's thread pool when threading is patched (under locust).
+
+    The calling greenlet waits for the result while the hub keeps running every
+    other user; outside gevent the call simply runs in place.
+    """
+    if _gevent is not None and _gevent_monkey.is_module_patched("threading"):
+        return _gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
+def first_available(source, index):
+    """(index, body) for the first loadable payload at or after index, wrapping around.
+
+    A claimed request sequence must still be sent when its planned body cannot
+    be loaded, or the run would end short of its request budget; the following
+    payloads are tried instead. Returns (index, None) when none can be loaded.
+    """
+    n = len(source)
+    for k in range(n):
+        candidate = (index + k) % n
+        body = source.get(candidate)
+        if body is not None:
+            return candidate, body
+    return index, None
+
+
+class InMemoryPayloadSource:
+    """All request bodies held in memory, indexed by position"""
+
+    def __init__(self, payloads):
+        self._payloads = payloads
+
+    def __len__(self):
+        return len(self._payloads)
+
+    def get(self, index):
+        return self._payloads[index]
+
+    def report(self):
+        total = sum(len(p) for p in self._payloads)
+        print(f"[INFO] Payload source: {len(self._payloads)} in-memory bodies, {total / (1024 * 1024):.1f}MB")
+
+    def close(self):
+        pass
+
+
+class _InFlight:
+    """A body some thread is loading; other threads wanting it wait on ``done``"""
+
+    __slots__ = ("done", "body")
+
+    def __init__(self):
+        self.done = _Event()
+        self.body = None
+
+
+class StreamingPayloadSource:
+    """Request bodies loaded on demand by ``loader(key)`` and kept in a byte-budgeted LRU.
+
+    ``keys`` fixes the index space; ``loader`` returns the encoded body bytes for
+    one key. A prefetch thread loads the ``prefetch_depth`` bodies following the
+    most recently requested index so the hot path normally hits the cache; when it
+    does not, the body is loaded on gevent's thread pool (see _off_hub) and counted
+    as a prefetch stall. A body that is already being loaded, by the prefetcher or
+    another user, is waited for instead of being read a second time.
+    """
+
+    def __init__(self, keys, loader, byte_budget, prefetch_depth=32):
+        self._keys = list(keys)
+        self._loader = loader
+        self.byte_budget = byte_budget
+        self.prefetch_depth = prefetch_depth
+
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight = {}         # index -> _InFlight while some thread loads it
+        self._lock = _Lock()
+        self._wakeup = _Event()
+        self._cursor = -1
+        self._closed = False
+
+        self.hits = 0
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.prefetched = 0
+        self.evictions = 0
+        self.load_errors = 0
+
+        self._thread = _Thread(target=self._prefetch_loop, name="payload-prefetch", daemon=True)
+        self._thread.start()
+        self._wakeup.set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _insert(self, index, body):
+        """Add a body as most recently used, evicting from the cold end to stay in budget"""
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return
+            self._cache[index] = body
+            self._cache_bytes += len(body)
+            while self._cache_bytes > self.byte_budget and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
+                self.evictions += 1
+
+    def _load(self, index):
+        try:
+            return self._loader(self._keys[index])
+        except Exception as e:
+            with self._lock:
+                self.load_errors += 1
+            print(f"[ERROR] Failed to load payload {self._keys[index]}: {e}")
+            return None
+
+    def _load_once(self, index):
+        """(body, loaded here) for index, waiting on a load already in flight; blocks its thread"""
+        with self._lock:
+            body = self._cache.get(index)
+            if body is not None:
+                return body, False
+            pending = self._inflight.get(index)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[index] = _InFlight()
+        if not owner:
+            pending.done.wait()
+            return pending.body, False
+        try:
+            pending.body = self._load(index)
+            if pending.body is not None:
+                self._insert(index, pending.body)
+        finally:
+            with self._lock:
+                del self._inflight[index]
+            pending.done.set()
+        return pending.body, True
+
+    def get(self, index):
+        """Return the body for index (None if it could not be loaded)"""
+        with self._lock:
+            self._cursor = index
+            body = self._cache.get(index)
+            if body is not None:
+                self._cache.move_to_end(index)
+                self.hits += 1
+        self._wakeup.set()
+        if body is not None:
+            return body
+
+        start = time.perf_counter()
+        body, _ = _off_hub(self._load_once, index)
+        with self._lock:
+            self.stalls += 1
+            self.stall_seconds += time.perf_counter() - start
+        return body
+
+    def _prefetch_loop(self):
+        while not self._closed:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closed:
+                return
+            n = len(self._keys)
+            if n == 0:
+                continue
+            with self._lock:
+                cursor = self._cursor
+            for k in range(1, min(self.prefetch_depth, n) + 1):
+                index = (cursor + k) % n
+                with self._lock:
+                    if index in self._cache or index in self._inflight:
+                        continue
+                body, loaded = self._load_once(index)
+                if body is None or not loaded:
+                    continue
+                with self._lock:
+                    self.prefetched += 1
+                    # Fell behind: restart from the new cursor instead of loading stale indices
+                    if (self._cursor - cursor) % n > self.prefetch_depth // 2:
+                        break
+
+    def summary(self):
+        with self._lock:
+            lookups = self.hits + self.stalls
+            return {
+                "payloads": len(self._keys),
+                "cached": len(self._cache),
+                "cached_mb": self._cache_bytes / (1024 * 1024),
+                "budget_mb": self.byte_budget / (1024 * 1024),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stalls": self.stalls,
+                "avg_stall_ms": self.stall_seconds / self.stalls * 1000 if self.stalls else 0.0,
+                "prefetched": self.prefetched,
+                "evictions": self.evictions,
+                "load_errors": self.load_errors,
+            }
+
+    def report(self):
+        s = self.summary()
+        print(f"[INFO] Payload source: {s['payloads']} streamed bodies, "
+              f"{s['cached']} cached ({s['cached_mb']:.1f}/{s['budget_mb']:.0f}MB), "
+              f"hit rate {s['hit_rate'] * 100:.1f}%, {s['stalls']} prefetch stalls "
+              f"(avg {s['avg_stall_ms']:.1f}ms), {s['prefetched']} prefetched, {s['evictions']} evictions")
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
@@ -0,0 +1,56 @@
+"""
+Helpers shared by the locustfiles for building request bodies and measuring
+how much time the load generator itself spends per request.
+"""
+import json
+import threading
+import time
+
+
+def encode_payload(payload, stream=False):
+    """Serialize a chat completion payload once into immutable request body bytes.
+
+    With stream=True the body asks for an SSE response that ends with a usage chunk.
+    """
+    if stream:
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+class ClientOverheadTracker:
+    """Accumulate per-request client-side overhead (time spent before the body hits the socket)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._cpu_start = time.process_time()
+        self._wall_start = time.perf_counter()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def summary(self):
+        with self._lock:
+            count, total, peak = self.count, self.total, self.max
+        cpu_used = time.process_time() - self._cpu_start
+        wall = time.perf_counter() - self._wall_start
+        return {
+            "requests": count,
+            "avg_overhead_ms": total / count * 1000 if count else 0.0,
+            "max_overhead_ms": peak * 1000,
+            "cpu_ms_per_request": cpu_used / count * 1000 if count else 0.0,
+            "cpu_utilization": cpu_used / wall if wall > 0 else 0.0,
+        }
+
+    def report(self):
+        s = self.summary()
+        print(f"[INFO] Client overhead: {s['requests']} requests, "
+              f"avg {s['avg_overhead_ms']:.3f}ms, max {s['max_overhead_ms']:.3f}ms before send, "
+              f"{s['cpu_ms_per_request']:.2f}ms CPU/request, "
+              f"generator CPU utilization {s['cpu_utilization'] * 100:.1f}%")
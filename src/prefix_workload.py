@@ -0,0 +1,242 @@
+"""
+Prefix-cache-aware workload for vLLM ``--enable-prefix-caching``.
+
+By default every request carries a different video, so the server's prefix
+cache never gets a hit and its effect is never measured. PrefixWorkload
+changes which preloaded payload a request uses and how its body is laid
+out:
+
+- each request either repeats a video that was already sent (probability
+  ``reuse``, the target drawn with Zipf popularity over the videos seen so
+  far) or moves on to the next new one;
+- the body is spliced (without copying the frames) so the images come
+  before the prompt text, and the prompt is drawn from ``prompts``. A
+  repeated video therefore shares its whole image prefix even when the
+  question differs;
+- an optional ``system_prompt`` becomes the system message of every request
+  (replacing one the body already has, as the video set's does), which
+  gives every request at least a short shared prefix.
+
+Bodies can be contiguous bytes/memoryviews or FragmentBody objects (wire
+artifacts); anything else raises ValueError rather than being sent unchanged
+under a PREFIX label. Bodies composed per request (fragment and grid mode)
+already choose their own prompt and frames, so the locustfiles refuse to
+combine those modes with this one.
+
+The plan is a pure function of the global request sequence and the seed, so
+all workers agree on it. Each request is classed as an expected ``hit``
+(its video is in a modelled LRU of ``cache_entries`` videos, 0 = unbounded),
+``partial`` (only the system prompt is shared) or ``miss``. Its latency is
+reported as a ``PREFIX`` request named ``<name>:hit`` / ``:partial`` /
+``:miss``, next to the main request.
+"""
+import bisect
+import json
+import threading
+import random
+from collections import Counter, OrderedDict
+
+from fragment_store import FragmentBody
+
+PREFIX_REQUEST_TYPE = "PREFIX"
+CACHE_CLASSES = ("hit", "partial", "miss")
+
+_MESSAGES_MARKER = b'"messages":['
+_USER_MARKER = b'{"role":"user","content":['
+_TEXT_PART = b'{"type":"text"'
+_IMAGE_SEPARATOR = b'},{"type":"image_url"'
+_CONTENT_END = b']}]'
+_HEAD_WINDOW = 1 << 16
+_TAIL_WINDOW = 4096
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _split_head(head):
+    """Offsets of the message list, the user message and its content in a body's head, or None"""
+    messages = head.find(_MESSAGES_MARKER)
+    user = head.find(_USER_MARKER)
+    if messages < 0 or user < 0:
+        return None
+    messages += len(_MESSAGES_MARKER)
+    content = user + len(_USER_MARKER)
+    if messages > user or not head.startswith(_TEXT_PART, content):
+        return None
+    return messages, user, content
+
+
+def split_body(body):
+    """Split a body into (head, earlier messages, user message start, text part, image fragments, tail).
+
+    Works on any payload_sets body whose user content is a text part followed
+    by image_url parts, either contiguous (bytes or memoryview, e.g. mapped or
+    shared memory) or a FragmentBody laid out as prompt prefix, images, suffix.
+    Every piece is a view or an existing fragment, so nothing is copied.
+    Returns None for any other layout.
+    """
+    if isinstance(body, FragmentBody):
+        fragments = body.fragments
+        if len(fragments) < 4 or bytes(fragments[1]) != b",":
+            return None
+        head = bytes(fragments[0])
+        offsets = _split_head(head)
+        if offsets is None or not bytes(fragments[-1][:len(_CONTENT_END)]) == _CONTENT_END:
+            return None
+        messages, user, content = offsets
+        return (head[:messages], head[messages:user], head[user:content], head[content:],
+                list(fragments[2:-1]), fragments[-1])
+
+    try:
+        view = memoryview(body)
+    except TypeError:
+        return None
+    head = bytes(view[:_HEAD_WINDOW])
+    offsets = _split_head(head)
+    if offsets is None:
+        return None
+    messages, user, content = offsets
+    text_end = head.find(_IMAGE_SEPARATOR, content)
+    if text_end < 0:
+        return None
+    tail_start = max(0, len(view) - _TAIL_WINDOW)
+    close = bytes(view[tail_start:]).rfind(_CONTENT_END)
+    if close < 0:
+        return None
+    close += tail_start
+    return (view[:messages], view[messages:user], view[user:content], view[content:text_end + 1],
+            [view[text_end + 2:close]], view[close:])
+
+
+class PrefixWorkload:
+    """Deterministic payload plan with a controllable share of prefix-cache hits"""
+
+    def __init__(self, reuse=0.5, zipf=1.0, prompts=None, system_prompt=None, cache_entries=0, seed=0):
+        if not 0.0 <= reuse <= 1.0:
+            raise ValueError("prefix reuse ratio must be between 0 and 1")
+        self.reuse = reuse
+        self.zipf = zipf
+        self.prompts = list(prompts or [])
+        self.system_prompt = system_prompt or None
+        self.cache_entries = cache_entries
+        self.seed = seed
+        self._text_parts = [_encode({"type": "text", "text": p}) for p in self.prompts]
+        self._system = (_encode({"role": "system", "content": self.system_prompt}) + b","
+                        if self.system_prompt else b"")
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._plan = []             # per sequence: (payload index, expected cache class)
+        self._count = None
+        self._seen = []             # payload indices in order of first use (popularity rank)
+        self._weights = []          # cumulative Zipf weights over _seen
+        self._next_new = 0
+        self._cache = OrderedDict()
+
+        self.latency = {c: [0, 0.0] for c in CACHE_CLASSES}   # class -> [requests, total ms]
+        self.planned = Counter()
+
+    def _extend(self, sequence, count):
+        """Plan every sequence up to and including ``sequence``; caller holds the lock"""
+        if self._count != count:
+            if self._plan:
+                raise ValueError("payload count changed after planning started")
+            self._count = count
+        while len(self._plan) <= sequence:
+            if self._seen and self._random.random() < self.reuse:
+                r = self._random.random() * self._weights[-1]
+                index = self._seen[bisect.bisect_right(self._weights, r)]
+            else:
+                index = self._next_new % count
+                self._next_new += 1
+                if self._next_new <= count:
+                    self._seen.append(index)
+                    rank = len(self._seen)
+                    self._weights.append((self._weights[-1] if self._weights else 0.0) + rank ** -self.zipf)
+            if index in self._cache:
+                expected = "hit"
+                self._cache.move_to_end(index)
+            else:
+                expected = "partial" if self._system and self._plan else "miss"
+                self._cache[index] = True
+                if self.cache_entries and len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+            self._plan.append((index, expected))
+
+    def plan(self, sequence, count):
+        """(payload index, expected cache class) for a global request sequence number"""
+        with self._lock:
+            self._extend(sequence, count)
+            index, expected = self._plan[sequence]
+            self.planned[expected] += 1
+        return index, expected
+
+    def compose(self, body, sequence):
+        """The body with images first, then this sequence's prompt, behind the shared system prompt"""
+        parts = split_body(body)
+        if parts is None:
+            raise ValueError("prefix workload needs a body with a text part followed by image_url parts")
+        head, earlier, user_start, text, images, tail = parts
+        if self._text_parts:
+            text = self._text_parts[hash((self.seed, sequence)) % len(self._text_parts)]
+        if self._system:
+            earlier = self._system
+        fragments = [head, earlier, user_start] + images + [b",", text, tail]
+        return FragmentBody([f for f in fragments if len(f)], getattr(body, "frames", None))
+
+    def record(self, events, name, expected, start, end, exception=None):
+        """Report this request's latency under its expected cache class"""
+        response_time = (end - start) * 1000
+        with self._lock:
+            entry = self.latency[expected]
+            entry[0] += 1
+            entry[1] += response_time
+        events.request.fire(
+            request_type=PREFIX_REQUEST_TYPE,
+            name=f"{name}:{expected}",
+            response_time=response_time,
+            response_length=0,
+            exception=exception,
+            context={},
+        )
+
+    def report(self):
+        with self._lock:
+            planned = dict(self.planned)
+            latency = {c: tuple(v) for c, v in self.latency.items()}
+        total = sum(planned.values())
+        if not total:
+            return
+        print(f"[INFO] Prefix workload: reuse {self.reuse:.2f}, zipf {self.zipf:g}, "
+              f"{len(self.prompts) or 1} prompt(s), system prompt {'on' if self._system else 'off'}, "
+              f"cache model {self.cache_entries or 'unbounded'} videos")
+        for c in CACHE_CLASSES:
+            n, total_ms = latency[c]
+            if planned.get(c):
+                mean = f", mean latency {total_ms / n / 1000:.2f}s" if n else ""
+                print(f"[INFO]   expected {c}: {planned[c]} requests "
+                      f"({planned[c] / total * 100:.1f}%){mean}")
+
+
+def workload_from_env(environ, default_prompt):
+    """Build a PrefixWorkload from the VLM_PREFIX_* variables, or None when VLM_PREFIX_WORKLOAD is off"""
+    if environ.get("VLM_PREFIX_WORKLOAD", "0") != "1":
+        return None
+    prompts = [default_prompt]
+    prompts_file = environ.get("VLM_PROMPTS_FILE", "")
+    if prompts_file:
+        with open(prompts_file, "r", encoding="utf-8") as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    system_prompt = environ.get("VLM_PREFIX_SYSTEM_PROMPT", "")
+    if system_prompt.startswith("@"):
+        with open(system_prompt[1:], "r", encoding="utf-8") as f:
+            system_prompt = f.read().strip()
+    return PrefixWorkload(
+        reuse=float(environ.get("VLM_PREFIX_REUSE", "0.5")),
+        zipf=float(environ.get("VLM_PREFIX_ZIPF", "1.0")),
+        prompts=prompts,
+        system_prompt=system_prompt,
+        cache_entries=int(environ.get("VLM_PREFIX_CACHE_ENTRIES", "0")),
+        seed=int(environ.get("VLM_PREFIX_SEED", "0")),
+    )
@@ -0,0 +1,146 @@
+"""
+Global request budget and payload sequencing for the locustfiles.
+
+Every request claims a global sequence number; the payload it sends is
+``sequence % len(payloads)``. Standalone, the sequence is a process-local
+counter. Under ``--master``/``--worker`` the master owns the counter and leases
+blocks of sequence numbers to workers on demand, so N workers send exactly
+``max_requests`` requests between them and the payload index space is split
+across workers instead of every worker replaying the same payloads.
+"""
+import threading
+from collections import deque
+
+try:
+    from locust.runners import MasterRunner, WorkerRunner
+except ImportError:  # outside locust only the standalone counter is available
+    MasterRunner = WorkerRunner = None
+
+BUDGET_CLAIM_MESSAGE = "vlm_budget_claim"
+BUDGET_GRANT_MESSAGE = "vlm_budget_grant"
+GRANT_TIMEOUT = 30  # seconds a worker waits for a grant before asking the master again
+
+
+class RequestBudget:
+    """Hands out global sequence numbers until ``max_requests`` have been claimed.
+
+    ``max_requests`` <= 0 means no budget: claims never run out.
+    ``block_size`` is how many sequence numbers a worker leases from the master
+    per round trip; it has no effect when running standalone. A worker asks for
+    the next block once half of the current one is used, so claims normally
+    never wait for the master, and the lock is never held across a round trip.
+    """
+
+    def __init__(self, max_requests, block_size=8):
+        self.max_requests = max_requests if max_requests > 0 else None
+        self.block_size = max(1, block_size)
+        self.low_water = self.block_size // 2
+        self._lock = threading.Lock()
+        self._next = 0             # standalone / master: next unclaimed sequence number
+        self._leased = deque()     # worker: sequence numbers leased but not yet used
+        self._exhausted = False
+        self._runner = None        # set on workers, where claims go through the master
+        self._requested = False    # worker: a claim message is awaiting its grant
+        self._granted = threading.Condition(self._lock)  # worker: notified when a grant arrives
+        self._run = 0              # worker: grants from an earlier test run are dropped
+        self.stalls = 0            # worker: claims that had to wait for a grant
+        self.timeouts = 0
+
+    def attach(self, environment):
+        """Wire the budget into locust's master/worker messaging (call from events.init)"""
+        runner = environment.runner
+        if MasterRunner is not None and isinstance(runner, MasterRunner):
+            runner.register_message(BUDGET_CLAIM_MESSAGE, self._on_claim)
+            environment.events.test_start.add_listener(self._on_test_start)
+            print(f"[INFO] Request budget of {self.max_requests or 'unlimited'} coordinated by master "
+                  f"(blocks of {self.block_size})")
+        elif WorkerRunner is not None and isinstance(runner, WorkerRunner):
+            self._runner = runner
+            runner.register_message(BUDGET_GRANT_MESSAGE, self._on_grant)
+            environment.events.test_start.add_listener(self._on_test_start)
+
+    def _on_test_start(self, **kwargs):
+        with self._lock:
+            self._next = 0
+            self._leased.clear()
+            self._exhausted = False
+            self._requested = False
+            self._run += 1
+            self.stalls = 0
+            self.timeouts = 0
+
+    def _on_claim(self, environment, msg, **kwargs):
+        """Master: lease up to ``count`` sequence numbers to the requesting worker"""
+        with self._lock:
+            start = self._next
+            end = start + msg.data["count"]
+            if self.max_requests is not None:
+                end = min(end, self.max_requests)
+            self._next = max(start, end)
+        environment.runner.send_message(
+            BUDGET_GRANT_MESSAGE, {"start": start, "end": max(start, end), "run": msg.data.get("run")},
+            client_id=msg.node_id)
+
+    def _on_grant(self, environment, msg, **kwargs):
+        """Worker: add a granted block; an empty block means the master's budget is spent"""
+        grant = msg.data
+        with self._granted:
+            if grant.get("run") != self._run:
+                return
+            self._requested = False
+            if grant["end"] > grant["start"]:
+                self._leased.extend(range(grant["start"], grant["end"]))
+            else:
+                self._exhausted = True
+            self._granted.notify_all()
+
+    def _claim_leased(self):
+        """Worker: pop a leased sequence number, asking for the next block at the low-water mark.
+
+        Only waits when the lease ran dry before the refill arrived; a missing
+        grant is asked for again after GRANT_TIMEOUT rather than ending the run.
+        """
+        while True:
+            sequence = None
+            ask = False
+            with self._granted:
+                if self._leased:
+                    sequence = self._leased.popleft()
+                    ask = len(self._leased) <= self.low_water
+                elif self._exhausted:
+                    return None
+                elif self._requested:
+                    self.stalls += 1
+                    if not self._granted.wait(GRANT_TIMEOUT) and not self._leased and not self._exhausted:
+                        self.timeouts += 1
+                        self._requested = False
+                        print(f"[WARNING] No request budget grant from master within {GRANT_TIMEOUT}s, asking again")
+                    continue
+                else:
+                    ask = True
+                ask = ask and not self._requested and not self._exhausted
+                if ask:
+                    self._requested = True
+                run = self._run
+            if ask:
+                # Sent without the lock: other users keep claiming while the message goes out
+                self._runner.send_message(BUDGET_CLAIM_MESSAGE, {"count": self.block_size, "run": run})
+            if sequence is not None:
+                return sequence
+
+    def claim(self):
+        """Return (sequence, is_final) for the next request, or None once the budget is spent"""
+        if self._runner is not None:
+            sequence = self._claim_leased()
+            if sequence is None:
+                return None
+        else:
+            with self._lock:
+                if self._exhausted:
+                    return None
+                if self.max_requests is not None and self._next >= self.max_requests:
+                    self._exhausted = True
+                    return None
+                sequence = self._next
+                self._next += 1
+        return sequence, self.max_requests is not None and sequence == self.max_requests - 1
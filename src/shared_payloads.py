@@ -0,0 +1,202 @@
+"""
+Node-local shared-memory store for preloaded request bodies.
+
+With one locust worker per core, every worker would otherwise run the full
+preload and hold its own copy of every body. Here the first worker on the host
+to take the build lock encodes the bodies once into a single shared-memory
+segment; the other workers attach to it and serve read-only memoryview slices
+of it, so the bodies exist once in RAM and are posted without copying.
+
+The segment name is derived from the payload set's parameters and its source
+files, so a changed dataset or setting gets a fresh segment. It is unlinked
+when the worker that built it exits.
+
+Segment layout: header ``<8sQQ`` (magic, count, ready), then ``count`` ``<QQ``
+(offset, length) entries, then the bodies back to back. ``ready`` is written
+last, so a reader never sees a half-built store.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import atexit
+import struct
+import sys
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+MAGIC = b"VLMSHM1\0"
+HEADER = struct.Struct("<8sQQ")
+ENTRY = struct.Struct("<QQ")
+SEGMENT_PREFIX = "vlm_payloads_"
+
+
+def payload_set_key(name, params, paths):
+    """Key for a payload set: its parameters plus the size and mtime of every source path"""
+    h = hashlib.sha1(json.dumps({"name": name, "params": params}, sort_keys=True).encode("utf-8"))
+    for path in paths:
+        try:
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            h.update(f"{path}\0missing\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class SharedPayloadStore:
+    """Read-only sequence of request bodies backed by one shared-memory segment"""
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        buf = shm.buf
+        _, count, _ = HEADER.unpack_from(buf, 0)
+        self._view = memoryview(buf).toreadonly()
+        self._views = []
+        for i in range(count):
+            offset, length = ENTRY.unpack_from(buf, HEADER.size + i * ENTRY.size)
+            self._views.append(self._view[offset:offset + length])
+        self.nbytes = sum(len(v) for v in self._views)
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._views)
+
+    def __getitem__(self, index):
+        return self._views[index]
+
+    def __iter__(self):
+        return iter(self._views)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @classmethod
+    def attach(cls, key):
+        """Attach to a fully built segment for key, or return None"""
+        name = SEGMENT_PREFIX + key
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers every attach with the resource tracker, which
+            # would unlink the segment when this worker exits
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                return None
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except FileNotFoundError:
+            return None
+        if shm.size < HEADER.size:
+            shm.close()
+            return None
+        magic, _, ready = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or not ready:
+            shm.close()
+            return None
+        return cls(shm, owner=False)
+
+    @classmethod
+    def create(cls, key, payloads):
+        """Copy payloads into a new segment for key; the caller must hold the build lock"""
+        name = SEGMENT_PREFIX + key
+        try:
+            # Left behind by a builder that died mid-write
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        data_start = HEADER.size + len(payloads) * ENTRY.size
+        size = data_start + sum(len(p) for p in payloads)
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        buf = shm.buf
+        offset = data_start
+        for i, body in enumerate(payloads):
+            ENTRY.pack_into(buf, HEADER.size + i * ENTRY.size, offset, len(body))
+            buf[offset:offset + len(body)] = body
+            offset += len(body)
+        HEADER.pack_into(buf, 0, MAGIC, len(payloads), 1)
+        return cls(shm, owner=True)
+
+    def close(self):
+        """Release the views and the mapping; the builder also unlinks the segment"""
+        if self._view is None:
+            return
+        if self.owner:
+            self._shm.unlink()
+        try:
+            for view in self._views:
+                view.release()
+            self._views = []
+            self._view.release()
+            self._shm.close()
+        except BufferError:
+            pass  # a body is still referenced elsewhere; the mapping goes away with the process
+        self._view = None
+
+    def report(self):
+        role = "built" if self.owner else "attached to"
+        print(f"[INFO] Shared payload store: {role} {self.name}, "
+              f"{len(self)} bodies, {self.nbytes / (1024 * 1024):.1f}MB")
+
+
+def _lock_path(key):
+    return os.path.join(tempfile.gettempdir(), f"{SEGMENT_PREFIX}{key}.lock")
+
+
+def load_shared_payloads(key, build, poll_interval=0.2):
+    """Return the shared store for key, calling ``build()`` to create it if no worker has yet.
+
+    ``build`` returns a list of body bytes. The lock is polled rather than blocked
+    on, so under locust the waiting worker keeps serving its other greenlets.
+    """
+    store = SharedPayloadStore.attach(key)
+    if store is not None:
+        store.report()
+        return store
+
+    with open(_lock_path(key), "w") as lock_file:
+        waited = 0.0
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if waited == 0.0:
+                    print("[INFO] Another worker is building the shared payloads, waiting...")
+                time.sleep(poll_interval)
+                waited += poll_interval
+        try:
+            store = SharedPayloadStore.attach(key)
+            if store is None:
+                payloads = build()
+                store = SharedPayloadStore.create(key, payloads)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    store.report()
+    return store
+
+
+def _list_segments():
+    try:
+        return sorted(n for n in os.listdir("/dev/shm") if n.startswith(SEGMENT_PREFIX))
+    except OSError:
+        return []
+
+
+if __name__ == "__main__":
+    # python shared_payloads.py [--clean]: list (or remove) leftover payload segments
+    segments = _list_segments()
+    for segment in segments:
+        size = os.path.getsize(os.path.join("/dev/shm", segment))
+        print(f"{segment}\t{size / (1024 * 1024):.1f}MB")
+    if "--clean" in sys.argv[1:]:
+        for segment in segments:
+            shm = shared_memory.SharedMemory(name=segment)
+            shm.close()
+            shm.unlink()
+        print(f"Removed {len(segments)} segment(s)")
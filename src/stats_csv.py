@@ -0,0 +1,263 @@
+"""
+Request statistics written in locust's CSV layout.
+
+Used by engines that do not run inside locust (async_engine.py) so their
+``<prefix>_stats.csv``, ``<prefix>_stats_history.csv`` and
+``<prefix>_failures.csv`` can be consumed by merge_results.py and anything
+else that already reads locust output. Like locust, samples are folded into
+histograms as they arrive rather than kept, so percentiles are within the
+LatencyHistogram precision (0.1%).
+"""
+import csv
+import time
+from collections import Counter
+
+from latency_histogram import LatencyHistogram, merge_snapshots, metric_for
+
+PERCENTILES = (0.50, 0.66, 0.75, 0.80, 0.90, 0.95, 0.98, 0.99, 0.999, 0.9999, 1.0)
+PERCENTILE_COLUMNS = [f"{p * 100:.10g}%" for p in PERCENTILES]
+STATS_COLUMNS = [
+    "Type", "Name", "Request Count", "Failure Count", "Median Response Time",
+    "Average Response Time", "Min Response Time", "Max Response Time",
+    "Average Content Size", "Requests/s", "Failures/s",
+] + PERCENTILE_COLUMNS
+HISTORY_COLUMNS = [
+    "Timestamp", "User Count", "Type", "Name", "Requests/s", "Failures/s",
+] + PERCENTILE_COLUMNS + [
+    "Total Request Count", "Total Failure Count", "Total Median Response Time",
+    "Total Average Response Time", "Total Min Response Time", "Total Max Response Time",
+    "Total Average Content Size",
+]
+FAILURE_COLUMNS = ["Method", "Name", "Error", "Occurrences"]
+HISTORY_WINDOW = 10  # seconds of samples behind each history row's current percentiles
+HDR_INTERVAL = 10.0  # seconds per interval histogram, as HdrRecorder's default
+
+
+class _Totals:
+    """Count, failures, content bytes and a latency histogram for one group of samples"""
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.length = 0
+        self.histogram = LatencyHistogram()
+
+    def add(self, response_time_ms, length, failed):
+        self.count += 1
+        self.failures += failed
+        self.length += length
+        self.histogram.record_ms(response_time_ms)
+
+    def merge(self, other):
+        self.count += other.count
+        self.failures += other.failures
+        self.length += other.length
+        self.histogram.merge(other.histogram)
+        return self
+
+    def to_dict(self):
+        return {"count": self.count, "failures": self.failures, "length": self.length,
+                "histogram": self.histogram.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        totals = cls()
+        totals.count = data["count"]
+        totals.failures = data["failures"]
+        totals.length = data["length"]
+        totals.histogram = LatencyHistogram.from_dict(data["histogram"])
+        return totals
+
+
+class RequestRecorder:
+    """Request stats aggregated as they are recorded, so memory does not grow with the run.
+
+    Keeps per-(type, name) totals for the stats CSV, per-second totals of each
+    (type, name) and of all requests for the history CSV, and per-interval HDR histograms of the
+    successful samples (keyed like latency_histogram.HdrRecorder's metrics).
+    Everything is a mergeable summary, so forked engine processes export only
+    these instead of every sample.
+    """
+
+    def __init__(self, hdr_interval=HDR_INTERVAL):
+        self.hdr_interval = hdr_interval
+        self.entries = {}        # (type, name) -> _Totals
+        self.seconds = {}        # whole second of the end timestamp -> _Totals over all entries
+        self.entry_seconds = {}  # (type, name) -> {whole second -> _Totals}
+        self.intervals = {}      # hdr interval index -> {metric: LatencyHistogram}
+        self.failures = Counter()
+        self.hdr_failures = 0
+
+    def record(self, request_type, name, response_time_ms, length, error=None):
+        now = time.time()
+        failed = error is not None
+        entry = self.entries.get((request_type, name))
+        if entry is None:
+            entry = self.entries[(request_type, name)] = _Totals()
+        entry.add(response_time_ms, length, failed)
+        for seconds in (self.seconds, self.entry_seconds.setdefault((request_type, name), {})):
+            second = seconds.get(int(now))
+            if second is None:
+                second = seconds[int(now)] = _Totals()
+            second.add(response_time_ms, length, failed)
+        if failed:
+            self.failures[(request_type, name, str(error))] += 1
+            self.hdr_failures += 1
+        else:
+            self._record_interval(metric_for(request_type, name), response_time_ms, now)
+
+    def _record_interval(self, metric, response_time_ms, now):
+        interval = self.intervals.setdefault(int(now // self.hdr_interval), {})
+        h = interval.get(metric)
+        if h is None:
+            h = interval[metric] = LatencyHistogram()
+        h.record_ms(response_time_ms)
+
+    def record_metric(self, metric, response_time_ms):
+        """HDR-only sample (e.g. one inter-token gap) that is not a request in the stats CSVs"""
+        self._record_interval(metric, response_time_ms, time.time())
+
+    def count(self, request_type, name):
+        """(requests, failures) recorded under (type, name)"""
+        entry = self.entries.get((request_type, name))
+        return (entry.count, entry.failures) if entry is not None else (0, 0)
+
+    def export(self):
+        return {
+            "entries": {key: t.to_dict() for key, t in self.entries.items()},
+            "seconds": {second: t.to_dict() for second, t in self.seconds.items()},
+            "entry_seconds": {key: {second: t.to_dict() for second, t in seconds.items()}
+                              for key, seconds in self.entry_seconds.items()},
+            "intervals": {k: {metric: h.to_dict() for metric, h in hs.items()}
+                          for k, hs in self.intervals.items()},
+            "failures": dict(self.failures),
+            "hdr_failures": self.hdr_failures,
+        }
+
+    def merge(self, exported):
+        pairs = [(self.entries, exported["entries"]), (self.seconds, exported["seconds"])]
+        pairs += [(self.entry_seconds.setdefault(key, {}), seconds)
+                  for key, seconds in exported["entry_seconds"].items()]
+        for groups, exported_groups in pairs:
+            for key, data in exported_groups.items():
+                totals = _Totals.from_dict(data)
+                if key in groups:
+                    groups[key].merge(totals)
+                else:
+                    groups[key] = totals
+        for k, snapshot in exported["intervals"].items():
+            interval = self.intervals.setdefault(k, {})
+            for metric, h in merge_snapshots([snapshot]).items():
+                interval.setdefault(metric, LatencyHistogram()).merge(h)
+        for key, count in exported["failures"].items():
+            self.failures[key] += count
+        self.hdr_failures += exported["hdr_failures"]
+
+    def interval_snapshots(self):
+        """[(interval end timestamp, {metric: histogram dict})] in time order, for HdrRecorder.replay"""
+        return [((k + 1) * self.hdr_interval, {metric: h.to_dict() for metric, h in self.intervals[k].items()})
+                for k in sorted(self.intervals)]
+
+
+def _percentile_columns(row, histogram):
+    for q, column in zip(PERCENTILES, PERCENTILE_COLUMNS):
+        row[column] = round(histogram.percentile_ms(q * 100)) if histogram.count else "N/A"
+
+
+def _row(request_type, name, totals, duration):
+    h = totals.histogram
+    count = totals.count
+    row = {
+        "Type": request_type,
+        "Name": name,
+        "Request Count": count,
+        "Failure Count": totals.failures,
+        "Median Response Time": round(h.percentile_ms(50)) if count else 0,
+        "Average Response Time": h.mean_ms() if count else 0,
+        "Min Response Time": h.min_us / 1000.0 if count else 0,
+        "Max Response Time": h.max_us / 1000.0 if count else 0,
+        "Average Content Size": totals.length / count if count else 0,
+        "Requests/s": count / duration if duration > 0 else 0,
+        "Failures/s": totals.failures / duration if duration > 0 else 0,
+    }
+    _percentile_columns(row, h)
+    return row
+
+
+def write_stats_csv(path, recorder, duration):
+    """<prefix>_stats.csv: one row per (type, name) plus the Aggregated row"""
+    everything = _Totals()
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=STATS_COLUMNS)
+        writer.writeheader()
+        for (request_type, name) in sorted(recorder.entries):
+            totals = recorder.entries[(request_type, name)]
+            everything.merge(totals)
+            writer.writerow(_row(request_type, name, totals, duration))
+        writer.writerow(_row("", "Aggregated", everything, duration))
+
+
+def write_history_csv(path, recorder, start_time, end_time, user_count):
+    """<prefix>_stats_history.csv: per second, one row per (type, name) and the Aggregated row.
+
+    Like locust's --csv-full-history, so merge_results can follow the main
+    request when derived STREAM/OPENLOOP rows are mixed into Aggregated.
+    """
+    groups = [(request_type, name, recorder.entry_seconds.get((request_type, name), {}))
+              for (request_type, name) in sorted(recorder.entries)]
+    groups.append(("", "Aggregated", recorder.seconds))
+    totals = [_Totals() for _ in groups]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_COLUMNS)
+        writer.writeheader()
+        second = int(start_time) + 1
+        while second <= int(end_time) + 1:
+            for (request_type, name, seconds), total in zip(groups, totals):
+                writer.writerow(_history_row(second, request_type, name, seconds, total, start_time, user_count))
+            second += 1
+
+
+def _history_row(second, request_type, name, seconds, total, start_time, user_count):
+    """History row at ``second`` for one group of per-second totals; folds the finished second into total"""
+    # A row at `second` covers samples that ended before it, like the original per-sample cut
+    done = seconds.get(second - 1)
+    if done is not None:
+        total.merge(done)
+    window = _Totals()
+    for s in range(second - HISTORY_WINDOW, second):
+        if s in seconds:
+            window.merge(seconds[s])
+    span = min(HISTORY_WINDOW, max(1, second - start_time))
+    row = {
+        "Timestamp": second,
+        "User Count": user_count,
+        "Type": request_type,
+        "Name": name,
+        "Requests/s": window.count / span,
+        "Failures/s": window.failures / span,
+        "Total Request Count": total.count,
+        "Total Failure Count": total.failures,
+    }
+    _percentile_columns(row, window.histogram)
+    h = total.histogram
+    row["Total Median Response Time"] = round(h.percentile_ms(50)) if total.count else 0
+    row["Total Average Response Time"] = h.mean_ms() if total.count else 0
+    row["Total Min Response Time"] = h.min_us / 1000.0 if total.count else 0
+    row["Total Max Response Time"] = h.max_us / 1000.0 if total.count else 0
+    row["Total Average Content Size"] = total.length / total.count if total.count else 0
+    return row
+
+
+def write_failures_csv(path, recorder):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FAILURE_COLUMNS)
+        writer.writeheader()
+        for (request_type, name, error), count in sorted(recorder.failures.items()):
+            writer.writerow({"Method": request_type, "Name": name, "Error": error, "Occurrences": count})
+
+
+def write_locust_csvs(prefix, recorder, start_time, end_time, user_count):
+    duration = end_time - start_time
+    write_stats_csv(f"{prefix}_stats.csv", recorder, duration)
+    write_history_csv(f"{prefix}_stats_history.csv", recorder, start_time, end_time, user_count)
+    write_failures_csv(f"{prefix}_failures.csv", recorder)
@@ -0,0 +1,172 @@
+"""
+Streaming (SSE) chat completions with per-token timing.
+
+In streaming mode the locustfiles post ``"stream": true`` bodies and parse the
+server-sent events as they arrive, so besides the usual end-to-end latency we
+can report time-to-first-token (vision prefill + first decode step), the
+inter-token latency distribution and time-per-output-token (decode speed).
+Each streamed request fires two extra locust request events with request type
+"STREAM": ``<name>:ttft`` and ``<name>:tpot``, so both show up in the locust
+stats and CSVs. They add two samples per streamed request to the Aggregated
+row, which is why merge_results leaves the derived types out of its totals.
+Per-token gaps are not locust requests: the ``:ttft`` event's context carries
+them and the HDR recorder (latency_histogram.py) takes them into its itl
+histogram.
+"""
+import json
+import time
+
+STREAM_REQUEST_TYPE = "STREAM"
+# Key of the STREAM event context read by latency_histogram.HdrRecorder
+STREAM_ITL_KEY = "itl_ms"
+
+
+class StreamResult:
+    """Timing and usage collected from one streamed completion"""
+
+    def __init__(self):
+        self.ttft = None         # seconds from send to first content token
+        self.itls = []           # seconds between consecutive content chunks
+        self.e2e = None          # seconds from send to end of stream
+        self.content_chunks = 0
+        self.bytes = 0
+        self.usage = None        # final usage block when include_usage is set
+
+    @property
+    def output_tokens(self):
+        if self.usage and self.usage.get("completion_tokens") is not None:
+            return self.usage["completion_tokens"]
+        return self.content_chunks
+
+    @property
+    def tpot(self):
+        """Average decode time per output token after the first one"""
+        if self.ttft is None or self.e2e is None or self.output_tokens < 2:
+            return None
+        return (self.e2e - self.ttft) / (self.output_tokens - 1)
+
+    @property
+    def itl_mean(self):
+        return sum(self.itls) / len(self.itls) if self.itls else None
+
+    @property
+    def itl_max(self):
+        return max(self.itls) if self.itls else None
+
+    def context(self):
+        """Per-request summary attached to the ``:ttft`` event (milliseconds)"""
+        return {
+            STREAM_ITL_KEY: [itl * 1000 for itl in self.itls],
+            "itl_mean_ms": self.itl_mean * 1000 if self.itls else None,
+            "itl_max_ms": self.itl_max * 1000 if self.itls else None,
+            "output_tokens": self.output_tokens,
+        }
+
+
+class SSEParser:
+    """Incremental parser for a chat completion SSE stream.
+
+    ``start`` is the perf_counter() value taken just before the request was sent.
+    Feed it one line at a time; feed() returns False once ``[DONE]`` is seen.
+    """
+
+    def __init__(self, start):
+        self.result = StreamResult()
+        self._start = start
+        self._last_token_time = None
+
+    def feed(self, line):
+        if not line:
+            return True
+        result = self.result
+        result.bytes += len(line)
+        if not line.startswith(b"data:"):
+            return True
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            return False
+
+        chunk = json.loads(data)
+        if chunk.get("usage"):
+            result.usage = chunk["usage"]
+        for choice in chunk.get("choices") or ():
+            if (choice.get("delta") or {}).get("content"):
+                now = time.perf_counter()
+                if self._last_token_time is None:
+                    result.ttft = now - self._start
+                else:
+                    result.itls.append(now - self._last_token_time)
+                self._last_token_time = now
+                result.content_chunks += 1
+        return True
+
+    def finish(self):
+        self.result.e2e = time.perf_counter() - self._start
+        return self.result
+
+
+def parse_sse_stream(lines, start):
+    """Consume an iterator of SSE lines (bytes) from a chat completion stream.
+
+    ``start`` is the perf_counter() value taken just before the request was sent.
+    """
+    parser = SSEParser(start)
+    for line in lines:
+        if not parser.feed(line):
+            break
+    return parser.finish()
+
+
+def fire_stream_metrics(events, name, result):
+    """Report a request's TTFT (ITLs in its context) and TPOT as STREAM events"""
+    if result.ttft is None:
+        return
+    events.request.fire(
+        request_type=STREAM_REQUEST_TYPE,
+        name=f"{name}:ttft",
+        response_time=result.ttft * 1000,
+        response_length=0,
+        exception=None,
+        context=result.context(),
+    )
+    if result.tpot is not None:
+        events.request.fire(
+            request_type=STREAM_REQUEST_TYPE,
+            name=f"{name}:tpot",
+            response_time=result.tpot * 1000,
+            response_length=0,
+            exception=None,
+            context={},
+        )
+
+
+def post_streaming_completion(client, events, body, headers, name, timeout=300):
+    """POST a ``"stream": true`` body and record e2e, TTFT, ITL and TPOT.
+
+    Returns (response, StreamResult or None). The e2e sample reported under
+    ``name`` covers the full stream rather than just the response headers.
+    """
+    start = time.perf_counter()
+    with client.post(
+        "/v1/chat/completions",
+        data=body,
+        headers=headers,
+        name=name,
+        timeout=timeout,
+        stream=True,
+        catch_response=True,
+    ) as response:
+        if response.status_code != 200:
+            response.failure(f"HTTP {response.status_code}: {response.text[:200]}")
+            return response, None
+        try:
+            result = parse_sse_stream(response.iter_lines(), start)
+        except Exception as e:
+            response.failure(f"Stream parse error: {e}")
+            return response, None
+        response.request_meta["response_time"] = result.e2e * 1000
+        response.request_meta["response_length"] = result.bytes
+        response.success()
+
+    fire_stream_metrics(events, name, result)
+    return response, result
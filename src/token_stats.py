@@ -0,0 +1,204 @@
+"""
+Token throughput accounting from the server's ``usage`` fields.
+
+Every completed request contributes its prompt/completion token counts; at the
+end of a run the totals are turned into input/output tokens per second and
+per-request distributions, printed and written next to locust's CSV output as
+``<csv_prefix>_tokens.csv``.
+
+Under --master/--worker each worker ships the samples recorded since its last
+report with locust's regular stats report (and the remainder when it stops);
+the master merges them and writes the CSV. When a headless run quits, the
+master fires test_stop before the workers have even been told to stop, so
+their final samples arrive after the CSV was written; the master rewrites it
+as each of those arrives.
+"""
+import csv
+import threading
+import time
+
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+TOKEN_REPORT_KEY = "vlm_tokens"
+
+
+def extract_usage(response):
+    """Return the usage dict of a non-streaming chat completion response, or None"""
+    if response is None or response.status_code != 200:
+        return None
+    try:
+        return response.json().get("usage")
+    except ValueError:
+        return None
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class TokenStats:
+    """Thread-safe accumulator of per-request token usage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {field: [] for field in TOKEN_FIELDS}
+        self.missing_usage = 0
+        self.first_start = None
+        self.last_end = None
+        self._shipped = {field: 0 for field in TOKEN_FIELDS}
+        self._shipped_missing = 0
+        self._csv_path = None    # master: CSV written at test_stop, rewritten for late worker samples
+
+    def record(self, usage, start=None, end=None):
+        """Record one request's usage; start/end are wall-clock send and completion times"""
+        end = end if end is not None else time.time()
+        with self._lock:
+            if start is not None and (self.first_start is None or start < self.first_start):
+                self.first_start = start
+            if self.last_end is None or end > self.last_end:
+                self.last_end = end
+            if not usage:
+                self.missing_usage += 1
+                return
+            prompt = usage.get("prompt_tokens") or 0
+            completion = usage.get("completion_tokens") or 0
+            self.samples["prompt_tokens"].append(prompt)
+            self.samples["completion_tokens"].append(completion)
+            self.samples["total_tokens"].append(usage.get("total_tokens") or prompt + completion)
+
+    def export(self):
+        """Picklable snapshot of the raw samples, for merging across processes"""
+        with self._lock:
+            return {
+                "samples": {field: list(values) for field, values in self.samples.items()},
+                "missing_usage": self.missing_usage,
+                "first_start": self.first_start,
+                "last_end": self.last_end,
+            }
+
+    def take(self):
+        """Like export(), but only the samples added since the previous take()"""
+        with self._lock:
+            exported = {
+                "samples": {field: values[self._shipped[field]:] for field, values in self.samples.items()},
+                "missing_usage": self.missing_usage - self._shipped_missing,
+                "first_start": self.first_start,
+                "last_end": self.last_end,
+            }
+            self._shipped = {field: len(values) for field, values in self.samples.items()}
+            self._shipped_missing = self.missing_usage
+        return exported
+
+    def merge(self, exported):
+        """Fold in a snapshot produced by export() in another process"""
+        with self._lock:
+            for field, values in exported["samples"].items():
+                self.samples[field].extend(values)
+            self.missing_usage += exported["missing_usage"]
+            if exported["first_start"] is not None and (
+                    self.first_start is None or exported["first_start"] < self.first_start):
+                self.first_start = exported["first_start"]
+            if exported["last_end"] is not None and (
+                    self.last_end is None or exported["last_end"] > self.last_end):
+                self.last_end = exported["last_end"]
+
+    def summary(self):
+        with self._lock:
+            samples = {field: sorted(values) for field, values in self.samples.items()}
+            duration = (self.last_end - self.first_start) if self.first_start and self.last_end else 0.0
+            missing = self.missing_usage
+        rows = []
+        for field in TOKEN_FIELDS:
+            values = samples[field]
+            total = sum(values)
+            rows.append({
+                "Metric": field,
+                "Requests": len(values),
+                "Total": total,
+                "Tokens/s": total / duration if duration > 0 else 0.0,
+                "Mean": total / len(values) if values else 0.0,
+                "Min": values[0] if values else 0,
+                "50%": _percentile(values, 50),
+                "90%": _percentile(values, 90),
+                "99%": _percentile(values, 99),
+                "Max": values[-1] if values else 0,
+            })
+        return rows, duration, missing
+
+    def report(self):
+        rows, duration, missing = self.summary()
+        if not rows[0]["Requests"]:
+            print(f"[INFO] Token stats: no usage recorded ({missing} responses without usage)")
+            return
+        by_metric = {row["Metric"]: row for row in rows}
+        print(f"[INFO] Token throughput over {duration:.2f}s: "
+              f"input {by_metric['prompt_tokens']['Tokens/s']:.1f} tok/s, "
+              f"output {by_metric['completion_tokens']['Tokens/s']:.1f} tok/s, "
+              f"total {by_metric['total_tokens']['Tokens/s']:.1f} tok/s")
+        for row in rows:
+            print(f"[INFO]   {row['Metric']:<17} mean {row['Mean']:.1f}, p50 {row['50%']}, "
+                  f"p90 {row['90%']}, p99 {row['99%']}, max {row['Max']}")
+        if missing:
+            print(f"[WARNING] {missing} responses carried no usage field")
+
+    def write_csv(self, path):
+        rows, duration, missing = self.summary()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) + ["Duration", "Missing Usage"])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(dict(row, **{"Duration": f"{duration:.3f}", "Missing Usage": missing}))
+        print(f"[INFO] Token stats written to {path}")
+
+    def _merge_report(self, data, source=None):
+        if data and (data["samples"]["prompt_tokens"] or data["missing_usage"]):
+            self.merge(data)
+            if self._csv_path is not None:
+                print(f"[INFO] Token stats: merged final samples from {source} after the run stopped")
+                self.write_csv(self._csv_path)
+
+    def _on_message(self, environment, msg, **kwargs):
+        self._merge_report(msg.data, msg.node_id)
+
+    def _on_test_start(self, **kwargs):
+        self._csv_path = None
+
+    def attach(self, environment):
+        """Ship worker samples to the master, which merges them (call from events.init)"""
+        from locust.runners import MasterRunner, WorkerRunner
+
+        runner = environment.runner
+        events = environment.events
+        if isinstance(runner, WorkerRunner):
+            @events.report_to_master.add_listener
+            def _ship(client_id, data, **kwargs):
+                data[TOKEN_REPORT_KEY] = self.take()
+
+            # A stopping worker fires test_stop but sends no final stats report;
+            # this message reaches the master before the worker's client_stopped
+            @events.test_stop.add_listener
+            def _ship_rest(**kwargs):
+                runner.send_message(TOKEN_REPORT_KEY, self.take())
+        elif isinstance(runner, MasterRunner):
+            runner.register_message(TOKEN_REPORT_KEY, self._on_message)
+            events.test_start.add_listener(self._on_test_start)
+
+            @events.worker_report.add_listener
+            def _collect(client_id, data, **kwargs):
+                self._merge_report(data.get(TOKEN_REPORT_KEY), client_id)
+
+
+def write_token_stats(environment, token_stats):
+    """Print the token summary and write <csv_prefix>_tokens.csv when locust runs with --csv.
+
+    On the master token_stats holds the samples merged from every worker (see attach());
+    worker samples arriving after this call are merged into the same CSV.
+    """
+    token_stats.report()
+    options = getattr(environment, "parsed_options", None)
+    csv_prefix = getattr(options, "csv_prefix", None)
+    if csv_prefix:
+        token_stats.write_csv(f"{csv_prefix}_tokens.csv")
+        token_stats._csv_path = f"{csv_prefix}_tokens.csv"
@@ -0,0 +1,262 @@
+"""
+Per-request trace log written off the hot path.
+
+The locustfiles used to print a few lines per request; at high concurrency
+those synchronous writes serialize on stdout and the information is lost
+in the scrollback anyway. TraceLog.record() instead appends one small dict
+to an in-memory queue (its own cost is timed and reported). A background OS
+thread drains the queue in batches to JSONL (or Parquet when the path ends
+in ``.parquet`` and pyarrow is installed) and prints a one-line summary of
+the last interval instead of the per-request lines. The file is rewritten on
+every test start, so it only ever holds the current run.
+
+The queue is bounded: when the writer cannot keep up, records are dropped
+and counted rather than blocking the request path or growing without limit.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+try:
+    # Under locust, threading is gevent-patched; the writer needs a real OS
+    # thread so encoding and file I/O do not run on the event loop.
+    from gevent import monkey as _gevent_monkey
+    _Thread = _gevent_monkey.get_original("threading", "Thread")
+    _Lock = _gevent_monkey.get_original("threading", "Lock")
+    _Event = _gevent_monkey.get_original("threading", "Event")
+except ImportError:
+    _Thread, _Lock, _Event = threading.Thread, threading.Lock, threading.Event
+
+# Column order of every record; also the Parquet schema
+TRACE_FIELDS = (
+    ("request_id", "int64"), ("worker", "string"), ("user", "int64"),
+    ("payload", "int64"), ("payload_key", "string"), ("frames", "int64"), ("bytes_sent", "int64"),
+    ("intended", "float64"), ("start", "float64"), ("end", "float64"),
+    ("latency_ms", "float64"), ("ttft_ms", "float64"), ("status", "int64"), ("ok", "bool"),
+    ("error", "string"), ("prompt_tokens", "int64"), ("completion_tokens", "int64"),
+    ("cache", "string"), ("cell", "string"),
+)
+
+
+def worker_label():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class _JsonlSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, records):
+        self._file.write("".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n"
+                                 for r in records))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetSink:
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.path = path
+        self._pa = pa
+        self._schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in TRACE_FIELDS])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, records):
+        columns = {name: [r.get(name) for r in records] for name, _ in TRACE_FIELDS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def open_sink(path):
+    if path.endswith(".parquet"):
+        try:
+            return _ParquetSink(path)
+        except ImportError:
+            path = path[:-len(".parquet")] + ".jsonl"
+            print(f"[WARNING] pyarrow is not installed, writing the trace as JSONL to {path}")
+    return _JsonlSink(path)
+
+
+class TraceLog:
+    """Bounded queue of per-request records, flushed in batches by a background writer"""
+
+    def __init__(self, path=None, batch_size=512, flush_interval=1.0, summary_interval=30.0,
+                 max_pending=100000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.summary_interval = summary_interval
+        self.max_pending = max_pending
+        self.worker = worker_label()
+
+        self._pending = deque()
+        self._lock = _Lock()
+        self._wakeup = _Event()
+        self._sink = None
+        self._thread = None
+        self._closed = False
+
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.record_seconds = 0.0
+        self.record_max = 0.0
+        self.write_seconds = 0.0
+        self._interval = self._new_interval()
+
+    @staticmethod
+    def _new_interval():
+        return {"start": time.time(), "count": 0, "failed": 0, "latency_ms": 0.0,
+                "bytes": 0, "last_error": None}
+
+    def start(self):
+        """Open the sink (if any) and start the writer thread; safe to call more than once"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.path:
+                self._sink = open_sink(self.path)
+                self.path = self._sink.path
+                print(f"[INFO] Writing per-request trace to {self.path}")
+            self._closed = False
+            self._interval = self._new_interval()
+            self._thread = _Thread(target=self._writer_loop, name="trace-writer", daemon=True)
+            self._thread.start()
+
+    def record(self, **fields):
+        """Queue one request's record; never blocks on I/O"""
+        t0 = time.perf_counter()
+        fields["worker"] = self.worker
+        with self._lock:
+            interval = self._interval
+            interval["count"] += 1
+            interval["latency_ms"] += fields.get("latency_ms") or 0.0
+            interval["bytes"] += fields.get("bytes_sent") or 0
+            if not fields.get("ok"):
+                interval["failed"] += 1
+                if fields.get("error"):
+                    interval["last_error"] = fields["error"]
+            self.recorded += 1
+            if self._sink is not None:
+                if len(self._pending) < self.max_pending:
+                    self._pending.append(fields)
+                else:
+                    self.dropped += 1
+            wake = len(self._pending) >= self.batch_size
+        if wake:
+            self._wakeup.set()
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self.record_seconds += elapsed
+            if elapsed > self.record_max:
+                self.record_max = elapsed
+
+    def _flush(self):
+        with self._lock:
+            batch = list(self._pending)
+            self._pending.clear()
+        if not batch or self._sink is None:
+            return
+        t0 = time.perf_counter()
+        try:
+            self._sink.write(batch)
+        except Exception as e:
+            print(f"[ERROR] Failed to write {len(batch)} trace records: {e}")
+            return
+        with self._lock:
+            self.written += len(batch)
+            self.write_seconds += time.perf_counter() - t0
+
+    def _writer_loop(self):
+        next_summary = time.time() + self.summary_interval
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._flush()
+            if self.summary_interval and time.time() >= next_summary:
+                self.print_interval()
+                next_summary += self.summary_interval
+
+    def print_interval(self):
+        """One-line summary of the requests completed since the last summary"""
+        now = time.time()
+        with self._lock:
+            interval, self._interval = self._interval, self._new_interval()
+            dropped = self.dropped
+        count = interval["count"]
+        if not count:
+            return
+        seconds = max(now - interval["start"], 1e-9)
+        line = (f"[TRACE] last {seconds:.0f}s: {count} requests ({interval['failed']} failed), "
+                f"{count / seconds:.2f} req/s, mean {interval['latency_ms'] / count / 1000:.2f}s, "
+                f"{interval['bytes'] / seconds / (1024 * 1024):.1f}MB/s sent")
+        if dropped:
+            line += f", {dropped} trace records dropped"
+        if interval["last_error"]:
+            line += f"; last error: {interval['last_error'][:200]}"
+        print(line)
+
+    def close(self):
+        """Flush everything queued, print the final summary and stop the writer"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._closed = True
+        self._wakeup.set()
+        thread.join()
+        self._flush()
+        self.print_interval()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def report(self):
+        with self._lock:
+            recorded, written, dropped = self.recorded, self.written, self.dropped
+            avg_us = self.record_seconds / recorded * 1e6 if recorded else 0.0
+            max_us = self.record_max * 1e6
+            write_ms = self.write_seconds * 1000
+        print(f"[INFO] Trace log: {recorded} requests recorded, avg {avg_us:.1f}us "
+              f"(max {max_us:.1f}us) on the request path; {written} written"
+              + (f" to {self.path} in {write_ms:.0f}ms" if self.path else "")
+              + (f", {dropped} dropped (writer fell behind)" if dropped else ""))
+
+    def attach(self, environment, trace_path=None):
+        """Resolve the trace path and start/stop the writer with the test (call from events.init).
+
+        ``trace_path`` "" means ``<csv prefix>_trace.jsonl`` when --csv is given,
+        "-" disables the file (summaries are still printed). Workers write their
+        own file, suffixed with host and pid.
+        """
+        from locust.runners import MasterRunner, WorkerRunner
+
+        if isinstance(environment.runner, MasterRunner):
+            return
+        if trace_path == "-":
+            trace_path = None
+        elif not trace_path:
+            prefix = getattr(getattr(environment, "parsed_options", None), "csv_prefix", None)
+            trace_path = f"{prefix}_trace.jsonl" if prefix else None
+        if trace_path and isinstance(environment.runner, WorkerRunner):
+            root, ext = os.path.splitext(trace_path)
+            trace_path = f"{root}_{self.worker.replace(':', '_')}{ext}"
+        self.path = trace_path
+
+        @environment.events.test_start.add_listener
+        def _start(**kwargs):
+            self.start()
+
+        @environment.events.test_stop.add_listener
+        def _stop(**kwargs):
+            self.close()
+            self.report()
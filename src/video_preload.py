@@ -0,0 +1,237 @@
+"""
+Video decode / resize / encode pipeline used by the video locustfile's preload.
+
+The per-video work is a top-level function so it can run in a process pool.
+This module deliberately does not import locust, so pool workers stay free of
+gevent monkey-patching and only pay for the vision dependencies.
+
+Decoding goes through frame_sampler.SparseFrameReader, which decodes only
+the frames that are kept, and falls back to decoding the whole clip when it
+cannot trust a video's frame count. VLM_SPARSE_DECODE=0 always decodes the
+whole clip as qwen_vl_utils does; scripts/benchmark_frame_sampling.py checks
+that both paths give the same frames on a dataset.
+"""
+import base64
+import multiprocessing
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from qwen_vl_utils import process_vision_info
+
+try:
+    # Internals of qwen_vl_utils.fetch_video, used to time decode and resize separately
+    from qwen_vl_utils.vision_process import (
+        FRAME_FACTOR, IMAGE_FACTOR, VIDEO_MAX_PIXELS, VIDEO_MIN_PIXELS, VIDEO_TOTAL_PIXELS,
+        VIDEO_READER_BACKENDS, get_video_reader_backend, smart_resize,
+    )
+    import torch
+    from torchvision import transforms
+    from torchvision.transforms import InterpolationMode
+    _SPLIT_STAGES = True
+except ImportError:
+    _SPLIT_STAGES = False
+
+from frame_sampler import SparseDecodeUnsupported, SparseFrameReader
+from payload_cache import read_frames, write_frames
+
+SPARSE_DECODE = os.environ.get("VLM_SPARSE_DECODE", "1") == "1"
+_sparse_reader = None
+
+STAGES = ("cache", "decode", "resize", "encode")
+
+
+def frame_cache_params(min_pixels, max_pixels, fps, max_frames):
+    """FrameCache key parameters for frames produced by decode_video_frames"""
+    return {
+        "min_pixels": min_pixels,
+        "max_pixels": max_pixels,
+        "fps": fps,
+        "max_frames": max_frames,
+        "format": "jpeg",
+    }
+
+
+def _read_video(video_part):
+    """Decode and temporally sample a video the same way qwen_vl_utils.fetch_video does"""
+    try:
+        result = VIDEO_READER_BACKENDS[get_video_reader_backend()](video_part)
+    except Exception:
+        result = VIDEO_READER_BACKENDS["torchvision"](video_part)
+    return result[0] if isinstance(result, tuple) else result
+
+
+def _resize_video(video, video_part, nframes=None):
+    """Apply fetch_video's smart-resize to a (T, C, H, W) uint8 tensor.
+
+    ``nframes`` is the number of frames fetch_video sampled, before any
+    truncation; the per-frame pixel budget depends on it.
+    """
+    _, _, height, width = video.shape
+    nframes = nframes or video.shape[0]
+    min_px = video_part.get("min_pixels", VIDEO_MIN_PIXELS)
+    total_pixels = video_part.get("total_pixels", VIDEO_TOTAL_PIXELS)
+    max_px = max(min(VIDEO_MAX_PIXELS, total_pixels / nframes * FRAME_FACTOR), int(min_px * 1.05))
+    max_px = min(video_part.get("max_pixels", max_px), max_px)
+    resized_height, resized_width = smart_resize(
+        height, width, factor=IMAGE_FACTOR, min_pixels=min_px, max_pixels=max_px)
+    return transforms.functional.resize(
+        video, [resized_height, resized_width],
+        interpolation=InterpolationMode.BICUBIC, antialias=True).float()
+
+
+def _read_sparse(video_part, max_frames):
+    """(T, C, H, W) uint8 tensor of the kept frames and the sampled frame count, or None to fall back"""
+    global _sparse_reader
+    if _sparse_reader is None:
+        _sparse_reader = SparseFrameReader()
+    try:
+        frames, _, nframes = _sparse_reader.read(video_part, max_frames)
+    except (ImportError, SparseDecodeUnsupported):
+        return None
+    except Exception as e:
+        print(f"[WARNING] Sparse decode failed for {video_part.get('video')}, decoding the whole clip: {e}")
+        return None
+    return torch.from_numpy(frames).permute(0, 3, 1, 2), nframes
+
+
+def decode_video(video_part, max_frames, timings=None, sparse=None):
+    """Decode, sample and resize one video content part to a float (T, C, H, W) tensor.
+
+    Returns the first ``max_frames`` frames process_vision_info would produce
+    (see frame_sampler for when the sparse path can differ).
+    If ``timings`` is a dict, seconds are added to its "decode" and "resize" keys.
+    """
+    if timings is None:
+        timings = {}
+    if sparse is None:
+        sparse = SPARSE_DECODE
+
+    t0 = time.perf_counter()
+    if _SPLIT_STAGES:
+        decoded = _read_sparse(video_part, max_frames) if sparse else None
+        if decoded is None:
+            video = _read_video(video_part)
+            decoded = video[:max_frames], len(video)
+        t1 = time.perf_counter()
+        # Resizing is per frame, so slicing first gives identical frames for less work
+        video = _resize_video(decoded[0], video_part, decoded[1])
+    else:
+        _, video_inputs, _ = process_vision_info([{'content': [video_part]}], return_video_kwargs=True)
+        assert video_inputs is not None, "video_inputs should not be None"
+        video = video_inputs.pop()[:max_frames]
+        t1 = time.perf_counter()
+    t2 = time.perf_counter()
+    timings["decode"] = timings.get("decode", 0.0) + (t1 - t0)
+    timings["resize"] = timings.get("resize", 0.0) + (t2 - t1)
+    return video
+
+
+def decode_video_frames(video_part, max_frames, timings=None, sparse=None):
+    """Decode, sample, resize and JPEG-encode one video content part.
+
+    Returns the selected frames as JPEG bytes. If ``timings`` is a dict, the
+    seconds spent per stage are added to its "decode", "resize" and "encode" keys.
+    """
+    if timings is None:
+        timings = {}
+
+    video = decode_video(video_part, max_frames, timings, sparse)
+    t1 = time.perf_counter()
+    selected_frames = video.permute(0, 2, 3, 1).numpy().astype(np.uint8)
+    t2 = time.perf_counter()
+
+    frames = []
+    for frame in selected_frames:
+        img = Image.fromarray(frame)
+        output_buffer = BytesIO()
+        img.save(output_buffer, format="jpeg")
+        frames.append(output_buffer.getvalue())
+    t3 = time.perf_counter()
+
+    timings["resize"] = timings.get("resize", 0.0) + (t2 - t1)
+    timings["encode"] = timings.get("encode", 0.0) + (t3 - t2)
+    return frames
+
+
+def load_video_task(task):
+    """Pool worker: return (video_file, base64 frames, cached, timings, error) for one video.
+
+    ``task`` is (video_file, video_part, max_frames, cache_path). When cache_path
+    exists the frames are read from it; otherwise the video is decoded and the
+    result written there for the next run.
+    """
+    video_file, video_part, max_frames, cache_path = task
+    timings = {}
+    cached = False
+    try:
+        frames = None
+        if cache_path and os.path.exists(cache_path):
+            t0 = time.perf_counter()
+            try:
+                frames = read_frames(cache_path)
+                cached = True
+            except (OSError, ValueError):
+                frames = None
+            timings["cache"] = time.perf_counter() - t0
+
+        if frames is None:
+            frames = decode_video_frames(video_part, max_frames, timings)
+            if cache_path and frames:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                write_frames(cache_path, frames)
+
+        t0 = time.perf_counter()
+        frames_b64 = [base64.b64encode(f).decode("utf-8") for f in frames]
+        timings["encode"] = timings.get("encode", 0.0) + (time.perf_counter() - t0)
+        timings["frames"] = len(frames)
+        timings["bytes"] = sum(len(f) for f in frames)
+        return video_file, frames_b64, cached, timings, None
+    except Exception as e:
+        return video_file, [], cached, timings, str(e)
+
+
+class StageStats:
+    """Per-stage time and frame counts aggregated over all preloaded videos"""
+
+    def __init__(self):
+        self.seconds = {stage: 0.0 for stage in STAGES}
+        self.frames = {stage: 0 for stage in STAGES}
+        self.videos = 0
+        self.bytes = 0
+
+    def add(self, timings):
+        frames = timings.get("frames", 0)
+        self.videos += 1
+        self.bytes += timings.get("bytes", 0)
+        for stage in STAGES:
+            if stage in timings:
+                self.seconds[stage] += timings[stage]
+                self.frames[stage] += frames
+
+    def report(self, wall_time, workers):
+        print(f"[INFO] Preload throughput with {workers} worker(s): "
+              f"{self.videos / wall_time if wall_time > 0 else 0:.2f} videos/s, "
+              f"{self.bytes / wall_time / (1024 * 1024) if wall_time > 0 else 0:.1f}MB/s of JPEG")
+        for stage in STAGES:
+            seconds, frames = self.seconds[stage], self.frames[stage]
+            if frames == 0:
+                continue
+            print(f"[INFO]   {stage:<7} {frames} frames in {seconds:.2f} worker-s "
+                  f"({frames / seconds if seconds > 0 else 0:.1f} frames/s per worker)")
+
+
+def iter_video_frames(tasks, workers):
+    """Yield load_video_task results in input order, using a process pool when workers > 1"""
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield load_video_task(task)
+        return
+
+    # spawn keeps children from inheriting the locust process's gevent state
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(processes=workers) as pool:
+        for result in pool.imap(load_video_task, tasks, chunksize=1):
+            yield result
@@ -0,0 +1,68 @@
+"""
+Wire-ready payload artifacts: each frame or image stored as its final JSON fragment.
+
+Preloading the frames and image sets spends its time reading JPEGs and
+base64-encoding them (the image set also decodes, resizes and re-encodes
+every image) to produce the same ``{"type":"image_url",...}`` fragments on
+every run and every worker. scripts/build_wire_payloads.py does that once
+and stores the fragments in frame_shards files under
+``<dataset>/wire/<kind>-<params hash>/`` (skipped by the dataset walkers,
+like ``shards/``). A worker then maps the shards and
+composes each request body from a prompt prefix, the mapped fragments and a
+suffix (fragment_store.FragmentBody); nothing is decoded or encoded, and the
+page cache is shared by every worker on the host.
+
+The directory name hashes the build parameters (image size, ...), so an
+artifact is only used for the settings it was built with. VLM_WIRE_PAYLOADS=0
+ignores artifacts. The artifact is a snapshot: rebuild it when the dataset
+changes.
+"""
+import hashlib
+import json
+import os
+
+from fragment_store import FragmentBody, body_suffix, prompt_prefix
+from frame_shards import WIRE_DIR, load_shards
+
+
+def wire_params(kind, image_size=None, quality=95, max_pixels=0):
+    """Build parameters that change the fragment bytes of a payload set.
+
+    ``max_pixels`` is a frames-set pixel budget of the input grid (0 = frames as stored).
+    """
+    if kind == "images":
+        return {"size": list(image_size), "quality": quality}
+    if max_pixels:
+        return {"format": "jpeg", "max_pixels": max_pixels, "quality": quality}
+    return {"format": "jpeg"}
+
+
+def wire_dir(base_path, kind, params):
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(base_path, WIRE_DIR, f"{kind}-{digest}")
+
+
+def load_wire(base_path, kind, params, environ=None):
+    """ShardSet of the artifact built for these parameters, or None"""
+    if (environ if environ is not None else os.environ).get("VLM_WIRE_PAYLOADS", "1") == "0":
+        return None
+    path = wire_dir(base_path, kind, params)
+    if not os.path.isdir(path):
+        return None
+    return load_shards(path)
+
+
+def wire_bodies(shards, keys, prompt_text, max_tokens, stream=False):
+    """One FragmentBody per key, byte-identical to the payload_sets body for the same data"""
+    prefix = prompt_prefix(prompt_text)
+    suffix = body_suffix(max_tokens, stream)
+    bodies = []
+    for key in keys:
+        frames = shards.frames(key)
+        fragments = [prefix]
+        for frame in frames:
+            fragments.append(b",")
+            fragments.append(frame)
+        fragments.append(suffix)
+        bodies.append(FragmentBody(fragments, len(frames)))
+    return bodies
@@ -0,0 +1,107 @@
+import os
+import sys
+
+# The locustfiles and scripts import their helpers as top-level modules
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for subdir in ("src", "scripts", ""):
+    path = os.path.join(ROOT, subdir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+import pytest  # noqa: E402
+
+
+def write_frames_dataset(base_path, videos):
+    """Create category/video/frame_XXXX.jpg files; ``videos`` maps "category/video" to frame bytes"""
+    for video_dir, frames in videos.items():
+        path = os.path.join(base_path, video_dir)
+        os.makedirs(path, exist_ok=True)
+        for i, data in enumerate(frames):
+            with open(os.path.join(path, f"frame_{i:04d}.jpg"), "wb") as f:
+                f.write(data)
+    return str(base_path)
+
+
+@pytest.fixture
+def frames_dataset(tmp_path):
+    """A small frames dataset; the frame bytes only need to be distinct, not real JPEGs"""
+    videos = {
+        "cat_a/video_1": [b"\xff\xd8a1-%d" % i * 7 for i in range(5)],
+        "cat_a/video_2": [b"\xff\xd8a2-%d" % i * 3 for i in range(3)],
+        "cat_b/video_3": [b"\xff\xd8b3-%d" % i * 11 for i in range(8)],
+    }
+    return write_frames_dataset(tmp_path / "frames", videos), videos
+
+
+class FakeMaster:
+    """Stands in for locust's MasterRunner: custom messages are delivered by FakeCluster"""
+
+    def __init__(self):
+        self.custom_messages = {}
+        self.greenlet = None
+
+
+class FakeWorker:
+    """Stands in for locust's WorkerRunner; send_message() reaches the master synchronously"""
+
+    def __init__(self, cluster, node_id):
+        self.cluster = cluster
+        self.client_id = node_id
+        self.custom_messages = {}
+        self.greenlet = None
+
+    def send_message(self, msg_type, data=None, client_id=None):
+        self.cluster.deliver(self.client_id, msg_type, data)
+
+
+class FakeCluster:
+    """A master and workers wired through locust Events, in the order the test drives them.
+
+    Locust's runner classes are subclassed without their __init__, so the
+    code under test sees the isinstance() checks it expects.
+    """
+
+    def __init__(self, workers=1, csv_prefix=None):
+        from types import SimpleNamespace
+
+        from locust.event import Events
+        from locust.runners import MasterRunner, WorkerRunner
+
+        master_cls = type("Master", (FakeMaster, MasterRunner), {})
+        worker_cls = type("Worker", (FakeWorker, WorkerRunner), {})
+        options = SimpleNamespace(csv_prefix=csv_prefix)
+        self.master = SimpleNamespace(events=Events(), runner=master_cls(), parsed_options=options)
+        self.workers = []
+        for i in range(workers):
+            runner = worker_cls(self, f"worker-{i}")
+            self.workers.append(SimpleNamespace(events=Events(), runner=runner,
+                                                parsed_options=SimpleNamespace(csv_prefix=None)))
+
+    def deliver(self, node_id, msg_type, data):
+        from types import SimpleNamespace
+
+        listener, _ = self.master.runner.custom_messages[msg_type]
+        listener(environment=self.master, msg=SimpleNamespace(type=msg_type, data=data, node_id=node_id))
+
+    def send_stats(self, worker):
+        """A worker's periodic (or final) stats report"""
+        data = {}
+        worker.events.report_to_master.fire(client_id=worker.runner.client_id, data=data)
+        self.master.events.worker_report.fire(client_id=worker.runner.client_id, data=data)
+
+    def test_start(self):
+        for env in [self.master] + self.workers:
+            env.events.test_start.fire(environment=env)
+
+    def quit_headless(self):
+        """MasterRunner.quit(): master test_stop first, then each worker stops and sends a last report"""
+        self.master.events.test_stop.fire(environment=self.master)
+        for worker in self.workers:
+            worker.events.test_stop.fire(environment=worker)
+            self.send_stats(worker)
+
+
+@pytest.fixture
+def cluster_factory():
+    return FakeCluster
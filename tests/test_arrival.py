@@ -0,0 +1,76 @@
+import pytest
+
+import arrival
+from arrival import ArrivalSchedule
+
+
+class _Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock(1000.0)
+    monkeypatch.setattr(arrival.time, "time", c)
+    return c
+
+
+def test_constant_spacing(clock):
+    schedule = ArrivalSchedule(4.0, "constant")
+    times = [schedule.claim()[1] for _ in range(5)]
+    assert times[0] == 1000.0
+    assert [b - a for a, b in zip(times, times[1:])] == pytest.approx([0.25] * 4)
+
+
+def test_poisson_mean_spacing():
+    schedule = ArrivalSchedule(10.0, "poisson", seed=1)
+    gaps = [schedule._gap() for _ in range(20000)]
+    assert sum(gaps) / len(gaps) == pytest.approx(0.1, rel=0.03)
+    assert min(gaps) >= 0
+
+
+def test_backlog_counts_due_unclaimed_slots(clock):
+    schedule = ArrivalSchedule(10.0, "constant")
+    schedule.claim()
+    clock.now += 1.05
+    assert schedule.backlog() == 10
+    slot, intended = schedule.claim()
+    assert slot == 1
+    assert intended == pytest.approx(1000.1)
+    assert schedule.max_backlog == 9
+
+
+def test_backlog_skips_future_slots(clock):
+    schedule = ArrivalSchedule(10.0, "constant")
+    schedule.claim()
+    clock.now += 10.05
+    assert schedule.backlog() == 100
+    assert schedule.backlog(clock.now - 5.0) == 50
+    for _ in range(100):
+        schedule.claim()
+    # Users ahead of the schedule take future slots; none of them is due yet
+    assert schedule.claim()[1] == pytest.approx(1010.1)
+    assert schedule.backlog() == 0
+
+
+def test_set_workers_splits_the_aggregate_rate(clock):
+    schedule = ArrivalSchedule(12.0, "constant")
+    schedule.set_workers(4)
+    assert schedule.rate == 3.0
+    times = [schedule.claim()[1] for _ in range(3)]
+    assert times[2] - times[0] == pytest.approx(2 / 3.0)
+    schedule.set_workers(0)
+    assert schedule.rate == 12.0
+
+
+def test_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        ArrivalSchedule(0)
+    with pytest.raises(ValueError):
+        ArrivalSchedule(1.0, "uniform")
+    assert arrival.schedule_from_env({}) is None
+    assert arrival.schedule_from_env({"VLM_ARRIVAL_RATE": "2", "VLM_ARRIVAL_DIST": "constant"}).rate == 2.0
@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+import pytest
+
+from calculate_tokens import (IMAGE_MAX_PIXELS, IMAGE_MIN_PIXELS, VIDEO_MAX_PIXELS, VIDEO_MIN_PIXELS,
+                              VIDEO_TOTAL_PIXELS, image_tokens, smart_nframes, smart_resize, video_tokens)
+
+
+def _reference_resize(height, width, factor=28, min_pixels=IMAGE_MIN_PIXELS, max_pixels=IMAGE_MAX_PIXELS):
+    """transformers' Qwen2-VL smart_resize, scalar"""
+    h_bar = max(factor, round(height / factor) * factor)
+    w_bar = max(factor, round(width / factor) * factor)
+    if h_bar * w_bar > max_pixels:
+        beta = math.sqrt((height * width) / max_pixels)
+        h_bar = max(factor, math.floor(height / beta / factor) * factor)
+        w_bar = max(factor, math.floor(width / beta / factor) * factor)
+    elif h_bar * w_bar < min_pixels:
+        beta = math.sqrt(min_pixels / (height * width))
+        h_bar = math.ceil(height * beta / factor) * factor
+        w_bar = math.ceil(width * beta / factor) * factor
+    return h_bar, w_bar
+
+
+@pytest.mark.parametrize("height, width, tokens", [
+    (1024, 1024, 1369),     # 1036x1036
+    (512, 512, 324),        # 504x504
+    (1080, 1920, 2691),     # 1092x1932
+    (28, 28, 4),            # raised to min_pixels (56x56)
+    (4000, 6000, 16224),    # capped at max_pixels: 2912x4368
+])
+def test_image_tokens_known_values(height, width, tokens):
+    assert int(image_tokens(height, width)) == tokens
+
+
+def test_smart_resize_matches_reference():
+    rng = np.random.default_rng(0)
+    heights = rng.integers(20, 5000, 500)
+    widths = np.clip((heights * rng.uniform(0.3, 3.0, 500)).astype(np.int64), 20, None)
+    for max_pixels in (IMAGE_MAX_PIXELS, 401408, 200704):
+        h_bar, w_bar = smart_resize(heights, widths, max_pixels=max_pixels)
+        expected = [_reference_resize(int(h), int(w), max_pixels=max_pixels) for h, w in zip(heights, widths)]
+        assert list(zip(h_bar.tolist(), w_bar.tolist())) == expected
+
+
+@pytest.mark.parametrize("total, sampled", [(1, 2), (3, 2), (4, 4), (5, 4), (7, 6), (16, 16), (2000, 768)])
+def test_smart_nframes_even_counts(total, sampled):
+    assert int(smart_nframes(total)) == sampled
+
+
+def test_smart_nframes_resamples_other_fps():
+    # 60 frames extracted at 2fps is 30s of video; qwen samples 1 frame per second
+    assert int(smart_nframes(60, video_fps=2.0, fps=1.0)) == 30
+    assert int(smart_nframes(6, video_fps=2.0, fps=1.0)) == 4   # min_frames
+
+
+def test_video_tokens_follow_fetch_video_pixel_budget():
+    # 16 frames: total_pixels / 16 * 2 is above VIDEO_MAX_PIXELS, so frames keep 504x504
+    assert int(video_tokens(512, 512, 16)) == 8 * 324
+    # 768 frames: budget VIDEO_TOTAL_PIXELS / 768 * 2 = 50176 falls below int(min_pixels * 1.05)
+    floor = int(VIDEO_MIN_PIXELS * 1.05)
+    h_bar, w_bar = _reference_resize(512, 512, min_pixels=VIDEO_MIN_PIXELS, max_pixels=floor)
+    assert int(video_tokens(512, 512, 768)) == 384 * (h_bar // 28) * (w_bar // 28)
+    # The request's max_pixels caps the per-frame budget
+    h_bar, w_bar = _reference_resize(512, 512, min_pixels=VIDEO_MIN_PIXELS, max_pixels=VIDEO_MIN_PIXELS * 2)
+    assert int(video_tokens(512, 512, 16, max_pixels=VIDEO_MIN_PIXELS * 2)) == 8 * (h_bar // 28) * (w_bar // 28)
+
+
+def test_matches_qwen_vl_utils_when_installed():
+    vision_process = pytest.importorskip("qwen_vl_utils.vision_process")
+    for height, width in [(1080, 1920), (480, 640), (512, 512), (37, 900)]:
+        assert tuple(int(v) for v in smart_resize(height, width)) == vision_process.smart_resize(height, width)
+    for total in (3, 5, 17, 120, 5000):
+        ele = {"fps": 2.0}
+        assert int(smart_nframes(total, 2.0, 2.0)) == vision_process.smart_nframes(ele, total, 2.0)
+    for nframes in (4, 64, 768):
+        max_pixels = max(min(VIDEO_MAX_PIXELS, VIDEO_TOTAL_PIXELS / nframes * 2), int(VIDEO_MIN_PIXELS * 1.05))
+        h_bar, w_bar = vision_process.smart_resize(720, 1280, min_pixels=VIDEO_MIN_PIXELS, max_pixels=max_pixels)
+        assert int(video_tokens(720, 1280, nframes)) == nframes // 2 * (h_bar // 28) * (w_bar // 28)
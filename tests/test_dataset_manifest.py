@@ -0,0 +1,142 @@
+import hashlib
+import io
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import dataset_manifest
+from build_manifest import build_manifest, verify_manifest, write_manifest
+from conftest import write_frames_dataset
+from dataset_manifest import MANIFEST_NAME, load_manifest
+from payload_sets import discover_frame_dirs, discover_image_files, list_frame_files
+
+
+def _jpeg(width, height, shade):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (shade, shade, 0)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def _no_manifest_override(monkeypatch):
+    monkeypatch.delenv("VLM_MANIFEST", raising=False)
+    monkeypatch.setattr(dataset_manifest, "_cache", {})
+
+
+@pytest.fixture
+def jpeg_frames(tmp_path):
+    videos = {
+        "cat_a/video_1": [_jpeg(112, 84, i * 30) for i in range(3)],
+        "cat_a/video_2": [_jpeg(56, 56, i * 30) for i in range(2)],
+        "cat_b/video_3": [_jpeg(84, 112, i * 30) for i in range(4)],
+    }
+    return write_frames_dataset(tmp_path / "frames", videos), videos
+
+
+def _write(base, manifest):
+    path = os.path.join(base, MANIFEST_NAME)
+    write_manifest(manifest, path)
+    dataset_manifest._cache.clear()
+    return path
+
+
+def test_build_and_load_round_trip(jpeg_frames):
+    base, videos = jpeg_frames
+    _write(base, build_manifest(base, "frames", workers=1))
+
+    manifest = load_manifest(base, "frames")
+    assert manifest.kind == "frames"
+    assert manifest.keys == sorted(videos)
+    for key, frames in videos.items():
+        entry = manifest.entry(key)
+        assert entry["files"] == [os.path.join(key, f"frame_{i:04d}.jpg") for i in range(len(frames))]
+        assert entry["bytes"] == [len(f) for f in frames]
+        assert entry["sha1"] == hashlib.sha1(b"".join(frames)).hexdigest()
+        assert entry["image_tokens"] > 0
+        assert manifest.files(key) == [os.path.join(os.path.abspath(base), f) for f in entry["files"]]
+    assert manifest.entry("cat_a/video_1")["sizes"] == [[112, 84]] * 3
+    assert load_manifest(base, "frames") is manifest
+    assert verify_manifest(os.path.join(base, MANIFEST_NAME), base, workers=1) == 0
+
+
+def test_discovery_follows_manifest_order(jpeg_frames):
+    base, _ = jpeg_frames
+    manifest = build_manifest(base, "frames", workers=1)
+    manifest["entries"].reverse()
+    manifest["entries"][0]["files"] = manifest["entries"][0]["files"][:1]
+    _write(base, manifest)
+
+    assert discover_frame_dirs(base) == ["cat_b/video_3", "cat_a/video_2", "cat_a/video_1"]
+    assert list_frame_files(base, "cat_b/video_3") == [os.path.join(os.path.abspath(base), "cat_b/video_3",
+                                                                     "frame_0000.jpg")]
+
+
+def test_image_discovery_follows_manifest_order(tmp_path):
+    base = tmp_path / "images"
+    for name, size in (("a.jpg", (56, 56)), ("sub/b.png", (84, 56)), ("c.jpeg", (28, 28))):
+        (base / name).parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", size).save(base / name)
+    manifest = build_manifest(str(base), "images", workers=1)
+    assert [e["key"] for e in manifest["entries"]] == ["a.jpg", "c.jpeg", "sub/b.png"]
+    manifest["entries"].reverse()
+    _write(str(base), manifest)
+
+    assert discover_image_files(str(base)) == [str(base / n) for n in ("sub/b.png", "c.jpeg", "a.jpg")]
+    assert discover_image_files(str(base), limit=1) == [str(base / "sub/b.png")]
+
+
+def test_manifest_disabled_or_of_another_kind(jpeg_frames, tmp_path, monkeypatch):
+    base, videos = jpeg_frames
+    manifest = build_manifest(base, "frames", workers=1)
+    manifest["entries"] = manifest["entries"][:1]
+    _write(base, manifest)
+    assert discover_frame_dirs(base) == ["cat_a/video_1"]
+
+    # A frames manifest is not an image list
+    assert load_manifest(base, "images") is None
+    assert len(discover_image_files(base)) == sum(len(f) for f in videos.values())
+
+    monkeypatch.setenv("VLM_MANIFEST", "0")
+    assert load_manifest(base) is None
+    assert sorted(discover_frame_dirs(base)) == sorted(videos)
+
+    # An explicit path replaces <base>/manifest.json
+    elsewhere = str(tmp_path / "other.json")
+    manifest["entries"] = build_manifest(base, "frames", workers=1)["entries"][1:]
+    write_manifest(manifest, elsewhere)
+    monkeypatch.setenv("VLM_MANIFEST", elsewhere)
+    assert discover_frame_dirs(base) == ["cat_a/video_2", "cat_b/video_3"]
+
+
+def test_unsupported_manifest_is_ignored(jpeg_frames, capsys):
+    base, videos = jpeg_frames
+    with open(os.path.join(base, MANIFEST_NAME), "w") as f:
+        json.dump({"version": 99, "kind": "frames", "entries": []}, f)
+    assert load_manifest(base, "frames") is None
+    assert "Ignoring manifest" in capsys.readouterr().out
+    assert sorted(discover_frame_dirs(base)) == sorted(videos)
+
+
+def test_verify_reports_changed_missing_and_new_entries(jpeg_frames, capsys):
+    base, _ = jpeg_frames
+    path = _write(base, build_manifest(base, "frames", workers=1))
+
+    changed = os.path.join(base, "cat_a/video_1/frame_0001.jpg")
+    with open(changed, "r+b") as f:       # same size, different content
+        f.seek(-3, os.SEEK_END)
+        f.write(b"\x00\x00\x00")
+    os.remove(os.path.join(base, "cat_b/video_3/frame_0003.jpg"))
+    write_frames_dataset(base, {"cat_c/video_9": [_jpeg(56, 56, 9)]})
+
+    problems = verify_manifest(path, base, workers=1)
+    out = capsys.readouterr().out
+    assert "内容不一致: cat_a/video_1" in out
+    assert "缺失: cat_b/video_3/frame_0003.jpg" in out
+    assert "帧文件列表不一致: cat_b/video_3" in out
+    assert "不在清单中: cat_c/video_9" in out
+    # changed sha1, missing file, its video's sha1 and frame list, the new video
+    assert problems == 5
+
+    assert verify_manifest(path, base, workers=1, checksum=False) == 3
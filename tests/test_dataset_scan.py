@@ -0,0 +1,88 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from conftest import write_frames_dataset
+from dataset_scan import image_size_from_bytes, list_video_dirs, print_histogram, read_image_size, scan_frames
+
+
+def _encode(width, height, fmt="JPEG", **options):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (10, 200, 30)).save(buffer, format=fmt, **options)
+    return buffer.getvalue()
+
+
+def _exif():
+    exif = Image.Exif()
+    exif[0x010F] = "camera maker"      # Make
+    exif[0x0112] = 6                   # Orientation: stored size is still reported, as PIL does
+    return exif
+
+
+@pytest.mark.parametrize("width, height, fmt, options", [
+    (123, 45, "JPEG", {}),
+    (640, 360, "JPEG", {"progressive": True}),
+    (37, 900, "JPEG", {"exif": _exif()}),
+    (200, 100, "JPEG", {"exif": _exif(), "progressive": True, "quality": 50}),
+    (321, 123, "PNG", {}),
+])
+def test_header_sizes_match_pil(tmp_path, width, height, fmt, options):
+    data = _encode(width, height, fmt, **options)
+    path = tmp_path / f"image.{fmt.lower()}"
+    path.write_bytes(data)
+    with Image.open(path) as img:
+        expected = img.size
+    assert expected == (width, height)
+    assert read_image_size(str(path)) == expected
+    assert image_size_from_bytes(data) == expected
+    assert image_size_from_bytes(memoryview(data)) == expected
+
+
+def test_unreadable_images(tmp_path):
+    assert read_image_size(str(tmp_path / "missing.jpg")) is None
+    garbage = tmp_path / "garbage.jpg"
+    garbage.write_bytes(b"\xff\xd8\xff\xd9not an image")
+    assert read_image_size(str(garbage)) is None
+    assert image_size_from_bytes(b"plain text") is None
+    # Not JPEG/PNG: PIL decides
+    gif = tmp_path / "image.gif"
+    Image.new("RGB", (17, 19)).save(gif)
+    assert read_image_size(str(gif)) == (17, 19)
+
+
+def test_scan_frames_skips_empty_directories(tmp_path):
+    frame = _encode(56, 28)
+    base = write_frames_dataset(tmp_path / "frames", {"cat_a/video_1": [frame] * 3, "cat_b/video_2": [frame]})
+    (tmp_path / "frames" / "cat_a" / "video_0").mkdir()
+    video_dirs = list_video_dirs(base)
+    assert [os.path.relpath(d, base) for d in video_dirs] == ["cat_a/video_0", "cat_a/video_1", "cat_b/video_2"]
+
+    scanned = scan_frames(video_dirs, workers=1)
+    assert [(d, n) for d, n, _ in scanned] == [(video_dirs[1], 3), (video_dirs[2], 1)]
+    assert scanned[0][2] == [(56, 28)] * 3
+    assert [sizes for _, _, sizes in scan_frames(video_dirs, workers=1, first_only=True)] == [[(56, 28)]] * 2
+    assert [sizes for _, _, sizes in scan_frames(video_dirs, workers=1, sizes=False)] == [[], []]
+
+
+def test_print_histogram_integer_bins(capsys):
+    rows = print_histogram([1, 1, 2, 3, 3, 3], "frames")
+    # Fewer distinct integers than bins: one bin per value
+    assert rows == [(1.0, 1.0, 2), (2.0, 2.0, 1), (3.0, 3.0, 3)]
+    assert "1 | " in capsys.readouterr().out
+
+    values = list(range(15)) + [14] * 5
+    rows = print_histogram(values, "frames", bins=10)
+    assert sum(n for _, _, n in rows) == len(values)
+    # Integer bins cover 0..14 without gaps or overlaps
+    assert rows[0][0] == 0 and rows[-1][1] == 14
+    assert all(b[0] == a[1] + 1 for a, b in zip(rows, rows[1:]))
+
+    assert print_histogram(list(range(100)), "frames") == [(float(i), float(i + 9), 10) for i in range(0, 100, 10)]
+    assert print_histogram([], "frames") == []
+
+
+def test_print_histogram_float_bins():
+    rows = print_histogram([0.5, 1.5, 9.5], "sizes", bins=3)
+    assert [n for _, _, n in rows] == [2, 0, 1]
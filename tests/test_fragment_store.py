@@ -0,0 +1,52 @@
+import json
+import random
+
+import pytest
+
+from fragment_store import FragmentPayloadSource, FrameFragmentStore, body_suffix, prompt_prefix, select_frames
+from payload_sets import build_frame_body, discover_frame_dirs
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_composed_body_is_byte_identical_to_build_frame_body(frames_dataset, stream):
+    base, _ = frames_dataset
+    store = FrameFragmentStore()
+    dirs = sorted(discover_frame_dirs(base))
+    for video_dir in dirs:
+        store.add_video(base, video_dir)
+
+    for index, video_dir in enumerate(store.keys):
+        expected, _, _ = build_frame_body(base, video_dir, "describe", 200, stream)
+        body = store.compose(index, prompt_prefix("describe"), body_suffix(200, stream))
+        assert body.tobytes() == expected
+        assert len(body) == len(expected)
+        assert b"".join(body) == expected
+
+
+def test_select_frames():
+    assert select_frames(8, None) == list(range(8))
+    assert select_frames(8, 20) == list(range(8))
+    assert select_frames(8, 0) == []
+    assert select_frames(8, 4) == [0, 2, 4, 6]
+    assert select_frames(8, 3, "head") == [0, 1, 2]
+    picked = select_frames(8, 3, "random", random.Random(0))
+    assert picked == sorted(picked) and len(set(picked)) == 3
+
+
+def test_payload_source_varies_prompt_and_frame_count(frames_dataset):
+    base, videos = frames_dataset
+    store = FrameFragmentStore()
+    store.add_video(base, "cat_b/video_3")
+    source = FragmentPayloadSource(store, ["p1", "p2"], 50, frame_counts=[2, 4], seed=3)
+
+    seen = set()
+    for _ in range(20):
+        body = source.get(0)
+        payload = json.loads(body.tobytes())
+        content = payload["messages"][0]["content"]
+        assert content[0]["text"] in ("p1", "p2")
+        assert len(content) - 1 == body.frames
+        seen.add((content[0]["text"], body.frames))
+    assert {frames for _, frames in seen} == {2, 4}
+    assert source.composed == 20
+    assert sum(source.frames_sent.values()) == 20
@@ -0,0 +1,72 @@
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from frame_sampler import SparseDecodeUnsupported, SparseFrameReader, _smart_nframes, sample_indices
+
+av = pytest.importorskip("av")
+
+
+def _write_video(path, frames, rate=10, pts=None):
+    """Encode solid frames whose shade depends on their ordinal; ``pts`` overrides the timestamps"""
+    with av.open(str(path), "w") as container:
+        stream = container.add_stream("mpeg4", rate=rate)
+        stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+        stream.codec_context.gop_size = 5
+        stream.codec_context.time_base = Fraction(1, rate)
+        for i in range(frames):
+            image = np.full((48, 64, 3), i * 7 % 256, dtype=np.uint8)
+            frame = av.VideoFrame.from_ndarray(image, format="rgb24")
+            frame.pts = pts[i] if pts is not None else i
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return str(path)
+
+
+def _decode_all(path):
+    with av.open(path) as container:
+        return [f.to_ndarray(format="rgb24") for f in container.decode(video=0)]
+
+
+@pytest.mark.parametrize("total, fps, nframes", [(10, 2.0, 4), (100, 2.0, 20), (7, 10.0, 6), (768 * 3, 10.0, 768)])
+def test_smart_nframes_fallback(total, fps, nframes):
+    assert _smart_nframes({"fps": fps}, total, 10.0) == nframes
+
+
+def test_sample_indices_span_the_clip():
+    indices, nframes = sample_indices({"fps": 2.0}, 100, 10.0, max_frames=5)
+    assert nframes == 20
+    assert indices == [0, 5, 10, 16, 21]
+    full, _ = sample_indices({"fps": 2.0}, 100, 10.0)
+    assert full[0] == 0 and full[-1] == 99 and len(full) == 20
+
+
+def test_sample_indices_round_like_torch():
+    torch = pytest.importorskip("torch")
+    for total in range(4, 400, 7):
+        for fps in (0.5, 1.0, 2.0):
+            indices, nframes = sample_indices({"fps": fps}, total, 10.0)
+            assert indices == torch.linspace(0, total - 1, nframes).round().long().tolist()
+
+
+@pytest.mark.parametrize("max_frames", [None, 3])
+def test_pyav_sparse_read_matches_full_decode(tmp_path, max_frames):
+    path = _write_video(tmp_path / "cfr.mp4", 60)
+    reader = SparseFrameReader(backend="pyav", seek_seconds=0.5)
+    frames, indices, nframes = reader.read({"video": path, "fps": 2.0}, max_frames)
+    decoded = _decode_all(path)
+    expected, _ = sample_indices({"fps": 2.0}, len(decoded), 10.0, max_frames)
+    assert indices == expected
+    assert nframes == 12
+    assert np.array_equal(frames, np.stack([decoded[i] for i in expected]))
+    assert reader.decoded < len(decoded)
+
+
+def test_pyav_variable_frame_rate_falls_back(tmp_path):
+    pts = [0, 1, 2, 4, 5, 6, 9, 10, 11, 12, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23]
+    path = _write_video(tmp_path / "vfr.mp4", len(pts), pts=pts)
+    with pytest.raises(SparseDecodeUnsupported):
+        SparseFrameReader(backend="pyav", seek_seconds=100).read({"video": path, "fps": 10.0})
@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+import frame_shards
+from frame_shards import SHARD_DIR, ShardReader, ShardSet, ShardWriter, load_shards, shard_paths, write_shard
+from payload_sets import build_frame_body, discover_frame_dirs, frame_count, iter_frame_bytes
+
+
+def _pack(base, videos, per_shard):
+    writer = ShardWriter(base, per_shard)
+    for key, frames in videos.items():
+        writer.add(key, [f"frame_{i:04d}.jpg" for i in range(len(frames))], frames)
+    writer.flush()
+    return writer
+
+
+def test_round_trip_across_shards(tmp_path, frames_dataset):
+    _, videos = frames_dataset
+    writer = _pack(str(tmp_path), videos, per_shard=2)
+    assert writer.videos == 3 and len(writer.paths) == 2
+    assert shard_paths(str(tmp_path)) == writer.paths
+
+    shards = ShardSet(writer.paths)
+    assert shards.keys == list(videos)
+    for key, frames in videos.items():
+        assert key in shards
+        assert [bytes(f) for f in shards.frames(key)] == frames
+        assert shards.frame_count(key) == len(frames)
+        assert shards.reader(key).names(key)[-1] == f"frame_{len(frames) - 1:04d}.jpg"
+    assert shards.frames("cat_z/missing") is None
+    assert shards.frame_count("cat_z/missing") == 0
+
+
+def test_index_longer_than_its_first_estimate(tmp_path):
+    # Many frames make the index JSON grow past the provisional data offset
+    videos = [(f"c/v{i}", [f"f{j}" for j in range(40)], [b"x" * (j + 1) for j in range(40)]) for i in range(20)]
+    path = str(tmp_path / "big.vlmshard")
+    write_shard(path, videos)
+    reader = ShardReader(path)
+    assert len(reader) == 20
+    for key, _, frames in videos:
+        assert [bytes(f) for f in reader.frames(key)] == frames
+
+
+def test_writer_resumes_numbering(tmp_path):
+    _pack(str(tmp_path), {"a/1": [b"1"]}, per_shard=1)
+    writer = _pack(str(tmp_path), {"a/2": [b"2"], "a/3": [b"3"]}, per_shard=1)
+    assert [os.path.basename(p) for p in shard_paths(str(tmp_path))] == [
+        "shard_00000.vlmshard", "shard_00001.vlmshard", "shard_00002.vlmshard"]
+    assert len(writer.paths) == 2
+
+
+def test_corrupt_shards_are_rejected(tmp_path):
+    bad = tmp_path / "bad.vlmshard"
+    bad.write_bytes(b"NOTSHARD" + b"\0" * 32)
+    with pytest.raises(ValueError):
+        ShardReader(str(bad))
+    short = tmp_path / "short.vlmshard"
+    short.write_bytes(b"VLM")
+    with pytest.raises(ValueError):
+        ShardReader(str(short))
+
+
+def test_payload_sets_read_packed_dataset(tmp_path, frames_dataset):
+    base, videos = frames_dataset
+    expected = {key: build_frame_body(base, key, "describe", 64)[0] for key in videos}
+
+    packed = str(tmp_path / "packed")
+    _pack(packed, videos, per_shard=2)
+    frame_shards._cache.pop(os.path.abspath(packed), None)
+    assert load_shards(packed) is load_shards(packed)
+    assert os.path.isdir(os.path.join(packed, SHARD_DIR))
+
+    assert discover_frame_dirs(packed) == list(videos)
+    for key, frames in videos.items():
+        assert frame_count(packed, key) == len(frames)
+        assert [bytes(data) for _, data in iter_frame_bytes(packed, key)] == frames
+        assert build_frame_body(packed, key, "describe", 64)[0] == expected[key]
@@ -0,0 +1,106 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from build_wire_payloads import build_wire
+from conftest import write_frames_dataset
+from input_grid import GridPayloadSource, cell_label, parse_cell_label, parse_int_list, prompt_of_length
+from payload_sets import resize_jpeg
+from wire_payloads import load_wire, wire_params
+
+
+def _jpeg(width, height, shade):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (shade, 0, 0)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def jpeg_dataset(tmp_path):
+    videos = {
+        "cat_a/video_1": [_jpeg(112, 84, i * 40) for i in range(4)],
+        "cat_b/video_2": [_jpeg(112, 84, i * 20) for i in range(6)],
+    }
+    return write_frames_dataset(tmp_path / "frames", videos), videos
+
+
+def _frame_images(body):
+    return [p for p in json.loads(body.tobytes())["messages"][0]["content"] if p["type"] == "image_url"]
+
+
+def test_cell_labels_round_trip():
+    assert cell_label(None, 0, 0) == "fall_p0_w0"
+    assert parse_cell_label(cell_label(8, 401408, 500)) == (8, 401408, 500)
+    assert parse_cell_label("e2e") is None
+    assert len(prompt_of_length("describe it", 10).split()) == 10
+
+
+def test_frame_counts_must_be_positive(jpeg_dataset):
+    assert parse_int_list("4, 8", (1,), minimum=1) == [4, 8]
+    assert parse_int_list("", (4, 8), minimum=1) == [4, 8]
+    assert parse_int_list("0,200704", (1,)) == [0, 200704]
+    with pytest.raises(ValueError):
+        parse_int_list("4,0", (1,), minimum=1)
+    assert cell_label(0, 0, 0) == "f0_p0_w0"
+
+    base, videos = jpeg_dataset
+    with pytest.raises(ValueError):
+        GridPayloadSource(base, sorted(videos), "describe", 50, frame_counts=(2, 0))
+
+
+def test_grid_leaves_out_videos_shorter_than_the_largest_cell(jpeg_dataset, capsys):
+    base, videos = jpeg_dataset
+    source = GridPayloadSource(base, sorted(videos), "describe", 50, frame_counts=(2, 5))
+    assert source.keys == ["cat_b/video_2"]
+    assert "fewer than 5 frames (e.g. cat_a/video_1)" in capsys.readouterr().out
+    assert len(_frame_images(source.get(1))) == 5
+
+
+def test_grid_resizes_frames_per_budget(jpeg_dataset):
+    base, videos = jpeg_dataset
+    source = GridPayloadSource(base, sorted(videos), "describe", 50, frame_counts=(2,),
+                               pixel_budgets=(0, 1568))
+    assert len(source) == 2 * len(source.cells) == 4
+    original, resized = source.stores[0], source.stores[1568]
+    assert original.keys == resized.keys == sorted(videos)
+    assert len(resized.frames[1]) == 6
+    assert resized.nbytes < original.nbytes
+
+    body = source.get(1)
+    assert source.cell_label(1) == "f2_p1568_w0"
+    assert len(_frame_images(body)) == 2
+
+
+def test_grid_maps_wire_artifacts(jpeg_dataset):
+    base, videos = jpeg_dataset
+    build_wire(base, "frames", None, per_shard=1, workers=1, max_pixels=1568)
+    wire = load_wire(base, "frames", wire_params("frames", max_pixels=1568))
+    assert wire is not None
+
+    mapped = GridPayloadSource(base, sorted(videos), "describe", 50, frame_counts=(3,),
+                               pixel_budgets=(1568,), wires={1568: wire})
+    resized = GridPayloadSource(base, sorted(videos), "describe", 50, frame_counts=(3,),
+                                pixel_budgets=(1568,))
+    assert mapped.stores[1568].nbytes == resized.stores[1568].nbytes
+    for index in range(len(mapped)):
+        assert mapped.get(index).tobytes() == resized.get(index).tobytes()
+
+
+def test_grid_leaves_out_videos_missing_from_a_wire_artifact(jpeg_dataset):
+    base, videos = jpeg_dataset
+    build_wire(base, "frames", None, per_shard=1, workers=1, max_pixels=1568)
+    wire = load_wire(base, "frames", wire_params("frames", max_pixels=1568))
+    extra = dict(videos, **{"cat_c/video_9": [_jpeg(56, 56, 1)]})
+    write_frames_dataset(base, {"cat_c/video_9": extra["cat_c/video_9"]})
+
+    source = GridPayloadSource(base, sorted(extra), "describe", 50, frame_counts=(1,),
+                               pixel_budgets=(0, 1568), wires={1568: wire})
+    assert source.keys == sorted(videos)
+
+
+def test_resize_jpeg_keeps_multiples_of_28():
+    with Image.open(io.BytesIO(resize_jpeg(_jpeg(300, 200, 0), 20000))) as img:
+        width, height = img.size
+    assert width % 28 == 0 and height % 28 == 0 and width * height <= 20000
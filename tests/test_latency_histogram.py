@@ -0,0 +1,123 @@
+import json
+import random
+
+import pytest
+
+from latency_histogram import (
+    HdrRecorder, LatencyHistogram, load_histogram_file, merge_snapshots, metric_for,
+)
+
+
+def _exact_percentile(values, q):
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+@pytest.mark.parametrize("scale_ms", [0.05, 20.0, 30000.0, 3600000.0])
+def test_percentiles_within_a_tenth_of_a_percent(scale_ms):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1) * scale_ms for _ in range(5000)]
+    h = LatencyHistogram()
+    for v in values:
+        h.record_ms(v)
+    us = [round(v * 1000) for v in values]
+    for q in (1, 50, 90, 99, 99.9, 100):
+        exact = _exact_percentile(us, q) / 1000.0
+        assert h.percentile_ms(q) == pytest.approx(exact, rel=1e-3, abs=0.001)
+    assert h.count == len(values)
+    assert h.mean_ms() == pytest.approx(sum(us) / len(us) / 1000.0)
+    assert h.max_us == max(us)
+
+
+def test_merge_is_lossless():
+    rng = random.Random(1)
+    values = [rng.uniform(1, 60000) for _ in range(2000)]
+    whole, a, b = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, v in enumerate(values):
+        whole.record_ms(v)
+        (a if i % 3 else b).record_ms(v)
+    merged = LatencyHistogram().merge(a).merge(b)
+    assert merged.to_dict() == whole.to_dict()
+    round_trip = LatencyHistogram.from_dict(json.loads(json.dumps(merged.to_dict())))
+    assert round_trip.to_dict() == whole.to_dict()
+
+
+def test_empty_and_precision_mismatch():
+    h = LatencyHistogram()
+    assert h.percentile_ms(50) is None
+    assert h.mean_ms() is None
+    data = h.to_dict()
+    data["sub_bucket_bits"] = 7
+    with pytest.raises(ValueError):
+        LatencyHistogram.from_dict(data)
+
+
+def test_metric_for():
+    assert metric_for("POST", "vllm_video_completion") == "e2e"
+    assert metric_for("STREAM", "chat:ttft") == "ttft"
+    assert metric_for("OPENLOOP", "chat:intended") == "intended"
+    assert metric_for("POST", "a:b") == "e2e"
+
+
+def test_recorder_file_round_trip(tmp_path):
+    prefix = str(tmp_path / "run")
+    recorder = HdrRecorder()
+    recorder._csv_prefix = prefix
+    recorder.start_run()
+    for ms in (100.0, 200.0, 300.0):
+        recorder.record("e2e", ms)
+    recorder.merge_interval(recorder.take_interval(), "w1", timestamp=10.0)
+    recorder.record("e2e", 400.0)
+    recorder.record("ttft", 50.0)
+    recorder.merge_interval(recorder.take_interval(), "w2", timestamp=20.0)
+    assert recorder.take_interval() == {}
+    recorder.write_totals()
+
+    totals = load_histogram_file(f"{prefix}_hdr.json")
+    assert totals["e2e"].count == 4
+    assert totals["ttft"].count == 1
+    intervals = load_histogram_file(f"{prefix}_hdr.jsonl")
+    assert intervals["e2e"].to_dict() == totals["e2e"].to_dict()
+    assert load_histogram_file(f"{prefix}_hdr.jsonl", start=10.0)["e2e"].count == 1
+
+    # A new run with the same prefix starts a fresh interval log
+    recorder.start_run()
+    recorder.record("e2e", 1.0)
+    recorder.merge_interval(recorder.take_interval(), "w1", timestamp=30.0)
+    assert load_histogram_file(f"{prefix}_hdr.jsonl")["e2e"].count == 1
+    assert recorder.totals["e2e"].count == 1
+
+
+def test_merge_snapshots_across_sources():
+    a, b = LatencyHistogram(), LatencyHistogram()
+    a.record_ms(10)
+    b.record_ms(20)
+    merged = merge_snapshots([{"e2e": a.to_dict()}, {"e2e": b.to_dict(), "itl": b.to_dict()}])
+    assert merged["e2e"].count == 2
+    assert merged["itl"].percentile_ms(50) == pytest.approx(20, rel=1e-3)
+
+
+def test_headless_quit_keeps_final_worker_intervals(tmp_path, cluster_factory):
+    cluster = cluster_factory(workers=2, csv_prefix=str(tmp_path / "run"))
+    master = HdrRecorder()
+    master.attach(cluster.master)
+    for worker in cluster.workers:
+        HdrRecorder().attach(worker)
+    cluster.test_start()
+
+    def request(worker, ms):
+        worker.events.request.fire(request_type="POST", name="/v1/chat/completions",
+                                   response_time=ms, response_length=0, exception=None, context={})
+
+    for worker in cluster.workers:
+        request(worker, 100.0)
+        cluster.send_stats(worker)
+    # Requests finishing between the last periodic report and the quit
+    for worker in cluster.workers:
+        request(worker, 200.0)
+    cluster.quit_headless()
+
+    totals = load_histogram_file(str(tmp_path / "run_hdr.json"))
+    assert totals["e2e"].count == 4
+    assert load_histogram_file(str(tmp_path / "run_hdr.jsonl"))["e2e"].count == 4
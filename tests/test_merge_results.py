@@ -0,0 +1,150 @@
+import csv
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from merge_results import (
+    analyze, find_knee, fit_latency_curve, load_history, main_request_row, max_sustainable, steady_state,
+)
+
+STATS_FIELDS = ["Type", "Name", "Request Count", "Failure Count", "Requests/s", "50%", "90%", "99%", "99.9%"]
+HISTORY_FIELDS = ["Timestamp", "User Count", "Type", "Name", "Total Request Count", "Total Failure Count",
+                  "50%", "90%", "99%", "99.9%"]
+
+
+def _write(path, fields, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def _ramp_history(seconds=101, users=10, rps=5.0, fail_rps=0.1):
+    """Users ramp up one per second, then requests complete at a constant rate"""
+    t = np.arange(seconds, dtype=float)
+    done = np.clip(t - users, 0, None)
+    hist = {
+        "t": t,
+        "users": np.minimum(t, users),
+        "total": done * rps,
+        "failures": done * fail_rps,
+        # Ramp and cooldown outliers that the steady window must drop
+        "50%": np.where((t < 20) | (t > 96), 9000.0, 1000.0),
+    }
+    for p in ("90%", "99%", "99.9%"):
+        hist[p] = hist["50%"] * 2
+    return hist
+
+
+def test_steady_state_drops_ramp_warmup_and_cooldown():
+    result = steady_state(_ramp_history())
+    # Full concurrency with completions spans t=11..100: warmup ends at 19.9, cooldown starts at 95.55
+    assert (result["t_start"], result["t_end"]) == (20.0, 95.0)
+    assert result["seconds"] == 75.0
+    assert result["requests"] == 375
+    assert result["rps"] == pytest.approx(5.0)
+    assert result["error_rate"] == pytest.approx(0.02)
+    assert result["50%"] == 1000.0
+    assert result["99%"] == 2000.0
+
+
+def test_steady_state_needs_enough_history():
+    hist = _ramp_history(seconds=12)
+    assert steady_state(hist) is None
+
+
+def test_fit_latency_curve_recovers_parameters():
+    x = np.array([1.0, 2.0, 5.0, 8.0, np.nan])
+    latency = 1000.0 / (1 - x / 10.0)
+    l0, xmax = fit_latency_curve(x, latency)
+    assert l0 == pytest.approx(1000.0)
+    assert xmax == pytest.approx(10.0)
+    # Latency falling with throughput has no saturation point
+    assert fit_latency_curve(np.array([1.0, 2.0, 3.0]), np.array([300.0, 200.0, 100.0])) is None
+    assert fit_latency_curve(np.array([1.0]), np.array([100.0])) is None
+
+
+def test_find_knee():
+    concurrency = np.array([1, 2, 4, 8, 16, 32])
+    assert find_knee(concurrency, np.array([1.0, 2.0, 4.0, 7.5, 8.0, 8.1])) == 8
+    # Throughput growing linearly in log2(concurrency) has no knee
+    assert find_knee(concurrency, np.arange(6, dtype=float)) is None
+    assert find_knee(concurrency[:2], np.array([1.0, 2.0])) is None
+
+
+def test_max_sustainable_interpolates_the_slo_crossing():
+    concurrency = np.array([1, 2, 4, 8, 16])
+    latency = np.array([100.0, 120.0, 200.0, 800.0, 3200.0])
+    best, estimate = max_sustainable(concurrency, latency, np.zeros(5), 400.0, 0.01)
+    assert best == 4
+    # 400ms is halfway between 200 and 800 on a log scale, so halfway between 4 and 8
+    assert estimate == pytest.approx(4 * np.sqrt(2))
+
+    errors = np.array([0.0, 0.0, 0.5, 0.0, 0.0])
+    assert max_sustainable(concurrency, latency, errors, 400.0, 0.01)[0] == 2
+    assert max_sustainable(concurrency, latency, np.zeros(5), 50.0, 0.01) == (None, None)
+    assert max_sustainable(concurrency, latency, np.zeros(5), 5000.0, 0.01) == (16, None)
+
+
+def _stats_rows(derived):
+    rows = [{"Type": "POST", "Name": "chat", "Request Count": 400, "Failure Count": 4, "Requests/s": 4.0,
+             "50%": 1000, "90%": 1500, "99%": 2000, "99.9%": 2500}]
+    if derived:
+        rows.append({"Type": "STREAM", "Name": "chat:ttft", "Request Count": 396, "Failure Count": 0,
+                     "Requests/s": 3.96, "50%": 100, "90%": 150, "99%": 200, "99.9%": 250})
+    rows.append({"Type": "", "Name": "Aggregated", "Request Count": 796 if derived else 400,
+                 "Failure Count": 4, "Requests/s": 7.96 if derived else 4.0,
+                 "50%": 500, "90%": 1400, "99%": 2000, "99.9%": 2500})
+    return rows
+
+
+def _history_rows(hist, names):
+    rows = []
+    for i, t in enumerate(hist["t"]):
+        for request_type, name, scale in names:
+            row = {"Timestamp": int(t), "User Count": int(hist["users"][i]), "Type": request_type, "Name": name,
+                   "Total Request Count": hist["total"][i] * scale,
+                   "Total Failure Count": hist["failures"][i] * scale}
+            for p in ("50%", "90%", "99%", "99.9%"):
+                row[p] = hist[p][i] if hist["total"][i] else "N/A"
+            rows.append(row)
+    return rows
+
+
+def test_main_request_row_skips_polluted_aggregated():
+    row, polluted = main_request_row([dict(r) for r in _stats_rows(derived=False)])
+    assert (row["Name"], polluted) == ("Aggregated", False)
+    row, polluted = main_request_row([dict(r) for r in _stats_rows(derived=True)])
+    assert (row["Type"], row["Name"], polluted) == ("POST", "chat", True)
+    assert main_request_row([{"Type": "STREAM", "Name": "chat:ttft", "Request Count": "1"}]) == (None, True)
+
+
+def test_load_history_prefers_main_request_rows(tmp_path):
+    hist = _ramp_history()
+    path = _write(tmp_path / "full_history.csv", HISTORY_FIELDS, _history_rows(
+        hist, [("POST", "chat", 1.0), ("STREAM", "chat:ttft", 1.0), ("", "Aggregated", 2.0)]))
+    loaded = load_history(path, polluted=True)
+    assert np.array_equal(loaded["total"], hist["total"])
+    assert steady_state(loaded)["rps"] == pytest.approx(5.0)
+
+    aggregated_only = _write(tmp_path / "history.csv", HISTORY_FIELDS,
+                             _history_rows(hist, [("", "Aggregated", 2.0)]))
+    assert load_history(aggregated_only, polluted=True) is None
+    assert steady_state(load_history(aggregated_only, polluted=False))["rps"] == pytest.approx(10.0)
+
+
+def test_analyze_falls_back_to_main_row_when_history_is_polluted(tmp_path):
+    hist = _ramp_history()
+    stats = _write(tmp_path / "results_8_stats.csv", STATS_FIELDS, _stats_rows(derived=True))
+    history = _write(tmp_path / "results_8_stats_history.csv", HISTORY_FIELDS,
+                     _history_rows(hist, [("", "Aggregated", 2.0)]))
+    args = SimpleNamespace(warmup=0.1, cooldown=0.05, slo_ms=0, slo_percentile=99, max_error_rate=0.01)
+
+    record = analyze([(8, stats, history, None, None)], args)["records"][0]
+    assert record["source"] == "stats"
+    assert record["requests"] == 400
+    assert record["rps"] == 4.0
+    assert record["error_rate"] == pytest.approx(0.01)
+    assert record["50%"] == 1000.0
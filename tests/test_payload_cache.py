@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from payload_cache import FrameCache, read_frames, write_frames
+
+
+def test_write_read_round_trip(tmp_path):
+    path = str(tmp_path / "entry.frames")
+    frames = [b"\xff\xd8first", b"", b"\xff\xd8third" * 100]
+    write_frames(path, frames)
+
+    loaded = read_frames(path)
+    assert [bytes(f) for f in loaded] == frames
+    assert all(isinstance(f, memoryview) for f in loaded)
+
+
+def test_read_rejects_bad_entries(tmp_path):
+    short = tmp_path / "short.frames"
+    short.write_bytes(b"VLM")
+    with pytest.raises(ValueError):
+        read_frames(str(short))
+
+    bad = tmp_path / "bad.frames"
+    write_frames(str(bad), [b"abc"])
+    bad.write_bytes(b"NOTMAGIC" + bad.read_bytes()[8:])
+    with pytest.raises(ValueError):
+        read_frames(str(bad))
+
+    cut = tmp_path / "cut.frames"
+    write_frames(str(cut), [b"abcdef"])
+    cut.write_bytes(cut.read_bytes()[:-2])
+    with pytest.raises(ValueError):
+        read_frames(str(cut))
+
+
+def test_frame_cache_get_or_build(tmp_path):
+    source = tmp_path / "video.mp4"
+    source.write_bytes(os.urandom(4096))
+    cache = FrameCache(str(tmp_path / "cache"), {"fps": 1.0})
+    built = []
+
+    def build(path):
+        built.append(path)
+        return [b"one", b"two"]
+
+    assert [bytes(f) for f in cache.get_or_build(str(source), build)] == [b"one", b"two"]
+    assert [bytes(f) for f in cache.get_or_build(str(source), build)] == [b"one", b"two"]
+    assert len(built) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    other = FrameCache(str(tmp_path / "cache"), {"fps": 2.0})
+    assert other.get(str(source)) is None
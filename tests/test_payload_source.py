@@ -0,0 +1,71 @@
+from payload_source import InMemoryPayloadSource, StreamingPayloadSource, first_available
+
+
+def _loader(key):
+    if key == "broken":
+        raise OSError("unreadable")
+    return key.encode() * 4
+
+
+def test_streaming_source_loads_and_evicts():
+    source = StreamingPayloadSource(["a", "b", "c"], _loader, byte_budget=8, prefetch_depth=0)
+    try:
+        assert len(source) == 3
+        assert source.get(0) == b"aaaa"
+        assert source.get(1) == b"bbbb"
+        assert source.get(2) == b"cccc"
+        summary = source.summary()
+        assert summary["cached"] == 2
+        assert summary["evictions"] == 1
+        assert source.get(2) == b"cccc"
+        assert source.summary()["hit_rate"] > 0
+    finally:
+        source.close()
+
+
+def test_first_available_skips_unloadable_payloads():
+    source = StreamingPayloadSource(["a", "broken", "c"], _loader, byte_budget=1 << 20, prefetch_depth=0)
+    try:
+        assert first_available(source, 1) == (2, b"cccc")
+        assert first_available(source, 0) == (0, b"aaaa")
+        assert source.summary()["load_errors"] == 1
+    finally:
+        source.close()
+
+
+def test_first_available_wraps_and_gives_up():
+    assert first_available(InMemoryPayloadSource([b"x", None]), 1) == (0, b"x")
+    assert first_available(InMemoryPayloadSource([None, None]), 1) == (1, None)
+
+
+def test_concurrent_misses_load_a_body_once():
+    from payload_source import _Event, _Thread
+
+    started, release, calls = _Event(), _Event(), []
+
+    def slow_loader(key):
+        calls.append(key)
+        started.set()
+        release.wait(5)
+        return key.encode()
+
+    source = StreamingPayloadSource(["a", "b"], slow_loader, byte_budget=1 << 20, prefetch_depth=0)
+    results, finished = [], [_Event(), _Event()]
+
+    def miss(done):
+        results.append(source._load_once(0))
+        done.set()
+
+    try:
+        # Raw OS threads, as the prefetcher and gevent's pool use; locust's monkey-patching makes join() unreliable
+        _Thread(target=miss, args=(finished[0],), daemon=True).start()
+        assert started.wait(5)
+        _Thread(target=miss, args=(finished[1],), daemon=True).start()
+        release.set()
+        assert all(done.wait(5) for done in finished)
+        assert calls == ["a"]
+        assert sorted(results) == [(b"a", False), (b"a", True)]
+        assert source.get(0) == b"a"
+        assert source.summary()["stalls"] == 0
+    finally:
+        source.close()
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+from fragment_store import FrameFragmentStore, body_suffix, prompt_prefix
+from payload_sets import build_body, build_frame_body, image_url_part
+from prefix_workload import PrefixWorkload, split_body
+
+
+def _images_first(body_bytes, prompt, system=None):
+    """What a composed body must decode to: same request, images before the prompt"""
+    payload = json.loads(body_bytes)
+    messages = [m for m in payload["messages"] if m["role"] != "system" or system is None]
+    if system is not None:
+        messages.insert(0, {"role": "system", "content": system})
+    user = messages[-1]
+    user["content"] = [p for p in user["content"] if p["type"] != "text"] + [{"type": "text", "text": prompt}]
+    payload["messages"] = messages
+    return payload
+
+
+def test_compose_contiguous_body_moves_images_first(frames_dataset):
+    base, _ = frames_dataset
+    body, _, _ = build_frame_body(base, "cat_a/video_1", "describe", 100)
+    workload = PrefixWorkload(prompts=["what happens?"])
+    for original in (body, memoryview(body)):
+        composed = workload.compose(original, 0)
+        assert json.loads(composed.tobytes()) == _images_first(body, "what happens?")
+
+
+def test_compose_fragment_body_matches_contiguous(frames_dataset):
+    base, _ = frames_dataset
+    store = FrameFragmentStore()
+    store.add_video(base, "cat_b/video_3")
+    fragmented = store.compose(0, prompt_prefix("describe"), body_suffix(100, True))
+    body, _, _ = build_frame_body(base, "cat_b/video_3", "describe", 100, True)
+    workload = PrefixWorkload(prompts=["p"], system_prompt="be brief")
+    assert workload.compose(fragmented, 5).tobytes() == workload.compose(body, 5).tobytes()
+    assert json.loads(workload.compose(fragmented, 5).tobytes()) == _images_first(body, "p", "be brief")
+
+
+def test_system_prompt_replaces_existing_system_message():
+    content = [{"type": "text", "text": "q"}, image_url_part("AAAA"), image_url_part("BBBB")]
+    body = build_body([{"role": "system", "content": "You are a helpful assistant."},
+                       {"role": "user", "content": content}], 50)
+    composed = json.loads(PrefixWorkload(prompts=["q2"], system_prompt="shared").compose(body, 1).tobytes())
+    assert [m["role"] for m in composed["messages"]] == ["system", "user"]
+    assert composed["messages"][0]["content"] == "shared"
+
+    # Without a system prompt the body's own system message is kept as is
+    kept = json.loads(PrefixWorkload(prompts=["q2"]).compose(body, 1).tobytes())
+    assert kept["messages"][0]["content"] == "You are a helpful assistant."
+
+
+def test_compose_rejects_unsplittable_bodies():
+    text_only = build_body([{"role": "user", "content": [{"type": "text", "text": "hi"}]}], 10)
+    assert split_body(text_only) is None
+    with pytest.raises(ValueError):
+        PrefixWorkload().compose(text_only, 0)
+    with pytest.raises(ValueError):
+        PrefixWorkload().compose(object(), 0)
+
+
+def test_plan_is_deterministic_per_seed():
+    a = PrefixWorkload(reuse=0.7, seed=4)
+    b = PrefixWorkload(reuse=0.7, seed=4)
+    plan_a = [a.plan(s, 10) for s in range(50)]
+    assert plan_a == [b.plan(s, 10) for s in reversed(range(50))][::-1]
+    assert plan_a[0] == (0, "miss")
+    assert all(0 <= index < 10 for index, _ in plan_a)
@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+
+import request_budget
+from request_budget import BUDGET_CLAIM_MESSAGE, BUDGET_GRANT_MESSAGE, RequestBudget
+
+
+class _Master:
+    """Delivers worker claims to the master budget and its grants back, synchronously"""
+
+    def __init__(self, max_requests):
+        self.budget = RequestBudget(max_requests)
+        self.workers = {}
+        self.dropped = 0
+        self.drop_next = 0
+
+    def send_message(self, msg_type, data, client_id=None):
+        assert msg_type == BUDGET_GRANT_MESSAGE
+        worker = self.workers[client_id]
+        worker.budget._on_grant(None, SimpleNamespace(data=data, node_id="master"))
+
+
+class _Worker:
+    def __init__(self, master, node_id, block_size):
+        self.master = master
+        self.node_id = node_id
+        self.claims = 0
+        self.budget = RequestBudget(master.budget.max_requests or 0, block_size)
+        self.budget._runner = self
+        self.budget._on_test_start()
+        master.workers[node_id] = self
+
+    def send_message(self, msg_type, data, client_id=None):
+        assert msg_type == BUDGET_CLAIM_MESSAGE
+        self.claims += 1
+        if self.master.drop_next:
+            self.master.drop_next -= 1
+            self.master.dropped += 1
+            return
+        # A real master may answer while the worker is still claiming; the lock must be free
+        assert not self.budget._lock.locked()
+        self.master.budget._on_claim(SimpleNamespace(runner=self.master),
+                                     SimpleNamespace(data=data, node_id=self.node_id))
+
+
+def _drain(budget):
+    claims = []
+    while True:
+        claim = budget.claim()
+        if claim is None:
+            return claims
+        claims.append(claim)
+
+
+def test_standalone_budget_and_final_sequence():
+    budget = RequestBudget(3)
+    assert _drain(budget) == [(0, False), (1, False), (2, True)]
+    assert budget.claim() is None
+
+    unlimited = RequestBudget(0)
+    assert [unlimited.claim() for _ in range(3)] == [(0, False), (1, False), (2, False)]
+
+
+def test_workers_split_the_budget_exactly_once():
+    master = _Master(25)
+    a = _Worker(master, "a", block_size=4)
+    b = _Worker(master, "b", block_size=4)
+    claims = []
+    while True:
+        got = [a.budget.claim(), b.budget.claim()]
+        claims.extend(c for c in got if c is not None)
+        if got == [None, None]:
+            break
+    sequences = sorted(seq for seq, _ in claims)
+    assert sequences == list(range(25))
+    assert [seq for seq, final in claims if final] == [24]
+
+
+def test_worker_refills_at_low_water_without_stalling():
+    master = _Master(100)
+    worker = _Worker(master, "w", block_size=8)
+    for expected in range(40):
+        assert worker.budget.claim() == (expected, False)
+    # First block was fetched on demand, every later one ahead of need
+    assert worker.budget.stalls == 0
+    assert worker.claims == 40 // 8 + 1
+    assert len(worker.budget._leased) > worker.budget.low_water
+
+
+def test_missing_grant_is_retried_not_treated_as_exhausted(monkeypatch):
+    monkeypatch.setattr(request_budget, "GRANT_TIMEOUT", 0.01)
+    master = _Master(5)
+    worker = _Worker(master, "w", block_size=2)
+    master.drop_next = 1
+    assert _drain(worker.budget) == [(0, False), (1, False), (2, False), (3, False), (4, True)]
+    assert master.dropped == 1
+    assert worker.budget.timeouts == 1
+
+
+def test_stale_grants_from_a_previous_run_are_ignored():
+    master = _Master(10)
+    worker = _Worker(master, "w", block_size=4)
+    worker.budget._on_grant(None, SimpleNamespace(data={"start": 100, "end": 104, "run": 0}, node_id="master"))
+    assert not worker.budget._leased
+    assert worker.budget.claim() == (0, False)
@@ -0,0 +1,104 @@
+import csv
+
+import pytest
+
+import stats_csv
+from latency_histogram import LatencyHistogram
+from stats_csv import (
+    FAILURE_COLUMNS, HISTORY_COLUMNS, PERCENTILE_COLUMNS, STATS_COLUMNS,
+    RequestRecorder, write_locust_csvs,
+)
+
+
+def _read(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_columns_match_locust():
+    stats = pytest.importorskip("locust.stats")
+    readable = stats.get_readable_percentiles(stats.PERCENTILES_TO_REPORT)
+    assert PERCENTILE_COLUMNS == readable
+    assert STATS_COLUMNS[:11] == ["Type", "Name", "Request Count", "Failure Count", "Median Response Time",
+                                  "Average Response Time", "Min Response Time", "Max Response Time",
+                                  "Average Content Size", "Requests/s", "Failures/s"]
+    assert STATS_COLUMNS[11:] == readable
+    assert HISTORY_COLUMNS[6:6 + len(readable)] == readable
+    assert FAILURE_COLUMNS == ["Method", "Name", "Error", "Occurrences"]
+
+
+def _recorder_at(monkeypatch, samples):
+    """Record (timestamp, type, name, ms, length, error) samples with a fixed clock"""
+    recorder = RequestRecorder(hdr_interval=10.0)
+    for ts, request_type, name, ms, length, error in samples:
+        monkeypatch.setattr(stats_csv.time, "time", lambda ts=ts: ts)
+        recorder.record(request_type, name, ms, length, error)
+    return recorder
+
+
+def test_recorder_rows_and_percentiles(tmp_path, monkeypatch):
+    samples = [(1000.5 + i * 0.1, "POST", "chat", 100.0 * (i + 1), 10, None) for i in range(10)]
+    samples.append((1001.9, "POST", "chat", 5000.0, 0, "HTTP 500"))
+    samples.append((1001.9, "STREAM", "chat:ttft", 40.0, 0, None))
+    recorder = _recorder_at(monkeypatch, samples)
+
+    prefix = str(tmp_path / "run")
+    write_locust_csvs(prefix, recorder, 1000.0, 1002.0, 8)
+    rows = {(r["Type"], r["Name"]): r for r in _read(f"{prefix}_stats.csv")}
+
+    post = rows[("POST", "chat")]
+    assert int(post["Request Count"]) == 11
+    assert int(post["Failure Count"]) == 1
+    assert int(post["Median Response Time"]) == 600
+    assert int(post["100%"]) == 5000
+    assert float(post["Min Response Time"]) == 100.0
+    assert float(post["Average Content Size"]) == pytest.approx(100 / 11)
+    assert int(rows[("", "Aggregated")]["Request Count"]) == 12
+
+    failures = _read(f"{prefix}_failures.csv")
+    assert failures == [{"Method": "POST", "Name": "chat", "Error": "HTTP 500", "Occurrences": "1"}]
+
+    history = _read(f"{prefix}_stats_history.csv")
+    aggregated = [r for r in history if r["Name"] == "Aggregated"]
+    assert [int(r["Total Request Count"]) for r in aggregated] == [5, 12, 12]
+    assert [(r["Type"], r["Name"]) for r in history[:3]] == [("POST", "chat"), ("STREAM", "chat:ttft"),
+                                                             ("", "Aggregated")]
+    assert [int(r["Total Request Count"]) for r in history if r["Name"] == "chat"] == [5, 11, 11]
+    assert [int(r["Total Failure Count"]) for r in history if r["Name"] == "chat"] == [0, 1, 1]
+
+
+def test_history_follows_the_main_request_when_aggregated_is_polluted(tmp_path, monkeypatch):
+    from merge_results import load_history, main_request_row
+
+    samples = []
+    for i in range(20):
+        samples.append((1000.5 + i, "POST", "chat", 1000.0, 10, None))
+        samples.append((1000.5 + i, "STREAM", "chat:ttft", 100.0, 0, None))
+        samples.append((1000.5 + i, "OPENLOOP", "chat:intended", 1200.0, 0, None))
+    prefix = str(tmp_path / "run")
+    write_locust_csvs(prefix, _recorder_at(monkeypatch, samples), 1000.0, 1020.0, 4)
+
+    _, polluted = main_request_row(_read(f"{prefix}_stats.csv"))
+    assert polluted
+    hist = load_history(f"{prefix}_stats_history.csv", polluted)
+    assert hist is not None
+    assert hist["total"][-1] == 20
+    assert hist["50%"][-1] == 1000
+
+
+def test_recorder_export_merge_and_hdr_intervals(monkeypatch):
+    a = _recorder_at(monkeypatch, [(1001.0, "POST", "chat", 100.0, 1, None),
+                                   (1015.0, "STREAM", "chat:ttft", 20.0, 0, None)])
+    b = _recorder_at(monkeypatch, [(1002.0, "POST", "chat", 300.0, 1, None),
+                                   (1003.0, "POST", "chat", 1.0, 0, "timeout")])
+    merged = RequestRecorder(hdr_interval=10.0)
+    merged.merge(a.export())
+    merged.merge(b.export())
+
+    assert merged.count("POST", "chat") == (3, 1)
+    assert merged.hdr_failures == 1
+    snapshots = merged.interval_snapshots()
+    assert [t for t, _ in snapshots] == [1010.0, 1020.0]
+    first = LatencyHistogram.from_dict(snapshots[0][1]["e2e"])
+    assert first.count == 2
+    assert LatencyHistogram.from_dict(snapshots[1][1]["ttft"]).count == 1
@@ -0,0 +1,75 @@
+import json
+
+from latency_histogram import HdrRecorder, LatencyHistogram
+from stream_metrics import STREAM_REQUEST_TYPE, StreamResult, fire_stream_metrics, parse_sse_stream
+
+
+class _Hook:
+    def __init__(self):
+        self.calls = []
+
+    def fire(self, **kwargs):
+        self.calls.append(kwargs)
+
+
+class _Events:
+    def __init__(self):
+        self.request = _Hook()
+
+
+def _chunk(content=None, usage=None):
+    data = {"choices": [{"delta": {"content": content}}] if content is not None else []}
+    if usage:
+        data["usage"] = usage
+    return b"data: " + json.dumps(data).encode()
+
+
+def test_parse_sse_stream_counts_tokens_and_usage():
+    lines = [_chunk("a"), b"", _chunk("b"), _chunk("c"),
+             _chunk(usage={"prompt_tokens": 5, "completion_tokens": 3}), b"data: [DONE]", _chunk("late")]
+    result = parse_sse_stream(iter(lines), start=0.0)
+    assert result.content_chunks == 3
+    assert len(result.itls) == 2
+    assert result.output_tokens == 3
+    assert result.usage["prompt_tokens"] == 5
+    assert result.tpot is not None
+
+
+def _result(ttft, itls, e2e, tokens):
+    result = StreamResult()
+    result.ttft = ttft
+    result.itls = itls
+    result.e2e = e2e
+    result.content_chunks = tokens
+    return result
+
+
+def test_ttft_and_tpot_events_per_request():
+    events = _Events()
+    fire_stream_metrics(events, "chat", _result(0.5, [0.01] * 499, 5.49, 500))
+    assert [c["name"] for c in events.request.calls] == ["chat:ttft", "chat:tpot"]
+    ttft, tpot = events.request.calls
+    assert ttft["request_type"] == tpot["request_type"] == STREAM_REQUEST_TYPE
+    assert ttft["response_time"] == 500.0
+    assert len(ttft["context"]["itl_ms"]) == 499
+    assert ttft["context"]["itl_max_ms"] == 10.0
+    assert abs(tpot["response_time"] - 10.0) < 1e-6
+
+    # No TPOT from a single token, nothing at all without a first token
+    fire_stream_metrics(events, "chat", _result(0.5, [], 0.6, 1))
+    assert [c["name"] for c in events.request.calls[2:]] == ["chat:ttft"]
+    fire_stream_metrics(events, "chat", _result(None, [], 1.0, 0))
+    assert len(events.request.calls) == 3
+
+
+def test_hdr_recorder_takes_itl_from_stream_context():
+    recorder = HdrRecorder()
+    context = _result(0.2, [0.01, 0.03], 0.3, 3).context()
+    recorder._on_request("POST", "chat", 300.0)
+    recorder._on_request(STREAM_REQUEST_TYPE, "chat:ttft", 200.0, context=context)
+    recorder._on_request(STREAM_REQUEST_TYPE, "chat:tpot", 50.0, context={})
+    snapshot = recorder.take_interval()
+    assert set(snapshot) == {"e2e", "ttft", "itl", "tpot"}
+    itl = LatencyHistogram.from_dict(snapshot["itl"])
+    assert itl.count == 2
+    assert abs(itl.percentile_ms(100) - 30.0) < 0.03
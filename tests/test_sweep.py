@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+import sweep
+
+
+def _rows(rates, start=0.0, step=1.0):
+    """History rows whose cumulative request count grows at the given per-second rates"""
+    rows, total, t = [], 0, start
+    for rate in rates:
+        rows.append({"t": t, "users": 8, "total": total, "failures": 0, "p50": "100", "p95": "200", "p99": "N/A"})
+        total += rate
+        t += step
+    return rows
+
+
+def test_is_steady():
+    assert sweep.is_steady(_rows([10] * 31), 0.1)
+    assert not sweep.is_steady(_rows([5] * 10 + [10] * 10 + [15] * 11), 0.1)
+    assert not sweep.is_steady(_rows([0] * 31), 0.1)
+    assert not sweep.is_steady(_rows([10] * 3), 0.1)
+
+
+def test_measure_window():
+    rows = _rows([4] * 11)
+    rows[-1]["failures"] = 4
+    result = sweep.measure_window(rows)
+    assert result["measured_s"] == 10
+    assert result["requests"] == 40
+    assert result["rps"] == 4.0
+    assert result["error_rate"] == 0.1
+    assert result["p95_ms"] == 200.0
+    assert result["p99_ms"] is None
+
+
+def test_levels():
+    assert sweep.doubling_levels(8, 100, 2.0) == [8, 16, 32, 64]
+    assert sweep.doubling_levels(1, 3, 1.1) == [1, 2, 3]
+    assert sweep.parse_levels("32, 8,16,8") == [8, 16, 32]
+
+
+def _args(**overrides):
+    args = dict(levels="", start_users=8, max_users=512, growth=2.0, plateau=0.05, bisect_steps=5,
+                resolution=0.05, slo_p95_ms=0, slo_error_rate=0.01)
+    args.update(overrides)
+    return SimpleNamespace(**args)
+
+
+def _run_model(capacity, p95_per_user=0.0):
+    """Fake run_level: throughput saturates at ``capacity`` users, p95 grows with users"""
+    def run_level(args, users, phase, locust_args):
+        result = {"users": users, "phase": phase, "status": "steady", "requests": 100,
+                  "rps": float(min(users, capacity)), "error_rate": 0.0, "p95_ms": users * p95_per_user}
+        result["slo_ok"] = sweep.meets_slo(result, args)
+        return result
+    return run_level
+
+
+def test_sweep_bisects_to_the_throughput_knee(monkeypatch):
+    monkeypatch.setattr(sweep, "run_level", _run_model(capacity=40))
+    results, reason, knee = sweep.sweep(_args(), [])
+    assert reason == "plateau"
+    assert [u for u in sorted(results) if results[u]["phase"] == "sweep"] == [8, 16, 32, 64, 128]
+    assert any(r["phase"] == "bisect" for r in results.values())
+    # Smallest level within 5% of the 40 req/s peak, to the bisection resolution
+    assert 38 <= knee <= 42
+
+
+def test_sweep_bisects_to_the_largest_level_meeting_the_slo(monkeypatch):
+    monkeypatch.setattr(sweep, "run_level", _run_model(capacity=1000, p95_per_user=100.0))
+    results, reason, knee = sweep.sweep(_args(slo_p95_ms=5000), [])
+    assert reason == "slo"
+    assert results[64]["slo_ok"] is False
+    assert knee == pytest.approx(50, abs=2)
+    assert results[knee]["slo_ok"]
@@ -0,0 +1,88 @@
+import csv
+
+from token_stats import TokenStats
+
+
+def _stats(usages, start, end):
+    stats = TokenStats()
+    for usage in usages:
+        stats.record(usage, start, end)
+    return stats
+
+
+def test_record_and_summary():
+    stats = _stats([{"prompt_tokens": 100, "completion_tokens": 10},
+                    {"prompt_tokens": 300, "completion_tokens": 30, "total_tokens": 330},
+                    None], 10.0, 12.0)
+    rows, duration, missing = stats.summary()
+    by_metric = {row["Metric"]: row for row in rows}
+    assert duration == 2.0
+    assert missing == 1
+    assert by_metric["prompt_tokens"]["Total"] == 400
+    assert by_metric["prompt_tokens"]["Tokens/s"] == 200.0
+    assert by_metric["total_tokens"]["Total"] == 440
+    assert by_metric["completion_tokens"]["Max"] == 30
+
+
+def test_merge_combines_samples_and_time_span():
+    a = _stats([{"prompt_tokens": 10, "completion_tokens": 1}], 5.0, 8.0)
+    b = _stats([{"prompt_tokens": 20, "completion_tokens": 2}, None], 3.0, 6.0)
+    merged = TokenStats()
+    merged.merge(a.export())
+    merged.merge(b.export())
+
+    assert merged.samples["prompt_tokens"] == [10, 20]
+    assert merged.missing_usage == 1
+    assert (merged.first_start, merged.last_end) == (3.0, 8.0)
+
+
+def test_take_ships_each_sample_once():
+    worker = _stats([{"prompt_tokens": 10, "completion_tokens": 1}], 0.0, 1.0)
+    master = TokenStats()
+    master.merge(worker.take())
+    worker.record({"prompt_tokens": 20, "completion_tokens": 2}, 1.0, 2.0)
+    worker.record(None, 1.0, 2.0)
+    master.merge(worker.take())
+    master.merge(worker.take())
+
+    assert master.samples["prompt_tokens"] == [10, 20]
+    assert master.missing_usage == 1
+    assert master.summary()[0] == worker.summary()[0]
+
+
+def test_write_csv(tmp_path):
+    path = tmp_path / "run_tokens.csv"
+    _stats([{"prompt_tokens": 4, "completion_tokens": 2}], 0.0, 1.0).write_csv(str(path))
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["Metric"] for r in rows] == ["prompt_tokens", "completion_tokens", "total_tokens"]
+    assert rows[2]["Total"] == "6"
+
+
+def test_headless_quit_keeps_final_worker_samples(tmp_path, cluster_factory):
+    from token_stats import write_token_stats
+
+    cluster = cluster_factory(workers=2, csv_prefix=str(tmp_path / "run"))
+    master_stats = TokenStats()
+    master_stats.attach(cluster.master)
+    worker_stats = []
+    for worker in cluster.workers:
+        stats = TokenStats()
+        stats.attach(worker)
+        worker_stats.append(stats)
+    cluster.master.events.test_stop.add_listener(lambda environment, **kw: write_token_stats(environment, master_stats))
+    cluster.test_start()
+
+    for stats in worker_stats:
+        stats.record({"prompt_tokens": 10, "completion_tokens": 1}, 0.0, 1.0)
+    for worker in cluster.workers:
+        cluster.send_stats(worker)
+    # Requests finishing between the last periodic report and the quit
+    for stats in worker_stats:
+        stats.record({"prompt_tokens": 20, "completion_tokens": 2}, 1.0, 2.0)
+    cluster.quit_headless()
+
+    with open(tmp_path / "run_tokens.csv", newline="") as f:
+        rows = {row["Metric"]: row for row in csv.DictReader(f)}
+    assert rows["prompt_tokens"]["Requests"] == "4"
+    assert rows["prompt_tokens"]["Total"] == "60"
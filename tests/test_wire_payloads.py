@@ -0,0 +1,64 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from build_wire_payloads import build_wire
+from dataset_scan import list_images, list_video_dirs
+from payload_sets import (build_frame_body, build_image_body, discover_frame_dirs, discover_image_files,
+                          encode_image_file)
+from wire_payloads import WIRE_DIR, load_wire, wire_bodies, wire_dir, wire_params
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_frame_wire_bodies_are_byte_identical(frames_dataset, stream):
+    base, videos = frames_dataset
+    build_wire(base, "frames", None, per_shard=2, workers=1)
+    wire = load_wire(base, "frames", wire_params("frames"))
+    keys = sorted(videos)
+    for key, body in zip(keys, wire_bodies(wire, keys, "describe", 128, stream)):
+        expected, _, _ = build_frame_body(base, key, "describe", 128, stream)
+        assert body.tobytes() == expected
+        assert len(body) == len(expected)
+        assert body.frames == len(videos[key])
+
+
+def test_image_wire_bodies_are_byte_identical(tmp_path):
+    base = tmp_path / "images"
+    (base / "docs").mkdir(parents=True)
+    for i, size in enumerate([(300, 200), (64, 64)]):
+        Image.new("RGB", size, (i * 90, 10, 10)).save(base / "docs" / f"img_{i}.png")
+    base = str(base)
+    build_wire(base, "images", (128, 128), per_shard=8, workers=1)
+    wire = load_wire(base, "images", wire_params("images", (128, 128)))
+    keys = sorted(os.path.relpath(f, base) for f in discover_image_files(base))
+    for key, body in zip(keys, wire_bodies(wire, keys, "read it", 64)):
+        expected = build_image_body(encode_image_file(os.path.join(base, key), (128, 128)), "read it", 64)
+        assert body.tobytes() == expected
+
+
+def test_walkers_skip_wire_and_shard_dirs(frames_dataset):
+    base, videos = frames_dataset
+    build_wire(base, "frames", None, per_shard=2, workers=1)
+    os.makedirs(os.path.join(base, ".cache", "stale"))
+    os.makedirs(os.path.join(base, "shards", "leftover"))
+    # A stray image inside an artifact directory is not a dataset image either
+    with open(os.path.join(base, WIRE_DIR, "preview.jpg"), "wb") as f:
+        buffer = io.BytesIO()
+        Image.new("RGB", (8, 8)).save(buffer, format="JPEG")
+        f.write(buffer.getvalue())
+
+    assert os.path.isdir(wire_dir(base, "frames", wire_params("frames")))
+    assert sorted(discover_frame_dirs(base)) == sorted(videos)
+    assert sorted(os.path.relpath(d, base) for d in list_video_dirs(base)) == sorted(videos)
+    frames = sum(len(f) for f in videos.values())
+    assert len(list_images(base)) == len(discover_image_files(base)) == frames
+    assert not any(os.path.relpath(path, base).startswith(WIRE_DIR + os.sep)
+                   for path in list_images(base) + discover_image_files(base))
+
+
+def test_grid_budgets_get_their_own_artifacts():
+    assert wire_params("frames", max_pixels=0) == wire_params("frames")
+    assert wire_dir("d", "frames", wire_params("frames", max_pixels=401408)) != wire_dir("d", "frames",
+                                                                                        wire_params("frames"))